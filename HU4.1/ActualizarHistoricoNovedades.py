@@ -35,10 +35,10 @@ DIAGRAMA DE FLUJO
                                   |
                                   v
     +-------------------------------------------------------------+
-    |  PASO 2: Para cada registro CON NOVEDAD:                    |
+    |  PASO 2: Para todos los registros CON NOVEDAD:              |
     |  +-------------------------------------------------------+  |
-    |  |  Verificar si ya existe en HistoricoNovedades         |  |
-    |  |  Buscar fechas en HistoricoOrdenesCompra              |  |
+    |  |  Cruzar en memoria contra HistoricoNovedades          |  |
+    |  |  Buscar fechas en HOC (una consulta para todos)       |  |
     |  +-------------------------------------------------------+  |
     |  |  CASO 1: No existe -> INSERT nuevo registro           |  |
     |  +-------------------------------------------------------+  |
@@ -142,6 +142,9 @@ NOTAS TECNICAS
     - Busca fechas en HistoricoOrdenesCompra por NIT + DocCompra
     - "NO ENCONTRADO" se usa como valor placeholder para fechas
     - Actualiza registros que pasaron de CON NOVEDAD a APROBADO
+    - Las fechas de HOC se obtienen en bloque (#ParesFechas + CROSS APPLY TOP 1)
+    - INSERT/UPDATE se aplican con un solo MERGE desde #HistoricoNovedadesLote;
+      los SKIP no se envian a la base de datos
 
 ================================================================================
 """
@@ -164,6 +167,7 @@ def ActualizarHistoricoNovedades():
     import ast
     import traceback
     import pyodbc
+    import sys
     import pandas as pd
     import numpy as np
     from datetime import datetime
@@ -246,7 +250,8 @@ def ActualizarHistoricoNovedades():
         cx = None
         for attempt in range(max_retries):
             try:
-                cx = pyodbc.connect(conn_str, timeout=30)
+                pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                cx = pool_sql.conectar(conn_str, timeout=30) if pool_sql else pyodbc.connect(conn_str, timeout=30)
                 cx.autocommit = False
                 print("[DEBUG] Conexion SQL abierta (intento " + str(attempt + 1) + ")")
                 break
@@ -315,30 +320,140 @@ def ActualizarHistoricoNovedades():
         
         print("[TABLA] Tabla creada exitosamente")
     
-    def buscar_fechas_comparativa(cx, nit, factura):
-        """Buscar Fec.Doc y Fec.Reg en tabla Comparativa"""
-        query = """
-        SELECT TOP 1
-            FecDoc,
-            FecReg
-        FROM [CxP].[HistoricoOrdenesCompra] WITH (NOLOCK)
-        WHERE NitCedula = ?
-          AND DocCompra = ?
-          AND (FecDoc IS NOT NULL OR FecReg IS NOT NULL)
+    def buscar_fechas_bulk(cx, pares):
+        """
+        Buscar Fec.Doc y Fec.Reg en HistoricoOrdenesCompra para todos los pares (NIT, DocCompra).
+        Carga los pares en la tabla temporal #ParesFechas y resuelve el TOP 1 por par con
+        un solo CROSS APPLY, con el mismo criterio que la busqueda individual.
+        Retorna dict (nit, doccompra) -> (fec_doc, fec_reg); los pares sin fechas
+        no se incluyen (el llamador usa "NO ENCONTRADO").
         """
+        pares = sorted(set(pares))
+        if not pares:
+            return {}
         
+        fechas = {}
         cur = cx.cursor()
-        cur.execute(query, (nit, factura))
-        row = cur.fetchone()
-        cx.commit()
-        cur.close()
+        try:
+            cur.execute("""
+            IF OBJECT_ID('tempdb..#ParesFechas') IS NOT NULL DROP TABLE #ParesFechas;
+            CREATE TABLE #ParesFechas (
+                Nit NVARCHAR(200),
+                DocCompra NVARCHAR(4000)
+            );
+            """)
+            cur.fast_executemany = True
+            cur.executemany("INSERT INTO #ParesFechas (Nit, DocCompra) VALUES (?, ?)", pares)
+            
+            cur.execute("""
+            SELECT p.Nit, p.DocCompra, h.FecDoc, h.FecReg
+            FROM #ParesFechas p
+            CROSS APPLY (
+                SELECT TOP 1 FecDoc, FecReg
+                FROM [CxP].[HistoricoOrdenesCompra] WITH (NOLOCK)
+                WHERE NitCedula = p.Nit
+                  AND DocCompra = p.DocCompra
+                  AND (FecDoc IS NOT NULL OR FecReg IS NOT NULL)
+            ) h
+            """)
+            for nit, doccompra, fec_doc, fec_reg in cur.fetchall():
+                fechas[(nit, doccompra)] = (
+                    safe_str(fec_doc) if fec_doc else "NO ENCONTRADO",
+                    safe_str(fec_reg) if fec_reg else "NO ENCONTRADO"
+                )
+            
+            cur.execute("DROP TABLE #ParesFechas")
+            cx.commit()
+        finally:
+            cur.close()
         
-        if row:
-            fec_doc = safe_str(row[0]) if row[0] else "NO ENCONTRADO"
-            fec_reg = safe_str(row[1]) if row[1] else "NO ENCONTRADO"
-            return fec_doc, fec_reg
-        else:
-            return "NO ENCONTRADO", "NO ENCONTRADO"
+        print("[DEBUG] Fechas HOC encontradas: " + str(len(fechas)) + "/" + str(len(pares)) + " pares")
+        return fechas
+    
+    def aplicar_merge_historico(cx, filas):
+        """
+        Aplicar con un solo MERGE sobre [CxP].[HistoricoNovedades] las acciones planificadas.
+        filas: lista de tuplas (Accion, Fecha_ejecucion, Fecha_de_retoma, ID_ejecucion, ID_registro,
+               Nit, Nombre_Proveedor, Orden_de_compra, Factura, Fec_Doc, Fec_Reg, Observaciones)
+        con Accion 'INSERT' o 'UPDATE'. Las filas UPDATE deben ser unicas por (Nit, Factura).
+        Las filas INSERT nunca hacen match (la condicion exige Accion = 'UPDATE'), de modo que
+        se insertan aunque la llave se repita, igual que los INSERT individuales.
+        Retorna dict con filas insertadas y actualizadas segun OUTPUT $action.
+        """
+        resultado = {'insertados': 0, 'actualizados': 0}
+        if not filas:
+            return resultado
+        
+        cur = cx.cursor()
+        try:
+            cur.execute("""
+            IF OBJECT_ID('tempdb..#HistoricoNovedadesLote') IS NOT NULL DROP TABLE #HistoricoNovedadesLote;
+            CREATE TABLE #HistoricoNovedadesLote (
+                Accion VARCHAR(10),
+                Fecha_ejecucion DATETIME NULL,
+                Fecha_de_retoma DATETIME NULL,
+                ID_ejecucion NVARCHAR(MAX) NULL,
+                ID_registro NVARCHAR(MAX) NULL,
+                Nit NVARCHAR(MAX) NULL,
+                Nombre_Proveedor NVARCHAR(MAX) NULL,
+                Orden_de_compra NVARCHAR(MAX) NULL,
+                Factura NVARCHAR(MAX) NULL,
+                Fec_Doc NVARCHAR(MAX) NULL,
+                Fec_Reg NVARCHAR(MAX) NULL,
+                Observaciones NVARCHAR(MAX) NULL
+            );
+            """)
+            cur.fast_executemany = True
+            cur.executemany("""
+            INSERT INTO #HistoricoNovedadesLote (
+                Accion, Fecha_ejecucion, Fecha_de_retoma, ID_ejecucion, ID_registro, Nit,
+                Nombre_Proveedor, Orden_de_compra, Factura, Fec_Doc, Fec_Reg, Observaciones
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, filas)
+            
+            cur.execute("""
+            SET NOCOUNT ON;
+            DECLARE @acciones TABLE (Accion NVARCHAR(10));
+            
+            MERGE [CxP].[HistoricoNovedades] AS t
+            USING #HistoricoNovedadesLote AS s
+                ON s.Accion = 'UPDATE'
+               AND t.Nit = s.Nit
+               AND t.Factura = s.Factura
+            WHEN MATCHED THEN
+                UPDATE SET Fecha_ejecucion = s.Fecha_ejecucion,
+                           Fec_Doc = s.Fec_Doc,
+                           Fec_Reg = s.Fec_Reg,
+                           Observaciones = s.Observaciones
+            WHEN NOT MATCHED BY TARGET AND s.Accion = 'INSERT' THEN
+                INSERT (Fecha_ejecucion, Fecha_de_retoma, ID_ejecucion, ID_registro, Nit,
+                        Nombre_Proveedor, Orden_de_compra, Factura, Fec_Doc, Fec_Reg, Observaciones)
+                VALUES (s.Fecha_ejecucion, s.Fecha_de_retoma, s.ID_ejecucion, s.ID_registro, s.Nit,
+                        s.Nombre_Proveedor, s.Orden_de_compra, s.Factura, s.Fec_Doc, s.Fec_Reg, s.Observaciones)
+            OUTPUT $action INTO @acciones;
+            
+            SELECT
+                SUM(CASE WHEN Accion = 'INSERT' THEN 1 ELSE 0 END),
+                SUM(CASE WHEN Accion = 'UPDATE' THEN 1 ELSE 0 END)
+            FROM @acciones;
+            
+            SET NOCOUNT OFF;
+            """)
+            fila = cur.fetchone()
+            resultado['insertados'] = int(fila[0] or 0) if fila else 0
+            resultado['actualizados'] = int(fila[1] or 0) if fila else 0
+            
+            cur.execute("DROP TABLE #HistoricoNovedadesLote")
+            cx.commit()
+        except Exception:
+            cx.rollback()
+            raise
+        finally:
+            cur.close()
+        
+        print("[MERGE] HistoricoNovedades: insertados=" + str(resultado['insertados']) +
+              " actualizados=" + str(resultado['actualizados']))
+        return resultado
     
     # ========================================================================
     # INICIO DE PROCESO
@@ -426,135 +541,83 @@ def ActualizarHistoricoNovedades():
                 print("[DEBUG] Registros en histórico: " + str(len(df_historico)))
                 
                 # ============================================================
-                # PASO 3: Procesar cada registro con CON NOVEDAD
+                # PASO 3: Planificar acciones y aplicar MERGE
                 # ============================================================
                 
                 print("")
-                print("[PASO 3] Procesando registros con CON NOVEDAD...")
+                print("[PASO 3] Planificando acciones sobre HistoricoNovedades...")
                 
-                for idx, row in df_novedades.iterrows():
-                    try:
-                        print("")
-                        print("[REGISTRO " + str(idx + 1) + "/" + str(len(df_novedades)) + "]")
-                        
-                        id_registro = safe_str(row['ID'])
-                        id_ejecucion = safe_str(row['executionNum'])
-                        fecha_retoma = row['Fecha_primer_proceso'] if pd.notna(row['Fecha_primer_proceso']) else fecha_ejecucion
-                        nit = safe_str(row['nit_emisor_o_nit_del_proveedor'])
-                        nombre = safe_str(row['nombre_emisor'])
-                        orden = safe_str(row['numero_de_liquidacion_u_orden_de_compra'])
-                        factura = safe_str(row['numero_de_factura'])
-                        observaciones = safe_str(row['ObservacionesFase_4'])
-                        
-                        print("[DEBUG] NIT: " + nit + " | Factura: " + factura)
-                        
-                        # Buscar fechas en Comparativa
-                        fec_doc, fec_reg = buscar_fechas_comparativa(cx, nit, orden)
-                        print("[DEBUG] Fec.Doc: " + fec_doc + " | Fec.Reg: " + fec_reg)
-                        
-                        # Verificar si existe en histórico
-                        existe = False
-                        tiene_fechas = False
-                        
-                        if not df_historico.empty:
-                            mask = (df_historico['Nit'] == nit) & (df_historico['Factura'] == factura)
-                            registros_existentes = df_historico[mask]
-                            
-                            if not registros_existentes.empty:
-                                existe = True
-                                # Verificar si tiene Fec.Doc o Fec.Reg
-                                fec_doc_hist = safe_str(registros_existentes.iloc[0]['Fec_Doc'])
-                                fec_reg_hist = safe_str(registros_existentes.iloc[0]['Fec_Reg'])
-                                
-                                if (fec_doc_hist and fec_doc_hist != 'NO ENCONTRADO') or \
-                                   (fec_reg_hist and fec_reg_hist != 'NO ENCONTRADO'):
-                                    tiene_fechas = True
-                        
-                        # ====================================================
-                        # CASO 1: NO existe en histórico - INSERT
-                        # ====================================================
-                        
-                        if not existe:
-                            print("[ACCION] Registro nuevo - INSERT")
-                            
-                            cur = cx.cursor()
-                            
-                            insert_query = """
-                            INSERT INTO [CxP].[HistoricoNovedades] (
-                                Fecha_ejecucion,
-                                Fecha_de_retoma,
-                                ID_ejecucion,
-                                ID_registro,
-                                Nit,
-                                Nombre_Proveedor,
-                                Orden_de_compra,
-                                Factura,
-                                Fec_Doc,
-                                Fec_Reg,
-                                Observaciones
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                            """
-                            
-                            cur.execute(insert_query, (
-                                fecha_ejecucion,
-                                fecha_retoma,
-                                id_ejecucion,
-                                id_registro,
-                                nit,
-                                nombre,
-                                orden,
-                                factura,
-                                fec_doc,
-                                fec_reg,
-                                observaciones
-                            ))
-                            cx.commit()
-                            cur.close()
-                            stats['nuevos_insertados'] += 1
-                            print("[INSERT] Nuevo registro insertado")
-                        
-                        # ====================================================
-                        # CASO 2: Existe y tiene fechas - UPDATE
-                        # ====================================================
-                        
-                        elif existe and tiene_fechas:
-                            print("[ACCION] Registro existe con fechas - UPDATE")
-                            
-                            cur = cx.cursor()
-                            
-                            update_query = """
-                            UPDATE [CxP].[HistoricoNovedades]
-                            SET Fecha_ejecucion = ?,
-                                Fec_Doc = ?,
-                                Fec_Reg = ?,
-                                Observaciones = ?
-                            WHERE Nit = ?
-                              AND Factura = ?
-                            """
-                            
-                            cur.execute(update_query, (
-                                fecha_ejecucion,
-                                fec_doc,
-                                fec_reg,
-                                observaciones,
-                                nit,
-                                factura
-                            ))
-                            cx.commit()
-                            cur.close()
-                            stats['actualizados'] += 1
-                            print("[UPDATE] Registro actualizado")
-                        
-                        # ====================================================
-                        # CASO 3: Existe sin fechas - SKIP
-                        # ====================================================
-                        
-                        else:
-                            print("[INFO] Registro existe sin fechas - SKIP")
-                    
-                    except Exception as e_row:
-                        print("[ERROR] Error procesando registro " + str(idx) + ": " + str(e_row))
-                        continue
+                df_plan = pd.DataFrame({
+                    'Fecha_de_retoma': [
+                        v if pd.notna(v) else fecha_ejecucion for v in df_novedades['Fecha_primer_proceso']
+                    ],
+                    'ID_ejecucion': df_novedades['executionNum'].map(safe_str).to_numpy(),
+                    'ID_registro': df_novedades['ID'].map(safe_str).to_numpy(),
+                    'Nit': df_novedades['nit_emisor_o_nit_del_proveedor'].map(safe_str).to_numpy(),
+                    'Nombre_Proveedor': df_novedades['nombre_emisor'].map(safe_str).to_numpy(),
+                    'Orden_de_compra': df_novedades['numero_de_liquidacion_u_orden_de_compra'].map(safe_str).to_numpy(),
+                    'Factura': df_novedades['numero_de_factura'].map(safe_str).to_numpy(),
+                    'Observaciones': df_novedades['ObservacionesFase_4'].map(safe_str).to_numpy()
+                })
+                
+                # Fechas de HOC por (NIT, OC) en una sola consulta
+                fechas_hoc = buscar_fechas_bulk(cx, zip(df_plan['Nit'], df_plan['Orden_de_compra']))
+                fechas_plan = [
+                    fechas_hoc.get(llave, ("NO ENCONTRADO", "NO ENCONTRADO"))
+                    for llave in zip(df_plan['Nit'], df_plan['Orden_de_compra'])
+                ]
+                df_plan['Fec_Doc'] = [f[0] for f in fechas_plan]
+                df_plan['Fec_Reg'] = [f[1] for f in fechas_plan]
+                
+                # Estado en historico por (Nit, Factura): se evalua la primera fila existente
+                df_plan['Existe'] = False
+                df_plan['TieneFechas'] = False
+                if not df_historico.empty:
+                    df_hist = df_historico.drop_duplicates(subset=['Nit', 'Factura'], keep='first').copy()
+                    fec_doc_hist = df_hist['Fec_Doc'].map(safe_str)
+                    fec_reg_hist = df_hist['Fec_Reg'].map(safe_str)
+                    df_hist['TieneFechasHist'] = (
+                        ((fec_doc_hist != '') & (fec_doc_hist != 'NO ENCONTRADO')) |
+                        ((fec_reg_hist != '') & (fec_reg_hist != 'NO ENCONTRADO'))
+                    )
+                    df_hist['ExisteHist'] = True
+                    df_cruce = df_plan[['Nit', 'Factura']].merge(
+                        df_hist[['Nit', 'Factura', 'ExisteHist', 'TieneFechasHist']],
+                        on=['Nit', 'Factura'],
+                        how='left'
+                    )
+                    df_plan['Existe'] = df_cruce['ExisteHist'].eq(True).to_numpy()
+                    df_plan['TieneFechas'] = df_cruce['TieneFechasHist'].eq(True).to_numpy()
+                
+                df_plan['Accion'] = np.select(
+                    [~df_plan['Existe'], df_plan['TieneFechas']],
+                    ['INSERT', 'UPDATE'],
+                    default='SKIP'
+                )
+                
+                stats['nuevos_insertados'] = int((df_plan['Accion'] == 'INSERT').sum())
+                stats['actualizados'] = int((df_plan['Accion'] == 'UPDATE').sum())
+                print("[DEBUG] INSERT: " + str(stats['nuevos_insertados']) +
+                      " | UPDATE: " + str(stats['actualizados']) +
+                      " | SKIP: " + str(int((df_plan['Accion'] == 'SKIP').sum())))
+                
+                # Los UPDATE repetidos por (Nit, Factura) se reducen a la ultima fila
+                df_insert = df_plan[df_plan['Accion'] == 'INSERT']
+                df_update = df_plan[df_plan['Accion'] == 'UPDATE'].drop_duplicates(subset=['Nit', 'Factura'], keep='last')
+                df_merge = pd.concat([df_insert, df_update])
+                
+                filas_merge = [
+                    (accion, fecha_ejecucion, fecha_retoma, id_ejecucion, id_registro, nit, nombre,
+                     orden, factura, fec_doc, fec_reg, observaciones)
+                    for accion, fecha_retoma, id_ejecucion, id_registro, nit, nombre, orden, factura,
+                        fec_doc, fec_reg, observaciones in zip(
+                        df_merge['Accion'], df_merge['Fecha_de_retoma'], df_merge['ID_ejecucion'],
+                        df_merge['ID_registro'], df_merge['Nit'], df_merge['Nombre_Proveedor'],
+                        df_merge['Orden_de_compra'], df_merge['Factura'], df_merge['Fec_Doc'],
+                        df_merge['Fec_Reg'], df_merge['Observaciones']
+                    )
+                ]
+                stats['merge_novedades'] = aplicar_merge_historico(cx, filas_merge)
             
             # ================================================================
             # PASO 4: Actualizar registros con NO ENCONTRADO
@@ -597,51 +660,43 @@ def ActualizarHistoricoNovedades():
                 df_aprobados = pd.read_sql(query_aprobados, cx)
                 print("[DEBUG] Registros APROBADOS: " + str(len(df_aprobados)))
                 
-                # Cruzar registros
-                for idx, row_hist in df_no_encontrado.iterrows():
-                    nit_hist = safe_str(row_hist['Nit'])
-                    factura_hist = safe_str(row_hist['Factura'])
-                    
-                    # Buscar en aprobados
-                    mask = (df_aprobados['nit_emisor_o_nit_del_proveedor'] == nit_hist) & \
-                           (df_aprobados['numero_de_factura'] == factura_hist)
+                # Cruzar registros (primer APROBADO por NIT + Factura)
+                df_ne = pd.DataFrame({
+                    'Nit': df_no_encontrado['Nit'].map(safe_str),
+                    'Factura': df_no_encontrado['Factura'].map(safe_str)
+                })
+                df_ap = df_aprobados.drop_duplicates(
+                    subset=['nit_emisor_o_nit_del_proveedor', 'numero_de_factura'], keep='first'
+                )
+                df_match = df_ne.merge(
+                    df_ap,
+                    left_on=['Nit', 'Factura'],
+                    right_on=['nit_emisor_o_nit_del_proveedor', 'numero_de_factura'],
+                    how='inner'
+                )
+                print("[DEBUG] Registros NO ENCONTRADO ahora APROBADOS: " + str(len(df_match)))
+                
+                if not df_match.empty:
+                    # Buscar fechas en HOC para todos los pares en una sola consulta
+                    fechas_ne = buscar_fechas_bulk(cx, zip(df_match['Nit'], df_match['Factura']))
                     
-                    registros_aprobados = df_aprobados[mask]
+                    # Solo actualizar si encontró fechas
+                    filas_ne = []
+                    llaves_ne = set()
+                    for nit_hist, factura_hist, obs in zip(df_match['Nit'], df_match['Factura'], df_match['ObservacionesFase_4']):
+                        fec_doc, fec_reg = fechas_ne.get((nit_hist, factura_hist), ("NO ENCONTRADO", "NO ENCONTRADO"))
+                        if fec_doc == "NO ENCONTRADO" and fec_reg == "NO ENCONTRADO":
+                            continue
+                        stats['actualizados_no_encontrado'] += 1
+                        if (nit_hist, factura_hist) in llaves_ne:
+                            continue
+                        llaves_ne.add((nit_hist, factura_hist))
+                        filas_ne.append((
+                            'UPDATE', fecha_ejecucion, None, None, None, nit_hist, None,
+                            None, factura_hist, fec_doc, fec_reg, safe_str(obs)
+                        ))
                     
-                    if not registros_aprobados.empty:
-                        print("[MATCH] Encontrado en APROBADOS: " + nit_hist + " - " + factura_hist)
-                        
-                        # Buscar fechas en Comparativa
-                        fec_doc, fec_reg = buscar_fechas_comparativa(cx, nit_hist, factura_hist)
-                        
-                        # Solo actualizar si encontró fechas
-                        if fec_doc != "NO ENCONTRADO" or fec_reg != "NO ENCONTRADO":
-                            observaciones = safe_str(registros_aprobados.iloc[0]['ObservacionesFase_4'])
-                            
-                            cur = cx.cursor()
-                            
-                            update_query = """
-                            UPDATE [CxP].[HistoricoNovedades]
-                            SET Fecha_ejecucion = ?,
-                                Fec_Doc = ?,
-                                Fec_Reg = ?,
-                                Observaciones = ?
-                            WHERE Nit = ?
-                              AND Factura = ?
-                            """
-                            
-                            cur.execute(update_query, (
-                                fecha_ejecucion,
-                                fec_doc,
-                                fec_reg,
-                                observaciones,
-                                nit_hist,
-                                factura_hist
-                            ))
-                            cx.commit()
-                            cur.close()
-                            stats['actualizados_no_encontrado'] += 1
-                            print("[UPDATE] Fechas actualizadas")
+                    stats['merge_no_encontrado'] = aplicar_merge_historico(cx, filas_ne)
             
             # ================================================================
             # FIN DE PROCESO
@@ -24,20 +24,13 @@ DIAGRAMA DE FLUJO
                                   |
                                   v
     +-------------------------------------------------------------+
-    |  PASO 1: Consultar registros CON NOVEDAD                    |
-    |  de [CxP].[DocumentsProcessing]                             |
-    +-----------------------------+-------------------------------+
-                                  |
-                                  v
-    +-------------------------------------------------------------+
-    |  PASO 2: Insertar nuevos registros en                       |
-    |  [CxP].[ReporteNovedades]                                   |
-    +-----------------------------+-------------------------------+
-                                  |
-                                  v
-    +-------------------------------------------------------------+
-    |  PASO 3: Consultar TODOS los registros de                   |
-    |  [CxP].[ReporteNovedades]                                   |
+    |  PASO 1-3: Un solo lote SQL                                 |
+    |  - INSERT ... SELECT de CON NOVEDAD de DocumentsProcessing  |
+    |    en [CxP].[ReporteNovedades]                              |
+    |  - Conteo insertado (@@ROWCOUNT)                            |
+    |  - Contenido completo de [CxP].[ReporteNovedades]           |
+    |  Si el lote falla: ROLLBACK e insercion fila por fila       |
+    |  (omitiendo las filas que fallan)                           |
     +-----------------------------+-------------------------------+
                                   |
                                   v
@@ -49,7 +42,7 @@ DIAGRAMA DE FLUJO
                                   |
                                   v
     +-------------------------------------------------------------+
-    |  PASO 5: Crear archivo Excel con openpyxl                   |
+    |  PASO 5: Crear archivo Excel en streaming (xlsxwriter)      |
     |  - Aplicar formato profesional                              |
     |  - Encabezados con estilo                                   |
     |  - Ajustar anchos de columna                                |
@@ -148,9 +141,16 @@ NOTAS TECNICAS
 
     - Timestamp se agrega automaticamente al nombre del archivo
     - Si no puede guardar, intenta con sufijo "1"
-    - Usa openpyxl para formato profesional
+    - Usa xlsxwriter en modo constant_memory: las filas se escriben en
+      streaming y la memoria no crece con el volumen (500k+ filas)
+    - Formatos compartidos de encabezado/celda (sin objetos de estilo por celda)
     - Ordena por Fecha_Insercion DESC, RowID DESC
     - SP_Origen = 'GenerarReporte_Retorno'
+    - La insercion es un INSERT ... SELECT en el servidor; el mismo lote
+      devuelve el contenido de ReporteNovedades usado para el Excel
+    - Si el INSERT ... SELECT falla (p.ej. un registro que excede el largo de
+      una columna), se revierte y se reintenta fila por fila: las filas que
+      fallan se omiten con [WARNING] y el resto se reporta, como antes
 
 ================================================================================
 """
@@ -160,6 +160,7 @@ def GenerarReporte_Retorno():
     import ast
     import traceback
     import pyodbc
+    import sys
     import pandas as pd
     import numpy as np
     from datetime import datetime
@@ -167,8 +168,7 @@ def GenerarReporte_Retorno():
     import time
     import warnings
     import os
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+    import xlsxwriter
     
     warnings.filterwarnings('ignore', message='pandas only supports SQLAlchemy')
     
@@ -245,7 +245,8 @@ def GenerarReporte_Retorno():
         cx = None
         for attempt in range(max_retries):
             try:
-                cx = pyodbc.connect(conn_str, timeout=30)
+                pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                cx = pool_sql.conectar(conn_str, timeout=30) if pool_sql else pyodbc.connect(conn_str, timeout=30)
                 cx.autocommit = False
                 print("[DEBUG] Conexion SQL abierta (intento " + str(attempt + 1) + ")")
                 break
@@ -272,6 +273,55 @@ def GenerarReporte_Retorno():
                 except:
                     pass
     
+    def escribir_excel_streaming(ruta, nombre_hoja, headers, anchos, filas):
+        """
+        Escribir hoja Excel en modo streaming (xlsxwriter constant_memory).
+        Cada fila se vuelca a disco al pasar a la siguiente, por lo que la
+        memoria no crece con el numero de filas. El formato se define una
+        sola vez (formato de encabezado y formato de celda compartidos).
+        Retorna el numero de filas de datos escritas.
+        """
+        wb = xlsxwriter.Workbook(ruta, {
+            'constant_memory': True,
+            'strings_to_numbers': False,
+            'strings_to_formulas': False,
+            'strings_to_urls': False
+        })
+        
+        try:
+            ws = wb.add_worksheet(nombre_hoja)
+            
+            # Formatos compartidos (una sola instancia por libro)
+            header_format = wb.add_format({
+                'font_name': 'Arial', 'font_size': 11, 'bold': True, 'font_color': '#FFFFFF',
+                'bg_color': '#366092', 'align': 'center', 'valign': 'vcenter',
+                'text_wrap': True, 'border': 1, 'border_color': '#000000'
+            })
+            cell_format = wb.add_format({
+                'font_name': 'Arial', 'font_size': 10, 'align': 'left', 'valign': 'vcenter',
+                'border': 1, 'border_color': '#000000'
+            })
+            
+            # Anchos de columna
+            for col_idx, ancho in enumerate(anchos):
+                ws.set_column(col_idx, col_idx, ancho)
+            
+            # Encabezados
+            ws.write_row(0, 0, headers, header_format)
+            
+            # Datos (en constant_memory las filas deben escribirse en orden)
+            filas_escritas = 0
+            for row_idx, row_data in enumerate(filas, 1):
+                ws.write_row(row_idx, 0, row_data, cell_format)
+                filas_escritas += 1
+                
+                if filas_escritas % 100000 == 0:
+                    print("[EXCEL] Filas escritas: " + str(filas_escritas))
+        finally:
+            wb.close()
+        
+        return filas_escritas
+    
     def crear_excel_reporte(df, ruta_completa):
         """
         Crear archivo Excel con formato profesional
@@ -279,64 +329,16 @@ def GenerarReporte_Retorno():
         print("[EXCEL] Creando archivo Excel...")
         print("[EXCEL] Ruta: " + ruta_completa)
         
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "FV"
-        
-        # Definir estilos
-        header_font = Font(name='Arial', size=11, bold=True, color='FFFFFF')
-        header_fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
-        header_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-        
-        cell_font = Font(name='Arial', size=10)
-        cell_alignment = Alignment(horizontal='left', vertical='center', wrap_text=False)
-        
-        border_thin = Border(
-            left=Side(style='thin', color='000000'),
-            right=Side(style='thin', color='000000'),
-            top=Side(style='thin', color='000000'),
-            bottom=Side(style='thin', color='000000')
-        )
-        
-        # Escribir encabezados
         headers = ['ID', 'Fecha_Carga', 'Nit', 'Nombre Proveedor', 'Orden_de_compra', 'Numero_factura', 'Estado_CXP_Bot', 'Observaciones']
         
-        for col_idx, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_idx)
-            cell.value = header
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-            cell.border = border_thin
-        
-        # Escribir datos
-        for row_idx, row_data in enumerate(df.itertuples(index=False), 2):
-            for col_idx, value in enumerate(row_data, 1):
-                cell = ws.cell(row=row_idx, column=col_idx)
-                cell.value = value
-                cell.font = cell_font
-                cell.alignment = cell_alignment
-                cell.border = border_thin
-        
-        # Ajustar anchos de columna
-        column_widths = {
-            'A': 12,  # ID
-            'B': 15,  # Fecha_Carga
-            'C': 15,  # Nit
-            'D': 35,  # Nombre Proveedor
-            'E': 18,  # Orden_de_compra
-            'F': 18,  # Numero_factura
-            'G': 50,  # Estado_CXP_Bot
-            'H': 60   # Observaciones
-        }
-        
-        for col_letter, width in column_widths.items():
-            ws.column_dimensions[col_letter].width = width
+        # Anchos de columna: ID, Fecha_Carga, Nit, Nombre Proveedor,
+        # Orden_de_compra, Numero_factura, Estado_CXP_Bot, Observaciones
+        column_widths = [12, 15, 15, 35, 18, 18, 50, 60]
         
         # Guardar archivo
         try:
-            wb.save(ruta_completa)
-            print("[EXCEL] Archivo guardado exitosamente")
+            filas = escribir_excel_streaming(ruta_completa, "FV", headers, column_widths, df.itertuples(index=False, name=None))
+            print("[EXCEL] Archivo guardado exitosamente (" + str(filas) + " filas)")
             return True, ruta_completa
         except Exception as e:
             print("[ERROR] Error guardando archivo: " + str(e))
@@ -347,13 +349,91 @@ def GenerarReporte_Retorno():
             ruta_alternativa = base_name + "1" + ext
             
             try:
-                wb.save(ruta_alternativa)
-                print("[EXCEL] Archivo guardado con nombre alternativo")
+                filas = escribir_excel_streaming(ruta_alternativa, "FV", headers, column_widths, df.itertuples(index=False, name=None))
+                print("[EXCEL] Archivo guardado con nombre alternativo (" + str(filas) + " filas)")
                 return True, ruta_alternativa
             except Exception as e2:
                 print("[ERROR] Error guardando con nombre alternativo: " + str(e2))
                 return False, None
     
+    def insertar_novedades_por_fila(cx, fecha_carga, sp_origen):
+        """
+        Respaldo del INSERT ... SELECT: inserta fila por fila y omite (con log)
+        las filas que fallan, como el flujo original, para que un registro con
+        datos invalidos no deje sin reporte al resto.
+        Retorna (consultados, insertados).
+        """
+        df_dp = pd.read_sql("""
+            SELECT 
+                ID,
+                nit_emisor_o_nit_del_proveedor AS Nit,
+                nombre_emisor AS Nombre_Proveedor,
+                numero_de_liquidacion_u_orden_de_compra AS Orden_de_compra,
+                numero_de_factura AS Numero_factura,
+                ResultadoFinalAntesEventos AS Estado_CXP_Bot,
+                ObservacionesFase_4 AS Observaciones
+            FROM [CxP].[DocumentsProcessing] WITH (NOLOCK)
+            WHERE documenttype = 'FV'
+              AND ResultadoFinalAntesEventos LIKE '%CON NOVEDAD%'
+            """, cx)
+        
+        insert_query = """
+        INSERT INTO [CxP].[ReporteNovedades] (
+            ID,
+            Fecha_Carga,
+            Nit,
+            Nombre_Proveedor,
+            Orden_de_compra,
+            Numero_factura,
+            Estado_CXP_Bot,
+            Observaciones,
+            SP_Origen,
+            Fecha_Insercion
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, GETDATE())
+        """
+        
+        registros_insertados = 0
+        cur = cx.cursor()
+        try:
+            for row in df_dp.itertuples(index=False):
+                try:
+                    cur.execute(insert_query, (
+                        safe_str(row.ID),
+                        fecha_carga,
+                        safe_str(row.Nit),
+                        safe_str(row.Nombre_Proveedor),
+                        safe_str(row.Orden_de_compra),
+                        safe_str(row.Numero_factura),
+                        safe_str(row.Estado_CXP_Bot),
+                        safe_str(row.Observaciones),
+                        sp_origen
+                    ))
+                    registros_insertados += 1
+                except Exception as e_row:
+                    print("[WARNING] Error insertando registro ID=" + safe_str(row.ID) + ": " + str(e_row))
+                    continue
+            cx.commit()
+        finally:
+            cur.close()
+        
+        return len(df_dp), registros_insertados
+    
+    def leer_reporte_novedades(cx):
+        """Contenido completo de [CxP].[ReporteNovedades] para el Excel."""
+        return pd.read_sql("""
+            SELECT 
+                ID,
+                Fecha_Carga,
+                Nit,
+                Nombre_Proveedor,
+                Orden_de_compra,
+                Numero_factura,
+                Estado_CXP_Bot,
+                Observaciones
+            FROM [CxP].[ReporteNovedades] WITH (NOLOCK)
+            ORDER BY Fecha_Insercion DESC, RowID DESC
+            """, cx)
+    
     # ========================================================================
     # INICIO DE PROCESO
     # ========================================================================
@@ -394,103 +474,50 @@ def GenerarReporte_Retorno():
         with crear_conexion_db(cfg) as cx:
             
             # ================================================================
-            # PASO 1: Consultar DocumentsProcessing (CON NOVEDAD)
+            # PASO 1-3: INSERT ... SELECT en [CxP].[ReporteNovedades] y
+            # lectura del reporte completo en un solo lote
             # ================================================================
             
             print("")
-            print("[PASO 1] Consultando DocumentsProcessing (CON NOVEDAD)...")
-            
-            query_dp = """
-            SELECT 
-                ID,
-                nit_emisor_o_nit_del_proveedor AS Nit,
-                nombre_emisor AS Nombre_Proveedor,
-                numero_de_liquidacion_u_orden_de_compra AS Orden_de_compra,
-                numero_de_factura AS Numero_factura,
-                ResultadoFinalAntesEventos AS Estado_CXP_Bot,
-                ObservacionesFase_4 AS Observaciones,
-                documenttype
-            FROM [CxP].[DocumentsProcessing] WITH (NOLOCK)
-            WHERE documenttype = 'FV'
-              AND ResultadoFinalAntesEventos LIKE '%CON NOVEDAD%'
-            """
+            print("[PASO 1-3] Insertando CON NOVEDAD de DocumentsProcessing en [CxP].[ReporteNovedades] (INSERT ... SELECT)...")
             
-            df_dp = pd.read_sql(query_dp, cx)
-            stats['total_registros_consultados'] = len(df_dp)
+            # La insercion se resuelve en el servidor (sin traer DocumentsProcessing a
+            # Python) y el mismo lote devuelve el conteo insertado y el contenido de
+            # ReporteNovedades, que es el frame con el que se construye el Excel.
+            # ReporteNovedades tambien recibe filas de los SP de HU4, por eso se
+            # exporta la tabla completa y no solo lo insertado aqui.
+            lote_reporte = """
+            SET NOCOUNT ON;
             
-            print("[DEBUG] Registros consultados: " + str(len(df_dp)))
-            
-            # ================================================================
-            # PASO 2: Insertar registros en [CxP].[ReporteNovedades]
-            # ================================================================
-            
-            if not df_dp.empty:
-                print("")
-                print("[PASO 2] Insertando registros en [CxP].[ReporteNovedades]...")
-                
-                cur = cx.cursor()
-                
-                # Agregar columna Fecha_Carga
-                df_dp['Fecha_Carga'] = fecha_carga
-                
-                insert_query = """
-                INSERT INTO [CxP].[ReporteNovedades] (
-                    ID,
-                    Fecha_Carga,
-                    Nit,
-                    Nombre_Proveedor,
-                    Orden_de_compra,
-                    Numero_factura,
-                    Estado_CXP_Bot,
-                    Observaciones,
-                    SP_Origen,
-                    Fecha_Insercion
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, GETDATE())
-                """
-                
-                registros_insertados = 0
-                sp_origen = 'GenerarReporte_Retorno'
-                
-                for idx, row in df_dp.iterrows():
-                    try:
-                        cur.execute(insert_query, (
-                            safe_str(row['ID']),
-                            fecha_carga,
-                            safe_str(row['Nit']),
-                            safe_str(row['Nombre_Proveedor']),
-                            safe_str(row['Orden_de_compra']),
-                            safe_str(row['Numero_factura']),
-                            safe_str(row['Estado_CXP_Bot']),
-                            safe_str(row['Observaciones']),
-                            sp_origen
-                        ))
-                        registros_insertados += 1
-                        
-                        if registros_insertados % 50 == 0:
-                            print("[DEBUG] Insertados " + str(registros_insertados) + " registros...")
-                            
-                    except Exception as e_row:
-                        print("[WARNING] Error insertando registro ID=" + safe_str(row['ID']) + ": " + str(e_row))
-                        continue
-                
-                cx.commit()
-                cur.close()
-                
-                stats['registros_insertados'] = registros_insertados
-                
-                print("[DEBUG] Total registros insertados: " + str(registros_insertados))
-            else:
-                print("[INFO] No hay registros CON NOVEDAD para insertar")
-                stats['registros_insertados'] = 0
-            
-            # ================================================================
-            # PASO 3: Consultar TODOS los registros de [CxP].[ReporteNovedades]
-            # ================================================================
-            
-            print("")
-            print("[PASO 3] Consultando todos los registros de [CxP].[ReporteNovedades]...")
+            INSERT INTO [CxP].[ReporteNovedades] (
+                ID,
+                Fecha_Carga,
+                Nit,
+                Nombre_Proveedor,
+                Orden_de_compra,
+                Numero_factura,
+                Estado_CXP_Bot,
+                Observaciones,
+                SP_Origen,
+                Fecha_Insercion
+            )
+            SELECT
+                LTRIM(RTRIM(CAST(dp.ID AS NVARCHAR(50)))),
+                ?,
+                LTRIM(RTRIM(ISNULL(CAST(dp.nit_emisor_o_nit_del_proveedor AS NVARCHAR(MAX)), ''))),
+                LTRIM(RTRIM(ISNULL(CAST(dp.nombre_emisor AS NVARCHAR(MAX)), ''))),
+                LTRIM(RTRIM(ISNULL(CAST(dp.numero_de_liquidacion_u_orden_de_compra AS NVARCHAR(MAX)), ''))),
+                LTRIM(RTRIM(ISNULL(CAST(dp.numero_de_factura AS NVARCHAR(MAX)), ''))),
+                LTRIM(RTRIM(ISNULL(CAST(dp.ResultadoFinalAntesEventos AS NVARCHAR(MAX)), ''))),
+                LTRIM(RTRIM(ISNULL(CAST(dp.ObservacionesFase_4 AS NVARCHAR(MAX)), ''))),
+                ?,
+                GETDATE()
+            FROM [CxP].[DocumentsProcessing] dp WITH (NOLOCK)
+            WHERE dp.documenttype = 'FV'
+              AND dp.ResultadoFinalAntesEventos LIKE '%CON NOVEDAD%';
+            
+            SELECT @@ROWCOUNT AS Insertados;
             
-            query_reporte = """
             SELECT 
                 ID,
                 Fecha_Carga,
@@ -501,12 +528,43 @@ def GenerarReporte_Retorno():
                 Estado_CXP_Bot,
                 Observaciones
             FROM [CxP].[ReporteNovedades] WITH (NOLOCK)
-            ORDER BY Fecha_Insercion DESC, RowID DESC
+            ORDER BY Fecha_Insercion DESC, RowID DESC;
+            
+            SET NOCOUNT OFF;
             """
             
-            df_reporte = pd.read_sql(query_reporte, cx)
+            sp_origen = 'GenerarReporte_Retorno'
+            cur = cx.cursor()
+            
+            try:
+                cur.execute(lote_reporte, (fecha_carga, sp_origen))
+                
+                registros_insertados = int(cur.fetchone()[0] or 0)
+                registros_consultados = registros_insertados
+                
+                cur.nextset()
+                columnas_reporte = [c[0] for c in cur.description]
+                df_reporte = pd.DataFrame.from_records(cur.fetchall(), columns=columnas_reporte)
+                
+                cx.commit()
+                cur.close()
+            except Exception as e_lote:
+                # Un registro invalido hace fallar todo el INSERT ... SELECT: se revierte
+                # y se reintenta fila por fila omitiendo solo los registros que fallan
+                cur.close()
+                cx.rollback()
+                print("[WARNING] INSERT ... SELECT fallido, reintentando fila por fila: " + str(e_lote))
+                registros_consultados, registros_insertados = insertar_novedades_por_fila(cx, fecha_carga, sp_origen)
+                df_reporte = leer_reporte_novedades(cx)
+            
+            stats['total_registros_consultados'] = registros_consultados
+            stats['registros_insertados'] = registros_insertados
             stats['total_registros_tabla'] = len(df_reporte)
             
+            if registros_insertados == 0:
+                print("[INFO] No hay registros CON NOVEDAD para insertar")
+            
+            print("[DEBUG] Total registros insertados: " + str(registros_insertados))
             print("[DEBUG] Total registros en tabla ReporteNovedades: " + str(len(df_reporte)))
             
             if df_reporte.empty:
@@ -554,9 +612,9 @@ def GenerarReporte_Retorno():
                 'Orden_de_compra', 'Numero_factura', 'Estado_CXP_Bot', 'Observaciones'
             ]
             
-            # Convertir valores a string para evitar problemas
+            # Convertir valores a string para evitar problemas (columnas NVARCHAR)
             for col in df_reporte.columns:
-                df_reporte[col] = df_reporte[col].apply(safe_str)
+                df_reporte[col] = df_reporte[col].fillna("").astype(str).str.strip()
             
             print("[DEBUG] Registros a exportar: " + str(len(df_reporte)))
             
@@ -314,6 +314,7 @@ def ZPAF_ValidarActivosFijos():
     import ast
     import traceback
     import pyodbc
+    import sys
     import pandas as pd
     import numpy as np
     from datetime import datetime
@@ -532,7 +533,10 @@ def ZPAF_ValidarActivosFijos():
             -123.45
 
         Note:
-            El procesamiento para strings es:
+            Si el parser de montos compartido esta registrado
+            (HU4.1/parser_montos.py) se usa su normalizar_decimal, que ademas
+            resuelve '.' y ',' mezclados ("1.234,56", "$1,000.00"). Si no,
+            el procesamiento local para strings es:
             1. Eliminar espacios extremos.
             2. Reemplazar comas por puntos (estandarizacion).
             3. Eliminar caracteres no numericos (excepto punto y signo negativo).
@@ -543,6 +547,9 @@ def ZPAF_ValidarActivosFijos():
             el resultado puede ser inesperado. Se recomienda preprocesar
             estos casos externamente si son comunes en los datos de origen.
         """
+        parser = getattr(sys, "_cxp_parser_montos", None)
+        if parser is not None:
+            return parser.normalizar_decimal(valor)
         if pd.isna(valor) or valor == '' or valor is None:
             return 0.0
         if isinstance(valor, (int, float)):
@@ -669,7 +676,8 @@ def ZPAF_ValidarActivosFijos():
         # Fase 1: Intentar Autenticacion SQL
         for attempt in range(max_retries):
             try:
-                cx = pyodbc.connect(conn_str_auth, timeout=30)
+                pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                cx = pool_sql.conectar(conn_str_auth, timeout=30) if pool_sql else pyodbc.connect(conn_str_auth, timeout=30)
                 cx.autocommit = False
                 conectado = True
                 break
@@ -682,7 +690,8 @@ def ZPAF_ValidarActivosFijos():
         if not conectado:
             for attempt in range(max_retries):
                 try:
-                    cx = pyodbc.connect(conn_str_trusted, timeout=30)
+                    pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                    cx = pool_sql.conectar(conn_str_trusted, timeout=30) if pool_sql else pyodbc.connect(conn_str_trusted, timeout=30)
                     cx.autocommit = False
                     conectado = True
                     break
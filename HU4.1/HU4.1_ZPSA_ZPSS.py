@@ -352,6 +352,7 @@ def ZPSA_ZPSS_ValidarServicios():
     import ast
     import traceback
     import pyodbc
+    import sys
     import pandas as pd
     import numpy as np
     from datetime import datetime
@@ -476,6 +477,8 @@ def ZPSA_ZPSS_ValidarServicios():
 
         Soporta formatos con coma decimal (1.000,50) o punto decimal (1000.50).
         Elimina caracteres no numericos excepto el signo menos y el separador decimal.
+        Usa el parser de montos compartido (HU4.1/parser_montos.py) si esta
+        registrado; si no, la conversion local.
 
         Args:
             valor (str | float | int | None): El valor a normalizar.
@@ -491,6 +494,9 @@ def ZPSA_ZPSS_ValidarServicios():
             >>> normalizar_decimal("$1,000.00")
             1000.0
         """
+        parser = getattr(sys, "_cxp_parser_montos", None)
+        if parser is not None:
+            return parser.normalizar_decimal(valor)
         if pd.isna(valor) or valor == '' or valor is None: return 0.0
         if isinstance(valor, (int, float)):
             if np.isnan(valor) if isinstance(valor, float) else False: return 0.0
@@ -566,7 +572,8 @@ def ZPSA_ZPSS_ValidarServicios():
         # Fase 1: Autenticacion SQL
         for attempt in range(max_retries):
             try:
-                cx = pyodbc.connect(conn_str_auth, timeout=30)
+                pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                cx = pool_sql.conectar(conn_str_auth, timeout=30) if pool_sql else pyodbc.connect(conn_str_auth, timeout=30)
                 cx.autocommit = False
                 conectado = True
                 break
@@ -578,7 +585,8 @@ def ZPSA_ZPSS_ValidarServicios():
         if not conectado:
             for attempt in range(max_retries):
                 try:
-                    cx = pyodbc.connect(conn_str_trusted, timeout=30)
+                    pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                    cx = pool_sql.conectar(conn_str_trusted, timeout=30) if pool_sql else pyodbc.connect(conn_str_trusted, timeout=30)
                     cx.autocommit = False
                     conectado = True
                     break
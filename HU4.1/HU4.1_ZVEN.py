@@ -309,6 +309,7 @@ def ZVEN_ValidarComercializados():
     import ast
     import traceback
     import pyodbc
+    import sys
     import pandas as pd
     import numpy as np
     from datetime import datetime
@@ -462,7 +463,10 @@ def ZVEN_ValidarComercializados():
             -123.45
 
         Note:
-            El orden de procesamiento para strings es:
+            Si el parser de montos compartido esta registrado
+            (HU4.1/parser_montos.py) se usa su normalizar_decimal, que ademas
+            resuelve '.' y ',' mezclados. Si no, el orden de procesamiento
+            local para strings es:
             1. Strip de espacios
             2. Reemplazo de comas por puntos
             3. Eliminacion de caracteres no numericos (excepto ., -)
@@ -473,6 +477,9 @@ def ZVEN_ValidarComercializados():
             (ej: "1.234.567,89" → "1.234.567.89"), el resultado puede ser
             inesperado. Se recomienda preprocesar estos casos externamente.
         """
+        parser = getattr(sys, "_cxp_parser_montos", None)
+        if parser is not None:
+            return parser.normalizar_decimal(valor)
         if pd.isna(valor) or valor == '' or valor is None: 
             return 0.0
         if isinstance(valor, (int, float)):
@@ -823,7 +830,8 @@ def ZVEN_ValidarComercializados():
         for conn_str in [conn_str_auth, conn_str_trusted]:
             for attempt in range(max_retries):
                 try:
-                    cx = pyodbc.connect(conn_str, timeout=30)
+                    pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                    cx = pool_sql.conectar(conn_str, timeout=30) if pool_sql else pyodbc.connect(conn_str, timeout=30)
                     cx.autocommit = False
                     conectado = True
                     break 
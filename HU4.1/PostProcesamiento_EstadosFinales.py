@@ -107,6 +107,8 @@ VARIABLES DE SALIDA (RocketBot)
         - aprobado_contado
         - aprobado
         - errores
+        - filas_actualizadas (por tabla destino)
+        - historico_ordenes (posiciones, filas_actualizadas, posiciones_sin_coincidencia)
 
 ================================================================================
 TABLAS ACTUALIZADAS
@@ -147,6 +149,8 @@ NOTAS TECNICAS
     - Solo procesa registros que pasaron validaciones previas
     - Clase 31 tiene tratamiento especial (sin contabilizacion)
     - Actualiza multiples posiciones de HOC por registro
+    - Las reglas se calculan como columnas sobre el frame combinado y se aplican
+      con un UPDATE ... JOIN por tabla destino (#EstadosFinales, #PosicionesHistorico)
 
 ================================================================================
 """
@@ -155,7 +159,9 @@ def PostProcesamiento_EstadosFinales():
     import json
     import ast
     import traceback
+    import re
     import pyodbc
+    import sys
     import pandas as pd
     import numpy as np
     from datetime import datetime
@@ -238,7 +244,8 @@ def PostProcesamiento_EstadosFinales():
         cx = None
         for attempt in range(max_retries):
             try:
-                cx = pyodbc.connect(conn_str, timeout=30)
+                pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                cx = pool_sql.conectar(conn_str, timeout=30) if pool_sql else pyodbc.connect(conn_str, timeout=30)
                 cx.autocommit = False
                 print("[DEBUG] Conexion SQL abierta (intento " + str(attempt + 1) + ")")
                 break
@@ -272,13 +279,257 @@ def PostProcesamiento_EstadosFinales():
         valores = str(valor_str).split('|')
         return [v.strip() for v in valores if v.strip()]
     
-    def contiene_valor(campo, valores_buscados):
-        """Verificar si campo contiene alguno de los valores buscados"""
-        valores = split_valores(campo)
-        for v in valores_buscados:
-            if v in valores:
-                return True
-        return False
+    def contiene_valor_vectorizado(serie, valores_buscados):
+        """Verificar por fila si algun valor separado por | coincide con los valores buscados"""
+        patron = r'(?:^|\|)\s*(?:' + '|'.join(re.escape(v) for v in valores_buscados) + r')\s*(?:\||$)'
+        texto = serie.where(serie.notna(), '').astype(str)
+        return texto.str.contains(patron, regex=True).fillna(False).astype(bool)
+    
+    # Casos de estado final
+    CASO_NOVEDAD_CLASE31 = 'CON_NOVEDAD_CLASE31'
+    CASO_SIN_CAMBIO = 'CON_NOVEDAD_SIN_CAMBIO'
+    CASO_SIN_CONTABILIZACION = 'APROBADO_SIN_CONTABILIZACION'
+    CASO_CONTADO = 'APROBADO_CONTADO'
+    CASO_CREDITO = 'APROBADO'
+    
+    ESTADO_FASE_4_EXITOSO = 'VALIDACION DATOS DE FACTURACION: Exitoso'
+    OBS_CLASE31 = "Factura corresponde a Clase de impuesto 31 (ZOMAC-ZESE)"
+    OBS_CONTADO = "Factura cuenta con forma de pago de contado"
+    
+    def calcular_estados_finales(df_merged):
+        """
+        Calcular sobre el frame combinado las columnas de estado final:
+            - Caso: regla aplicada (ver constantes CASO_*)
+            - NuevoResultado: ResultadoFinalAntesEventos a escribir
+            - ObservacionFinal: observacion antepuesta a ObservacionesFase_4 (None si no cambia)
+            - EstadoFinalFase_4: 'VALIDACION DATOS DE FACTURACION: Exitoso'
+        Las reglas son las mismas del flujo por registro:
+            CON NOVEDAD + Clase 31  -> resultado + ' EXCLUIDOS CONTABILIZACION'
+            CON NOVEDAD sin 31      -> no se procesa
+            Sin novedad + Clase 31  -> APROBADO SIN CONTABILIZACION
+            Sin novedad, pago 1/01  -> APROBADO CONTADO
+            Sin novedad, otro pago  -> APROBADO
+        """
+        df = df_merged.copy()
+        
+        df['nit'] = df['nit_emisor_o_nit_del_proveedor_dp'].map(safe_str)
+        df['factura'] = df['numero_de_factura_dp'].map(safe_str)
+        df['oc'] = df['numero_de_liquidacion_u_orden_de_compra_dp'].map(safe_str)
+        
+        resultado_actual = df['ResultadoFinalAntesEventos'].map(safe_str)
+        obs_actual = df['ObservacionesFase_4'].map(safe_str)
+        forma_pago = df['forma_de_pago'].map(safe_str)
+        
+        tiene_clase31 = contiene_valor_vectorizado(df['ClaseDeImpuesto_hoc'], ['31']).to_numpy()
+        tiene_con_novedad = resultado_actual.str.upper().str.contains("CON NOVEDAD", regex=False).to_numpy()
+        es_contado = forma_pago.isin(['1', '01']).to_numpy()
+        
+        df['Caso'] = np.select(
+            [
+                tiene_con_novedad & tiene_clase31,
+                tiene_con_novedad,
+                tiene_clase31,
+                es_contado
+            ],
+            [CASO_NOVEDAD_CLASE31, CASO_SIN_CAMBIO, CASO_SIN_CONTABILIZACION, CASO_CONTADO],
+            default=CASO_CREDITO
+        )
+        caso = df['Caso'].to_numpy()
+        
+        ya_excluido = resultado_actual.str.contains("EXCLUIDOS CONTABILIZACION", regex=False).to_numpy()
+        resultado_excluido = np.where(
+            ya_excluido, resultado_actual.to_numpy(), (resultado_actual + " EXCLUIDOS CONTABILIZACION").to_numpy()
+        )
+        df['NuevoResultado'] = np.select(
+            [
+                caso == CASO_NOVEDAD_CLASE31,
+                caso == CASO_SIN_CONTABILIZACION,
+                caso == CASO_CONTADO,
+                caso == CASO_CREDITO
+            ],
+            [resultado_excluido, "APROBADO SIN CONTABILIZACION", "APROBADO CONTADO", "APROBADO"],
+            default=resultado_actual.to_numpy()
+        )
+        
+        # Observacion antepuesta (PREPEND) sobre la observacion leida de DocumentsProcessing
+        nueva_obs = pd.Series(
+            np.select(
+                [np.isin(caso, [CASO_NOVEDAD_CLASE31, CASO_SIN_CONTABILIZACION]), caso == CASO_CONTADO],
+                [OBS_CLASE31, OBS_CONTADO],
+                default=""
+            ),
+            index=df.index
+        )
+        obs_final = nueva_obs.where(obs_actual == "", nueva_obs + ", " + obs_actual)
+        df['ObservacionFinal'] = obs_final.where(nueva_obs != "", None)
+        
+        df['EstadoFinalFase_4'] = ESTADO_FASE_4_EXITOSO
+        return df
+    
+    def aplicar_estados_finales_bulk(cx, df_estados):
+        """
+        Aplicar en bloque los estados finales calculados a DocumentsProcessing y CxP.Comparativa.
+        Carga una fila por (nit, factura, oc) en la tabla temporal #EstadosFinales y aplica
+        un UPDATE ... JOIN por tabla destino. Si hay llaves repetidas gana la ultima fila,
+        igual que en el flujo por registro.
+        Retorna dict con las filas afectadas por tabla.
+        """
+        resultado = {'documents_processing': 0, 'comparativa_estado': 0}
+        if df_estados.empty:
+            print("[UPDATE] Estados finales: sin registros para actualizar")
+            return resultado
+        
+        df_llaves = df_estados.drop_duplicates(subset=['nit', 'factura', 'oc'], keep='last')
+        filas = [
+            (nit, factura, oc, estado_fase, obs if isinstance(obs, str) else None, nuevo_resultado)
+            for nit, factura, oc, estado_fase, obs, nuevo_resultado in zip(
+                df_llaves['nit'], df_llaves['factura'], df_llaves['oc'],
+                df_llaves['EstadoFinalFase_4'], df_llaves['ObservacionFinal'], df_llaves['NuevoResultado']
+            )
+        ]
+        
+        cur = cx.cursor()
+        try:
+            cur.execute("""
+            IF OBJECT_ID('tempdb..#EstadosFinales') IS NOT NULL DROP TABLE #EstadosFinales;
+            CREATE TABLE #EstadosFinales (
+                Orden INT IDENTITY(1,1),
+                nit NVARCHAR(100),
+                factura NVARCHAR(200),
+                oc NVARCHAR(4000),
+                EstadoFinalFase_4 NVARCHAR(200),
+                ObservacionFinal NVARCHAR(MAX) NULL,
+                NuevoResultado NVARCHAR(400)
+            );
+            """)
+            cur.fast_executemany = True
+            cur.executemany(
+                "INSERT INTO #EstadosFinales (nit, factura, oc, EstadoFinalFase_4, ObservacionFinal, NuevoResultado) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                filas
+            )
+            
+            cur.execute("""
+            UPDATE dp
+            SET EstadoFinalFase_4 = e.EstadoFinalFase_4,
+                ObservacionesFase_4 = COALESCE(e.ObservacionFinal, dp.ObservacionesFase_4),
+                ResultadoFinalAntesEventos = e.NuevoResultado
+            FROM [CxP].[DocumentsProcessing] dp
+            INNER JOIN #EstadosFinales e
+                ON dp.nit_emisor_o_nit_del_proveedor = e.nit
+               AND dp.numero_de_factura = e.factura
+               AND dp.numero_de_liquidacion_u_orden_de_compra = e.oc
+            """)
+            resultado['documents_processing'] = cur.rowcount
+            
+            # Comparativa se actualiza por (NIT, Factura): gana la ultima fila cargada
+            cur.execute("""
+            UPDATE c
+            SET Estado_validacion_antes_de_eventos = e.NuevoResultado
+            FROM [dbo].[CxP.Comparativa] c
+            INNER JOIN (
+                SELECT nit, factura, NuevoResultado,
+                       ROW_NUMBER() OVER (PARTITION BY nit, factura ORDER BY Orden DESC) AS rn
+                FROM #EstadosFinales
+            ) e ON c.NIT = e.nit AND c.Factura = e.factura AND e.rn = 1
+            """)
+            resultado['comparativa_estado'] = cur.rowcount
+            
+            cur.execute("DROP TABLE #EstadosFinales")
+            cx.commit()
+        except Exception:
+            cx.rollback()
+            raise
+        finally:
+            cur.close()
+        
+        print("[UPDATE] Estados finales: DocumentsProcessing=" + str(resultado['documents_processing']) +
+              " Comparativa(Estado)=" + str(resultado['comparativa_estado']) +
+              " (" + str(len(filas)) + " llaves)")
+        return resultado
+    
+    def registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list):
+        """Acumular posiciones de HistoricoOrdenesCompra a marcar como PROCESADO al final de la ejecucion"""
+        max_len = max(len(doccompra_list), len(nitcedula_list), len(porcalcular_list), len(textobreve_list))
+        
+        for i in range(max_len):
+            doccompra = doccompra_list[i] if i < len(doccompra_list) else ""
+            nitcedula = nitcedula_list[i] if i < len(nitcedula_list) else ""
+            porcalcular = porcalcular_list[i] if i < len(porcalcular_list) else ""
+            textobreve = textobreve_list[i] if i < len(textobreve_list) else ""
+            
+            if doccompra and nitcedula:
+                posiciones_historico.add((doccompra, nitcedula, porcalcular, textobreve))
+    
+    def actualizar_historico_ordenes(cx, posiciones_historico):
+        """
+        Marcar como PROCESADO en HistoricoOrdenesCompra todas las posiciones de la ejecucion.
+        Carga las llaves (DocCompra, NitCedula, PorCalcular, TextoBreve) en la tabla
+        temporal #PosicionesHistorico y aplica un solo UPDATE ... JOIN.
+        Retorna dict con posiciones enviadas, filas actualizadas y posiciones sin coincidencia.
+        """
+        resultado = {'posiciones': len(posiciones_historico), 'filas_actualizadas': 0, 'posiciones_sin_coincidencia': 0}
+        if not posiciones_historico:
+            print("[UPDATE] HistoricoOrdenesCompra: sin posiciones para marcar")
+            return resultado
+        
+        cur = cx.cursor()
+        try:
+            cur.execute("""
+            IF OBJECT_ID('tempdb..#PosicionesHistorico') IS NOT NULL DROP TABLE #PosicionesHistorico;
+            CREATE TABLE #PosicionesHistorico (
+                DocCompra NVARCHAR(200),
+                NitCedula NVARCHAR(200),
+                PorCalcular NVARCHAR(200),
+                TextoBreve NVARCHAR(500)
+            );
+            """)
+            cur.fast_executemany = True
+            cur.executemany(
+                "INSERT INTO #PosicionesHistorico (DocCompra, NitCedula, PorCalcular, TextoBreve) VALUES (?, ?, ?, ?)",
+                sorted(posiciones_historico)
+            )
+            
+            cur.execute("""
+            UPDATE h
+            SET Marca = 'PROCESADO'
+            FROM [CxP].[HistoricoOrdenesCompra] h
+            INNER JOIN #PosicionesHistorico p
+                ON h.DocCompra = p.DocCompra
+               AND h.NitCedula = p.NitCedula
+               AND h.PorCalcular = p.PorCalcular
+               AND h.TextoBreve = p.TextoBreve
+            """)
+            resultado['filas_actualizadas'] = cur.rowcount
+            
+            cur.execute("""
+            SELECT COUNT(*)
+            FROM #PosicionesHistorico p
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM [CxP].[HistoricoOrdenesCompra] h
+                WHERE h.DocCompra = p.DocCompra
+                  AND h.NitCedula = p.NitCedula
+                  AND h.PorCalcular = p.PorCalcular
+                  AND h.TextoBreve = p.TextoBreve
+            )
+            """)
+            resultado['posiciones_sin_coincidencia'] = cur.fetchone()[0]
+            
+            cur.execute("DROP TABLE #PosicionesHistorico")
+            cx.commit()
+        except Exception:
+            cx.rollback()
+            raise
+        finally:
+            cur.close()
+        
+        print("[UPDATE] HistoricoOrdenesCompra: " + str(resultado['filas_actualizadas']) +
+              " registros marcados como PROCESADO (" + str(resultado['posiciones']) + " posiciones)")
+        if resultado['posiciones_sin_coincidencia']:
+            print("[WARNING] HistoricoOrdenesCompra: " + str(resultado['posiciones_sin_coincidencia']) +
+                  " posiciones sin registro coincidente")
+        return resultado
     
     # ========================================================================
     # INICIO DE PROCESO
@@ -342,9 +593,7 @@ def PostProcesamiento_EstadosFinales():
             
             # Aplicar filtro de ClaseDePedido
             print("[DEBUG] Aplicando filtro de ClaseDePedido: " + str(clases_pedido_filtro))
-            mask_clase = df_candidatos['ClaseDePedido_hoc'].apply(
-                lambda x: contiene_valor(x, clases_pedido_filtro) if pd.notna(x) else False
-            )
+            mask_clase = contiene_valor_vectorizado(df_candidatos['ClaseDePedido_hoc'], clases_pedido_filtro)
             
             df_candidatos_filtrado = df_candidatos[mask_clase].copy()
             print("[DEBUG] Registros despues de filtro: " + str(len(df_candidatos_filtrado)))
@@ -404,281 +653,52 @@ def PostProcesamiento_EstadosFinales():
             stats['total_registros'] = len(df_merged)
             
             # ================================================================
-            # PASO 4: Procesar cada registro
+            # PASO 4: Calcular estados finales (vectorizado)
             # ================================================================
             
             print("")
-            print("[PASO 4] Procesando post-validaciones...")
+            print("[PASO 4] Calculando estados finales sobre el frame combinado...")
             
-            for idx, row in df_merged.iterrows():
-                try:
-                    print("")
-                    print("[REGISTRO " + str(idx + 1) + "/" + str(len(df_merged)) + "]")
-                    
-                    nit = safe_str(row['nit_emisor_o_nit_del_proveedor_dp'])
-                    factura = safe_str(row['numero_de_factura_dp'])
-                    oc = safe_str(row['numero_de_liquidacion_u_orden_de_compra_dp'])
-                    
-                    resultado_actual = safe_str(row['ResultadoFinalAntesEventos'])
-                    forma_pago = safe_str(row['forma_de_pago'])
-                    clase_impuesto_completo = safe_str(row['ClaseDeImpuesto_hoc'])
-                    obs_actual = safe_str(row['ObservacionesFase_4'])
-                    
-                    print("[DEBUG] NIT: " + nit)
-                    print("[DEBUG] Factura: " + factura)
-                    print("[DEBUG] OC: " + oc)
-                    print("[DEBUG] ResultadoFinalAntesEventos: '" + resultado_actual + "'")
-                    print("[DEBUG] forma_de_pago: '" + forma_pago + "'")
-                    print("[DEBUG] ClaseDeImpuesto_hoc: '" + clase_impuesto_completo + "'")
-                    
-                    # CORRECCION: Verificar si ClaseDeImpuesto_hoc contiene '31'
-                    tiene_clase31 = contiene_valor(clase_impuesto_completo, ['31'])
-                    print("[DEBUG] Contiene Clase 31: " + str(tiene_clase31))
-                    
-                    tiene_con_novedad = "CON NOVEDAD" in resultado_actual.upper()
-                    
-                    # ====================================================
-                    # CASO 1: TIENE CON NOVEDAD
-                    # ====================================================
-                    
-                    if tiene_con_novedad:
-                        print("[VALIDACION] Registro con CON NOVEDAD")
-                        
-                        if tiene_clase31:
-                            print("[ACCION] ClaseDeImpuesto contiene 31 (ZOMAC-ZESE)")
-                            stats['con_novedad_clase31'] += 1
-                            
-                            # Actualizar ResultadoFinalAntesEventos
-                            # Agregar "EXCLUIDOS CONTABILIZACION" al final
-                            nuevo_resultado = resultado_actual
-                            if "EXCLUIDOS CONTABILIZACION" not in nuevo_resultado:
-                                nuevo_resultado = resultado_actual + " EXCLUIDOS CONTABILIZACION"
-                            
-                            # Actualizar observaciones (PREPEND)
-                            nueva_obs = "Factura corresponde a Clase de impuesto 31 (ZOMAC-ZESE)"
-                            if obs_actual:
-                                obs_final = nueva_obs + ", " + obs_actual
-                            else:
-                                obs_final = nueva_obs
-                            
-                            # Actualizar DocumentsProcessing
-                            cur = cx.cursor()
-                            
-                            update_dp = """
-                            UPDATE [CxP].[DocumentsProcessing]
-                            SET EstadoFinalFase_4 = 'VALIDACION DATOS DE FACTURACION: Exitoso',
-                                ObservacionesFase_4 = ?,
-                                ResultadoFinalAntesEventos = ?
-                            WHERE nit_emisor_o_nit_del_proveedor = ?
-                              AND numero_de_factura = ?
-                              AND numero_de_liquidacion_u_orden_de_compra = ?
-                            """
-                            cur.execute(update_dp, (obs_final, nuevo_resultado, nit, factura, oc))
-                            print("[UPDATE] DocumentsProcessing actualizado")
-                            
-                            # Actualizar Comparativa - ESTADO en todas las filas
-                            update_comparativa = """
-                            UPDATE [dbo].[CxP.Comparativa]
-                            SET Estado_validacion_antes_de_eventos = ?
-                            WHERE NIT = ?
-                              AND Factura = ?
-                            """
-                            cur.execute(update_comparativa, (nuevo_resultado, nit, factura))
-                            print("[UPDATE] Comparativa actualizada (ESTADO)")
-                            cx.commit()
-                            cur.close()
-                        
-                        else:
-                            print("[INFO] ClaseDeImpuesto NO contiene 31, no se procesa")
-                    
-                    # ====================================================
-                    # CASO 2: NO TIENE CON NOVEDAD (APROBADO o vacio)
-                    # ====================================================
-                    
-                    else:
-                        print("[VALIDACION] Registro SIN CON NOVEDAD")
-                        
-                        # SUBCASO 2.1: ClaseDeImpuesto contiene 31
-                        if tiene_clase31:
-                            print("[ACCION] ClaseDeImpuesto contiene 31 (ZOMAC-ZESE)")
-                            stats['aprobado_sin_contab'] += 1
-                            
-                            nuevo_resultado = "APROBADO SIN CONTABILIZACION"
-                            
-                            # Actualizar observaciones (PREPEND)
-                            nueva_obs = "Factura corresponde a Clase de impuesto 31 (ZOMAC-ZESE)"
-                            if obs_actual:
-                                obs_final = nueva_obs + ", " + obs_actual
-                            else:
-                                obs_final = nueva_obs
-                            
-                            # Actualizar DocumentsProcessing
-                            cur = cx.cursor()
-                            
-                            update_dp = """
-                            UPDATE [CxP].[DocumentsProcessing]
-                            SET EstadoFinalFase_4 = 'VALIDACION DATOS DE FACTURACION: Exitoso',
-                                ObservacionesFase_4 = ?,
-                                ResultadoFinalAntesEventos = ?
-                            WHERE nit_emisor_o_nit_del_proveedor = ?
-                              AND numero_de_factura = ?
-                              AND numero_de_liquidacion_u_orden_de_compra = ?
-                            """
-                            cur.execute(update_dp, (obs_final, nuevo_resultado, nit, factura, oc))
-                            print("[UPDATE] DocumentsProcessing actualizado")
-                            
-                            # Actualizar Comparativa
-                            update_comparativa = """
-                            UPDATE [dbo].[CxP.Comparativa]
-                            SET Estado_validacion_antes_de_eventos = ?
-                            WHERE NIT = ?
-                              AND Factura = ?
-                            """
-                            cur.execute(update_comparativa, (nuevo_resultado, nit, factura))
-                            print("[UPDATE] Comparativa actualizada (ESTADO)")
-                            cx.commit()
-                            cur.close()
-                        
-                        # SUBCASO 2.2: ClaseDeImpuesto NO contiene 31
-                        else:
-                            print("[VALIDACION] ClaseDeImpuesto NO contiene 31")
-                            
-                            # SUBCASO 2.2.1: forma_de_pago = "1" o "01"
-                            if forma_pago in ['1', '01']:
-                                print("[ACCION] forma_de_pago = " + forma_pago + " (CONTADO)")
-                                stats['aprobado_contado'] += 1
-                                
-                                nuevo_resultado = "APROBADO CONTADO"
-                                
-                                # Actualizar observaciones (PREPEND)
-                                nueva_obs = "Factura cuenta con forma de pago de contado"
-                                if obs_actual:
-                                    obs_final = nueva_obs + ", " + obs_actual
-                                else:
-                                    obs_final = nueva_obs
-                                
-                                # Actualizar DocumentsProcessing
-                                cur = cx.cursor()
-                                
-                                update_dp = """
-                                UPDATE [CxP].[DocumentsProcessing]
-                                SET EstadoFinalFase_4 = 'VALIDACION DATOS DE FACTURACION: Exitoso',
-                                    ObservacionesFase_4 = ?,
-                                    ResultadoFinalAntesEventos = ?
-                                WHERE nit_emisor_o_nit_del_proveedor = ?
-                                  AND numero_de_factura = ?
-                                  AND numero_de_liquidacion_u_orden_de_compra = ?
-                                """
-                                cur.execute(update_dp, (obs_final, nuevo_resultado, nit, factura, oc))
-                                print("[UPDATE] DocumentsProcessing actualizado")
-                                
-                                # Actualizar Comparativa
-                                update_comparativa = """
-                                UPDATE [dbo].[CxP.Comparativa]
-                                SET Estado_validacion_antes_de_eventos = ?
-                                WHERE NIT = ?
-                                  AND Factura = ?
-                                """
-                                cur.execute(update_comparativa, (nuevo_resultado, nit, factura))
-                                print("[UPDATE] Comparativa actualizada (ESTADO)")
-                                
-                                # Actualizar HistoricoOrdenesCompra (solo columna Marca)
-                                doccompra_list = split_valores(row['DocCompra_hoc'])
-                                nitcedula_list = split_valores(row['NitCedula_hoc'])
-                                porcalcular_list = split_valores(row['PorCalcular_hoc'])
-                                textobreve_list = split_valores(row['TextoBreve_hoc'])
-                                
-                                num_actualizados = 0
-                                max_len = max(len(doccompra_list), len(nitcedula_list), len(porcalcular_list), len(textobreve_list))
-                                
-                                for i in range(max_len):
-                                    doccompra = doccompra_list[i] if i < len(doccompra_list) else ""
-                                    nitcedula = nitcedula_list[i] if i < len(nitcedula_list) else ""
-                                    porcalcular = porcalcular_list[i] if i < len(porcalcular_list) else ""
-                                    textobreve = textobreve_list[i] if i < len(textobreve_list) else ""
-                                    
-                                    if doccompra and nitcedula:
-                                        update_hoc = """
-                                        UPDATE [CxP].[HistoricoOrdenesCompra]
-                                        SET Marca = 'PROCESADO'
-                                        WHERE DocCompra = ?
-                                          AND NitCedula = ?
-                                          AND PorCalcular = ?
-                                          AND TextoBreve = ?
-                                        """
-                                        cur.execute(update_hoc, (doccompra, nitcedula, porcalcular, textobreve))
-                                        num_actualizados += 1
-                                
-                                print("[UPDATE] HistoricoOrdenesCompra: " + str(num_actualizados) + " registros actualizados")
-                                cx.commit()
-                                cur.close()
-                            
-                            # SUBCASO 2.2.2: forma_de_pago != "1" ni "01"
-                            else:
-                                print("[ACCION] forma_de_pago != 1/01 (CREDITO)")
-                                stats['aprobado'] += 1
-                                
-                                nuevo_resultado = "APROBADO"
-                                
-                                # Actualizar DocumentsProcessing
-                                cur = cx.cursor()
-                                
-                                update_dp = """
-                                UPDATE [CxP].[DocumentsProcessing]
-                                SET EstadoFinalFase_4 = 'VALIDACION DATOS DE FACTURACION: Exitoso',
-                                    ResultadoFinalAntesEventos = ?
-                                WHERE nit_emisor_o_nit_del_proveedor = ?
-                                  AND numero_de_factura = ?
-                                  AND numero_de_liquidacion_u_orden_de_compra = ?
-                                """
-                                cur.execute(update_dp, (nuevo_resultado, nit, factura, oc))
-                                print("[UPDATE] DocumentsProcessing actualizado")
-                                
-                                # Actualizar Comparativa
-                                update_comparativa = """
-                                UPDATE [dbo].[CxP.Comparativa]
-                                SET Estado_validacion_antes_de_eventos = ?
-                                WHERE NIT = ?
-                                  AND Factura = ?
-                                """
-                                cur.execute(update_comparativa, (nuevo_resultado, nit, factura))
-                                print("[UPDATE] Comparativa actualizada (ESTADO)")
-                                
-                                # Actualizar HistoricoOrdenesCompra (solo columna Marca)
-                                doccompra_list = split_valores(row['DocCompra_hoc'])
-                                nitcedula_list = split_valores(row['NitCedula_hoc'])
-                                porcalcular_list = split_valores(row['PorCalcular_hoc'])
-                                textobreve_list = split_valores(row['TextoBreve_hoc'])
-                                
-                                num_actualizados = 0
-                                max_len = max(len(doccompra_list), len(nitcedula_list), len(porcalcular_list), len(textobreve_list))
-                                
-                                for i in range(max_len):
-                                    doccompra = doccompra_list[i] if i < len(doccompra_list) else ""
-                                    nitcedula = nitcedula_list[i] if i < len(nitcedula_list) else ""
-                                    porcalcular = porcalcular_list[i] if i < len(porcalcular_list) else ""
-                                    textobreve = textobreve_list[i] if i < len(textobreve_list) else ""
-                                    
-                                    if doccompra and nitcedula:
-                                        update_hoc = """
-                                        UPDATE [CxP].[HistoricoOrdenesCompra]
-                                        SET Marca = 'PROCESADO'
-                                        WHERE DocCompra = ?
-                                          AND NitCedula = ?
-                                          AND PorCalcular = ?
-                                          AND TextoBreve = ?
-                                        """
-                                        cur.execute(update_hoc, (doccompra, nitcedula, porcalcular, textobreve))
-                                        num_actualizados += 1
-                                
-                                print("[UPDATE] HistoricoOrdenesCompra: " + str(num_actualizados) + " registros actualizados")
-                                cx.commit()
-                                cur.close()
-                
-                except Exception as e_row:
-                    print("[ERROR] Error procesando registro " + str(idx) + ": " + str(e_row))
-                    stats['errores'] += 1
-                    continue
+            df_estados = calcular_estados_finales(df_merged)
+            
+            stats['con_novedad_clase31'] = int((df_estados['Caso'] == CASO_NOVEDAD_CLASE31).sum())
+            stats['aprobado_sin_contab'] = int((df_estados['Caso'] == CASO_SIN_CONTABILIZACION).sum())
+            stats['aprobado_contado'] = int((df_estados['Caso'] == CASO_CONTADO).sum())
+            stats['aprobado'] = int((df_estados['Caso'] == CASO_CREDITO).sum())
+            sin_cambio = int((df_estados['Caso'] == CASO_SIN_CAMBIO).sum())
+            
+            print("[DEBUG] CON NOVEDAD + Clase 31: " + str(stats['con_novedad_clase31']))
+            print("[DEBUG] APROBADO SIN CONTABILIZACION: " + str(stats['aprobado_sin_contab']))
+            print("[DEBUG] APROBADO CONTADO: " + str(stats['aprobado_contado']))
+            print("[DEBUG] APROBADO: " + str(stats['aprobado']))
+            print("[DEBUG] CON NOVEDAD sin Clase 31 (no se procesan): " + str(sin_cambio))
+            
+            # Posiciones HOC de los casos CONTADO y CREDITO
+            posiciones_historico = set()
+            df_hoc = df_estados[df_estados['Caso'].isin([CASO_CONTADO, CASO_CREDITO])]
+            for doccompra, nitcedula, porcalcular, textobreve in zip(
+                df_hoc['DocCompra_hoc'], df_hoc['NitCedula_hoc'],
+                df_hoc['PorCalcular_hoc'], df_hoc['TextoBreve_hoc']
+            ):
+                registrar_posiciones_historico(
+                    posiciones_historico,
+                    split_valores(doccompra),
+                    split_valores(nitcedula),
+                    split_valores(porcalcular),
+                    split_valores(textobreve)
+                )
+            
+            # ================================================================
+            # PASO 5: Aplicar estados finales en bloque
+            # ================================================================
+            
+            print("")
+            print("[PASO 5] Aplicando estados finales en bloque...")
+            
+            stats['filas_actualizadas'] = aplicar_estados_finales_bulk(
+                cx, df_estados[df_estados['Caso'] != CASO_SIN_CAMBIO]
+            )
+            stats['historico_ordenes'] = actualizar_historico_ordenes(cx, posiciones_historico)
             
             # ================================================================
             # FIN DE PROCESO
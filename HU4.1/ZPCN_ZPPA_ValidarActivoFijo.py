@@ -135,7 +135,11 @@ NOTAS TECNICAS
 
     - Procesa posicion por posicion (valores separados por |)
     - Crea items en Comparativa si no existen
-    - Archivo Excel se carga una sola vez al inicio
+    - Archivo Excel se carga una sola vez al inicio y se compila en un
+      indice CECO -> frozenset de indicadores permitidos
+    - CECO/IndicadorImpuestos de todas las posiciones se validan en bloque
+      antes del recorrido; tiempos en stats (tiempo_indice_ceco,
+      tiempo_validacion_ceco)
     - Cada posicion puede tener diferente camino de validacion
 
 ================================================================================
@@ -146,6 +150,7 @@ def ZPCN_ZPPA_ValidarActivoFijo():
     import ast
     import traceback
     import pyodbc
+    import sys
     import pandas as pd
     import numpy as np
     from datetime import datetime
@@ -248,7 +253,8 @@ def ZPCN_ZPPA_ValidarActivoFijo():
         cx = None
         for attempt in range(max_retries):
             try:
-                cx = pyodbc.connect(conn_str, timeout=30)
+                pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                cx = pool_sql.conectar(conn_str, timeout=30) if pool_sql else pyodbc.connect(conn_str, timeout=30)
                 cx.autocommit = False
                 print("[DEBUG] Conexion SQL abierta (intento " + str(attempt + 1) + ")")
                 break
@@ -479,11 +485,8 @@ def ZPCN_ZPPA_ValidarActivoFijo():
         cur.close()
         print("[UPDATE] DocumentsProcessing actualizado (CON NOVEDAD)")
     
-    def actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list):
-        """Actualizar HistoricoOrdenesCompra marcando como PROCESADO"""
-        cur = cx.cursor()
-        
-        num_actualizados = 0
+    def registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list):
+        """Acumular posiciones de HistoricoOrdenesCompra a marcar como PROCESADO al final de la ejecucion"""
         max_len = max(len(doccompra_list), len(nitcedula_list), len(porcalcular_list), len(textobreve_list))
         
         for i in range(max_len):
@@ -493,19 +496,77 @@ def ZPCN_ZPPA_ValidarActivoFijo():
             textobreve = textobreve_list[i] if i < len(textobreve_list) else ""
             
             if doccompra and nitcedula:
-                update_marca = """
-                UPDATE [CxP].[HistoricoOrdenesCompra]
-                SET Marca = 'PROCESADO'
-                WHERE DocCompra = ?
-                  AND NitCedula = ?
-                  AND PorCalcular = ?
-                  AND TextoBreve = ?
-                """
-                cur.execute(update_marca, (doccompra, nitcedula, porcalcular, textobreve))
-                num_actualizados += 1
-        cx.commit()
-        cur.close()
-        print("[UPDATE] HistoricoOrdenesCompra: " + str(num_actualizados) + " registros marcados como PROCESADO")
+                posiciones_historico.add((doccompra, nitcedula, porcalcular, textobreve))
+    
+    def actualizar_historico_ordenes(cx, posiciones_historico):
+        """
+        Marcar como PROCESADO en HistoricoOrdenesCompra todas las posiciones de la ejecucion.
+        Carga las llaves (DocCompra, NitCedula, PorCalcular, TextoBreve) en la tabla
+        temporal #PosicionesHistorico y aplica un solo UPDATE ... JOIN.
+        Retorna dict con posiciones enviadas, filas actualizadas y posiciones sin coincidencia.
+        """
+        resultado = {'posiciones': len(posiciones_historico), 'filas_actualizadas': 0, 'posiciones_sin_coincidencia': 0}
+        if not posiciones_historico:
+            print("[UPDATE] HistoricoOrdenesCompra: sin posiciones para marcar")
+            return resultado
+        
+        cur = cx.cursor()
+        try:
+            cur.execute("""
+            IF OBJECT_ID('tempdb..#PosicionesHistorico') IS NOT NULL DROP TABLE #PosicionesHistorico;
+            CREATE TABLE #PosicionesHistorico (
+                DocCompra NVARCHAR(200),
+                NitCedula NVARCHAR(200),
+                PorCalcular NVARCHAR(200),
+                TextoBreve NVARCHAR(500)
+            );
+            """)
+            cur.fast_executemany = True
+            cur.executemany(
+                "INSERT INTO #PosicionesHistorico (DocCompra, NitCedula, PorCalcular, TextoBreve) VALUES (?, ?, ?, ?)",
+                sorted(posiciones_historico)
+            )
+            
+            cur.execute("""
+            UPDATE h
+            SET Marca = 'PROCESADO'
+            FROM [CxP].[HistoricoOrdenesCompra] h
+            INNER JOIN #PosicionesHistorico p
+                ON h.DocCompra = p.DocCompra
+               AND h.NitCedula = p.NitCedula
+               AND h.PorCalcular = p.PorCalcular
+               AND h.TextoBreve = p.TextoBreve
+            """)
+            resultado['filas_actualizadas'] = cur.rowcount
+            
+            cur.execute("""
+            SELECT COUNT(*)
+            FROM #PosicionesHistorico p
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM [CxP].[HistoricoOrdenesCompra] h
+                WHERE h.DocCompra = p.DocCompra
+                  AND h.NitCedula = p.NitCedula
+                  AND h.PorCalcular = p.PorCalcular
+                  AND h.TextoBreve = p.TextoBreve
+            )
+            """)
+            resultado['posiciones_sin_coincidencia'] = cur.fetchone()[0]
+            
+            cur.execute("DROP TABLE #PosicionesHistorico")
+            cx.commit()
+        except Exception:
+            cx.rollback()
+            raise
+        finally:
+            cur.close()
+        
+        print("[UPDATE] HistoricoOrdenesCompra: " + str(resultado['filas_actualizadas']) +
+              " registros marcados como PROCESADO (" + str(resultado['posiciones']) + " posiciones)")
+        if resultado['posiciones_sin_coincidencia']:
+            print("[WARNING] HistoricoOrdenesCompra: " + str(resultado['posiciones_sin_coincidencia']) +
+                  " posiciones sin registro coincidente")
+        return resultado
     
     def cargar_excel_impuestos(ruta_archivo):
         """
@@ -560,43 +621,54 @@ def ZPCN_ZPPA_ValidarActivoFijo():
         except Exception as e:
             raise ValueError("ERROR CRITICO: Error al cargar Excel: " + str(e))
     
-    def buscar_indicadores_permitidos(df_excel, centro_coste):
+    def compilar_indice_ceco(df_excel):
         """
-        Buscar en Excel los indicadores permitidos para un Centro de Coste.
-        FIXED: Usa columna sin tildes
-        Retorna lista de indicadores permitidos o None si no se encuentra.
+        Compilar la hoja 'IVA CECO' en un indice CECO -> indicadores permitidos.
+        Se ejecuta una sola vez al cargar el Excel; si un CECO se repite se
+        conserva la primera fila, igual que la busqueda anterior con iloc[0].
+        Retorna (indice, orden): indice CECO -> frozenset de indicadores y
+        orden CECO -> tupla de indicadores en el orden del Excel (para mensajes).
         """
-        try:
-            # Convertir centro_coste a int para buscar
-            ceco_int = int(centro_coste) if centro_coste.isdigit() else None
-            
-            if ceco_int is None:
-                print("[EXCEL] CentroDeCoste no es numerico: '" + centro_coste + "'")
-                return None
-            
-            # Buscar en DataFrame
-            resultado = df_excel[df_excel['CECO'] == ceco_int]
-            
-            if resultado.empty:
-                print("[EXCEL] CECO " + str(ceco_int) + " NO encontrado en Excel")
-                return None
-            
-            # Extraer codigo (SIN TILDES)
-            codigo = str(resultado.iloc[0]['Codigo Ind. Iva aplicable'])
-            print("[EXCEL] CECO " + str(ceco_int) + " encontrado -> Codigo: '" + codigo + "'")
-            
-            # Separar por guion
-            if '-' in codigo:
-                indicadores = codigo.split('-')
-            else:
-                indicadores = [codigo]
-            
-            print("[EXCEL] Indicadores permitidos: " + str(indicadores))
-            return indicadores
-            
-        except Exception as e:
-            print("[ERROR] Error buscando en Excel: " + str(e))
-            return None
+        indice = {}
+        orden = {}
+        cecos = pd.to_numeric(df_excel['CECO'], errors='coerce')
+        codigos = df_excel['Codigo Ind. Iva aplicable'].map(str)
+        
+        for ceco, codigo in zip(cecos, codigos):
+            if pd.isna(ceco) or float(ceco) != int(ceco):
+                continue
+            ceco_int = int(ceco)
+            if ceco_int in indice:
+                continue
+            indicadores = tuple(codigo.split('-')) if '-' in codigo else (codigo,)
+            indice[ceco_int] = frozenset(indicadores)
+            orden[ceco_int] = indicadores
+        
+        print("[EXCEL] Indice CECO compilado: " + str(len(indice)) + " centros de coste")
+        return indice, orden
+    
+    def validar_indicadores_por_ceco(df_posiciones, indice_ceco):
+        """
+        Validar todas las posiciones contra el indice CECO en una sola pasada.
+        df_posiciones trae columnas 'CentroDeCoste' e 'IndicadorImpuestos'
+        (una fila por posicion). Retorna el DataFrame con dos columnas nuevas:
+            - CecoEnExcel: el CentroDeCoste es numerico y existe en el Excel
+            - IndicadorPermitido: el IndicadorImpuestos esta permitido para el CECO
+        """
+        df_posiciones = df_posiciones.copy()
+        centro = df_posiciones['CentroDeCoste'].astype(str)
+        ceco_num = pd.to_numeric(centro.where(centro.str.isdigit()), errors='coerce').astype('Int64')
+        
+        pares_permitidos = pd.MultiIndex.from_tuples(
+            [(ceco, ind) for ceco, inds in indice_ceco.items() for ind in inds],
+            names=['CECO', 'Indicador']
+        ) if indice_ceco else pd.MultiIndex.from_arrays([[], []], names=['CECO', 'Indicador'])
+        
+        df_posiciones['CecoEnExcel'] = ceco_num.isin(list(indice_ceco)).fillna(False).astype(bool)
+        df_posiciones['IndicadorPermitido'] = pd.MultiIndex.from_arrays(
+            [ceco_num, df_posiciones['IndicadorImpuestos'].astype(str)]
+        ).isin(pares_permitidos) & df_posiciones['CecoEnExcel'].to_numpy()
+        return df_posiciones
     
     # ========================================================================
     # INICIO DE PROCESO
@@ -613,19 +685,25 @@ def ZPCN_ZPPA_ValidarActivoFijo():
         
         ruta_excel = cfg['DocImpuestosEspeciales']
         
-        # Cargar Excel (puede generar error critico)
-        df_impuestos = cargar_excel_impuestos(ruta_excel)
-        
         stats = {
             'total_registros': 0,
             'posiciones_procesadas': 0,
             'validaciones_ok': 0,
             'validaciones_novedad': 0,
             'errores': 0,
+            'tiempo_indice_ceco': 0,
+            'tiempo_validacion_ceco': 0,
             'tiempo_total': 0
         }
         
         t_inicio = time.time()
+        posiciones_historico = set()
+        
+        # Cargar Excel (puede generar error critico) y compilar indice CECO
+        df_impuestos = cargar_excel_impuestos(ruta_excel)
+        t_indice = time.time()
+        indice_ceco, orden_indicadores_ceco = compilar_indice_ceco(df_impuestos)
+        stats['tiempo_indice_ceco'] = time.time() - t_indice
         
         with crear_conexion_db(cfg) as cx:
             
@@ -692,6 +770,36 @@ def ZPCN_ZPPA_ValidarActivoFijo():
             
             stats['total_registros'] = len(df_filtrado)
             
+            # ================================================================
+            # PASO 2.1: Validar CECO/IndicadorImpuestos de todas las posiciones
+            # ================================================================
+            
+            t_validacion = time.time()
+            filas_posiciones = []
+            for idx, ind_str, centro_str in zip(df_filtrado.index,
+                                                df_filtrado['IndicadorImpuestos_hoc'],
+                                                df_filtrado['CentroDeCoste_hoc']):
+                inds = split_valores(ind_str)
+                centros = split_valores(centro_str)
+                for pos in range(max(len(inds), len(centros))):
+                    filas_posiciones.append((
+                        idx, pos,
+                        centros[pos] if pos < len(centros) else "",
+                        inds[pos] if pos < len(inds) else ""
+                    ))
+            df_posiciones = pd.DataFrame(
+                filas_posiciones, columns=['idx', 'pos', 'CentroDeCoste', 'IndicadorImpuestos']
+            )
+            df_posiciones = validar_indicadores_por_ceco(df_posiciones, indice_ceco)
+            validacion_ceco = {
+                (i, p): (en_excel, permitido)
+                for i, p, en_excel, permitido in zip(df_posiciones['idx'], df_posiciones['pos'],
+                                                     df_posiciones['CecoEnExcel'],
+                                                     df_posiciones['IndicadorPermitido'])
+            }
+            stats['tiempo_validacion_ceco'] = time.time() - t_validacion
+            print("[DEBUG] Posiciones validadas contra indice CECO: " + str(len(df_posiciones)))
+            
             # ================================================================
             # PASO 3: Procesar cada registro - VALIDACIONES POR POSICION
             # ================================================================
@@ -790,7 +898,7 @@ def ZPCN_ZPPA_ValidarActivoFijo():
                                     actualizar_item_comparativa(cx, nit, factura, None, observacion=obs)
                                     estado = 'CON NOVEDAD - CONTADO' if forma_pago in ['1', '01'] else 'CON NOVEDAD'
                                     actualizar_item_comparativa(cx, nit, factura, None, estado=estado)
-                                    actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
+                                    registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
                                 else:
                                     print("[NOVEDAD] IndicadorImpuestos NO valido para DIFERIDO: '" + ind_imp + "'")
                                     hay_novedad = True
@@ -800,7 +908,7 @@ def ZPCN_ZPPA_ValidarActivoFijo():
                                     actualizar_item_comparativa(cx, nit, factura, None, observacion=obs)
                                     estado = 'CON NOVEDAD - CONTADO' if forma_pago in ['1', '01'] else 'CON NOVEDAD'
                                     actualizar_item_comparativa(cx, nit, factura, None, estado=estado)
-                                    actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
+                                    registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
                                 
                                 # Validacion 2: CentroDeCoste (debe estar vacio)
                                 if not centro:
@@ -815,7 +923,7 @@ def ZPCN_ZPPA_ValidarActivoFijo():
                                     actualizar_item_comparativa(cx, nit, factura, None, observacion=obs)
                                     estado = 'CON NOVEDAD - CONTADO' if forma_pago in ['1', '01'] else 'CON NOVEDAD'
                                     actualizar_item_comparativa(cx, nit, factura, None, estado=estado)
-                                    actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
+                                    registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
                                 
                                 # Validacion 3: Cuenta (debe ser 2695950020)
                                 if cuenta == '2695950020':
@@ -830,7 +938,7 @@ def ZPCN_ZPPA_ValidarActivoFijo():
                                     actualizar_item_comparativa(cx, nit, factura, None, observacion=obs)
                                     estado = 'CON NOVEDAD - CONTADO' if forma_pago in ['1', '01'] else 'CON NOVEDAD'
                                     actualizar_item_comparativa(cx, nit, factura, None, estado=estado)
-                                    actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
+                                    registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
                             
                             # ============================================
                             # CAMINO 1.2: BONOS (8000* - 9 digitos)
@@ -854,7 +962,7 @@ def ZPCN_ZPPA_ValidarActivoFijo():
                                     actualizar_item_comparativa(cx, nit, factura, None, observacion=obs)
                                     estado = 'CON NOVEDAD - CONTADO' if forma_pago in ['1', '01'] else 'CON NOVEDAD'
                                     actualizar_item_comparativa(cx, nit, factura, None, estado=estado)
-                                    actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
+                                    registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
                                 else:
                                     print("[NOVEDAD] IndicadorImpuestos NO valido para BONOS: '" + ind_imp + "'")
                                     hay_novedad = True
@@ -864,7 +972,7 @@ def ZPCN_ZPPA_ValidarActivoFijo():
                                     actualizar_item_comparativa(cx, nit, factura, None, observacion=obs)
                                     estado = 'CON NOVEDAD - CONTADO' if forma_pago in ['1', '01'] else 'CON NOVEDAD'
                                     actualizar_item_comparativa(cx, nit, factura, None, estado=estado)
-                                    actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
+                                    registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
                                 
                                 # Validacion 2: CentroDeCoste (debe estar vacio)
                                 if not centro:
@@ -879,7 +987,7 @@ def ZPCN_ZPPA_ValidarActivoFijo():
                                     actualizar_item_comparativa(cx, nit, factura, None, observacion=obs)
                                     estado = 'CON NOVEDAD - CONTADO' if forma_pago in ['1', '01'] else 'CON NOVEDAD'
                                     actualizar_item_comparativa(cx, nit, factura, None, estado=estado)
-                                    actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
+                                    registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
                                 
                                 # Validacion 3: Cuenta (debe ser 2695950020)
                                 if cuenta == '2695950020':
@@ -894,7 +1002,7 @@ def ZPCN_ZPPA_ValidarActivoFijo():
                                     actualizar_item_comparativa(cx, nit, factura, None, observacion=obs)
                                     estado = 'CON NOVEDAD - CONTADO' if forma_pago in ['1', '01'] else 'CON NOVEDAD'
                                     actualizar_item_comparativa(cx, nit, factura, None, estado=estado)
-                                    actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
+                                    registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
                         
                         # ====================================================
                         # CAMINO 2: ACTIVO FIJO VACIO (GENERALES)
@@ -916,7 +1024,7 @@ def ZPCN_ZPPA_ValidarActivoFijo():
                                 actualizar_item_comparativa(cx, nit, factura, None, observacion=obs)
                                 estado = 'CON NOVEDAD - CONTADO' if forma_pago in ['1', '01'] else 'CON NOVEDAD'
                                 actualizar_item_comparativa(cx, nit, factura, None, estado=estado)
-                                actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
+                                registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
                                 continue  # No continuar con validaciones de GENERALES
                             
                             # Validacion 2: IndicadorImpuestos
@@ -930,10 +1038,10 @@ def ZPCN_ZPPA_ValidarActivoFijo():
                                     # Marcar CentroCoste como SI inicialmente
                                     actualizar_item_comparativa(cx, nit, factura, 'CentroCoste', aprobado='SI')
                                     
-                                    # Buscar en Excel
-                                    indicadores_permitidos = buscar_indicadores_permitidos(df_impuestos, centro)
+                                    # Resultado precalculado contra el indice CECO
+                                    ceco_en_excel, ind_permitido = validacion_ceco.get((idx, pos), (False, False))
                                     
-                                    if indicadores_permitidos is None:
+                                    if not ceco_en_excel:
                                         # CentroDeCoste NO encontrado en Excel
                                         print("[NOVEDAD] CentroDeCoste NO encontrado en Excel")
                                         hay_novedad = True
@@ -944,10 +1052,12 @@ def ZPCN_ZPPA_ValidarActivoFijo():
                                         actualizar_item_comparativa(cx, nit, factura, None, observacion=obs)
                                         estado = 'CON NOVEDAD - CONTADO' if forma_pago in ['1', '01'] else 'CON NOVEDAD'
                                         actualizar_item_comparativa(cx, nit, factura, None, estado=estado)
-                                        actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
+                                        registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
                                     else:
+                                        indicadores_permitidos = orden_indicadores_ceco[int(centro)]
+                                        
                                         # Validar que IndicadorImpuestos este en lista permitida
-                                        if ind_imp in indicadores_permitidos:
+                                        if ind_permitido:
                                             print("[OK] IndicadorImpuestos '" + ind_imp + "' es valido segun Excel")
                                             actualizar_item_comparativa(cx, nit, factura, 'IndicadorImpuestos', aprobado='SI')
                                         else:
@@ -959,7 +1069,7 @@ def ZPCN_ZPPA_ValidarActivoFijo():
                                             actualizar_item_comparativa(cx, nit, factura, None, observacion=obs)
                                             estado = 'CON NOVEDAD - CONTADO' if forma_pago in ['1', '01'] else 'CON NOVEDAD'
                                             actualizar_item_comparativa(cx, nit, factura, None, estado=estado)
-                                            actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
+                                            registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
                                 
                                 else:
                                     # CentroDeCoste vacio
@@ -971,7 +1081,7 @@ def ZPCN_ZPPA_ValidarActivoFijo():
                                     actualizar_item_comparativa(cx, nit, factura, None, observacion=obs)
                                     estado = 'CON NOVEDAD - CONTADO' if forma_pago in ['1', '01'] else 'CON NOVEDAD'
                                     actualizar_item_comparativa(cx, nit, factura, None, estado=estado)
-                                    actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
+                                    registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
                             
                             else:
                                 # IndicadorImpuestos vacio
@@ -983,7 +1093,7 @@ def ZPCN_ZPPA_ValidarActivoFijo():
                                 actualizar_item_comparativa(cx, nit, factura, None, observacion=obs)
                                 estado = 'CON NOVEDAD - CONTADO' if forma_pago in ['1', '01'] else 'CON NOVEDAD'
                                 actualizar_item_comparativa(cx, nit, factura, None, estado=estado)
-                                actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
+                                registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
                     
                     # Actualizar estadisticas
                     stats['posiciones_procesadas'] += posiciones_procesadas
@@ -1001,6 +1111,9 @@ def ZPCN_ZPPA_ValidarActivoFijo():
             # FIN DE PROCESO
             # ================================================================
             
+            # Marcar en bloque las posiciones de HistoricoOrdenesCompra de toda la ejecucion
+            stats['historico_ordenes'] = actualizar_historico_ordenes(cx, posiciones_historico)
+            
             stats['tiempo_total'] = time.time() - t_inicio
             
             print("")
@@ -1013,6 +1126,8 @@ def ZPCN_ZPPA_ValidarActivoFijo():
             print("  Validaciones OK: " + str(stats['validaciones_ok']))
             print("  Validaciones con novedad: " + str(stats['validaciones_novedad']))
             print("  Errores: " + str(stats['errores']))
+            print("  Tiempo indice CECO: " + str(round(stats['tiempo_indice_ceco'], 4)) + "s")
+            print("  Tiempo validacion CECO: " + str(round(stats['tiempo_validacion_ceco'], 4)) + "s")
             print("  Tiempo total: " + str(round(stats['tiempo_total'], 2)) + "s")
             print("=" * 80)
             
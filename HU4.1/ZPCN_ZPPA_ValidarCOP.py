@@ -172,6 +172,7 @@ def ZPCN_ZPPA_ValidarCOP():
     import ast
     import traceback
     import pyodbc
+    import sys
     import pandas as pd
     import numpy as np
     from datetime import datetime
@@ -259,7 +260,8 @@ def ZPCN_ZPPA_ValidarCOP():
         cx = None
         for attempt in range(max_retries):
             try:
-                cx = pyodbc.connect(conn_str, timeout=30)
+                pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                cx = pool_sql.conectar(conn_str, timeout=30) if pool_sql else pyodbc.connect(conn_str, timeout=30)
                 cx.autocommit = False
                 print("[DEBUG] Conexion SQL abierta (intento " + str(attempt + 1) + ")")
                 break
@@ -302,15 +304,31 @@ def ZPCN_ZPPA_ValidarCOP():
             return valores[0]
         return ""
     
-    def sumar_valores(campo):
-        valores = split_valores(campo)
-        total = 0.0
-        for val in valores:
+    def sumar_valores(valor_str):
+        suma = 0.0
+        for v in split_valores(valor_str):
             try:
-                total += float(val)
+                suma += float(v)
             except:
                 pass
-        return total
+        return suma
+    
+    def sumar_montos_por_factura(serie):
+        """
+        Suma por fila los montos separados por | con el parser compartido
+        (HU4.1/parser_montos.py, registrado con registrar_parser_montos).
+        Si el parser no esta registrado se suma con sumar_valores.
+
+        Args:
+            serie (pd.Series): Columna con montos separados por |.
+
+        Returns:
+            np.ndarray: Suma float64 por fila.
+        """
+        parser = getattr(sys, "_cxp_parser_montos", None)
+        if parser is None:
+            return np.array([sumar_valores(v) for v in serie], dtype=np.float64)
+        return parser.sumar_montos_por_factura(serie)
     
     # CORRECCIÓN SQL: Obtener min_id primero, sin subconsulta
     def verificar_y_crear_item(cx, nit, factura, item_name):
@@ -384,6 +402,89 @@ def ZPCN_ZPPA_ValidarCOP():
         cur.close()
         return True
     
+    def registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list):
+        """Acumular posiciones de HistoricoOrdenesCompra a marcar como PROCESADO al final de la ejecucion"""
+        max_len = max(len(doccompra_list), len(nitcedula_list), len(porcalcular_list), len(textobreve_list))
+        
+        for i in range(max_len):
+            doccompra = doccompra_list[i] if i < len(doccompra_list) else ""
+            nitcedula = nitcedula_list[i] if i < len(nitcedula_list) else ""
+            porcalcular = porcalcular_list[i] if i < len(porcalcular_list) else ""
+            textobreve = textobreve_list[i] if i < len(textobreve_list) else ""
+            
+            if doccompra and nitcedula:
+                posiciones_historico.add((doccompra, nitcedula, porcalcular, textobreve))
+    
+    def actualizar_historico_ordenes(cx, posiciones_historico):
+        """
+        Marcar como PROCESADO en HistoricoOrdenesCompra todas las posiciones de la ejecucion.
+        Carga las llaves (DocCompra, NitCedula, PorCalcular, TextoBreve) en la tabla
+        temporal #PosicionesHistorico y aplica un solo UPDATE ... JOIN.
+        Retorna dict con posiciones enviadas, filas actualizadas y posiciones sin coincidencia.
+        """
+        resultado = {'posiciones': len(posiciones_historico), 'filas_actualizadas': 0, 'posiciones_sin_coincidencia': 0}
+        if not posiciones_historico:
+            print("[UPDATE] HistoricoOrdenesCompra: sin posiciones para marcar")
+            return resultado
+        
+        cur = cx.cursor()
+        try:
+            cur.execute("""
+            IF OBJECT_ID('tempdb..#PosicionesHistorico') IS NOT NULL DROP TABLE #PosicionesHistorico;
+            CREATE TABLE #PosicionesHistorico (
+                DocCompra NVARCHAR(200),
+                NitCedula NVARCHAR(200),
+                PorCalcular NVARCHAR(200),
+                TextoBreve NVARCHAR(500)
+            );
+            """)
+            cur.fast_executemany = True
+            cur.executemany(
+                "INSERT INTO #PosicionesHistorico (DocCompra, NitCedula, PorCalcular, TextoBreve) VALUES (?, ?, ?, ?)",
+                sorted(posiciones_historico)
+            )
+            
+            cur.execute("""
+            UPDATE h
+            SET Marca = 'PROCESADO'
+            FROM [CxP].[HistoricoOrdenesCompra] h
+            INNER JOIN #PosicionesHistorico p
+                ON h.DocCompra = p.DocCompra
+               AND h.NitCedula = p.NitCedula
+               AND h.PorCalcular = p.PorCalcular
+               AND h.TextoBreve = p.TextoBreve
+            """)
+            resultado['filas_actualizadas'] = cur.rowcount
+            
+            cur.execute("""
+            SELECT COUNT(*)
+            FROM #PosicionesHistorico p
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM [CxP].[HistoricoOrdenesCompra] h
+                WHERE h.DocCompra = p.DocCompra
+                  AND h.NitCedula = p.NitCedula
+                  AND h.PorCalcular = p.PorCalcular
+                  AND h.TextoBreve = p.TextoBreve
+            )
+            """)
+            resultado['posiciones_sin_coincidencia'] = cur.fetchone()[0]
+            
+            cur.execute("DROP TABLE #PosicionesHistorico")
+            cx.commit()
+        except Exception:
+            cx.rollback()
+            raise
+        finally:
+            cur.close()
+        
+        print("[UPDATE] HistoricoOrdenesCompra: " + str(resultado['filas_actualizadas']) +
+              " registros marcados como PROCESADO (" + str(resultado['posiciones']) + " posiciones)")
+        if resultado['posiciones_sin_coincidencia']:
+            print("[WARNING] HistoricoOrdenesCompra: " + str(resultado['posiciones_sin_coincidencia']) +
+                  " posiciones sin registro coincidente")
+        return resultado
+    
     try:
         print("[DEBUG] Obteniendo configuracion...")
         cfg = parse_config(GetVar("vLocDicConfig"))
@@ -398,6 +499,7 @@ def ZPCN_ZPPA_ValidarCOP():
         }
         
         t_inicio = time.time()
+        posiciones_historico = set()
         
         with crear_conexion_db(cfg) as cx:
             
@@ -455,6 +557,10 @@ def ZPCN_ZPPA_ValidarCOP():
             
             stats['total_registros'] = len(df_filtrado)
             
+            # Sumas por factura calculadas una sola vez para todo el lote
+            df_filtrado['_SumaPorCalcular'] = sumar_montos_por_factura(df_filtrado['PorCalcular_hoc'])
+            df_filtrado['_SumaValorCompra'] = sumar_montos_por_factura(df_filtrado['Valor de la Compra LEA_ddp'])
+            
             print("")
             print("[PASO 3] Procesando VALIDACION: Suma de valores...")
             
@@ -465,8 +571,8 @@ def ZPCN_ZPPA_ValidarCOP():
                     oc = safe_str(row['numero_de_liquidacion_u_orden_de_compra_dp'])
                     forma_pago = safe_str(row['forma_de_pago_dp'])
                     
-                    suma_porcalcular = sumar_valores(row['PorCalcular_hoc'])
-                    suma_valor_compra = sumar_valores(row['Valor de la Compra LEA_ddp'])
+                    suma_porcalcular = float(row['_SumaPorCalcular'])
+                    suma_valor_compra = float(row['_SumaValorCompra'])
                     
                     diferencia = abs(suma_porcalcular - suma_valor_compra)
                     tolerancia = 500.0
@@ -582,27 +688,13 @@ def ZPCN_ZPPA_ValidarCOP():
                         """
                         cur.execute(update_estado_todos, (estado_final, nit, factura))
                         
-                        valores_doccompra = split_valores(row['DocCompra_hoc'])
-                        valores_nitcedula = split_valores(row['NitCedula_hoc'])
-                        valores_porcalcular = split_valores(row['PorCalcular_hoc'])
-                        valores_textobreve = split_valores(row['TextoBreve_hoc'])
-                        
-                        for i in range(max(len(valores_doccompra), len(valores_nitcedula), len(valores_porcalcular), len(valores_textobreve))):
-                            doccompra_val = valores_doccompra[i] if i < len(valores_doccompra) else ""
-                            nitcedula_val = valores_nitcedula[i] if i < len(valores_nitcedula) else ""
-                            porcalcular_val = valores_porcalcular[i] if i < len(valores_porcalcular) else ""
-                            textobreve_val = valores_textobreve[i] if i < len(valores_textobreve) else ""
-                            
-                            if doccompra_val and nitcedula_val:
-                                update_marca = """
-                                UPDATE [CxP].[HistoricoOrdenesCompra]
-                                SET Marca = 'PROCESADO'
-                                WHERE DocCompra = ?
-                                  AND NitCedula = ?
-                                  AND PorCalcular = ?
-                                  AND TextoBreve = ?
-                                """
-                                cur.execute(update_marca, (doccompra_val, nitcedula_val, porcalcular_val, textobreve_val))
+                        registrar_posiciones_historico(
+                            posiciones_historico,
+                            split_valores(row['DocCompra_hoc']),
+                            split_valores(row['NitCedula_hoc']),
+                            split_valores(row['PorCalcular_hoc']),
+                            split_valores(row['TextoBreve_hoc'])
+                        )
                         cx.commit()
                         cur.close()
                     else:
@@ -613,6 +705,9 @@ def ZPCN_ZPPA_ValidarCOP():
                     stats['errores'] += 1
                     continue
             
+            # Marcar en bloque las posiciones de HistoricoOrdenesCompra de toda la ejecucion
+            stats['historico_ordenes'] = actualizar_historico_ordenes(cx, posiciones_historico)
+            
             stats['tiempo_total'] = time.time() - t_inicio
             
             msg = ("Proceso OK. Total:" + str(stats['total_registros']) + 
@@ -175,6 +175,7 @@ def ZPCN_ZPPA_ValidarEmisor():
     import ast
     import traceback
     import pyodbc
+    import sys
     import pandas as pd
     import numpy as np
     from datetime import datetime
@@ -269,7 +270,8 @@ def ZPCN_ZPPA_ValidarEmisor():
         cx = None
         for attempt in range(max_retries):
             try:
-                cx = pyodbc.connect(conn_str, timeout=30)
+                pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                cx = pool_sql.conectar(conn_str, timeout=30) if pool_sql else pyodbc.connect(conn_str, timeout=30)
                 cx.autocommit = False
                 print("[DEBUG] Conexion SQL abierta (intento " + str(attempt + 1) + ")")
                 break
@@ -473,6 +475,89 @@ def ZPCN_ZPPA_ValidarEmisor():
         
         return coincide, norm1, norm2, detalle
     
+    def registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list):
+        """Acumular posiciones de HistoricoOrdenesCompra a marcar como PROCESADO al final de la ejecucion"""
+        max_len = max(len(doccompra_list), len(nitcedula_list), len(porcalcular_list), len(textobreve_list))
+        
+        for i in range(max_len):
+            doccompra = doccompra_list[i] if i < len(doccompra_list) else ""
+            nitcedula = nitcedula_list[i] if i < len(nitcedula_list) else ""
+            porcalcular = porcalcular_list[i] if i < len(porcalcular_list) else ""
+            textobreve = textobreve_list[i] if i < len(textobreve_list) else ""
+            
+            if doccompra and nitcedula:
+                posiciones_historico.add((doccompra, nitcedula, porcalcular, textobreve))
+    
+    def actualizar_historico_ordenes(cx, posiciones_historico):
+        """
+        Marcar como PROCESADO en HistoricoOrdenesCompra todas las posiciones de la ejecucion.
+        Carga las llaves (DocCompra, NitCedula, PorCalcular, TextoBreve) en la tabla
+        temporal #PosicionesHistorico y aplica un solo UPDATE ... JOIN.
+        Retorna dict con posiciones enviadas, filas actualizadas y posiciones sin coincidencia.
+        """
+        resultado = {'posiciones': len(posiciones_historico), 'filas_actualizadas': 0, 'posiciones_sin_coincidencia': 0}
+        if not posiciones_historico:
+            print("[UPDATE] HistoricoOrdenesCompra: sin posiciones para marcar")
+            return resultado
+        
+        cur = cx.cursor()
+        try:
+            cur.execute("""
+            IF OBJECT_ID('tempdb..#PosicionesHistorico') IS NOT NULL DROP TABLE #PosicionesHistorico;
+            CREATE TABLE #PosicionesHistorico (
+                DocCompra NVARCHAR(200),
+                NitCedula NVARCHAR(200),
+                PorCalcular NVARCHAR(200),
+                TextoBreve NVARCHAR(500)
+            );
+            """)
+            cur.fast_executemany = True
+            cur.executemany(
+                "INSERT INTO #PosicionesHistorico (DocCompra, NitCedula, PorCalcular, TextoBreve) VALUES (?, ?, ?, ?)",
+                sorted(posiciones_historico)
+            )
+            
+            cur.execute("""
+            UPDATE h
+            SET Marca = 'PROCESADO'
+            FROM [CxP].[HistoricoOrdenesCompra] h
+            INNER JOIN #PosicionesHistorico p
+                ON h.DocCompra = p.DocCompra
+               AND h.NitCedula = p.NitCedula
+               AND h.PorCalcular = p.PorCalcular
+               AND h.TextoBreve = p.TextoBreve
+            """)
+            resultado['filas_actualizadas'] = cur.rowcount
+            
+            cur.execute("""
+            SELECT COUNT(*)
+            FROM #PosicionesHistorico p
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM [CxP].[HistoricoOrdenesCompra] h
+                WHERE h.DocCompra = p.DocCompra
+                  AND h.NitCedula = p.NitCedula
+                  AND h.PorCalcular = p.PorCalcular
+                  AND h.TextoBreve = p.TextoBreve
+            )
+            """)
+            resultado['posiciones_sin_coincidencia'] = cur.fetchone()[0]
+            
+            cur.execute("DROP TABLE #PosicionesHistorico")
+            cx.commit()
+        except Exception:
+            cx.rollback()
+            raise
+        finally:
+            cur.close()
+        
+        print("[UPDATE] HistoricoOrdenesCompra: " + str(resultado['filas_actualizadas']) +
+              " registros marcados como PROCESADO (" + str(resultado['posiciones']) + " posiciones)")
+        if resultado['posiciones_sin_coincidencia']:
+            print("[WARNING] HistoricoOrdenesCompra: " + str(resultado['posiciones_sin_coincidencia']) +
+                  " posiciones sin registro coincidente")
+        return resultado
+    
     # ========================================================================
     # INICIO DE PROCESO
     # ========================================================================
@@ -493,6 +578,7 @@ def ZPCN_ZPPA_ValidarEmisor():
         }
         
         t_inicio = time.time()
+        posiciones_historico = set()
         
         with crear_conexion_db(cfg) as cx:
             
@@ -810,35 +896,14 @@ def ZPCN_ZPPA_ValidarEmisor():
                         # 3.3 ACTUALIZAR [CxP].[HistoricoOrdenesCompra]
                         # ====================================================
                         
-                        print("[UPDATE] Actualizando tabla HistoricoOrdenesCompra...")
-                        
-                        valores_doccompra = split_valores(row['DocCompra_hoc'])
-                        valores_nitcedula = split_valores(row['NitCedula_hoc'])
-                        valores_porcalcular = split_valores(row['PorCalcular_hoc'])
-                        valores_textobreve = split_valores(row['TextoBreve_hoc'])
-                        
-                        num_actualizados = 0
-                        for i in range(max(len(valores_doccompra), len(valores_nitcedula), 
-                                          len(valores_porcalcular), len(valores_textobreve))):
-                            
-                            doccompra_val = valores_doccompra[i] if i < len(valores_doccompra) else ""
-                            nitcedula_val = valores_nitcedula[i] if i < len(valores_nitcedula) else ""
-                            porcalcular_val = valores_porcalcular[i] if i < len(valores_porcalcular) else ""
-                            textobreve_val = valores_textobreve[i] if i < len(valores_textobreve) else ""
-                            
-                            if doccompra_val and nitcedula_val:
-                                update_marca = """
-                                UPDATE [CxP].[HistoricoOrdenesCompra]
-                                SET Marca = 'PROCESADO'
-                                WHERE DocCompra = ?
-                                  AND NitCedula = ?
-                                  AND PorCalcular = ?
-                                  AND TextoBreve = ?
-                                """
-                                cur.execute(update_marca, (doccompra_val, nitcedula_val, porcalcular_val, textobreve_val))
-                                num_actualizados += 1
-                        
-                        print("[DEBUG] HistoricoOrdenesCompra actualizado: " + str(num_actualizados) + " registros")
+                        # Se marcan en bloque al final de la ejecucion
+                        registrar_posiciones_historico(
+                            posiciones_historico,
+                            split_valores(row['DocCompra_hoc']),
+                            split_valores(row['NitCedula_hoc']),
+                            split_valores(row['PorCalcular_hoc']),
+                            split_valores(row['TextoBreve_hoc'])
+                        )
                         cx.commit()
                         cur.close()
                         print("[UPDATE] Todas las tablas actualizadas OK (CON NOVEDAD)")
@@ -852,6 +917,9 @@ def ZPCN_ZPPA_ValidarEmisor():
             # FIN DE PROCESO
             # ================================================================
             
+            # Marcar en bloque las posiciones de HistoricoOrdenesCompra de toda la ejecucion
+            stats['historico_ordenes'] = actualizar_historico_ordenes(cx, posiciones_historico)
+            
             stats['tiempo_total'] = time.time() - t_inicio
             
             print("")
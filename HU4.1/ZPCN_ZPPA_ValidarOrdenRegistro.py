@@ -163,6 +163,7 @@ def ZPCN_ZPPA_ValidarOrdenRegistro():
     import ast
     import traceback
     import pyodbc
+    import sys
     import pandas as pd
     import numpy as np
     from datetime import datetime
@@ -255,7 +256,8 @@ def ZPCN_ZPPA_ValidarOrdenRegistro():
         cx = None
         for attempt in range(max_retries):
             try:
-                cx = pyodbc.connect(conn_str, timeout=30)
+                pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                cx = pool_sql.conectar(conn_str, timeout=30) if pool_sql else pyodbc.connect(conn_str, timeout=30)
                 cx.autocommit = False
                 print("[DEBUG] Conexion SQL abierta (intento " + str(attempt + 1) + ")")
                 break
@@ -489,11 +491,8 @@ def ZPCN_ZPPA_ValidarOrdenRegistro():
         cur.close()
         print("[UPDATE] DocumentsProcessing actualizado (CON NOVEDAD)")
     
-    def actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list):
-        """Actualizar HistoricoOrdenesCompra marcando como PROCESADO"""
-        cur = cx.cursor()
-        
-        num_actualizados = 0
+    def registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list):
+        """Acumular posiciones de HistoricoOrdenesCompra a marcar como PROCESADO al final de la ejecucion"""
         max_len = max(len(doccompra_list), len(nitcedula_list), len(porcalcular_list), len(textobreve_list))
         
         for i in range(max_len):
@@ -503,19 +502,77 @@ def ZPCN_ZPPA_ValidarOrdenRegistro():
             textobreve = textobreve_list[i] if i < len(textobreve_list) else ""
             
             if doccompra and nitcedula:
-                update_marca = """
-                UPDATE [CxP].[HistoricoOrdenesCompra]
-                SET Marca = 'PROCESADO'
-                WHERE DocCompra = ?
-                  AND NitCedula = ?
-                  AND PorCalcular = ?
-                  AND TextoBreve = ?
-                """
-                cur.execute(update_marca, (doccompra, nitcedula, porcalcular, textobreve))
-                num_actualizados += 1
-        cx.commit()
-        cur.close()
-        print("[UPDATE] HistoricoOrdenesCompra: " + str(num_actualizados) + " registros marcados como PROCESADO")
+                posiciones_historico.add((doccompra, nitcedula, porcalcular, textobreve))
+    
+    def actualizar_historico_ordenes(cx, posiciones_historico):
+        """
+        Marcar como PROCESADO en HistoricoOrdenesCompra todas las posiciones de la ejecucion.
+        Carga las llaves (DocCompra, NitCedula, PorCalcular, TextoBreve) en la tabla
+        temporal #PosicionesHistorico y aplica un solo UPDATE ... JOIN.
+        Retorna dict con posiciones enviadas, filas actualizadas y posiciones sin coincidencia.
+        """
+        resultado = {'posiciones': len(posiciones_historico), 'filas_actualizadas': 0, 'posiciones_sin_coincidencia': 0}
+        if not posiciones_historico:
+            print("[UPDATE] HistoricoOrdenesCompra: sin posiciones para marcar")
+            return resultado
+        
+        cur = cx.cursor()
+        try:
+            cur.execute("""
+            IF OBJECT_ID('tempdb..#PosicionesHistorico') IS NOT NULL DROP TABLE #PosicionesHistorico;
+            CREATE TABLE #PosicionesHistorico (
+                DocCompra NVARCHAR(200),
+                NitCedula NVARCHAR(200),
+                PorCalcular NVARCHAR(200),
+                TextoBreve NVARCHAR(500)
+            );
+            """)
+            cur.fast_executemany = True
+            cur.executemany(
+                "INSERT INTO #PosicionesHistorico (DocCompra, NitCedula, PorCalcular, TextoBreve) VALUES (?, ?, ?, ?)",
+                sorted(posiciones_historico)
+            )
+            
+            cur.execute("""
+            UPDATE h
+            SET Marca = 'PROCESADO'
+            FROM [CxP].[HistoricoOrdenesCompra] h
+            INNER JOIN #PosicionesHistorico p
+                ON h.DocCompra = p.DocCompra
+               AND h.NitCedula = p.NitCedula
+               AND h.PorCalcular = p.PorCalcular
+               AND h.TextoBreve = p.TextoBreve
+            """)
+            resultado['filas_actualizadas'] = cur.rowcount
+            
+            cur.execute("""
+            SELECT COUNT(*)
+            FROM #PosicionesHistorico p
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM [CxP].[HistoricoOrdenesCompra] h
+                WHERE h.DocCompra = p.DocCompra
+                  AND h.NitCedula = p.NitCedula
+                  AND h.PorCalcular = p.PorCalcular
+                  AND h.TextoBreve = p.TextoBreve
+            )
+            """)
+            resultado['posiciones_sin_coincidencia'] = cur.fetchone()[0]
+            
+            cur.execute("DROP TABLE #PosicionesHistorico")
+            cx.commit()
+        except Exception:
+            cx.rollback()
+            raise
+        finally:
+            cur.close()
+        
+        print("[UPDATE] HistoricoOrdenesCompra: " + str(resultado['filas_actualizadas']) +
+              " registros marcados como PROCESADO (" + str(resultado['posiciones']) + " posiciones)")
+        if resultado['posiciones_sin_coincidencia']:
+            print("[WARNING] HistoricoOrdenesCompra: " + str(resultado['posiciones_sin_coincidencia']) +
+                  " posiciones sin registro coincidente")
+        return resultado
     
     # ========================================================================
     # INICIO DE PROCESO
@@ -535,6 +592,7 @@ def ZPCN_ZPPA_ValidarOrdenRegistro():
         }
         
         t_inicio = time.time()
+        posiciones_historico = set()
         
         with crear_conexion_db(cfg) as cx:
             
@@ -670,7 +728,7 @@ def ZPCN_ZPPA_ValidarOrdenRegistro():
                                 actualizar_item_comparativa(cx, nit, factura, None, observacion=obs)
                                 estado = 'CON NOVEDAD - CONTADO' if forma_pago in ['1', '01'] else 'CON NOVEDAD'
                                 actualizar_item_comparativa(cx, nit, factura, None, estado=estado)
-                                actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
+                                registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
                             
                             if not centro:
                                 print("[OK] CentroDeCoste vacio (correcto para Orden 15)")
@@ -685,7 +743,7 @@ def ZPCN_ZPPA_ValidarOrdenRegistro():
                                 actualizar_item_comparativa(cx, nit, factura, None, observacion=obs)
                                 estado = 'CON NOVEDAD - CONTADO' if forma_pago in ['1', '01'] else 'CON NOVEDAD'
                                 actualizar_item_comparativa(cx, nit, factura, None, estado=estado)
-                                actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
+                                registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
                             
                             if cuenta == '5199150001':
                                 print("[OK] Cuenta es 5199150001 (correcto)")
@@ -700,7 +758,7 @@ def ZPCN_ZPPA_ValidarOrdenRegistro():
                                 actualizar_item_comparativa(cx, nit, factura, None, observacion=obs)
                                 estado = 'CON NOVEDAD - CONTADO' if forma_pago in ['1', '01'] else 'CON NOVEDAD'
                                 actualizar_item_comparativa(cx, nit, factura, None, estado=estado)
-                                actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
+                                registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
                             
                             clase_correcta = False
                             obs_clase = ""
@@ -733,7 +791,7 @@ def ZPCN_ZPPA_ValidarOrdenRegistro():
                                 actualizar_item_comparativa(cx, nit, factura, None, observacion=obs_clase)
                                 estado = 'CON NOVEDAD - CONTADO' if forma_pago in ['1', '01'] else 'CON NOVEDAD'
                                 actualizar_item_comparativa(cx, nit, factura, None, estado=estado)
-                                actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
+                                registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
                         
                         elif len(orden) == 8 and orden.isdigit():
                             print("[VALIDACION] Orden de 8 digitos detectada")
@@ -754,7 +812,7 @@ def ZPCN_ZPPA_ValidarOrdenRegistro():
                                     actualizar_item_comparativa(cx, nit, factura, None, observacion=obs)
                                     estado = 'CON NOVEDAD - CONTADO' if forma_pago in ['1', '01'] else 'CON NOVEDAD'
                                     actualizar_item_comparativa(cx, nit, factura, None, estado=estado)
-                                    actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
+                                    registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
                             
                             else:
                                 print("[DEBUG] Orden NO 53 (NO ESTADISTICAS)")
@@ -772,7 +830,7 @@ def ZPCN_ZPPA_ValidarOrdenRegistro():
                                     actualizar_item_comparativa(cx, nit, factura, None, observacion=obs)
                                     estado = 'CON NOVEDAD - CONTADO' if forma_pago in ['1', '01'] else 'CON NOVEDAD'
                                     actualizar_item_comparativa(cx, nit, factura, None, estado=estado)
-                                    actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
+                                    registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
                                 
                                 cuenta_ok = (cuenta == '5299150099') or (len(cuenta) == 10 and cuenta.startswith('73'))
                                 
@@ -789,7 +847,7 @@ def ZPCN_ZPPA_ValidarOrdenRegistro():
                                     actualizar_item_comparativa(cx, nit, factura, None, observacion=obs)
                                     estado = 'CON NOVEDAD - CONTADO' if forma_pago in ['1', '01'] else 'CON NOVEDAD'
                                     actualizar_item_comparativa(cx, nit, factura, None, estado=estado)
-                                    actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
+                                    registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
                         
                         elif len(orden) == 10 and orden.startswith('73'):
                             print("[VALIDACION] Orden de 10 digitos empezando con 73")
@@ -807,7 +865,7 @@ def ZPCN_ZPPA_ValidarOrdenRegistro():
                                 actualizar_item_comparativa(cx, nit, factura, None, observacion=obs)
                                 estado = 'CON NOVEDAD - CONTADO' if forma_pago in ['1', '01'] else 'CON NOVEDAD'
                                 actualizar_item_comparativa(cx, nit, factura, None, estado=estado)
-                                actualizar_historico_ordenes(cx, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
+                                registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list)
                         
                         else:
                             print("[INFO] Orden no cumple ningun criterio de validacion")
@@ -822,6 +880,9 @@ def ZPCN_ZPPA_ValidarOrdenRegistro():
                     stats['errores'] += 1
                     continue
             
+            # Marcar en bloque las posiciones de HistoricoOrdenesCompra de toda la ejecucion
+            stats['historico_ordenes'] = actualizar_historico_ordenes(cx, posiciones_historico)
+            
             stats['tiempo_total'] = time.time() - t_inicio
             
             print("")
@@ -46,24 +46,24 @@ DIAGRAMA DE FLUJO
                                   |
                                   v
     +-------------------------------------------------------------+
-    |  Para cada registro:                                        |
+    |  comparar_trm_vectorizado() - todos los candidatos:         |
     |  +-------------------------------------------------------+  |
-    |  |  Obtener CalculationRate_dp (XML)                     |  |
-    |  |  Obtener primer valor de Trm_hoc (SAP)                |  |
-    |  +-------------------------------------------------------+  |
-    |  |  SI |TRM_dp - TRM_hoc| > 0 (diferente):               |  |
-    |  |    -> CON NOVEDAD                                     |  |
-    |  |    -> Actualizar DocumentsProcessing                  |  |
-    |  |    -> Actualizar Comparativa                          |  |
-    |  |    -> Actualizar HistoricoOrdenesCompra               |  |
-    |  +-------------------------------------------------------+  |
-    |  |  SI TRM_dp == TRM_hoc:                                |  |
-    |  |    -> Aprobado                                        |  |
+    |  |  Primer valor de Trm_hoc (SAP) vs CalculationRate_dp  |  |
+    |  |  SI |TRM_dp - TRM_hoc| <= ToleranciaTRM_ZPCN          |  |
+    |  |     -> Aprobado (sin TRM en SAP ni en XML: Aprobado)  |  |
     |  +-------------------------------------------------------+  |
     +-----------------------------+-------------------------------+
                                   |
                                   v
     +-------------------------------------------------------------+
+    |  Facturas sin coincidencia -> CON NOVEDAD:                  |
+    |  - aplicar_novedades_bulk(): DocumentsProcessing y          |
+    |    Comparativa en bloque                                    |
+    |  - Actualizar HistoricoOrdenesCompra                        |
+    +-----------------------------+-------------------------------+
+                                  |
+                                  v
+    +-------------------------------------------------------------+
     |  Retornar estadisticas y configurar variables RocketBot     |
     +-------------------------------------------------------------+
 
@@ -75,6 +75,8 @@ VARIABLES DE ENTRADA (RocketBot)
         Configuracion JSON con parametros:
         - ServidorBaseDatos: Servidor SQL Server
         - NombreBaseDatos: Nombre de la base de datos
+        - ToleranciaTRM_ZPCN: Tolerancia para comparacion TRM (default: 0).
+          Llave propia: ToleranciaTRM es la de ZPRE_ValidarTRM (default 10)
 
     vGblStrUsuarioBaseDatos : str
         Usuario para conexion SQL Server
@@ -114,9 +116,13 @@ VALIDACION REALIZADA
     TRM (Tasa Representativa del Mercado):
         - CalculationRate_dp (XML) - valor numerico
         - Trm_hoc (SAP) - se toma el PRIMER valor (si hay multiples)
-        - Comparacion: valores deben ser IGUALES
+        - Comparacion numerica: |TRM_dp - TRM_hoc| <= ToleranciaTRM_ZPCN
+          (con el default 0 los valores deben ser IGUALES)
+        - CalculationRate_dp vacio o no numerico nunca coincide, salvo que
+          Trm_hoc tambien este vacio (se aprueba, igual que la comparacion
+          original de textos)
         
-    Si TRM_dp != TRM_hoc:
+    Si no coincide:
         - Estado: CON NOVEDAD o CON NOVEDAD - CONTADO
         - Observacion: "No se encuentra coincidencia en el campo TRM..."
 
@@ -157,7 +163,10 @@ NOTAS TECNICAS
 ================================================================================
 
     - Solo se compara contra el PRIMER valor de Trm_hoc
-    - Comparacion es exacta (diferencia > 0 = novedad)
+    - Comparacion numerica en bloque (comparar_trm_vectorizado); con
+      ToleranciaTRM_ZPCN = 0 es exacta (diferencia > 0 = novedad)
+    - DocumentsProcessing y Comparativa se actualizan en bloque con tabla
+      temporal y UPDATE ... JOIN (aplicar_novedades_bulk)
     - Actualiza HistoricoOrdenesCompra con Marca = 'PROCESADO'
     - Observaciones se truncan a 3900 caracteres
 
@@ -169,6 +178,7 @@ def ZPCN_ZPPA_ValidarTRM():
     import ast
     import traceback
     import pyodbc
+    import sys
     import pandas as pd
     import numpy as np
     from datetime import datetime
@@ -261,7 +271,8 @@ def ZPCN_ZPPA_ValidarTRM():
         cx = None
         for attempt in range(max_retries):
             try:
-                cx = pyodbc.connect(conn_str, timeout=30)
+                pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                cx = pool_sql.conectar(conn_str, timeout=30) if pool_sql else pyodbc.connect(conn_str, timeout=30)
                 cx.autocommit = False
                 print("[DEBUG] Conexion SQL abierta (intento " + str(attempt + 1) + ")")
                 break
@@ -307,6 +318,208 @@ def ZPCN_ZPPA_ValidarTRM():
             return valores[0]
         return ""
     
+    def comparar_trm_vectorizado(df, columna_trm_sap, tolerancia, solo_primer_valor=False):
+        """
+        Comparar CalculationRate_dp contra las TRM de SAP de todos los candidatos a la vez.
+        Explota una sola vez la columna de TRM SAP (valores separados por |),
+        convierte a numero (quitando comas de miles) y evalua
+        abs(TRM_xml - TRM_sap) <= tolerancia con NumPy. Valores SAP o
+        CalculationRate_dp vacios o no numericos nunca coinciden; si no hay
+        TRM SAP ni CalculationRate_dp la factura se aprueba (la comparacion
+        original de textos daba '' == '').
+        Retorna una Serie booleana alineada con df.index: True si al menos una
+        TRM SAP (o la primera, si solo_primer_valor) coincide.
+        """
+        if df.empty:
+            return pd.Series(False, index=df.index, dtype=bool)
+        
+        trm_xml_texto = df['CalculationRate_dp'].map(safe_str)
+        trm_xml = pd.to_numeric(trm_xml_texto, errors='coerce')
+        
+        trm_sap = df[columna_trm_sap].where(df[columna_trm_sap].notna(), '').map(str)
+        trm_sap = trm_sap.str.split('|').explode().str.strip()
+        trm_sap = trm_sap[trm_sap != '']
+        if solo_primer_valor:
+            trm_sap = trm_sap[~trm_sap.index.duplicated(keep='first')]
+        
+        trm_sap_num = pd.to_numeric(trm_sap.str.replace(',', '', regex=False), errors='coerce')
+        diferencia = np.abs(trm_sap_num.to_numpy(dtype=np.float64) - trm_xml.reindex(trm_sap_num.index).to_numpy(dtype=np.float64))
+        coincide = pd.Series(diferencia <= tolerancia, index=trm_sap_num.index)
+        
+        coincide = coincide.groupby(level=0).any().reindex(df.index, fill_value=False).astype(bool)
+        ambos_vacios = ~df.index.isin(trm_sap.index) & (trm_xml_texto == '')
+        return coincide | ambos_vacios
+    
+    def aplicar_novedades_bulk(cx, df_novedades, observacion):
+        """
+        Aplicar en bloque las novedades de un lote a DocumentsProcessing y CxP.Comparativa.
+        df_novedades trae columnas nit, factura, oc, estado (una fila por factura).
+        Carga las llaves en la tabla temporal #NovedadesLote con fast_executemany
+        y aplica con UPDATE ... JOIN las mismas reglas que el flujo por fila:
+            - EstadoFinalFase_4 = 'VALIDACION DATOS DE FACTURACION: Exitoso'
+            - ObservacionesFase_4 / Valor_XML('Observaciones') = observacion antepuesta, truncada a 3900
+            - ResultadoFinalAntesEventos / Estado_validacion_antes_de_eventos = estado
+        Retorna dict con las filas afectadas por tabla.
+        """
+        resultado = {'documents_processing': 0, 'comparativa_observaciones': 0, 'comparativa_estado': 0}
+        if df_novedades.empty:
+            return resultado
+        
+        # Una fila por llave con el MAX(estado) de la llave (mismo criterio que el agregado SQL)
+        df_llaves = (df_novedades[['nit', 'factura', 'oc', 'estado']]
+                     .sort_values('estado', ascending=False, kind='stable')
+                     .drop_duplicates(subset=['nit', 'factura', 'oc'], keep='first'))
+        filas = [tuple(safe_str(v) for v in fila) for fila in df_llaves.itertuples(index=False, name=None)]
+        
+        cur = cx.cursor()
+        try:
+            cur.execute("""
+            IF OBJECT_ID('tempdb..#NovedadesLote') IS NOT NULL DROP TABLE #NovedadesLote;
+            CREATE TABLE #NovedadesLote (
+                nit NVARCHAR(100),
+                factura NVARCHAR(200),
+                oc NVARCHAR(4000),
+                estado NVARCHAR(100)
+            );
+            """)
+            cur.fast_executemany = True
+            cur.executemany("INSERT INTO #NovedadesLote (nit, factura, oc, estado) VALUES (?, ?, ?, ?)", filas)
+            
+            cur.execute("""
+            UPDATE dp
+            SET EstadoFinalFase_4 = 'VALIDACION DATOS DE FACTURACION: Exitoso',
+                ObservacionesFase_4 = LEFT(
+                    CASE WHEN NULLIF(LTRIM(RTRIM(dp.ObservacionesFase_4)), '') IS NULL THEN ?
+                         ELSE ? + ', ' + LTRIM(RTRIM(dp.ObservacionesFase_4)) END, 3900),
+                ResultadoFinalAntesEventos = n.estado
+            FROM [CxP].[DocumentsProcessing] dp
+            INNER JOIN #NovedadesLote n
+                ON dp.nit_emisor_o_nit_del_proveedor = n.nit
+               AND dp.numero_de_factura = n.factura
+               AND dp.numero_de_liquidacion_u_orden_de_compra = n.oc
+            """, (observacion, observacion))
+            resultado['documents_processing'] = cur.rowcount
+            
+            cur.execute("""
+            UPDATE c
+            SET Valor_XML = LEFT(
+                CASE WHEN NULLIF(LTRIM(RTRIM(c.Valor_XML)), '') IS NULL THEN ?
+                     ELSE ? + ', ' + LTRIM(RTRIM(c.Valor_XML)) END, 3900)
+            FROM [dbo].[CxP.Comparativa] c
+            INNER JOIN (SELECT DISTINCT nit, factura FROM #NovedadesLote) n
+                ON c.NIT = n.nit AND c.Factura = n.factura
+            WHERE c.Item = 'Observaciones'
+            """, (observacion, observacion))
+            resultado['comparativa_observaciones'] = cur.rowcount
+            
+            cur.execute("""
+            UPDATE c
+            SET Estado_validacion_antes_de_eventos = n.estado
+            FROM [dbo].[CxP.Comparativa] c
+            INNER JOIN (
+                SELECT nit, factura, MAX(estado) AS estado
+                FROM #NovedadesLote
+                GROUP BY nit, factura
+            ) n ON c.NIT = n.nit AND c.Factura = n.factura
+            """)
+            resultado['comparativa_estado'] = cur.rowcount
+            
+            cur.execute("DROP TABLE #NovedadesLote")
+            cx.commit()
+        except Exception:
+            cx.rollback()
+            raise
+        finally:
+            cur.close()
+        
+        print("[UPDATE] Bulk novedades: DocumentsProcessing=" + str(resultado['documents_processing']) +
+              " Comparativa(Observaciones)=" + str(resultado['comparativa_observaciones']) +
+              " Comparativa(Estado)=" + str(resultado['comparativa_estado']))
+        return resultado
+    
+    def registrar_posiciones_historico(posiciones_historico, doccompra_list, nitcedula_list, porcalcular_list, textobreve_list):
+        """Acumular posiciones de HistoricoOrdenesCompra a marcar como PROCESADO al final de la ejecucion"""
+        max_len = max(len(doccompra_list), len(nitcedula_list), len(porcalcular_list), len(textobreve_list))
+        
+        for i in range(max_len):
+            doccompra = doccompra_list[i] if i < len(doccompra_list) else ""
+            nitcedula = nitcedula_list[i] if i < len(nitcedula_list) else ""
+            porcalcular = porcalcular_list[i] if i < len(porcalcular_list) else ""
+            textobreve = textobreve_list[i] if i < len(textobreve_list) else ""
+            
+            if doccompra and nitcedula:
+                posiciones_historico.add((doccompra, nitcedula, porcalcular, textobreve))
+    
+    def actualizar_historico_ordenes(cx, posiciones_historico):
+        """
+        Marcar como PROCESADO en HistoricoOrdenesCompra todas las posiciones de la ejecucion.
+        Carga las llaves (DocCompra, NitCedula, PorCalcular, TextoBreve) en la tabla
+        temporal #PosicionesHistorico y aplica un solo UPDATE ... JOIN.
+        Retorna dict con posiciones enviadas, filas actualizadas y posiciones sin coincidencia.
+        """
+        resultado = {'posiciones': len(posiciones_historico), 'filas_actualizadas': 0, 'posiciones_sin_coincidencia': 0}
+        if not posiciones_historico:
+            print("[UPDATE] HistoricoOrdenesCompra: sin posiciones para marcar")
+            return resultado
+        
+        cur = cx.cursor()
+        try:
+            cur.execute("""
+            IF OBJECT_ID('tempdb..#PosicionesHistorico') IS NOT NULL DROP TABLE #PosicionesHistorico;
+            CREATE TABLE #PosicionesHistorico (
+                DocCompra NVARCHAR(200),
+                NitCedula NVARCHAR(200),
+                PorCalcular NVARCHAR(200),
+                TextoBreve NVARCHAR(500)
+            );
+            """)
+            cur.fast_executemany = True
+            cur.executemany(
+                "INSERT INTO #PosicionesHistorico (DocCompra, NitCedula, PorCalcular, TextoBreve) VALUES (?, ?, ?, ?)",
+                sorted(posiciones_historico)
+            )
+            
+            cur.execute("""
+            UPDATE h
+            SET Marca = 'PROCESADO'
+            FROM [CxP].[HistoricoOrdenesCompra] h
+            INNER JOIN #PosicionesHistorico p
+                ON h.DocCompra = p.DocCompra
+               AND h.NitCedula = p.NitCedula
+               AND h.PorCalcular = p.PorCalcular
+               AND h.TextoBreve = p.TextoBreve
+            """)
+            resultado['filas_actualizadas'] = cur.rowcount
+            
+            cur.execute("""
+            SELECT COUNT(*)
+            FROM #PosicionesHistorico p
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM [CxP].[HistoricoOrdenesCompra] h
+                WHERE h.DocCompra = p.DocCompra
+                  AND h.NitCedula = p.NitCedula
+                  AND h.PorCalcular = p.PorCalcular
+                  AND h.TextoBreve = p.TextoBreve
+            )
+            """)
+            resultado['posiciones_sin_coincidencia'] = cur.fetchone()[0]
+            
+            cur.execute("DROP TABLE #PosicionesHistorico")
+            cx.commit()
+        except Exception:
+            cx.rollback()
+            raise
+        finally:
+            cur.close()
+        
+        print("[UPDATE] HistoricoOrdenesCompra: " + str(resultado['filas_actualizadas']) +
+              " registros marcados como PROCESADO (" + str(resultado['posiciones']) + " posiciones)")
+        if resultado['posiciones_sin_coincidencia']:
+            print("[WARNING] HistoricoOrdenesCompra: " + str(resultado['posiciones_sin_coincidencia']) +
+                  " posiciones sin registro coincidente")
+        return resultado
+    
     # ========================================================================
     # INICIO DE PROCESO
     # ========================================================================
@@ -318,6 +531,9 @@ def ZPCN_ZPPA_ValidarTRM():
         print("[DEBUG] Servidor: " + cfg.get('ServidorBaseDatos', 'N/A'))
         print("[DEBUG] Base de datos: " + cfg.get('NombreBaseDatos', 'N/A'))
         
+        tolerancia_trm = float(cfg.get('ToleranciaTRM_ZPCN', 0))
+        print("[DEBUG] Tolerancia TRM: " + str(tolerancia_trm))
+        
         stats = {
             'total_registros': 0,
             'aprobados': 0,
@@ -327,6 +543,7 @@ def ZPCN_ZPPA_ValidarTRM():
         }
         
         t_inicio = time.time()
+        posiciones_historico = set()
         
         with crear_conexion_db(cfg) as cx:
             
@@ -392,175 +609,42 @@ def ZPCN_ZPPA_ValidarTRM():
             stats['total_registros'] = len(df_filtrado)
             
             print("")
-            print("[PASO 3] Procesando VALIDACION: TRM vs CalculationRate...")
+            print("[PASO 3] Procesando VALIDACION: TRM vs CalculationRate (en bloque)...")
             
-            for idx, row in df_filtrado.iterrows():
-                try:
-                    print("")
-                    print("[REGISTRO " + str(idx + 1) + "/" + str(len(df_filtrado)) + "] - VALIDACION TRM")
-                    
-                    nit = safe_str(row['nit_emisor_o_nit_del_proveedor_dp'])
-                    factura = safe_str(row['numero_de_factura_dp'])
-                    oc = safe_str(row['numero_de_liquidacion_u_orden_de_compra_dp'])
-                    forma_pago = safe_str(row['forma_de_pago_dp'])
-                    
-                    print("[DEBUG] NIT: " + nit)
-                    print("[DEBUG] Factura: " + factura)
-                    print("[DEBUG] OC: " + oc)
-                    
-                    trm_hoc_primer_valor = obtener_primer_valor(row['Trm_hoc'])
-                    calculation_rate = safe_str(row['CalculationRate_dp'])
-                    
-                    print("[DEBUG] Trm_hoc (primer valor): '" + trm_hoc_primer_valor + "'")
-                    print("[DEBUG] CalculationRate_dp: '" + calculation_rate + "'")
-                    
-                    if trm_hoc_primer_valor != calculation_rate:
-                        print("[RESULTADO] CON NOVEDAD - TRM (valores diferentes)")
-                        stats['con_novedad'] += 1
-                        
-                        if forma_pago == '1' or forma_pago == '01':
-                            estado_final = 'CON NOVEDAD - CONTADO'
-                        else:
-                            estado_final = 'CON NOVEDAD'
-                        
-                        print("[DEBUG] Estado final: " + estado_final)
-                        
-                        cur = cx.cursor()
-                        
-                        print("[UPDATE] Actualizando tabla DocumentsProcessing...")
-                        
-                        update_fase4 = """
-                        UPDATE [CxP].[DocumentsProcessing]
-                        SET EstadoFinalFase_4 = 'VALIDACION DATOS DE FACTURACION: Exitoso'
-                        WHERE nit_emisor_o_nit_del_proveedor = ?
-                          AND numero_de_factura = ?
-                          AND numero_de_liquidacion_u_orden_de_compra = ?
-                        """
-                        cur.execute(update_fase4, (nit, factura, oc))
-                        
-                        select_obs = """
-                        SELECT ObservacionesFase_4
-                        FROM [CxP].[DocumentsProcessing]
-                        WHERE nit_emisor_o_nit_del_proveedor = ?
-                          AND numero_de_factura = ?
-                          AND numero_de_liquidacion_u_orden_de_compra = ?
-                        """
-                        cur.execute(select_obs, (nit, factura, oc))
-                        result_obs = cur.fetchone()
-                        
-                        obs_actual = safe_str(result_obs[0]) if result_obs and result_obs[0] else ""
-                        nueva_obs = "No se encuentra coincidencia en el campo TRM de la factura vs la informacion reportada en SAP"
-                        
-                        if obs_actual:
-                            obs_final = nueva_obs + ", " + obs_actual
-                        else:
-                            obs_final = nueva_obs
-                        
-                        # CORRECCIÓN: Truncar antes de UPDATE
-                        obs_final = truncar_observacion(obs_final)
-                        
-                        update_obs = """
-                        UPDATE [CxP].[DocumentsProcessing]
-                        SET ObservacionesFase_4 = ?
-                        WHERE nit_emisor_o_nit_del_proveedor = ?
-                          AND numero_de_factura = ?
-                          AND numero_de_liquidacion_u_orden_de_compra = ?
-                        """
-                        cur.execute(update_obs, (obs_final, nit, factura, oc))
-                        
-                        update_resultado = """
-                        UPDATE [CxP].[DocumentsProcessing]
-                        SET ResultadoFinalAntesEventos = ?
-                        WHERE nit_emisor_o_nit_del_proveedor = ?
-                          AND numero_de_factura = ?
-                          AND numero_de_liquidacion_u_orden_de_compra = ?
-                        """
-                        cur.execute(update_resultado, (estado_final, nit, factura, oc))
-                        
-                        print("[DEBUG] DocumentsProcessing actualizado OK")
-                        
-                        print("[UPDATE] Actualizando tabla CxP.Comparativa...")
-                        
-                        select_obs_comp = """
-                        SELECT Valor_XML
-                        FROM [dbo].[CxP.Comparativa]
-                        WHERE NIT = ?
-                          AND Factura = ?
-                          AND Item = 'Observaciones'
-                        """
-                        cur.execute(select_obs_comp, (nit, factura))
-                        result_obs_comp = cur.fetchone()
-                        
-                        obs_comp_actual = safe_str(result_obs_comp[0]) if result_obs_comp and result_obs_comp[0] else ""
-                        
-                        if obs_comp_actual:
-                            obs_comp_final = nueva_obs + ", " + obs_comp_actual
-                        else:
-                            obs_comp_final = nueva_obs
-                        
-                        # CORRECCIÓN: Truncar antes de UPDATE
-                        obs_comp_final = truncar_observacion(obs_comp_final)
-                        
-                        update_obs_comp = """
-                        UPDATE [dbo].[CxP.Comparativa]
-                        SET Valor_XML = ?
-                        WHERE NIT = ?
-                          AND Factura = ?
-                          AND Item = 'Observaciones'
-                        """
-                        cur.execute(update_obs_comp, (obs_comp_final, nit, factura))
-                        
-                        update_estado_todos = """
-                        UPDATE [dbo].[CxP.Comparativa]
-                        SET Estado_validacion_antes_de_eventos = ?
-                        WHERE NIT = ?
-                          AND Factura = ?
-                        """
-                        cur.execute(update_estado_todos, (estado_final, nit, factura))
-                        
-                        print("[DEBUG] CxP.Comparativa actualizado OK")
-                        
-                        print("[UPDATE] Actualizando tabla HistoricoOrdenesCompra...")
-                        
-                        valores_doccompra = split_valores(row['DocCompra_hoc'])
-                        valores_nitcedula = split_valores(row['NitCedula_hoc'])
-                        valores_porcalcular = split_valores(row['PorCalcular_hoc'])
-                        valores_textobreve = split_valores(row['TextoBreve_hoc'])
-                        
-                        num_actualizados = 0
-                        for i in range(max(len(valores_doccompra), len(valores_nitcedula), 
-                                          len(valores_porcalcular), len(valores_textobreve))):
-                            
-                            doccompra_val = valores_doccompra[i] if i < len(valores_doccompra) else ""
-                            nitcedula_val = valores_nitcedula[i] if i < len(valores_nitcedula) else ""
-                            porcalcular_val = valores_porcalcular[i] if i < len(valores_porcalcular) else ""
-                            textobreve_val = valores_textobreve[i] if i < len(valores_textobreve) else ""
-                            
-                            if doccompra_val and nitcedula_val:
-                                update_marca = """
-                                UPDATE [CxP].[HistoricoOrdenesCompra]
-                                SET Marca = 'PROCESADO'
-                                WHERE DocCompra = ?
-                                  AND NitCedula = ?
-                                  AND PorCalcular = ?
-                                  AND TextoBreve = ?
-                                """
-                                cur.execute(update_marca, (doccompra_val, nitcedula_val, porcalcular_val, textobreve_val))
-                                num_actualizados += 1
-                        
-                        print("[DEBUG] HistoricoOrdenesCompra actualizado: " + str(num_actualizados) + " registros")
-                        cx.commit()
-                        cur.close()
-                        print("[UPDATE] Todas las tablas actualizadas OK (TRM)")
-                        
-                    else:
-                        print("[RESULTADO] APROBADO - TRM (valores iguales)")
-                        stats['aprobados'] += 1
-                    
-                except Exception as e_row:
-                    print("[ERROR] Error procesando registro " + str(idx) + " (TRM): " + str(e_row))
-                    stats['errores'] += 1
-                    continue
+            # Primer valor de Trm_hoc vs CalculationRate_dp para todos los candidatos
+            coincide_trm = comparar_trm_vectorizado(df_filtrado, 'Trm_hoc', tolerancia_trm, solo_primer_valor=True)
+            stats['aprobados'] = int(coincide_trm.sum())
+            stats['con_novedad'] = int((~coincide_trm).sum())
+            print("[DEBUG] Aprobados: " + str(stats['aprobados']) + " | Con novedad: " + str(stats['con_novedad']))
+            
+            df_sin_coincidencia = df_filtrado[~coincide_trm]
+            forma_pago = df_sin_coincidencia['forma_de_pago_dp'].map(safe_str)
+            df_novedades = pd.DataFrame({
+                'nit': df_sin_coincidencia['nit_emisor_o_nit_del_proveedor_dp'].map(safe_str),
+                'factura': df_sin_coincidencia['numero_de_factura_dp'].map(safe_str),
+                'oc': df_sin_coincidencia['numero_de_liquidacion_u_orden_de_compra_dp'].map(safe_str),
+                'estado': np.where(forma_pago.isin(['1', '01']), 'CON NOVEDAD - CONTADO', 'CON NOVEDAD')
+            })
+            
+            print("[UPDATE] Actualizando DocumentsProcessing y CxP.Comparativa en bloque...")
+            stats['filas_actualizadas'] = aplicar_novedades_bulk(
+                cx, df_novedades,
+                "No se encuentra coincidencia en el campo TRM de la factura vs la informacion reportada en SAP"
+            )
+            
+            for doccompra, nitcedula, porcalcular, textobreve in zip(
+                    df_sin_coincidencia['DocCompra_hoc'], df_sin_coincidencia['NitCedula_hoc'],
+                    df_sin_coincidencia['PorCalcular_hoc'], df_sin_coincidencia['TextoBreve_hoc']):
+                registrar_posiciones_historico(
+                    posiciones_historico,
+                    split_valores(doccompra),
+                    split_valores(nitcedula),
+                    split_valores(porcalcular),
+                    split_valores(textobreve)
+                )
+            
+            # Marcar en bloque las posiciones de HistoricoOrdenesCompra de toda la ejecucion
+            stats['historico_ordenes'] = actualizar_historico_ordenes(cx, posiciones_historico)
             
             stats['tiempo_total'] = time.time() - t_inicio
             
@@ -162,6 +162,7 @@ NOTAS TECNICAS
 
 def ZPCN_ZPPA_ValidarUSD():
     import json, ast, traceback, pyodbc, pandas as pd, numpy as np
+    import sys
     from datetime import datetime
     from contextlib import contextmanager
     import time, warnings
@@ -210,7 +211,8 @@ def ZPCN_ZPPA_ValidarUSD():
         cx = None
         for attempt in range(max_retries):
             try:
-                cx = pyodbc.connect(conn_str, timeout=30)
+                pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                cx = pool_sql.conectar(conn_str, timeout=30) if pool_sql else pyodbc.connect(conn_str, timeout=30)
                 cx.autocommit = False
                 print("[DEBUG] Conexion SQL abierta (intento " + str(attempt + 1) + ")")
                 break
@@ -245,7 +247,7 @@ def ZPCN_ZPPA_ValidarUSD():
     def contiene(campo, val):
         return val in split_valores(campo)
     
-    def sumar(valor_str):
+    def sumar_valores(valor_str):
         suma = 0.0
         for v in split_valores(valor_str):
             try:
@@ -254,6 +256,23 @@ def ZPCN_ZPPA_ValidarUSD():
                 pass
         return suma
     
+    def sumar_montos_por_factura(serie):
+        """
+        Suma por fila los montos separados por | con el parser compartido
+        (HU4.1/parser_montos.py, registrado con registrar_parser_montos).
+        Si el parser no esta registrado se suma con sumar_valores.
+
+        Args:
+            serie (pd.Series): Columna con montos separados por |.
+
+        Returns:
+            np.ndarray: Suma float64 por fila.
+        """
+        parser = getattr(sys, "_cxp_parser_montos", None)
+        if parser is None:
+            return np.array([sumar_valores(v) for v in serie], dtype=np.float64)
+        return parser.sumar_montos_por_factura(serie)
+    
     try:
         cfg = parse_config(GetVar("vLocDicConfig"))
         tol = float(cfg.get('Tolerancia', 500))
@@ -280,6 +299,10 @@ def ZPCN_ZPPA_ValidarUSD():
             df = df[mask_clase & mask_usd].copy()
             stats['total'] = len(df)
             
+            # Sumas por factura calculadas una sola vez para todo el lote
+            df['_SumaPorCalcular'] = sumar_montos_por_factura(df['PorCalcular_hoc'])
+            df['_SumaVlrPagarCop'] = sumar_montos_por_factura(df['VlrPagarCop_dp'])
+            
             for idx, row in df.iterrows():
                 try:
                     nit = safe_str(row['nit_emisor_o_nit_del_proveedor_dp'])
@@ -287,8 +310,8 @@ def ZPCN_ZPPA_ValidarUSD():
                     oc = safe_str(row['numero_de_liquidacion_u_orden_de_compra_dp'])
                     forma_pago = safe_str(row['forma_de_pago_dp'])
                     
-                    suma_hoc = sumar(row['PorCalcular_hoc'])
-                    vlr_cop = sumar(row['VlrPagarCop_dp'])
+                    suma_hoc = float(row['_SumaPorCalcular'])
+                    vlr_cop = float(row['_SumaVlrPagarCop'])
                     diff = abs(suma_hoc - vlr_cop)
                     
                     if diff <= tol:
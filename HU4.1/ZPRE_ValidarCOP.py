@@ -172,6 +172,7 @@ def ZPRE_ValidarCOP():
     import ast
     import traceback
     import pyodbc
+    import sys
     import pandas as pd
     import numpy as np
     from datetime import datetime
@@ -351,7 +352,8 @@ def ZPRE_ValidarCOP():
         cx = None
         for attempt in range(max_retries):
             try:
-                cx = pyodbc.connect(conn_str, timeout=30)
+                pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                cx = pool_sql.conectar(conn_str, timeout=30) if pool_sql else pyodbc.connect(conn_str, timeout=30)
                 cx.autocommit = False
                 print("[DEBUG] Conexion SQL abierta (intento " + str(attempt + 1) + ")")
                 break
@@ -384,46 +386,32 @@ def ZPRE_ValidarCOP():
         valores = str(valor_str).split('|')
         return [v.strip() for v in valores if v.strip()]
     
-    def convertir_a_numero(valor_str):
-        if not valor_str or valor_str == "" or pd.isna(valor_str):
-            return 0.0
-        try:
-            v = str(valor_str).strip()
-            v = v.replace(',', '')
-            return float(v)
-        except:
-            print("[WARNING] No se pudo convertir '" + str(valor_str) + "' a numero, usando 0.0")
-            return 0.0
-    
-    def sumar_valores(valor_str, nombre_campo="campo"):
-        valores = split_valores(valor_str)
+    def sumar_valores(valor_str):
         suma = 0.0
-        errores = []
-        
-        for i, v in enumerate(valores):
+        for v in split_valores(valor_str):
             try:
-                v_limpio = v.strip()
-                v_limpio = v_limpio.replace(',', '')
-                valor_num = float(v_limpio)
-                suma += valor_num
-                
-                if i < 3:
-                    print("[DEBUG] " + nombre_campo + "[" + str(i) + "]: '" + v + "' -> " + str(valor_num))
-                    
-            except ValueError as e:
-                errores.append("Valor[" + str(i) + "]='" + v + "' no convertible: " + str(e))
-            except Exception as e:
-                errores.append("Error[" + str(i) + "]='" + v + "': " + str(e))
-        
-        if errores:
-            print("[WARNING] Errores en conversion de " + nombre_campo + ":")
-            for err in errores[:5]:
-                print("  " + err)
-        
-        print("[DEBUG] " + nombre_campo + " - Total valores: " + str(len(valores)) + " | Suma: " + str(suma))
-        
+                suma += float(v.replace(',', ''))
+            except:
+                pass
         return suma
     
+    def sumar_montos_por_factura(serie):
+        """
+        Suma por fila los montos separados por | con el parser compartido
+        (HU4.1/parser_montos.py, registrado con registrar_parser_montos).
+        Si el parser no esta registrado se suma con sumar_valores.
+
+        Args:
+            serie (pd.Series): Columna con montos separados por |.
+
+        Returns:
+            np.ndarray: Suma float64 por fila.
+        """
+        parser = getattr(sys, "_cxp_parser_montos", None)
+        if parser is None:
+            return np.array([sumar_valores(v) for v in serie], dtype=np.float64)
+        return parser.sumar_montos_por_factura(serie)
+    
     def contiene_valor(campo, valor_buscado):
         valores = split_valores(campo)
         return valor_buscado in valores
@@ -525,6 +513,10 @@ def ZPRE_ValidarCOP():
             
             stats['total_registros'] = len(df_filtrado)
             
+            # Sumas por factura calculadas una sola vez para todo el lote
+            df_filtrado['_SumaPorCalcular'] = sumar_montos_por_factura(df_filtrado['PorCalcular_hoc'])
+            df_filtrado['_SumaValorCompra'] = sumar_montos_por_factura(df_filtrado['Valor de la Compra LEA_ddp'])
+            
             print("")
             print("[PASO 3] Procesando registros...")
             
@@ -544,11 +536,8 @@ def ZPRE_ValidarCOP():
                     print("[DEBUG] OC: " + oc)
                     print("")
                     
-                    print("[CALCULO] Sumando valores de PorCalcular_hoc...")
-                    suma_por_calcular = sumar_valores(row['PorCalcular_hoc'], "PorCalcular_hoc")
-                    
-                    print("[CALCULO] Sumando valores de Valor de la Compra LEA_ddp...")
-                    suma_valor_compra = sumar_valores(row['Valor de la Compra LEA_ddp'], "Valor_Compra_LEA")
+                    suma_por_calcular = float(row['_SumaPorCalcular'])
+                    suma_valor_compra = float(row['_SumaValorCompra'])
                     
                     diferencia = abs(suma_por_calcular - suma_valor_compra)
                     print("")
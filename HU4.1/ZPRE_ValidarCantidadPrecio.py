@@ -169,6 +169,7 @@ NOTAS TECNICAS
 
 def ZPRE_ValidarCantidadPrecio():
     import json, ast, traceback, pyodbc, pandas as pd, numpy as np
+    import sys
     from datetime import datetime
     from contextlib import contextmanager
     import time, warnings
@@ -217,7 +218,8 @@ def ZPRE_ValidarCantidadPrecio():
         cx = None
         for attempt in range(max_retries):
             try:
-                cx = pyodbc.connect(conn_str, timeout=30)
+                pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                cx = pool_sql.conectar(conn_str, timeout=30) if pool_sql else pyodbc.connect(conn_str, timeout=30)
                 cx.autocommit = False
                 print("[DEBUG] Conexion SQL abierta (intento " + str(attempt + 1) + ")")
                 break
@@ -172,6 +172,7 @@ NOTAS TECNICAS
 
 def ZPRE_ValidarEmisor():
     import json, ast, traceback, pyodbc, pandas as pd, numpy as np
+    import sys
     from datetime import datetime
     from contextlib import contextmanager
     import time, warnings, unicodedata
@@ -220,7 +221,8 @@ def ZPRE_ValidarEmisor():
         cx = None
         for attempt in range(max_retries):
             try:
-                cx = pyodbc.connect(conn_str, timeout=30)
+                pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                cx = pool_sql.conectar(conn_str, timeout=30) if pool_sql else pyodbc.connect(conn_str, timeout=30)
                 cx.autocommit = False
                 print("[DEBUG] Conexion SQL abierta (intento " + str(attempt + 1) + ")")
                 break
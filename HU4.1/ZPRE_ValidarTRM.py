@@ -46,27 +46,23 @@ DIAGRAMA DE FLUJO
                                   |
                                   v
     +-------------------------------------------------------------+
-    |  Para cada registro:                                        |
+    |  comparar_trm_vectorizado() - todos los candidatos:         |
     |  +-------------------------------------------------------+  |
-    |  |  Obtener CalculationRate_dp (XML)                     |  |
-    |  |  Obtener lista TRM_hoc (SAP) - separados por |        |  |
-    |  +-------------------------------------------------------+  |
-    |  |  Para cada TRM en lista:                              |  |
-    |  |    SI |TRM_dp - TRM_hoc| <= tolerancia:               |  |
-    |  |      -> Coincidencia encontrada                       |  |
-    |  +-------------------------------------------------------+  |
-    |  |  SI coincide con alguno:                              |  |
-    |  |    -> Aprobado                                        |  |
-    |  +-------------------------------------------------------+  |
-    |  |  SI no coincide con ninguno:                          |  |
-    |  |    -> CON NOVEDAD                                     |  |
-    |  |    -> Actualizar DocumentsProcessing                  |  |
-    |  |    -> Actualizar Comparativa                          |  |
+    |  |  Explotar TRM_hoc (SAP) separados por | una sola vez   |  |
+    |  |  |TRM_dp - TRM_hoc| <= tolerancia con NumPy           |  |
+    |  |  Coincide con alguno -> Aprobado                      |  |
     |  +-------------------------------------------------------+  |
     +-----------------------------+-------------------------------+
                                   |
                                   v
     +-------------------------------------------------------------+
+    |  aplicar_novedades_bulk() - facturas sin coincidencia:      |
+    |  -> CON NOVEDAD                                             |
+    |  -> UPDATE en bloque DocumentsProcessing y Comparativa      |
+    +-----------------------------+-------------------------------+
+                                  |
+                                  v
+    +-------------------------------------------------------------+
     |  Retornar estadisticas y configurar variables RocketBot     |
     +-------------------------------------------------------------+
 
@@ -160,7 +156,9 @@ NOTAS TECNICAS
     - Basta que coincida con UNO para aprobar
     - Valores con comas se convierten (ej: "4,500.00" -> 4500.00)
     - Observaciones se truncan a 3900 caracteres
-    - Errores por registro se loguean pero no detienen proceso
+    - La comparacion se hace en bloque (comparar_trm_vectorizado) y las
+      novedades se escriben con una tabla temporal y UPDATE ... JOIN
+      (aplicar_novedades_bulk), un solo commit por ejecucion
 
 ================================================================================
 """
@@ -170,6 +168,7 @@ def ZPRE_ValidarTRM():
     import ast
     import traceback
     import pyodbc
+    import sys
     import pandas as pd
     import numpy as np
     from datetime import datetime
@@ -237,7 +236,8 @@ def ZPRE_ValidarTRM():
         cx = None
         for attempt in range(max_retries):
             try:
-                cx = pyodbc.connect(conn_str, timeout=30)
+                pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                cx = pool_sql.conectar(conn_str, timeout=30) if pool_sql else pyodbc.connect(conn_str, timeout=30)
                 cx.autocommit = False
                 break
             except:
@@ -265,6 +265,120 @@ def ZPRE_ValidarTRM():
     def contiene_valor(campo, valor_buscado):
         return valor_buscado in split_valores(campo)
     
+    def comparar_trm_vectorizado(df, columna_trm_sap, tolerancia, solo_primer_valor=False):
+        """
+        Comparar CalculationRate_dp contra las TRM de SAP de todos los candidatos a la vez.
+        Explota una sola vez la columna de TRM SAP (valores separados por |),
+        convierte a numero (quitando comas de miles) y evalua
+        abs(TRM_xml - TRM_sap) <= tolerancia con NumPy. Valores SAP no
+        numericos nunca coinciden.
+        Retorna una Serie booleana alineada con df.index: True si al menos una
+        TRM SAP (o la primera, si solo_primer_valor) coincide.
+        """
+        if df.empty:
+            return pd.Series(False, index=df.index, dtype=bool)
+        
+        trm_xml = pd.to_numeric(df['CalculationRate_dp'], errors='coerce').fillna(0.0)
+        
+        trm_sap = df[columna_trm_sap].where(df[columna_trm_sap].notna(), '').map(str)
+        trm_sap = trm_sap.str.split('|').explode().str.strip()
+        trm_sap = trm_sap[trm_sap != '']
+        if solo_primer_valor:
+            trm_sap = trm_sap[~trm_sap.index.duplicated(keep='first')]
+        
+        trm_sap_num = pd.to_numeric(trm_sap.str.replace(',', '', regex=False), errors='coerce')
+        diferencia = np.abs(trm_sap_num.to_numpy(dtype=np.float64) - trm_xml.reindex(trm_sap_num.index).to_numpy(dtype=np.float64))
+        coincide = pd.Series(diferencia <= tolerancia, index=trm_sap_num.index)
+        
+        return coincide.groupby(level=0).any().reindex(df.index, fill_value=False).astype(bool)
+    
+    def aplicar_novedades_bulk(cx, df_novedades, observacion):
+        """
+        Aplicar en bloque las novedades de un lote a DocumentsProcessing y CxP.Comparativa.
+        df_novedades trae columnas nit, factura, oc, estado (una fila por factura).
+        Carga las llaves en la tabla temporal #NovedadesLote con fast_executemany
+        y aplica con UPDATE ... JOIN las mismas reglas que el flujo por fila:
+            - EstadoFinalFase_4 = 'VALIDACION DATOS DE FACTURACION: Exitoso'
+            - ObservacionesFase_4 / Valor_XML('Observaciones') = observacion antepuesta, truncada a 3900
+            - ResultadoFinalAntesEventos / Estado_validacion_antes_de_eventos = estado
+        Retorna dict con las filas afectadas por tabla.
+        """
+        resultado = {'documents_processing': 0, 'comparativa_observaciones': 0, 'comparativa_estado': 0}
+        if df_novedades.empty:
+            return resultado
+        
+        # Una fila por llave con el MAX(estado) de la llave (mismo criterio que el agregado SQL)
+        df_llaves = (df_novedades[['nit', 'factura', 'oc', 'estado']]
+                     .sort_values('estado', ascending=False, kind='stable')
+                     .drop_duplicates(subset=['nit', 'factura', 'oc'], keep='first'))
+        filas = [tuple(safe_str(v) for v in fila) for fila in df_llaves.itertuples(index=False, name=None)]
+        
+        cur = cx.cursor()
+        try:
+            cur.execute("""
+            IF OBJECT_ID('tempdb..#NovedadesLote') IS NOT NULL DROP TABLE #NovedadesLote;
+            CREATE TABLE #NovedadesLote (
+                nit NVARCHAR(100),
+                factura NVARCHAR(200),
+                oc NVARCHAR(4000),
+                estado NVARCHAR(100)
+            );
+            """)
+            cur.fast_executemany = True
+            cur.executemany("INSERT INTO #NovedadesLote (nit, factura, oc, estado) VALUES (?, ?, ?, ?)", filas)
+            
+            cur.execute("""
+            UPDATE dp
+            SET EstadoFinalFase_4 = 'VALIDACION DATOS DE FACTURACION: Exitoso',
+                ObservacionesFase_4 = LEFT(
+                    CASE WHEN NULLIF(LTRIM(RTRIM(dp.ObservacionesFase_4)), '') IS NULL THEN ?
+                         ELSE ? + ', ' + LTRIM(RTRIM(dp.ObservacionesFase_4)) END, 3900),
+                ResultadoFinalAntesEventos = n.estado
+            FROM [CxP].[DocumentsProcessing] dp
+            INNER JOIN #NovedadesLote n
+                ON dp.nit_emisor_o_nit_del_proveedor = n.nit
+               AND dp.numero_de_factura = n.factura
+               AND dp.numero_de_liquidacion_u_orden_de_compra = n.oc
+            """, (observacion, observacion))
+            resultado['documents_processing'] = cur.rowcount
+            
+            cur.execute("""
+            UPDATE c
+            SET Valor_XML = LEFT(
+                CASE WHEN NULLIF(LTRIM(RTRIM(c.Valor_XML)), '') IS NULL THEN ?
+                     ELSE ? + ', ' + LTRIM(RTRIM(c.Valor_XML)) END, 3900)
+            FROM [dbo].[CxP.Comparativa] c
+            INNER JOIN (SELECT DISTINCT nit, factura FROM #NovedadesLote) n
+                ON c.NIT = n.nit AND c.Factura = n.factura
+            WHERE c.Item = 'Observaciones'
+            """, (observacion, observacion))
+            resultado['comparativa_observaciones'] = cur.rowcount
+            
+            cur.execute("""
+            UPDATE c
+            SET Estado_validacion_antes_de_eventos = n.estado
+            FROM [dbo].[CxP.Comparativa] c
+            INNER JOIN (
+                SELECT nit, factura, MAX(estado) AS estado
+                FROM #NovedadesLote
+                GROUP BY nit, factura
+            ) n ON c.NIT = n.nit AND c.Factura = n.factura
+            """)
+            resultado['comparativa_estado'] = cur.rowcount
+            
+            cur.execute("DROP TABLE #NovedadesLote")
+            cx.commit()
+        except Exception:
+            cx.rollback()
+            raise
+        finally:
+            cur.close()
+        
+        print("[UPDATE] Bulk novedades: DocumentsProcessing=" + str(resultado['documents_processing']) +
+              " Comparativa(Observaciones)=" + str(resultado['comparativa_observaciones']) +
+              " Comparativa(Estado)=" + str(resultado['comparativa_estado']))
+        return resultado
+    
     try:
         cfg = parse_config(GetVar("vLocDicConfig"))
         tolerancia_trm = float(cfg.get('ToleranciaTRM', 10))
@@ -291,94 +405,23 @@ def ZPRE_ValidarTRM():
             
             stats['total'] = len(df_filtrado)
             
-            for idx, row in df_filtrado.iterrows():
-                try:
-                    nit = safe_str(row['nit_emisor_o_nit_del_proveedor_dp'])
-                    factura = safe_str(row['numero_de_factura_dp'])
-                    oc = safe_str(row['numero_de_liquidacion_u_orden_de_compra_dp'])
-                    forma_pago = safe_str(row['forma_de_pago_dp'])
-                    
-                    trm_dp = float(row['CalculationRate_dp']) if pd.notna(row['CalculationRate_dp']) else 0
-                    trms_hoc = split_valores(row['TRM_hoc'])
-                    
-                    trm_match = False
-                    for trm_str in trms_hoc:
-                        try:
-                            trm_hoc = float(trm_str.replace(',', ''))
-                            if abs(trm_dp - trm_hoc) <= tolerancia_trm:
-                                trm_match = True
-                                break
-                        except:
-                            pass
-                    
-                    if trm_match:
-                        stats['aprobados'] += 1
-                    else:
-                        stats['con_novedad'] += 1
-                        estado_final = 'CON NOVEDAD - CONTADO' if forma_pago in ('1', '01') else 'CON NOVEDAD'
-                        
-                        cur = cx.cursor()
-                        cur.execute("""
-                        UPDATE [CxP].[DocumentsProcessing]
-                        SET EstadoFinalFase_4 = 'VALIDACION DATOS DE FACTURACION: Exitoso'
-                        WHERE nit_emisor_o_nit_del_proveedor = ? AND numero_de_factura = ? AND numero_de_liquidacion_u_orden_de_compra = ?
-                        """, (nit, factura, oc))
-                        
-                        cur.execute("""
-                        SELECT ObservacionesFase_4 FROM [CxP].[DocumentsProcessing]
-                        WHERE nit_emisor_o_nit_del_proveedor = ? AND numero_de_factura = ? AND numero_de_liquidacion_u_orden_de_compra = ?
-                        """, (nit, factura, oc))
-                        result = cur.fetchone()
-                        obs_actual = safe_str(result[0]) if result and result[0] else ""
-                        nueva_obs = "No se encuentra coincidencia de TRM"
-                        
-                        if obs_actual:
-                            obs_final = nueva_obs + ", " + obs_actual
-                        else:
-                            obs_final = nueva_obs
-                        
-                        # CORRECCIÓN: Truncar antes de UPDATE
-                        obs_final = truncar_observacion(obs_final)
-                        
-                        cur.execute("""
-                        UPDATE [CxP].[DocumentsProcessing] SET ObservacionesFase_4 = ?
-                        WHERE nit_emisor_o_nit_del_proveedor = ? AND numero_de_factura = ? AND numero_de_liquidacion_u_orden_de_compra = ?
-                        """, (obs_final, nit, factura, oc))
-                        
-                        cur.execute("""
-                        UPDATE [CxP].[DocumentsProcessing] SET ResultadoFinalAntesEventos = ?
-                        WHERE nit_emisor_o_nit_del_proveedor = ? AND numero_de_factura = ? AND numero_de_liquidacion_u_orden_de_compra = ?
-                        """, (estado_final, nit, factura, oc))
-                        
-                        cur.execute("""
-                        SELECT Valor_XML FROM [dbo].[CxP.Comparativa]
-                        WHERE NIT = ? AND Factura = ? AND Item = 'Observaciones'
-                        """, (nit, factura))
-                        result_comp = cur.fetchone()
-                        obs_comp_actual = safe_str(result_comp[0]) if result_comp and result_comp[0] else ""
-                        
-                        if obs_comp_actual:
-                            obs_comp_final = nueva_obs + ", " + obs_comp_actual
-                        else:
-                            obs_comp_final = nueva_obs
-                        
-                        # CORRECCIÓN: Truncar antes de UPDATE
-                        obs_comp_final = truncar_observacion(obs_comp_final)
-                        
-                        cur.execute("""
-                        UPDATE [dbo].[CxP.Comparativa] SET Valor_XML = ?
-                        WHERE NIT = ? AND Factura = ? AND Item = 'Observaciones'
-                        """, (obs_comp_final, nit, factura))
-                        
-                        cur.execute("""
-                        UPDATE [dbo].[CxP.Comparativa] SET Estado_validacion_antes_de_eventos = ?
-                        WHERE NIT = ? AND Factura = ?
-                        """, (estado_final, nit, factura))
-                        cx.commit()
-                        cur.close()
-                
-                except Exception as e:
-                    print("[ERROR] " + str(e))
+            # Comparacion TRM en bloque: todas las TRM SAP contra CalculationRate_dp
+            coincide_trm = comparar_trm_vectorizado(df_filtrado, 'TRM_hoc', tolerancia_trm)
+            stats['aprobados'] = int(coincide_trm.sum())
+            stats['con_novedad'] = int((~coincide_trm).sum())
+            
+            df_sin_coincidencia = df_filtrado[~coincide_trm]
+            forma_pago = df_sin_coincidencia['forma_de_pago_dp'].map(safe_str)
+            df_novedades = pd.DataFrame({
+                'nit': df_sin_coincidencia['nit_emisor_o_nit_del_proveedor_dp'].map(safe_str),
+                'factura': df_sin_coincidencia['numero_de_factura_dp'].map(safe_str),
+                'oc': df_sin_coincidencia['numero_de_liquidacion_u_orden_de_compra_dp'].map(safe_str),
+                'estado': np.where(forma_pago.isin(['1', '01']), 'CON NOVEDAD - CONTADO', 'CON NOVEDAD')
+            })
+            
+            stats['filas_actualizadas'] = aplicar_novedades_bulk(
+                cx, df_novedades, "No se encuentra coincidencia de TRM"
+            )
             
             msg = "OK. Total:" + str(stats['total']) + " Aprobados:" + str(stats['aprobados'])
             SetVar("vLocStrResultadoSP", "True")
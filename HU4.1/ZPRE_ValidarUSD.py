@@ -142,6 +142,7 @@ def ZPRE_ValidarUSD():
     import ast
     import traceback
     import pyodbc
+    import sys
     import pandas as pd
     import numpy as np
     from datetime import datetime
@@ -316,7 +317,8 @@ def ZPRE_ValidarUSD():
         cx = None
         for attempt in range(max_retries):
             try:
-                cx = pyodbc.connect(conn_str, timeout=30)
+                pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                cx = pool_sql.conectar(conn_str, timeout=30) if pool_sql else pyodbc.connect(conn_str, timeout=30)
                 cx.autocommit = False
                 print("[DEBUG] Conexion SQL abierta (intento " + str(attempt + 1) + ")")
                 break
@@ -349,18 +351,32 @@ def ZPRE_ValidarUSD():
         valores = str(valor_str).split('|')
         return [v.strip() for v in valores if v.strip()]
     
-    def sumar_valores(valor_str, nombre_campo="campo"):
-        valores = split_valores(valor_str)
+    def sumar_valores(valor_str):
         suma = 0.0
-        for i, v in enumerate(valores):
+        for v in split_valores(valor_str):
             try:
-                v_limpio = v.strip().replace(',', '')
-                suma += float(v_limpio)
+                suma += float(v.replace(',', ''))
             except:
                 pass
-        print("[DEBUG] " + nombre_campo + " suma: " + str(suma))
         return suma
     
+    def sumar_montos_por_factura(serie):
+        """
+        Suma por fila los montos separados por | con el parser compartido
+        (HU4.1/parser_montos.py, registrado con registrar_parser_montos).
+        Si el parser no esta registrado se suma con sumar_valores.
+
+        Args:
+            serie (pd.Series): Columna con montos separados por |.
+
+        Returns:
+            np.ndarray: Suma float64 por fila.
+        """
+        parser = getattr(sys, "_cxp_parser_montos", None)
+        if parser is None:
+            return np.array([sumar_valores(v) for v in serie], dtype=np.float64)
+        return parser.sumar_montos_por_factura(serie)
+    
     def contiene_valor(campo, valor_buscado):
         valores = split_valores(campo)
         return valor_buscado in valores
@@ -404,6 +420,10 @@ def ZPRE_ValidarUSD():
             
             stats['total_registros'] = len(df_filtrado)
             
+            # Sumas por factura calculadas una sola vez para todo el lote
+            df_filtrado['_SumaPorCalcular'] = sumar_montos_por_factura(df_filtrado['PorCalcular_hoc'])
+            df_filtrado['_SumaVlrPagarCop'] = sumar_montos_por_factura(df_filtrado['VlrPagarCop_dp'])
+            
             for idx, row in df_filtrado.iterrows():
                 try:
                     id_reg = safe_str(row['ID_dp'])
@@ -412,8 +432,8 @@ def ZPRE_ValidarUSD():
                     oc = safe_str(row['numero_de_liquidacion_u_orden_de_compra_dp'])
                     forma_pago = safe_str(row['forma_de_pago_dp'])
                     
-                    suma_por_calcular = sumar_valores(row['PorCalcular_hoc'], "PorCalcular")
-                    vlr_pagar_cop = sumar_valores(row['VlrPagarCop_dp'], "VlrPagarCop")
+                    suma_por_calcular = float(row['_SumaPorCalcular'])
+                    vlr_pagar_cop = float(row['_SumaVlrPagarCop'])
                     diferencia = abs(suma_por_calcular - vlr_pagar_cop)
                     
                     if diferencia <= tolerancia:
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+================================================================================
+MODULO: parser_montos.py
+================================================================================
+
+Descripcion General:
+--------------------
+    Parser de montos compartido por los validadores de HU4.1 y HU4.2:
+
+        - sumar_montos_por_factura / parsear_montos_vectorizado: convierten
+          una columna completa de montos separados por | en un arreglo plano
+          float64 con offsets por fila y suman por factura con
+          np.add.reduceat (ZPRE_ValidarCOP, ZPRE_ValidarUSD,
+          ZPCN_ZPPA_ValidarCOP, ZPCN_ZPPA_ValidarUSD).
+        - normalizar_decimal: conversion de un valor suelto, con las mismas
+          reglas de separadores (HU4.1_ZPAF, HU4.1_ZPSA_ZPSS, HU4.1_ZVEN,
+          HU4.2_ValidarNC_ND).
+
+    Igual que el pool de conexiones, el parser se registra en el modulo sys
+    (atributo _cxp_parser_montos) para que sea visible desde cualquier script
+    aunque cada uno se ejecute con su propio espacio de nombres. Si no esta
+    registrado, cada script usa su conversion local:
+
+        parser = getattr(sys, "_cxp_parser_montos", None)
+        sumas = parser.sumar_montos_por_factura(df["PorCalcular_hoc"])
+
+Autor: Diego Ivan Lopez Ochoa
+Version: 1.1.0
+
+================================================================================
+REGLAS DE CONVERSION POR MONTO
+================================================================================
+
+    Se eliminan los caracteres que no son digitos, '.', ',' o '-' (simbolos
+    de moneda, espacios, letras) y se decide el papel de cada separador:
+
+        +-----------------------------+------------------+--------------+
+        | Monto                       | Regla            | Resultado    |
+        +-----------------------------+------------------+--------------+
+        | "1.234,56"  "$1,234.56"     | '.' y ',': el    | 1234.56      |
+        |                             | ultimo es decimal|              |
+        | "1.000.000" "1,000,000"     | repetido: miles  | 1000000.0    |
+        | "1200.50"   "COP 2.500"     | '.' unico:       | 1200.5 / 2.5 |
+        |                             | decimal          |              |
+        | "12,345"                    | ',' unica: miles | 12345.0      |
+        |                             | (coma_decimal=   |              |
+        |                             | False)           |              |
+        | "1,5"                       | ',' unica:       | 1.5          |
+        |                             | decimal (coma_   |              |
+        |                             | decimal=True)    |              |
+        +-----------------------------+------------------+--------------+
+
+    La ',' unica depende del origen:
+        - Columnas de montos SAP de los validadores ZPRE/ZPCN (coma_decimal=
+          False, valor por defecto de sumar_montos_por_factura): ',' es
+          separador de miles, como en sus sumar_valores originales.
+        - normalizar_decimal (coma_decimal=True): ',' es decimal, como en
+          las normalizar_decimal originales.
+
+    Un '.' unico siempre es decimal ("1.000" -> 1.0, "COP 2.500" -> 2.5):
+    es lo que hacian float() y normalizar_decimal, y se conserva.
+
+    Lo que no se convierte vale 0.0. Celdas vacias, None, NaN y 0 no aportan
+    montos; tokens vacios entre | se descartan (igual que split_valores).
+
+    Cambios frente a las conversiones originales (montos que daban 0.0 o un
+    valor errado):
+        - normalizar_decimal: "1.234,56" y "$1,000.00" daban 0.0 (varios '.'
+          tras cambiar ',' por '.'); ahora 1234.56 y 1000.0.
+        - Validadores: "1.234,56" daba 1.23456 y "$1,000" 0.0; ahora 1234.56
+          y 1000.0.
+        - Notacion cientifica ("1e3") no es un formato de monto: la 'e' se
+          elimina como cualquier letra, igual que en normalizar_decimal.
+
+================================================================================
+VARIABLES DE ENTRADA/SALIDA
+================================================================================
+
+Variables de Salida (SetVar):
+-----------------------------
+    vLocStrResultadoSP : bool
+    vLocStrResumenSP : str - Estado del registro.
+
+================================================================================
+"""
+
+
+def registrar_parser_montos():
+    """
+    Registra el parser de montos en sys para los validadores de HU4.1 y HU4.2.
+
+    Returns:
+        tuple: (bool, str) - exito y resumen.
+
+    Example:
+        # Al inicio del bot, una sola vez (junto a inicializar_pool_conexiones)
+        ok, resumen = registrar_parser_montos()
+    """
+    import sys
+    import types
+    import pandas as pd
+    import numpy as np
+
+    ATRIBUTO_SYS = "_cxp_parser_montos"
+
+    class _SoloNumerico(dict):
+        """Tabla para str.translate: conserva digitos, '.', ',', '-' y '|'."""
+        def __missing__(self, codigo):
+            caracter = chr(codigo)
+            destino = codigo if caracter.isdecimal() or caracter in '.,-|' else None
+            self[codigo] = destino
+            return destino
+
+    TABLA_SOLO_NUMERICO = _SoloNumerico()
+
+    def float_o_cero(texto):
+        """float() de Python o 0.0 si no convierte."""
+        try:
+            return float(texto)
+        except Exception:
+            return 0.0
+
+    def convertir_monto(texto, coma_decimal):
+        """
+        Convierte un monto suelto (sin |) aplicando las reglas de separadores.
+
+        Args:
+            texto (str): Monto con posibles simbolos y separadores.
+            coma_decimal (bool): Si una ',' unica es decimal (True) o miles.
+
+        Returns:
+            float: Valor convertido o 0.0.
+        """
+        limpio = texto.translate(TABLA_SOLO_NUMERICO).replace('|', '')
+        ult_punto = limpio.rfind('.')
+        ult_coma = limpio.rfind(',')
+        if ult_punto >= 0 and ult_coma >= 0:
+            if ult_coma > ult_punto:
+                limpio = limpio.replace('.', '').replace(',', '.')
+            else:
+                limpio = limpio.replace(',', '')
+        elif ult_coma >= 0:
+            if coma_decimal and limpio.count(',') == 1:
+                limpio = limpio.replace(',', '.')
+            else:
+                limpio = limpio.replace(',', '')
+        elif limpio.count('.') > 1:
+            limpio = limpio.replace('.', '')
+        return float_o_cero(limpio)
+
+    def convertir_tokens_montos(tokens, coma_decimal):
+        """
+        Convierte un arreglo de montos ya depurados a float64.
+
+        Aplica las reglas de convertir_monto con operaciones np.char sobre todo
+        el arreglo; solo los tokens que to_numeric no acepta (digitos no ASCII,
+        '-' sueltos) se reintentan uno a uno con float().
+
+        Args:
+            tokens (np.ndarray): Strings no vacios con solo digitos, '.', ',' y '-'.
+            coma_decimal (bool): Si una ',' unica es decimal (True) o miles.
+
+        Returns:
+            np.ndarray: Valores float64, uno por token.
+        """
+        if tokens.size == 0:
+            return np.zeros(0, dtype=np.float64)
+
+        ult_punto = np.char.rfind(tokens, '.')
+        ult_coma = np.char.rfind(tokens, ',')
+        ambos = (ult_punto >= 0) & (ult_coma >= 0)
+        coma_unica = (ult_coma >= 0) & (np.char.find(tokens, ',') == ult_coma)
+        punto_unico = (ult_punto >= 0) & (np.char.find(tokens, '.') == ult_punto)
+
+        decimal_coma = (ambos & (ult_coma > ult_punto)) | (~ambos & coma_unica & coma_decimal)
+        decimal_punto = (ambos & (ult_punto > ult_coma)) | (~ambos & punto_unico)
+
+        sin_puntos = np.char.replace(tokens, '.', '')
+        limpio = np.where(
+            decimal_coma,
+            np.char.replace(sin_puntos, ',', '.'),
+            np.where(decimal_punto, np.char.replace(tokens, ',', ''), np.char.replace(sin_puntos, ',', ''))
+        )
+        valores = pd.to_numeric(pd.Series(limpio, dtype=object), errors='coerce')
+
+        pendientes = valores.isna().to_numpy()
+        if pendientes.any():
+            valores[pendientes] = [float_o_cero(t) for t in limpio[pendientes]]
+        return valores.to_numpy(dtype=np.float64)
+
+    def parsear_montos_vectorizado(serie, coma_decimal=False):
+        """
+        Convierte una columna de montos separados por | en un arreglo plano.
+
+        Args:
+            serie (pd.Series): Columna con strings separados por | o numeros.
+            coma_decimal (bool): Si una ',' unica es decimal. Por defecto
+                False: en las columnas SAP de los validadores es de miles.
+
+        Returns:
+            tuple: (valores, offsets)
+                - valores: np.ndarray float64 con todos los montos.
+                - offsets: np.ndarray int64 de largo len(serie) + 1; los montos
+                  de la fila i son valores[offsets[i]:offsets[i + 1]].
+
+        Examples:
+            >>> valores, offsets = parsear_montos_vectorizado(pd.Series(["1.234,56|10", None, "$1,000"]))
+            >>> valores.tolist(), offsets.tolist()
+            ([1234.56, 10.0, 1000.0], [0, 2, 2, 3])
+        """
+        serie = pd.Series(serie, dtype=object).reset_index(drop=True)
+        n = len(serie)
+        if n == 0:
+            return np.zeros(0, dtype=np.float64), np.zeros(1, dtype=np.int64)
+
+        # Celdas numericas (int/float) se toman tal cual; 0 no aporta montos
+        # (split_valores descartaba los valores falsy)
+        es_numero = serie.notna() & serie.map(
+            lambda v: isinstance(v, (int, float, np.number)) and not isinstance(v, bool)
+        )
+        celdas = serie.where(~es_numero & serie.notna(), '').astype(str).to_numpy(dtype=str)
+
+        # Un solo translate + split sobre todo el texto en lugar de uno por celda;
+        # translate elimina tambien los espacios, por lo que no hace falta strip
+        texto = '|'.join(celdas).translate(TABLA_SOLO_NUMERICO)
+        tokens_por_celda = np.char.count(celdas, '|') + 1
+        tokens = np.array(texto.split('|'), dtype=str)
+        fila_token = np.repeat(np.arange(n, dtype=np.int64), tokens_por_celda)
+
+        no_vacio = tokens != ''
+        valores_texto = convertir_tokens_montos(tokens[no_vacio], coma_decimal)
+        fila_token = fila_token[no_vacio]
+
+        numeros = pd.to_numeric(serie[es_numero], errors='coerce')
+        numeros = numeros[numeros.notna() & (numeros != 0)]
+        fila_numero = numeros.index.to_numpy(dtype=np.int64)
+
+        filas = np.concatenate([fila_token, fila_numero])
+        orden = np.argsort(filas, kind='stable')
+        valores = np.concatenate([
+            valores_texto,
+            numeros.to_numpy(dtype=np.float64)
+        ])[orden]
+
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(filas, minlength=n), out=offsets[1:])
+        return valores, offsets
+
+    def sumar_montos_por_factura(serie, coma_decimal=False):
+        """
+        Suma los montos separados por | de cada fila de una columna.
+
+        Args:
+            serie (pd.Series): Columna con montos separados por |.
+            coma_decimal (bool): Ver parsear_montos_vectorizado.
+
+        Returns:
+            np.ndarray: Suma float64 por fila (0.0 si la fila no tiene montos).
+
+        Examples:
+            >>> sumar_montos_por_factura(pd.Series(["1,000,000|2,500.50", "", "7"])).tolist()
+            [1002500.5, 0.0, 7.0]
+        """
+        valores, offsets = parsear_montos_vectorizado(serie, coma_decimal)
+        if len(offsets) == 1:
+            return np.zeros(0, dtype=np.float64)
+        # Centinela al final para que reduceat acepte offsets == len(valores)
+        sumas = np.add.reduceat(np.append(valores, 0.0), offsets[:-1])
+        sumas[np.diff(offsets) == 0] = 0.0
+        return sumas
+
+    def normalizar_decimal(valor):
+        """
+        Convierte un valor suelto a float (',' unica como decimal).
+
+        Args:
+            valor (str | float | int | None): Valor a normalizar.
+
+        Returns:
+            float: Valor numerico; 0.0 si es vacio, NaN o no convertible.
+
+        Examples:
+            >>> normalizar_decimal("1.234,56")
+            1234.56
+            >>> normalizar_decimal("$1,000.00")
+            1000.0
+            >>> normalizar_decimal("1,5")
+            1.5
+            >>> normalizar_decimal(None)
+            0.0
+        """
+        if valor is None:
+            return 0.0
+        if isinstance(valor, (int, float, np.number)):
+            return 0.0 if pd.isna(valor) else float(valor)
+        if pd.isna(valor) or valor == '':
+            return 0.0
+        return convertir_monto(str(valor), coma_decimal=True)
+
+    # ==========================================================================
+    # REGISTRO
+    # ==========================================================================
+    try:
+        setattr(sys, ATRIBUTO_SYS, types.SimpleNamespace(
+            parsear_montos_vectorizado=parsear_montos_vectorizado,
+            sumar_montos_por_factura=sumar_montos_por_factura,
+            normalizar_decimal=normalizar_decimal,
+        ))
+        resumen = "Parser de montos REGISTRADO"
+        print(f"[INFO] {resumen}")
+        SetVar("vLocStrResultadoSP", True)
+        SetVar("vLocStrResumenSP", resumen)
+        return True, resumen
+
+    except Exception as e:
+        resumen = f"ERROR Parser de montos | {e}"
+        print(f"[ERROR] {resumen}")
+        try:
+            SetVar("vLocStrResultadoSP", False)
+            SetVar("vLocStrResumenSP", resumen)
+        except Exception:
+            pass
+        return False, resumen
@@ -33,6 +33,19 @@
 #     )
 # END
 
+
+# Huella de origen por documento del snapshot incremental (la crea el script si no existe)
+# IF NOT EXISTS (SELECT * FROM sys.objects WHERE object_id = OBJECT_ID(N'[CxP].[Comparativa_Huella]') AND type in (N'U'))
+# BEGIN
+#     CREATE TABLE [CxP].[Comparativa_Huella](
+#         [Tipo_Nota] [varchar](2) NOT NULL,
+#         [ID_Registro] [varchar](50) NOT NULL,
+#         [Huella] [char](64) NOT NULL,
+#         [Fecha_de_ejecucion] [datetime] NULL,
+#         CONSTRAINT [PK_Comparativa_Huella] PRIMARY KEY ([Tipo_Nota], [ID_Registro])
+#     )
+# END
+
 """
 ================================================================================
 SCRIPT: HU4_2_ValidarNC_ND.py
@@ -81,7 +94,7 @@ DIAGRAMA DE FLUJO
                                   |
                                   v
     +-------------------------------------------------------------+
-    |  4. Poblar tabla [CxP].[Comparativa_NC] con items           |
+    |  4. Sincronizar snapshot [CxP].[Comparativa_NC]             |
     +-----------------------------+-------------------------------+
                                   |
                                   v
@@ -239,6 +252,15 @@ VARIABLES DE ENTRADA (RocketBot)
         - ClaveBaseDatos: Contrasena SQL (opcional)
         - RutaBaseReporteNC: Ruta base para reportes NC
         - NombreReporteNC: Nombre del archivo de reporte
+        - ReconstruirComparativas: "True" para limpiar y repoblar por completo
+          Comparativa_NC/ND (recuperacion). Por defecto el snapshot es incremental
+        - FasesConcurrentes: "True" para ejecutar las fases NC y ND en paralelo,
+          cada una con su propia conexion. El reporte de novedades se genera al final
+        - TamanoPagina: Documentos por pagina keyset (por ID). 0 (defecto) lee todos
+          los pendientes de una vez
+        - RutaCheckpoint: Archivo JSON con el ultimo ID escrito por fase (opcional,
+          por defecto en el directorio temporal). Una corrida reiniciada el mismo dia
+          continua desde ese ID; se elimina al completar
 
 ================================================================================
 VARIABLES DE SALIDA (RocketBot)
@@ -250,6 +272,11 @@ VARIABLES DE SALIDA (RocketBot)
     vLocStrResumenSP : str
         "Procesamiento Finalizado. NC: X, ND: Y"
 
+    vLocDicEstadisticas : str
+        Diccionario con NC/ND procesadas y filas escritas por fase
+        (snapshot eliminadas/insertadas, items actualizados/insertados, estados),
+        tiempos por fase y ahorro de tiempo por concurrencia
+
     vGblStrDetalleError : str
         Traceback en caso de error critico
 
@@ -331,27 +358,24 @@ FUNCIONES AUXILIARES PRINCIPALES
     quitar_tildes(texto):
         Elimina acentos para estandarizacion
         
-    calcular_dias_diferencia(fecha_inicio, fecha_fin):
-        Calcula dias entre fechas (multiples formatos)
+    convertir_fechas_vectorizado(serie) / calcular_plazos_retoma(df, ...):
+        Conversion de fechas y regla de plazo de retoma por columnas
 
 ================================================================================
-FUNCIONES DE VALIDACION ND
+FUNCIONES DE VALIDACION NC / ND (vectorizadas)
 ================================================================================
 
-    validar_nombre_receptor(nombre):
-        Verifica DIANA CORPORACION SAS o DICORP SAS
-        
-    validar_nit_receptor(nit):
-        Verifica NIT 860031606
+    calcular_reglas_tributarias(df):
+        Columnas booleanas por Item sobre el DataFrame completo:
+        - Nombre/NIT/Fecha emisor con valor
+        - Nombre receptor DIANA CORPORACION SAS o DICORP SAS
+        - NIT receptor 860031606
+        - Tipo persona 31, digito de verificacion 6
+        - TaxLevelCode con O-13, O-15, O-23, O-47 o R-99-PN
         
-    validar_tipo_persona(tipo):
-        Verifica codigo 31
-        
-    validar_digito_verificacion(digito):
-        Verifica digito 6
-        
-    validar_tax_level_code(tax_code):
-        Verifica O-13, O-15, O-23, O-47 o R-99-PN
+    tabla_reglas_tributarias(df):
+        Tabla larga (documento, Item, valor, SI/NO) escrita en bloque
+        a Comparativa_NC/ND
 
 ================================================================================
 """
@@ -362,7 +386,7 @@ def HU42_ValidarNotasCreditoDebito():
     
     Esta funcion orquesta todo el flujo de negocio:
     1. Conecta a la base de datos SQL Server.
-    2. Limpia y repuebla las tablas de comparativa [CxP].[Comparativa_NC] y [CxP].[Comparativa_ND].
+    2. Sincroniza el snapshot de [CxP].[Comparativa_NC] y [CxP].[Comparativa_ND] (incremental o completo).
     3. Itera sobre las NC pendientes, busca sus Facturas (FV) correspondientes y valida montos y referencias.
     4. Itera sobre las ND pendientes y valida datos tributarios.
     5. Genera reportes en Excel con las novedades encontradas.
@@ -374,18 +398,24 @@ def HU42_ValidarNotasCreditoDebito():
     import ast
     import traceback
     import pyodbc
+    import sys
     import pandas as pd
     import numpy as np
-    from datetime import datetime, timedelta
+    from datetime import date, datetime, timedelta
     from contextlib import contextmanager
     import time
     import warnings
     import re
     import os
     import unicodedata
+    import hashlib
     from dateutil.relativedelta import relativedelta
     import random
-    from openpyxl import load_workbook, Workbook 
+    from openpyxl import load_workbook
+    import xlsxwriter
+    from concurrent.futures import ThreadPoolExecutor
+    import threading
+    import tempfile
 
     # Ignoramos advertencias de pandas sobre SQLAlchemy para mantener la consola limpia
     warnings.filterwarnings('ignore', message='pandas only supports SQLAlchemy')
@@ -469,7 +499,9 @@ def HU42_ValidarNotasCreditoDebito():
         """
         Normaliza un valor numerico o string monetario a float estandar.
 
-        Maneja formatos como '1.200,50' o '1200.50'.
+        Maneja formatos como '1.200,50' o '1200.50'. Usa el parser de montos
+        compartido (HU4.1/parser_montos.py) si esta registrado; si no, la
+        conversion local.
 
         Args:
             valor (str|float): Valor a normalizar.
@@ -477,6 +509,9 @@ def HU42_ValidarNotasCreditoDebito():
         Returns:
             float: Valor numerico puro. Retorna 0.0 si falla la conversion.
         """
+        parser = getattr(sys, "_cxp_parser_montos", None)
+        if parser is not None:
+            return parser.normalizar_decimal(valor)
         if pd.isna(valor) or valor == '' or valor is None: return 0.0
         try: return float(str(valor).strip().replace(',', '.').replace(r'[^\d.\-]', ''))
         except: return 0.0
@@ -518,52 +553,85 @@ def HU42_ValidarNotasCreditoDebito():
         if not texto: return ""
         return ''.join([c for c in unicodedata.normalize('NFKD', texto) if not unicodedata.combining(c)])
 
-    def calcular_dias_diferencia(fecha_inicio, fecha_fin):
+    def convertir_fechas_vectorizado(serie):
         """
-        Calcula los dias transcurridos entre dos fechas soportando multiples formatos.
+        Convierte una columna de fechas en formatos mixtos a datetime64 en una sola pasada.
+
+        Acepta valores datetime y textos en los formatos soportados (orden de prioridad);
+        los milisegundos se descartan antes del parseo.
 
         Args:
-            fecha_inicio (str|datetime): Fecha inicial.
-            fecha_fin (str|datetime): Fecha final.
+            serie (pandas.Series): Columna con fechas (datetime o str).
 
         Returns:
-            int: Cantidad de dias de diferencia. Retorna 0 si falla el parseo.
+            pandas.Series: Fechas datetime64 (NaT si no se pudo interpretar).
         """
-        try:
-            # Lista de formatos soportados (orden de prioridad)
-            formatos = [
-                '%Y-%m-%d %H:%M:%S',    # Formato con hora estandar
-                '%Y-%m-%d',             # Formato fecha estandar
-                '%d/%m/%Y',             # Formato latino
-                '%d-%m-%Y'              # Variante con guiones
-            ]
-
-            def convertir_a_datetime(fecha):
-                if isinstance(fecha, datetime):
-                    return fecha
-                
-                if isinstance(fecha, str):
-                    # Limpiamos milisegundos si existen para evitar errores de formato
-                    if '.' in fecha:
-                        fecha = fecha.split('.')[0]
-                    
-                    for fmt in formatos:
-                        try:
-                            return datetime.strptime(fecha, fmt)
-                        except ValueError:
-                            continue
-                return None
-
-            dt_inicio = convertir_a_datetime(fecha_inicio)
-            dt_fin = convertir_a_datetime(fecha_fin)
-
-            if dt_inicio and dt_fin:
-                return (dt_fin - dt_inicio).days
-                
-            return 0
+        # Lista de formatos soportados (orden de prioridad)
+        formatos = [
+            '%Y-%m-%d %H:%M:%S',    # Formato con hora estandar
+            '%Y-%m-%d',             # Formato fecha estandar
+            '%d/%m/%Y',             # Formato latino
+            '%d-%m-%Y'              # Variante con guiones
+        ]
+
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            return serie
+
+        es_fecha = serie.map(lambda v: isinstance(v, datetime))
+        resultado = pd.Series(pd.NaT, index=serie.index, dtype='datetime64[ns]')
+        if es_fecha.any():
+            resultado[es_fecha] = pd.to_datetime(serie[es_fecha], errors='coerce')
+
+        es_texto = serie.map(lambda v: isinstance(v, str))
+        if es_texto.any():
+            # Limpiamos milisegundos si existen para evitar errores de formato
+            texto = serie[es_texto].str.split('.').str[0]
+            for fmt in formatos:
+                pendientes = resultado[es_texto].isna()
+                if not pendientes.any():
+                    break
+                idx_pendientes = pendientes[pendientes].index
+                resultado[idx_pendientes] = pd.to_datetime(texto[idx_pendientes], format=fmt, errors='coerce')
+        return resultado
 
-        except Exception as e:
-            return 0
+    def calcular_plazos_retoma(df, fecha_referencia, plazo_max):
+        """
+        Evalua la regla de plazo maximo de retoma para todas las filas de un DataFrame NC/ND.
+
+        Args:
+            df (pandas.DataFrame): Documentos con EstadoFase_3 y Fecha_retoma_contabilizacion.
+            fecha_referencia (datetime): Fecha contra la que se cuentan los dias.
+            plazo_max (int): Plazo maximo de retoma en dias.
+
+        Returns:
+            pandas.DataFrame: Mismo indice que df con las columnas
+            RetornoManual, TieneFechaRetoma, DiasRetoma, ExcedePlazo y RequiereFechaRetoma.
+        """
+        def columna_texto(nombre):
+            if nombre not in df.columns:
+                return pd.Series('', index=df.index)
+            serie = df[nombre]
+            return serie.astype(object).where(serie.notna(), '').astype(str).str.strip()
+
+        estado_fase3 = columna_texto('EstadoFase_3')
+        texto_retoma = columna_texto('Fecha_retoma_contabilizacion')
+
+        retorno_manual = estado_fase3.str.upper().str.contains('EXITOSO', regex=False)
+        tiene_fecha = (texto_retoma != '') & ~texto_retoma.str.lower().isin(['null', 'none', 'nan'])
+
+        if 'Fecha_retoma_contabilizacion' in df.columns:
+            fechas = convertir_fechas_vectorizado(df['Fecha_retoma_contabilizacion'])
+            dias = (pd.Timestamp(fecha_referencia) - fechas).dt.days.fillna(0).astype(int)
+        else:
+            dias = pd.Series(0, index=df.index)
+
+        return pd.DataFrame({
+            'RetornoManual': retorno_manual,
+            'TieneFechaRetoma': tiene_fecha,
+            'DiasRetoma': dias,
+            'ExcedePlazo': ~retorno_manual & tiene_fecha & (dias > plazo_max),
+            'RequiereFechaRetoma': ~retorno_manual & ~tiene_fecha
+        }, index=df.index)
 
     # =========================================================================
     # FUNCIONES DE CONEXION A BASE DE DATOS
@@ -619,7 +687,8 @@ def HU42_ValidarNotasCreditoDebito():
         # Intento 1: SQL Auth
         for attempt in range(max_retries):
             try:
-                cx = pyodbc.connect(conn_str_auth, timeout=30)
+                pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                cx = pool_sql.conectar(conn_str_auth, timeout=30) if pool_sql else pyodbc.connect(conn_str_auth, timeout=30)
                 cx.autocommit = False
                 conectado = True
                 print(f"[INFO] Conexion SQL (Auth) establecida exitosamente (intento {attempt + 1})")
@@ -633,7 +702,8 @@ def HU42_ValidarNotasCreditoDebito():
             print("[WARNING] Fallo Auth SQL. Intentando Trusted Connection...")
             for attempt in range(max_retries):
                 try:
-                    cx = pyodbc.connect(conn_str_trusted, timeout=30)
+                    pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                    cx = pool_sql.conectar(conn_str_trusted, timeout=30) if pool_sql else pyodbc.connect(conn_str_trusted, timeout=30)
                     cx.autocommit = False
                     conectado = True
                     print(f"[INFO] Conexion SQL (Trusted) establecida exitosamente (intento {attempt + 1})")
@@ -697,273 +767,244 @@ def HU42_ValidarNotasCreditoDebito():
             print(f"[ERROR] Fallo al actualizar DocumentsProcessing ID {registro_id}: {str(e)}")
             raise
 
-    def actualizar_items_comparativa_nc(registro_id, cx, nit, nombre_item,
-                                    actualizar_valor_xml=True, valor_xml=None,
-                                    actualizar_aprobado=True, valor_aprobado=None, 
-                                    actualizar_valor_factura=True, valor_factura=None, 
-                                    actualizar_estado=True, valor_estado=None, 
-                                    # Datos de contexto para INSERT
-                                    id_ejecucion=None, fecha_retoma=None, nombre_proveedor=None):
+    def valor_db(v):
         """
-        Actualiza o inserta items en la tabla [CxP].[Comparativa_NC].
-        
-        Utiliza logica de CTE para manejar multiples items identicos (duplicados por splits).
-        
+        Normaliza un sub-valor de item para escritura en las tablas comparativas.
+
+        Args:
+            v (any): Valor a normalizar.
+
+        Returns:
+            str|None: Cadena limpia o None si es vacia, 'none' o 'null'.
+        """
+        if v is None: return None
+        s = str(v).strip()
+        if not s or s.lower() == 'none' or s.lower() == 'null': return None
+        return s
+
+    def registrar_item_comparativa(buffer, registro_id, nit, nombre_item,
+                                   valor_xml=None, valor_aprobado=None,
+                                   valor_factura=None, valor_estado=None,
+                                   # Datos de contexto para INSERT
+                                   id_ejecucion=None, fecha_retoma=None, nombre_proveedor=None):
+        """
+        Acumula en memoria la escritura de un item de Comparativa_NC/ND.
+
+        Replica la logica del escritor por item: los valores concatenados con pipe '|'
+        se expanden en sub-filas (rn = 1..N). Si el mismo item se registra varias veces,
+        gana el ultimo registro por sub-fila, igual que los UPDATE secuenciales.
+
         Args:
+            buffer (dict): Acumulador {(registro_id, nit, item, rn): valores}.
             registro_id (str): ID del registro unico.
-            cx (pyodbc.Connection): Conexion.
             nit (str): NIT del emisor.
             nombre_item (str): Nombre del campo validado (ej: 'NIT Emisor').
-            actualizar_valor_xml (bool): Flag para actualizar el valor XML.
-            valor_xml (str): Valor extraido del XML/NC.
-            actualizar_aprobado (bool): Flag para actualizar estado aprobado.
+            valor_xml (str): Valor extraido del XML.
             valor_aprobado (str): 'SI' o 'NO'.
-            actualizar_valor_factura (bool): Flag para actualizar valor contrapartida.
-            valor_factura (str): Valor de la Factura encontrada.
-            actualizar_estado (bool): Flag para actualizar estado general.
-            valor_estado (str): Estado del proceso (ej: 'EXITOSO').
+            valor_factura (str): Valor de la Factura encontrada (solo NC).
+            valor_estado (str): Estado del proceso.
             id_ejecucion (str): ID de ejecucion del bot (solo para inserts).
             fecha_retoma (datetime): Fecha de retoma (solo para inserts).
             nombre_proveedor (str): Nombre del proveedor (solo para inserts).
+        """
+        lista_factura = str(valor_factura).split('|') if valor_factura else []
+        lista_xml = str(valor_xml).split('|') if valor_xml else []
+        lista_aprob = str(valor_aprobado).split('|') if valor_aprobado else []
+        lista_estado = str(valor_estado).split('|') if valor_estado else []
+
+        maximo_conteo = max(len(lista_factura), len(lista_xml), len(lista_aprob), len(lista_estado))
+        maximo_conteo = 1 if maximo_conteo == 0 else maximo_conteo
+
+        for i in range(maximo_conteo):
+            buffer[(registro_id, nit, nombre_item, i + 1)] = (
+                valor_db(lista_factura[i] if i < len(lista_factura) else None),
+                valor_db(lista_xml[i] if i < len(lista_xml) else None),
+                valor_db(lista_aprob[i] if i < len(lista_aprob) else None),
+                valor_db(lista_estado[i] if i < len(lista_estado) else None),
+                id_ejecucion, fecha_retoma, nombre_proveedor
+            )
+
+    def registrar_estado_comparativa(estados, nit, registro_id, estado):
+        """
+        Acumula el estado global de todos los items de una NC/ND.
 
-        Raises:
-            Exception: Si falla la consulta SQL.
+        Se aplica despues de los items en escribir_items_comparativa_bulk, conservando
+        el orden items -> estado del flujo por registro.
+
+        Args:
+            estados (dict): Acumulador {(nit, registro_id): estado}.
+            nit (str): NIT del emisor.
+            registro_id (str): ID unico del registro.
+            estado (str): Nuevo estado (ej: 'ENCONTRADO', 'NO EXITOSO').
         """
-        try:
-            cur = cx.cursor()
-            
-            def safe_db_val(v):
-                if v is None: return None
-                s = str(v).strip()
-                if not s or s.lower() == 'none' or s.lower() == 'null': return None
-                return s
-
-            # 1. Verificamos cuantos registros existen para decidir entre UPDATE o INSERT
-            query_count = """
-            SELECT COUNT(*)
-            FROM [CxP].[Comparativa_NC]
-            WHERE NIT = ? AND Item = ? AND ID_Registro = ?
-            """
-            cur.execute(query_count, (nit, nombre_item, registro_id))
-            count_existentes = cur.fetchone()[0]
-
-            # 2. Preparamos las listas por si vienen valores concatenados con pipe '|'
-            lista_factura = str(valor_factura).split('|') if valor_factura else []
-            lista_xml = str(valor_xml).split('|') if valor_xml else []
-            lista_aprob = str(valor_aprobado).split('|') if valor_aprobado else []
-            lista_estado = str(valor_estado).split('|') if valor_estado else []
-
-            maximo_conteo = max(len(lista_factura), len(lista_xml), len(lista_aprob), len(lista_estado))
-            maximo_conteo = 1 if maximo_conteo == 0 else maximo_conteo
-
-            # 3. Iteramos para procesar cada sub-valor
-            for i in range(maximo_conteo):
-                item_factura = lista_factura[i] if i < len(lista_factura) else None
-                item_xml = lista_xml[i] if i < len(lista_xml) else None
-                item_aprob = lista_aprob[i] if i < len(lista_aprob) else None
-                item_estado = lista_estado[i] if i < len(lista_estado) else None
-
-                val_factura = safe_db_val(item_factura)
-                val_xml = safe_db_val(item_xml)
-                val_aprob = safe_db_val(item_aprob)
-                val_estado = safe_db_val(item_estado)
-
-                if i < count_existentes:
-                    # LOGICA UPDATE
-                    set_clauses = []
-                    params = []
-
-                    if actualizar_valor_factura:
-                        set_clauses.append("Valor_Factura = ?")
-                        params.append(val_factura)
-                    if actualizar_valor_xml:
-                        set_clauses.append("Valor_XML = ?")
-                        params.append(val_xml)
-                    if actualizar_aprobado:
-                        set_clauses.append("Aprobado = ?")
-                        params.append(val_aprob)
-                    if actualizar_estado:
-                        set_clauses.append("Estado = ?")
-                        params.append(val_estado)
-
-                    if not set_clauses: continue
-
-                    # Usamos CTE con ; al inicio para compatibilidad SQL Server
-                    update_query = f"""
-                    ;WITH CTE AS (
-                        SELECT Valor_Factura, Valor_XML, Aprobado, Estado,
-                            ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) as rn
-                        FROM [CxP].[Comparativa_NC]
-                        WHERE NIT = ?  AND Item = ? AND ID_Registro = ?
-                    )
-                    UPDATE CTE
-                    SET {", ".join(set_clauses)}
-                    WHERE rn = ?
-                    """
-                    final_params = params + [nit, nombre_item, registro_id, i + 1]
-                    cur.execute(update_query, final_params)
+        estados[(nit, registro_id)] = estado
 
-                else:
-                    # LOGICA INSERT
-                    insert_query = """
-                    INSERT INTO [CxP].[Comparativa_NC] (
-                        Fecha_de_ejecucion, Fecha_de_retoma, ID_ejecucion, ID_Registro, 
-                        NIT, Nombre_Proveedor, Item, 
-                        Valor_Factura, Valor_XML, Aprobado, Estado
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """
-                    cur.execute(insert_query, (
-                        datetime.now(), fecha_retoma, id_ejecucion, registro_id,
-                        nit, nombre_proveedor, nombre_item,
-                        val_factura, val_xml, val_aprob, val_estado or 'PENDIENTE'
-                    ))
-            
-            cx.commit()
+    def escribir_items_comparativa_bulk(cx, tipo_nota, buffer, estados=None):
+        """
+        Escribe en bloque los items y estados acumulados en [CxP].[Comparativa_NC] o [CxP].[Comparativa_ND].
+
+        Carga los items en la tabla temporal #ItemsLote y aplica:
+            1. UPDATE de las sub-filas existentes (ROW_NUMBER por NIT + Item + ID_Registro).
+            2. INSERT de las sub-filas que exceden las existentes (Estado 'PENDIENTE' por defecto).
+            3. UPDATE del Estado global por (NIT, ID_Registro) desde #EstadosLote.
+        Todo en una sola transaccion.
 
-        except Exception as e:
-            print(f"[ERROR] Fallo en actualizar_items_comparativa_nc para ID {registro_id}: {e}")
-            cx.rollback()
-            raise e
-   
-    def actualizar_items_comparativa_nd(registro_id, cx, nit, nombre_item,
-                                        actualizar_valor_xml=True, valor_xml=None,
-                                        actualizar_aprobado=True, valor_aprobado=None, 
-                                        actualizar_estado=True, valor_estado=None,
-                                        # Datos de contexto para INSERT
-                                        id_ejecucion=None, nombre_proveedor=None):
-        """
-        Actualiza o inserta items en la tabla [CxP].[Comparativa_ND].
-        
         Args:
-            registro_id (str): ID del registro unico.
             cx (pyodbc.Connection): Conexion activa.
-            nit (str): NIT del emisor.
-            nombre_item (str): Nombre del item validado.
-            actualizar_valor_xml (bool): Flag valor XML.
-            valor_xml (str): Valor del XML/ND.
-            actualizar_aprobado (bool): Flag aprobado.
-            valor_aprobado (str): 'SI' o 'NO'.
-            actualizar_estado (bool): Flag estado.
-            valor_estado (str): Estado del proceso.
-            id_ejecucion (str): ID de ejecucion del bot.
-            nombre_proveedor (str): Nombre del proveedor.
+            tipo_nota (str): 'NC' o 'ND'.
+            buffer (dict): Items acumulados con registrar_item_comparativa.
+            estados (dict): Estados acumulados con registrar_estado_comparativa.
+
+        Returns:
+            dict: Filas actualizadas/insertadas de items y filas con estado actualizado.
 
         Raises:
             Exception: Si falla la transaccion SQL.
         """
+        es_nc = tipo_nota == 'NC'
+        tabla = '[CxP].[Comparativa_NC]' if es_nc else '[CxP].[Comparativa_ND]'
+        estados = estados or {}
+        resultado = {'items_actualizados': 0, 'items_insertados': 0, 'estados_actualizados': 0}
+        if not buffer and not estados:
+            return resultado
+
+        cur = cx.cursor()
         try:
-            cur = cx.cursor()
-            
-            def safe_db_val(v):
-                if v is None: return None
-                s = str(v).strip()
-                if not s or s.lower() == 'none' or s.lower() == 'null': return None
-                return s
-
-            query_count = """
-            SELECT COUNT(*)
-            FROM [CxP].[Comparativa_ND]
-            WHERE NIT = ? AND Item = ? AND ID_Registro = ?
-            """
-            cur.execute(query_count, (nit, nombre_item, registro_id))
-            count_existentes = cur.fetchone()[0]
-
-            lista_xml = str(valor_xml).split('|') if valor_xml else []
-            lista_aprob = str(valor_aprobado).split('|') if valor_aprobado else []
-            lista_estado = str(valor_estado).split('|') if valor_estado else []
-
-            maximo_conteo = max(len(lista_xml), len(lista_aprob), len(lista_estado))
-            maximo_conteo = 1 if maximo_conteo == 0 else maximo_conteo
-
-            for i in range(maximo_conteo):
-                item_xml = lista_xml[i] if i < len(lista_xml) else None
-                item_aprob = lista_aprob[i] if i < len(lista_aprob) else None
-                item_estado = lista_estado[i] if i < len(lista_estado) else None
-
-                val_xml = safe_db_val(item_xml)
-                val_aprob = safe_db_val(item_aprob)
-                val_estado = safe_db_val(item_estado)
-
-                if i < count_existentes:
-                    set_clauses = []
-                    params = []
-
-                    if actualizar_valor_xml:
-                        set_clauses.append("Valor_XML = ?")
-                        params.append(val_xml)
-                    if actualizar_aprobado:
-                        set_clauses.append("Aprobado = ?")
-                        params.append(val_aprob)
-                    if actualizar_estado:
-                        set_clauses.append("Estado = ?")
-                        params.append(val_estado)
-
-                    if not set_clauses: continue
-
-                    update_query = f"""
-                    ;WITH CTE AS (
-                        SELECT Valor_XML, Aprobado, Estado,
-                            ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) as rn
-                        FROM [CxP].[Comparativa_ND]
-                        WHERE NIT = ? AND Item = ? AND ID_Registro = ?
+            if buffer:
+                filas = [
+                    (str(reg_id), str(nit), item, rn, fac, xml, aprob, est,
+                     valor_db(id_ej), f_ret if isinstance(f_ret, datetime) and pd.notna(f_ret) else None, valor_db(nombre))
+                    for (reg_id, nit, item, rn), (fac, xml, aprob, est, id_ej, f_ret, nombre) in buffer.items()
+                ]
+                cur.execute("""
+                IF OBJECT_ID('tempdb..#ItemsLote') IS NOT NULL DROP TABLE #ItemsLote;
+                CREATE TABLE #ItemsLote (
+                    Orden INT IDENTITY(1,1),
+                    ID_Registro NVARCHAR(100),
+                    NIT NVARCHAR(100),
+                    Item NVARCHAR(200),
+                    rn INT,
+                    Valor_Factura NVARCHAR(MAX) NULL,
+                    Valor_XML NVARCHAR(MAX) NULL,
+                    Aprobado NVARCHAR(50) NULL,
+                    Estado NVARCHAR(200) NULL,
+                    ID_ejecucion NVARCHAR(100) NULL,
+                    Fecha_retoma DATETIME NULL,
+                    Nombre_Proveedor NVARCHAR(500) NULL
+                );
+                """)
+                cur.fast_executemany = True
+                cur.executemany("""
+                INSERT INTO #ItemsLote (ID_Registro, NIT, Item, rn, Valor_Factura, Valor_XML, Aprobado,
+                                        Estado, ID_ejecucion, Fecha_retoma, Nombre_Proveedor)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, filas)
+
+                # Conteo de sub-filas existentes por item, antes de modificar la tabla
+                cur.execute(f"""
+                IF OBJECT_ID('tempdb..#ConteoItems') IS NOT NULL DROP TABLE #ConteoItems;
+                SELECT c.NIT, c.Item, c.ID_Registro, COUNT(*) AS Existentes
+                INTO #ConteoItems
+                FROM {tabla} c
+                INNER JOIN (SELECT DISTINCT NIT, Item, ID_Registro FROM #ItemsLote) k
+                    ON c.NIT = k.NIT AND c.Item = k.Item AND c.ID_Registro = k.ID_Registro
+                GROUP BY c.NIT, c.Item, c.ID_Registro;
+                """)
+
+                set_factura = "Valor_Factura = l.Valor_Factura," if es_nc else ""
+                cols_cte = "Valor_Factura, Valor_XML, Aprobado, Estado" if es_nc else "Valor_XML, Aprobado, Estado"
+                cur.execute(f"""
+                ;WITH CTE AS (
+                    SELECT {cols_cte}, NIT, Item, ID_Registro,
+                        ROW_NUMBER() OVER (PARTITION BY NIT, Item, ID_Registro ORDER BY (SELECT NULL)) AS rn
+                    FROM {tabla} c
+                    WHERE EXISTS (
+                        SELECT 1 FROM #ConteoItems k
+                        WHERE k.NIT = c.NIT AND k.Item = c.Item AND k.ID_Registro = c.ID_Registro
                     )
-                    UPDATE CTE
-                    SET {", ".join(set_clauses)}
-                    WHERE rn = ?
-                    """
-                    final_params = params + [nit, nombre_item, registro_id, i + 1]
-                    cur.execute(update_query, final_params)
-
+                )
+                UPDATE CTE
+                SET {set_factura}
+                    Valor_XML = l.Valor_XML,
+                    Aprobado = l.Aprobado,
+                    Estado = l.Estado
+                FROM CTE
+                INNER JOIN #ItemsLote l
+                    ON CTE.NIT = l.NIT AND CTE.Item = l.Item AND CTE.ID_Registro = l.ID_Registro AND CTE.rn = l.rn
+                """)
+                resultado['items_actualizados'] = cur.rowcount
+
+                if es_nc:
+                    cur.execute("""
+                    INSERT INTO [CxP].[Comparativa_NC] (
+                        Fecha_de_ejecucion, Fecha_de_retoma, ID_ejecucion, ID_Registro,
+                        NIT, Nombre_Proveedor, Item,
+                        Valor_Factura, Valor_XML, Aprobado, Estado
+                    )
+                    SELECT ?, l.Fecha_retoma, l.ID_ejecucion, l.ID_Registro,
+                           l.NIT, l.Nombre_Proveedor, l.Item,
+                           l.Valor_Factura, l.Valor_XML, l.Aprobado, ISNULL(l.Estado, 'PENDIENTE')
+                    FROM #ItemsLote l
+                    LEFT JOIN #ConteoItems k
+                        ON k.NIT = l.NIT AND k.Item = l.Item AND k.ID_Registro = l.ID_Registro
+                    WHERE l.rn > ISNULL(k.Existentes, 0)
+                    ORDER BY l.Orden
+                    """, (datetime.now(),))
                 else:
-                    insert_query = """
+                    cur.execute("""
                     INSERT INTO [CxP].[Comparativa_ND] (
-                        Fecha_de_ejecucion, ID_ejecucion, ID_Registro, 
-                        NIT, Nombre_Proveedor, Item, 
+                        Fecha_de_ejecucion, ID_ejecucion, ID_Registro,
+                        NIT, Nombre_Proveedor, Item,
                         Valor_XML, Aprobado, Estado
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """
-                    cur.execute(insert_query, (
-                        datetime.now(), id_ejecucion, registro_id,
-                        nit, nombre_proveedor, nombre_item,
-                        val_xml, val_aprob, val_estado or 'PENDIENTE'
-                    ))
-            
-            cx.commit()
-
-        except Exception as e:
-            print(f"[ERROR] Fallo en actualizar_items_comparativa_nd para ID {registro_id}: {e}")
-            cx.rollback()
-            raise e
-    
-    def actualizar_estado_comparativa_nc(cx, nit, registro_id, estado):
-        """
-        Actualiza la columna 'Estado' masivamente para todos los items de una NC especifica.
-
-        Args:
-            cx (pyodbc.Connection): Conexion activa.
-            nit (str): NIT del emisor.
-            registro_id (str): ID unico del registro.
-            estado (str): Nuevo estado (ej: 'ENCONTRADO', 'NO EXITOSO').
+                    )
+                    SELECT ?, l.ID_ejecucion, l.ID_Registro,
+                           l.NIT, l.Nombre_Proveedor, l.Item,
+                           l.Valor_XML, l.Aprobado, ISNULL(l.Estado, 'PENDIENTE')
+                    FROM #ItemsLote l
+                    LEFT JOIN #ConteoItems k
+                        ON k.NIT = l.NIT AND k.Item = l.Item AND k.ID_Registro = l.ID_Registro
+                    WHERE l.rn > ISNULL(k.Existentes, 0)
+                    ORDER BY l.Orden
+                    """, (datetime.now(),))
+                resultado['items_insertados'] = cur.rowcount
+
+                cur.execute("DROP TABLE #ConteoItems; DROP TABLE #ItemsLote;")
+
+            if estados:
+                cur.execute("""
+                IF OBJECT_ID('tempdb..#EstadosLote') IS NOT NULL DROP TABLE #EstadosLote;
+                CREATE TABLE #EstadosLote (
+                    NIT NVARCHAR(100),
+                    ID_Registro NVARCHAR(100),
+                    Estado NVARCHAR(200)
+                );
+                """)
+                cur.fast_executemany = True
+                cur.executemany(
+                    "INSERT INTO #EstadosLote (NIT, ID_Registro, Estado) VALUES (?, ?, ?)",
+                    [(str(nit), str(reg_id), estado) for (nit, reg_id), estado in estados.items()]
+                )
+                cur.execute(f"""
+                UPDATE c
+                SET Estado = e.Estado
+                FROM {tabla} c
+                INNER JOIN #EstadosLote e
+                    ON c.NIT = e.NIT AND c.ID_Registro = e.ID_Registro
+                """)
+                resultado['estados_actualizados'] = cur.rowcount
+                cur.execute("DROP TABLE #EstadosLote")
 
-        Raises:
-            Exception: Si falla la actualizacion.
-        """
-        try:
-            cur = cx.cursor()
-            
-            update_sql = """
-            UPDATE [CxP].[Comparativa_NC]
-            SET Estado = ?
-            WHERE NIT = ? AND [ID_Registro] = ?
-            """
-            cur.execute(update_sql, (estado, nit, registro_id))
             cx.commit()
             cur.close()
-            
+
         except Exception as e:
-            print(f"[ERROR] Error actualizando estado global en Comparativa_NC: {e}")
+            print(f"[ERROR] Fallo en escritura masiva de items {tabla}: {e}")
             cx.rollback()
             raise e
+
+        print(f"[SUCCESS] Items {tabla}: actualizados={resultado['items_actualizados']} "
+              f"insertados={resultado['items_insertados']} estados={resultado['estados_actualizados']}")
+        return resultado
     
     def limpiar_tablas_comparativas(cx):
         """
@@ -984,6 +1025,9 @@ def HU42_ValidarNotasCreditoDebito():
             print("[INFO] Limpiando tabla [CxP].[Comparativa_ND]...")
             cursor.execute("TRUNCATE TABLE [CxP].[Comparativa_ND]")
             
+            # Sin huellas, la siguiente corrida incremental restablece cada documento una vez
+            cursor.execute("IF OBJECT_ID('[CxP].[Comparativa_Huella]', 'U') IS NOT NULL TRUNCATE TABLE [CxP].[Comparativa_Huella]")
+            
             cx.commit()
             print("[SUCCESS] Tablas comparativas limpiadas exitosamente.")
             
@@ -992,6 +1036,46 @@ def HU42_ValidarNotasCreditoDebito():
             cx.rollback()
             raise e
     
+    # Lista items estandarizada (SIN TILDES) del snapshot de Comparativa_NC
+    ITEMS_COMPARATIVA_NC = [
+        "Nombre Emisor",
+        "NIT Emisor",
+        "Nombre Receptor",
+        "Nit Receptor",
+        "Tipo Persona Receptor",
+        "DigitoVerificacion Receptor",
+        "TaxLevelCode Receptor",
+        "Fecha emision del documento",
+        "LineExtensionAmount",
+        "Tipo de nota credito",
+        "Referencia",
+        "Codigo CUFE de la factura",
+        "Cude de la Nota Credito",
+        "ActualizacionNombreArchivos",
+        "RutaRespaldo",
+        "Observaciones"
+    ]
+
+    # Lista items estandarizada ND (SIN TILDES) del snapshot de Comparativa_ND
+    ITEMS_COMPARATIVA_ND = [
+        "Nombre Emisor",
+        "NIT Emisor",
+        "Nombre Receptor",
+        "Nit Receptor",
+        "Tipo Persona Receptor",
+        "DigitoVerificacion Receptor",
+        "TaxLevelCode Receptor",
+        "Fecha emision del documento",
+        "LineExtensionAmount",
+        "Tipo de nota debito",
+        "Referencia",
+        "Codigo CUFE de la factura",
+        "Cude de la Nota Debito",
+        "ActualizacionNombreArchivos",
+        "RutaRespaldo",
+        "Observaciones"
+    ]
+
     def poblar_inicial_comparativa_nc(cx, df):
         """
         Realiza una insercion masiva (Bulk Insert) inicial en Comparativa_NC.
@@ -1002,29 +1086,14 @@ def HU42_ValidarNotasCreditoDebito():
             cx (pyodbc.Connection): Conexion activa.
             df (pandas.DataFrame): DataFrame con las NC pendientes.
 
+        Returns:
+            int: Filas insertadas.
+
         Raises:
             Exception: Si falla la insercion masiva.
         """
         try:
-            # Lista items estandarizada (SIN TILDES)
-            items_a_validar = [
-                "Nombre Emisor",
-                "NIT Emisor",
-                "Nombre Receptor",
-                "Nit Receptor",
-                "Tipo Persona Receptor",
-                "DigitoVerificacion Receptor",
-                "TaxLevelCode Receptor",
-                "Fecha emision del documento",
-                "LineExtensionAmount",
-                "Tipo de nota credito",
-                "Referencia",
-                "Codigo CUFE de la factura",
-                "Cude de la Nota Credito", 
-                "ActualizacionNombreArchivos",
-                "RutaRespaldo",
-                "Observaciones"
-            ]
+            items_a_validar = ITEMS_COMPARATIVA_NC
 
             fecha_actual = datetime.now()
             datos_para_insertar = []
@@ -1073,9 +1142,11 @@ def HU42_ValidarNotasCreditoDebito():
                 cursor.executemany(sql_insert, datos_para_insertar)
                 cx.commit()
                 print("[SUCCESS] Poblado inicial NC completado con exito.")
+                return len(datos_para_insertar)
                 
             else:
                 print("[WARNING] El DataFrame de NC estaba vacio, no se insertaron registros.")
+                return 0
 
         except Exception as e:
             print(f"[ERROR] Fallo al poblar tabla inicial NC: {e}")
@@ -1090,29 +1161,14 @@ def HU42_ValidarNotasCreditoDebito():
             cx (pyodbc.Connection): Conexion activa.
             df (pandas.DataFrame): DataFrame con las ND pendientes.
 
+        Returns:
+            int: Filas insertadas.
+
         Raises:
             Exception: Si falla la insercion.
         """
         try:
-            # Lista items estandarizada ND (SIN TILDES)
-            items_a_validar = [
-                "Nombre Emisor",
-                "NIT Emisor",
-                "Nombre Receptor",
-                "Nit Receptor",
-                "Tipo Persona Receptor",
-                "DigitoVerificacion Receptor",
-                "TaxLevelCode Receptor",
-                "Fecha emision del documento",
-                "LineExtensionAmount",
-                "Tipo de nota debito",
-                "Referencia",
-                "Codigo CUFE de la factura",
-                "Cude de la Nota Debito",
-                "ActualizacionNombreArchivos",
-                "RutaRespaldo",
-                "Observaciones"
-            ]
+            items_a_validar = ITEMS_COMPARATIVA_ND
 
             fecha_actual = datetime.now()
             datos_para_insertar = []
@@ -1158,44 +1214,889 @@ def HU42_ValidarNotasCreditoDebito():
                 cursor.executemany(sql_insert, datos_para_insertar)
                 cx.commit()
                 print("[SUCCESS] Poblado inicial de ND completado con exito.")
+                return len(datos_para_insertar)
                 
             else:
                 print("[WARNING] El DataFrame de ND estaba vacio, no se insertaron registros.")
+                return 0
 
         except Exception as e:
             print(f"[ERROR] Fallo al poblar tabla inicial ND: {e}")
             cx.rollback()
             raise e
-    
-    
+
+    # Columnas de DocumentsProcessing que determinan el contenido del snapshot de un documento
+    # (estado, fecha de retoma y fuentes de los items); su huella decide si se restablece
+    COLUMNAS_HUELLA_NC = ['ResultadoFinalAntesEventos', 'Fecha_retoma_contabilizacion', 'tipo_de_nota_credito',
+                          'Tipo_de_nota_cred_deb', 'cufeuuid', 'cufe_fe', 'PrefijoYNumero',
+                          'numero_de_factura', 'valor_a_pagar']
+    COLUMNAS_HUELLA_ND = ['ResultadoFinalAntesEventos', 'Tipo_de_nota_cred_deb', 'cufeuuid', 'cufe_fe',
+                          'PrefijoYNumero', 'valor_a_pagar']
+
+    def huellas_origen(df, tipo_nota):
+        """
+        Calcula la huella (SHA-256) de las columnas de origen de cada documento.
+
+        Incluye el estado, la fecha de retoma (NC), las fuentes de los items escritos por la
+        validacion y las columnas de las reglas tributarias. Columnas ausentes cuentan como ''.
+
+        Args:
+            df (pandas.DataFrame): Documentos pendientes del tipo indicado.
+            tipo_nota (str): 'NC' o 'ND'.
+
+        Returns:
+            pd.Series: Huella hexadecimal de 64 caracteres, alineada con df.index.
+        """
+        columnas = (COLUMNAS_HUELLA_NC if tipo_nota == 'NC' else COLUMNAS_HUELLA_ND) + \
+                   [columna for _, columna, _ in REGLAS_TRIBUTARIAS]
+        textos = [texto_vectorizado(df[c]) if c in df.columns else pd.Series("", index=df.index)
+                  for c in columnas]
+        return pd.Series(
+            [hashlib.sha256('\x1f'.join(valores).encode('utf-8')).hexdigest() for valores in zip(*textos)],
+            index=df.index, dtype=object
+        )
+
+    def sincronizar_snapshot_comparativa(cx, tipo_nota, df, podar_no_pendientes=True):
+        """
+        Sincroniza de forma incremental el snapshot de [CxP].[Comparativa_NC] o [CxP].[Comparativa_ND].
+
+        En lugar de TRUNCATE + poblado completo, carga los documentos pendientes en la tabla
+        temporal #SnapshotDocs y solo re-siembra (DELETE + INSERT de sus items) los documentos
+        cuyo registro de origen cambio (ID_ejecucion, NIT, Nombre_Proveedor o numero de nota)
+        o cuyo snapshot esta incompleto. Los documentos que ya no estan pendientes se eliminan.
+
+        De los demas documentos pendientes solo se restablecen en sitio (valores del poblado
+        completo: sin sub-filas de splits, fechas y Estado actuales, items en '') los que tienen
+        alguna columna de origen distinta a la del ultimo restablecimiento: estado, fecha de
+        retoma o fuentes de los items (huellas_origen, guardada en [CxP].[Comparativa_Huella]).
+        Los documentos sin cambios no se escriben; la validacion vuelve a escribir sus items.
+
+        En modo paginado df es solo una pagina: la poda de no pendientes se hace una vez con
+        podar_snapshot_comparativa y aqui se desactiva (podar_no_pendientes=False).
+
+        Args:
+            cx (pyodbc.Connection): Conexion activa.
+            tipo_nota (str): 'NC' o 'ND'.
+            df (pandas.DataFrame): Documentos pendientes del tipo indicado.
+            podar_no_pendientes (bool): True para eliminar los documentos que no estan en df.
+
+        Returns:
+            dict: Documentos pendientes, re-sembrados y restablecidos; filas eliminadas,
+                insertadas y restablecidas.
+
+        Raises:
+            Exception: Si falla la sincronizacion.
+        """
+        es_nc = tipo_nota == 'NC'
+        tabla = '[CxP].[Comparativa_NC]' if es_nc else '[CxP].[Comparativa_ND]'
+        col_nota = 'Nota_Credito' if es_nc else 'Nota_Debito'
+        items_a_validar = ITEMS_COMPARATIVA_NC if es_nc else ITEMS_COMPARATIVA_ND
+        resultado = {'documentos_pendientes': len(df), 'documentos_resembrados': 0, 'documentos_restablecidos': 0,
+                     'filas_eliminadas': 0, 'filas_insertadas': 0, 'filas_restablecidas': 0}
+        fecha_ejecucion = datetime.now()
+
+        try:
+            huellas = huellas_origen(df, tipo_nota)
+            documentos = []
+            vistos = set()
+            for row, huella in zip(df.itertuples(index=False), huellas):
+                id_registro = str(getattr(row, 'ID', None))
+                if id_registro in vistos: continue
+                vistos.add(id_registro)
+
+                if es_nc:
+                    nota = getattr(row, 'Numero_de_nota_credito', None)
+                    fecha_retoma = getattr(row, 'Fecha_retoma_contabilizacion', None)
+                    estado = getattr(row, 'ResultadoFinalAntesEventos', None)
+                else:
+                    nota = getattr(row, 'numero_de_nota_debito', None)
+                    if not nota: nota = getattr(row, 'Numero_de_nota_debito', None)
+                    fecha_retoma = None
+                    estado = 'PENDIENTE'
+
+                if fecha_retoma is not None and not isinstance(fecha_retoma, datetime):
+                    fecha_retoma = pd.to_datetime(fecha_retoma, errors='coerce')
+                if fecha_retoma is not None and pd.isna(fecha_retoma):
+                    fecha_retoma = None
+
+                documentos.append((
+                    id_registro,
+                    str(getattr(row, 'executionNum', None)),
+                    str(getattr(row, 'nit_emisor_o_nit_del_proveedor', None)),
+                    str(getattr(row, 'nombre_emisor', None)),
+                    str(nota),
+                    fecha_retoma,
+                    None if estado is None or (isinstance(estado, float) and pd.isna(estado)) else estado,
+                    huella
+                ))
+
+            cur = cx.cursor()
+            cur.execute("""
+            IF OBJECT_ID('[CxP].[Comparativa_Huella]', 'U') IS NULL
+                CREATE TABLE [CxP].[Comparativa_Huella] (
+                    Tipo_Nota VARCHAR(2) NOT NULL,
+                    ID_Registro VARCHAR(50) NOT NULL,
+                    Huella CHAR(64) NOT NULL,
+                    Fecha_de_ejecucion DATETIME NULL,
+                    CONSTRAINT PK_Comparativa_Huella PRIMARY KEY (Tipo_Nota, ID_Registro)
+                );
+            IF OBJECT_ID('tempdb..#SnapshotDocs') IS NOT NULL DROP TABLE #SnapshotDocs;
+            CREATE TABLE #SnapshotDocs (
+                Orden INT IDENTITY(1,1),
+                ID_Registro NVARCHAR(100),
+                ID_ejecucion NVARCHAR(100),
+                NIT NVARCHAR(100),
+                Nombre_Proveedor NVARCHAR(500),
+                Nota NVARCHAR(200),
+                Fecha_retoma DATETIME NULL,
+                Estado NVARCHAR(200) NULL,
+                Huella CHAR(64) NOT NULL,
+                Cambio BIT NOT NULL DEFAULT 0,
+                Restablecer BIT NOT NULL DEFAULT 0
+            );
+            IF OBJECT_ID('tempdb..#SnapshotItems') IS NOT NULL DROP TABLE #SnapshotItems;
+            CREATE TABLE #SnapshotItems (
+                Orden INT,
+                Item NVARCHAR(200)
+            );
+            """)
+            cur.fast_executemany = True
+            if documentos:
+                cur.executemany("""
+                INSERT INTO #SnapshotDocs (ID_Registro, ID_ejecucion, NIT, Nombre_Proveedor, Nota, Fecha_retoma, Estado, Huella)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, documentos)
+            cur.executemany("INSERT INTO #SnapshotItems (Orden, Item) VALUES (?, ?)",
+                            list(enumerate(items_a_validar, start=1)))
+
+            # Documentos nuevos, con origen modificado o con snapshot incompleto
+            cur.execute(f"""
+            UPDATE s
+            SET Cambio = 1
+            FROM #SnapshotDocs s
+            WHERE NOT EXISTS (
+                    SELECT 1 FROM {tabla} c
+                    WHERE c.ID_Registro = s.ID_Registro
+                      AND c.Item = ?
+                      AND ISNULL(c.ID_ejecucion, '') = s.ID_ejecucion
+                      AND ISNULL(c.NIT, '') = s.NIT
+                      AND ISNULL(c.Nombre_Proveedor, '') = s.Nombre_Proveedor
+                      AND ISNULL(c.{col_nota}, '') = s.Nota
+                  )
+               OR EXISTS (
+                    SELECT 1 FROM #SnapshotItems i
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM {tabla} c
+                        WHERE c.ID_Registro = s.ID_Registro AND c.Item = i.Item
+                    )
+                  )
+            """, (items_a_validar[0],))
+            cur.execute("SELECT COUNT(*) FROM #SnapshotDocs WHERE Cambio = 1")
+            resultado['documentos_resembrados'] = cur.fetchone()[0]
+
+            # Documentos sin re-siembra cuyas columnas de origen cambiaron desde el ultimo restablecimiento
+            cur.execute("""
+            UPDATE s
+            SET Restablecer = 1
+            FROM #SnapshotDocs s
+            WHERE s.Cambio = 0
+              AND NOT EXISTS (
+                    SELECT 1 FROM [CxP].[Comparativa_Huella] h
+                    WHERE h.Tipo_Nota = ? AND h.ID_Registro = s.ID_Registro AND h.Huella = s.Huella
+                  )
+            """, (tipo_nota,))
+            cur.execute("SELECT COUNT(*) FROM #SnapshotDocs WHERE Restablecer = 1")
+            resultado['documentos_restablecidos'] = cur.fetchone()[0]
+
+            # Se eliminan los documentos a re-sembrar y (si aplica) los que ya no estan pendientes
+            condicion_poda = "OR NOT EXISTS (SELECT 1 FROM #SnapshotDocs s WHERE s.ID_Registro = c.ID_Registro)" if podar_no_pendientes else ""
+            cur.execute(f"""
+            DELETE c
+            FROM {tabla} c
+            WHERE EXISTS (SELECT 1 FROM #SnapshotDocs s WHERE s.ID_Registro = c.ID_Registro AND s.Cambio = 1)
+               {condicion_poda}
+            """)
+            resultado['filas_eliminadas'] = cur.rowcount
+
+            if es_nc:
+                cur.execute("""
+                INSERT INTO [CxP].[Comparativa_NC] (
+                    [Fecha_de_ejecucion], [Fecha_de_retoma], [ID_ejecucion], [ID_Registro],
+                    [NIT], [Nombre_Proveedor], [Nota_Credito], [Item],
+                    [Valor_XML], [Valor_Factura], [Aprobado], [Estado]
+                )
+                SELECT ?, s.Fecha_retoma, s.ID_ejecucion, s.ID_Registro,
+                       s.NIT, s.Nombre_Proveedor, s.Nota, i.Item,
+                       '', '', '', s.Estado
+                FROM #SnapshotDocs s
+                CROSS JOIN #SnapshotItems i
+                WHERE s.Cambio = 1
+                ORDER BY s.Orden, i.Orden
+                """, (fecha_ejecucion,))
+            else:
+                cur.execute("""
+                INSERT INTO [CxP].[Comparativa_ND] (
+                    [Fecha_de_ejecucion], [ID_ejecucion], [ID_Registro],
+                    [NIT], [Nombre_Proveedor], [Nota_Debito], [Item],
+                    [Valor_XML], [Aprobado], [Estado]
+                )
+                SELECT ?, s.ID_ejecucion, s.ID_Registro,
+                       s.NIT, s.Nombre_Proveedor, s.Nota, i.Item,
+                       '', '', s.Estado
+                FROM #SnapshotDocs s
+                CROSS JOIN #SnapshotItems i
+                WHERE s.Cambio = 1
+                ORDER BY s.Orden, i.Orden
+                """, (fecha_ejecucion,))
+            resultado['filas_insertadas'] = cur.rowcount
+
+            # Documentos a restablecer: sub-filas de splits fuera y valores iniciales
+            if resultado['documentos_restablecidos']:
+                cur.execute(f"""
+                ;WITH CTE AS (
+                    SELECT ROW_NUMBER() OVER (PARTITION BY c.ID_Registro, c.Item ORDER BY (SELECT NULL)) AS rn
+                    FROM {tabla} c
+                    WHERE EXISTS (SELECT 1 FROM #SnapshotDocs s WHERE s.ID_Registro = c.ID_Registro AND s.Restablecer = 1)
+                )
+                DELETE FROM CTE WHERE rn > 1
+                """)
+                resultado['filas_eliminadas'] += cur.rowcount
+
+                set_retoma = "Fecha_de_retoma = s.Fecha_retoma," if es_nc else ""
+                set_factura = "Valor_Factura = '', " if es_nc else ""
+                cur.execute(f"""
+                UPDATE c
+                SET Fecha_de_ejecucion = ?,
+                    {set_retoma}
+                    {set_factura}Valor_XML = '',
+                    Aprobado = '',
+                    Estado = s.Estado
+                FROM {tabla} c
+                INNER JOIN #SnapshotDocs s
+                    ON s.ID_Registro = c.ID_Registro AND s.Restablecer = 1
+                """, (fecha_ejecucion,))
+                resultado['filas_restablecidas'] = cur.rowcount
+
+            # Huellas de los documentos re-sembrados o restablecidos (y poda de no pendientes)
+            cur.execute("""
+            MERGE [CxP].[Comparativa_Huella] AS h
+            USING (SELECT ID_Registro, Huella FROM #SnapshotDocs WHERE Cambio = 1 OR Restablecer = 1) AS s
+                ON h.Tipo_Nota = ? AND h.ID_Registro = s.ID_Registro
+            WHEN MATCHED THEN
+                UPDATE SET Huella = s.Huella, Fecha_de_ejecucion = ?
+            WHEN NOT MATCHED THEN
+                INSERT (Tipo_Nota, ID_Registro, Huella, Fecha_de_ejecucion)
+                VALUES (?, s.ID_Registro, s.Huella, ?);
+            """, (tipo_nota, fecha_ejecucion, tipo_nota, fecha_ejecucion))
+            if podar_no_pendientes:
+                cur.execute("""
+                DELETE h
+                FROM [CxP].[Comparativa_Huella] h
+                WHERE h.Tipo_Nota = ?
+                  AND NOT EXISTS (SELECT 1 FROM #SnapshotDocs s WHERE s.ID_Registro = h.ID_Registro)
+                """, (tipo_nota,))
+
+            cur.execute("DROP TABLE #SnapshotDocs; DROP TABLE #SnapshotItems;")
+            cx.commit()
+            cur.close()
+
+        except Exception as e:
+            print(f"[ERROR] Fallo al sincronizar snapshot {tabla}: {e}")
+            cx.rollback()
+            raise e
+
+        print(f"[SUCCESS] Snapshot {tabla}: {resultado['documentos_resembrados']}/{resultado['documentos_pendientes']} "
+              f"documentos re-sembrados, {resultado['documentos_restablecidos']} restablecidos, "
+              f"{resultado['filas_eliminadas']} filas eliminadas, {resultado['filas_insertadas']} filas insertadas, "
+              f"{resultado['filas_restablecidas']} filas restablecidas.")
+        return resultado
+
+    # =========================================================================
+    # PAGINACION KEYSET Y CHECKPOINTS
+    # =========================================================================
+
+    # Filtro de documentos pendientes por tipo de nota (comun a lectura completa, paginas y poda)
+    FILTRO_PENDIENTES = {
+        'NC': "[tipo_de_documento]='NC' AND ([ResultadoFinalAntesEventos] IS NULL OR [ResultadoFinalAntesEventos] NOT IN ('ENCONTRADO', 'NO EXITOSO'))",
+        'ND': "[tipo_de_documento]='ND' AND ([ResultadoFinalAntesEventos] IS NULL OR [ResultadoFinalAntesEventos] NOT IN ('Exitoso'))"
+    }
+
+    bloqueo_checkpoint = threading.Lock()
+
+    def iterar_paginas_pendientes(cx, tipo_nota, tamano_pagina, ultimo_id=None):
+        """
+        Recorre los documentos pendientes de un tipo en paginas keyset por ID.
+
+        Cada pagina se consulta con TOP (tamano_pagina) ... WHERE ID > ultimo ID ORDER BY ID,
+        de modo que el costo por pagina no depende de la posicion (sin OFFSET) y los documentos
+        que dejan de estar pendientes al procesarse no desplazan las paginas siguientes.
+
+        Args:
+            cx (pyodbc.Connection): Conexion activa.
+            tipo_nota (str): 'NC' o 'ND'.
+            tamano_pagina (int): Documentos por pagina.
+            ultimo_id (int|None): Ultimo ID ya procesado (checkpoint), None para iniciar.
+
+        Yields:
+            tuple: (DataFrame de la pagina, ultimo ID de la pagina)
+        """
+        cursor_id = -1 if ultimo_id is None else int(ultimo_id)
+        query = f"""
+        SELECT TOP (?) *
+        FROM [CxP].[DocumentsProcessing]
+        WHERE {FILTRO_PENDIENTES[tipo_nota]}
+          AND [ID] > ?
+        ORDER BY [ID]
+        """
+        while True:
+            df_pagina = pd.read_sql(query, cx, params=[int(tamano_pagina), cursor_id])
+            if df_pagina.empty:
+                break
+            cursor_id = int(df_pagina['ID'].max())
+            yield df_pagina, cursor_id
+            if len(df_pagina) < tamano_pagina:
+                break
+
+    def podar_snapshot_comparativa(cx, tipo_nota):
+        """
+        Elimina de Comparativa_NC/ND (y de Comparativa_Huella) los documentos que ya no estan pendientes.
+
+        Es la poda que sincronizar_snapshot_comparativa hace sobre el DataFrame completo,
+        resuelta en el servidor para el modo paginado (se ejecuta una vez antes de la primera
+        pagina de una corrida nueva, no al reanudar).
+
+        Args:
+            cx (pyodbc.Connection): Conexion activa.
+            tipo_nota (str): 'NC' o 'ND'.
+
+        Returns:
+            int: Filas eliminadas.
+        """
+        tabla = '[CxP].[Comparativa_NC]' if tipo_nota == 'NC' else '[CxP].[Comparativa_ND]'
+        cur = cx.cursor()
+        try:
+            # ID_Registro se convierte una vez a INT para buscar por la llave de DocumentsProcessing
+            cur.execute(f"""
+            DELETE c
+            FROM {tabla} c
+            WHERE NOT EXISTS (
+                SELECT 1 FROM [CxP].[DocumentsProcessing] d
+                WHERE d.[ID] = TRY_CAST(c.ID_Registro AS INT)
+                  AND {FILTRO_PENDIENTES[tipo_nota]}
+            )
+            """)
+            filas = cur.rowcount
+            cur.execute(f"""
+            IF OBJECT_ID('[CxP].[Comparativa_Huella]', 'U') IS NOT NULL
+                DELETE h
+                FROM [CxP].[Comparativa_Huella] h
+                WHERE h.Tipo_Nota = ?
+                  AND NOT EXISTS (
+                    SELECT 1 FROM [CxP].[DocumentsProcessing] d
+                    WHERE d.[ID] = TRY_CAST(h.ID_Registro AS INT)
+                      AND {FILTRO_PENDIENTES[tipo_nota]}
+                  )
+            """, (tipo_nota,))
+            cx.commit()
+            cur.close()
+        except Exception as e:
+            print(f"[ERROR] Fallo al podar snapshot {tabla}: {e}")
+            cx.rollback()
+            raise e
+        print(f"[INFO] Poda snapshot {tabla}: {filas} filas de documentos no pendientes eliminadas.")
+        return filas
+
+    def leer_checkpoint(ruta_checkpoint, fecha_ejecucion):
+        """
+        Lee el checkpoint de paginacion de una corrida anterior del mismo dia.
+
+        Args:
+            ruta_checkpoint (str): Ruta del archivo JSON de checkpoint.
+            fecha_ejecucion (datetime): Fecha de la corrida actual.
+
+        Returns:
+            dict: {'NC': ultimo_id, 'ND': ultimo_id} o dict vacio si no hay checkpoint vigente.
+        """
+        if not ruta_checkpoint or not os.path.exists(ruta_checkpoint):
+            return {}
+        try:
+            with open(ruta_checkpoint, 'r', encoding='utf-8') as f:
+                datos = json.load(f)
+        except Exception as e:
+            print(f"[WARNING] Checkpoint ilegible, se inicia desde el principio: {e}")
+            return {}
+        if datos.get('fecha') != fecha_ejecucion.strftime('%Y-%m-%d'):
+            print("[INFO] Checkpoint de otra fecha, se ignora.")
+            return {}
+        return {k: v for k, v in datos.get('ultimo_id', {}).items() if v is not None}
+
+    def guardar_checkpoint(ruta_checkpoint, fecha_ejecucion, tipo_nota, ultimo_id):
+        """
+        Registra el ultimo ID procesado de una fase (escritura atomica, segura entre fases paralelas).
+
+        Args:
+            ruta_checkpoint (str): Ruta del archivo JSON de checkpoint.
+            fecha_ejecucion (datetime): Fecha de la corrida actual.
+            tipo_nota (str): 'NC' o 'ND'.
+            ultimo_id (int): Ultimo ID cuya pagina quedo escrita en BD.
+        """
+        if not ruta_checkpoint:
+            return
+        with bloqueo_checkpoint:
+            actuales = leer_checkpoint(ruta_checkpoint, fecha_ejecucion)
+            actuales[tipo_nota] = int(ultimo_id)
+            ruta_temporal = ruta_checkpoint + ".tmp"
+            with open(ruta_temporal, 'w', encoding='utf-8') as f:
+                json.dump({'fecha': fecha_ejecucion.strftime('%Y-%m-%d'), 'ultimo_id': actuales}, f)
+            os.replace(ruta_temporal, ruta_checkpoint)
+
+    def eliminar_checkpoint(ruta_checkpoint):
+        """Elimina el checkpoint al completar la corrida."""
+        if ruta_checkpoint and os.path.exists(ruta_checkpoint):
+            os.remove(ruta_checkpoint)
+
+    def acumular_filas_escritas(total, parcial):
+        """Suma los contadores de filas escritas de una pagina al total de la fase."""
+        for clave, valor in parcial.items():
+            total[clave] = total.get(clave, 0) + valor
+        return total
+
     # =========================================================================
     # VALIDACIONES DE NEGOCIO HU4.2
     # =========================================================================
 
-    def validar_nombre_receptor(nombre):
-        """Valida que el receptor sea DIANA o DICORP."""
-        if campo_vacio(nombre): return False
-        nombre = re.sub(r'[,.\s]', '', quitar_tildes(safe_str(nombre).upper()))
-        return nombre in ['DIANACORPORACIONSAS', 'DICORPSAS']
-
-    def validar_nit_receptor(nit):
-        """Valida que el NIT receptor sea el estandar 860031606."""
-        return re.sub(r'\D', '', safe_str(nit)) == '860031606'
-
-    def validar_tipo_persona(tipo):
-        """Valida codigo tipo persona '31'."""
-        return safe_str(tipo) == '31'
-
-    def validar_digito_verificacion(digito):
-        """Valida digito verificacion '6'."""
-        return safe_str(digito) == '6'
-
-    def validar_tax_level_code(tax_code):
-        """Valida que el codigo de responsabilidad contenga alguno de los valores permitidos."""
-        if campo_vacio(tax_code): return False
-        tax = safe_str(tax_code).upper()
-        return any(v in tax for v in ['O-13', 'O-15', 'O-23', 'O-47', 'R-99-PN'])
+    # Reglas tributarias de emisor/receptor comunes a NC y ND: (Item, columna, regla)
+    REGLAS_TRIBUTARIAS = [
+        ('Nombre Emisor', 'nombre_emisor', 'con_valor'),
+        ('NIT Emisor', 'nit_emisor_o_nit_del_proveedor', 'con_valor'),
+        ('Fecha emision del documento', 'fecha_de_emision_documento', 'con_valor'),
+        ('Nombre Receptor', 'nombre_del_adquiriente', 'nombre_receptor'),
+        ('Nit Receptor', 'nit_del_adquiriente', 'nit_receptor'),
+        ('Tipo Persona Receptor', 'tipo_persona', 'tipo_persona'),
+        ('DigitoVerificacion Receptor', 'digito_de_verificacion', 'digito_verificacion'),
+        ('TaxLevelCode Receptor', 'responsabilidad_tributaria_adquiriente', 'tax_level_code')
+    ]
+
+    def texto_vectorizado(serie):
+        """
+        Equivalente vectorizado de safe_str sobre una columna completa.
+
+        Args:
+            serie (pd.Series): Columna con valores de cualquier tipo.
+
+        Returns:
+            pd.Series: Cadenas limpias (strip), vacias para nulos.
+        """
+        s = serie.astype(object)
+        nulos = s.isna()
+        es_bytes = s.map(lambda v: isinstance(v, bytes))
+        if es_bytes.any():
+            s = s.where(~es_bytes, s[es_bytes].map(lambda v: v.decode('latin-1', errors='replace')))
+        return s.where(~nulos, "").astype(str).str.strip()
+
+    def calcular_reglas_tributarias(df):
+        """
+        Evalua las reglas tributarias de emisor/receptor como columnas booleanas.
+
+        Reemplaza las validaciones por documento (nombre, NIT, tipo persona, digito de
+        verificacion y TaxLevelCode del receptor, y datos obligatorios del emisor) por
+        operaciones de columna sobre el DataFrame completo de NC o ND.
+
+        Args:
+            df (pd.DataFrame): Documentos NC o ND de DocumentsProcessing.
+
+        Returns:
+            tuple: (valores, aprobados) DataFrames con una columna por Item de
+                   REGLAS_TRIBUTARIAS: texto evaluado y resultado booleano.
+        """
+        valores = pd.DataFrame(index=df.index)
+        aprobados = pd.DataFrame(index=df.index)
+
+        for item, columna, regla in REGLAS_TRIBUTARIAS:
+            if columna in df.columns:
+                texto = texto_vectorizado(df[columna])
+            else:
+                texto = pd.Series("", index=df.index, dtype=object)
+            con_valor = ~(texto.eq("") | texto.str.lower().isin(['null', 'none', 'nan']))
+
+            if regla == 'con_valor':
+                ok = con_valor
+            elif regla == 'nombre_receptor':
+                nombre = (texto.str.upper()
+                               .str.normalize('NFKD')
+                               .str.replace(r'[\u0300-\u036f]', '', regex=True)
+                               .str.replace(r'[,.\s]', '', regex=True))
+                ok = con_valor & nombre.isin(['DIANACORPORACIONSAS', 'DICORPSAS'])
+            elif regla == 'nit_receptor':
+                ok = texto.str.replace(r'\D', '', regex=True).eq('860031606')
+            elif regla == 'tipo_persona':
+                ok = texto.eq('31')
+            elif regla == 'digito_verificacion':
+                ok = texto.eq('6')
+            else:
+                ok = con_valor & texto.str.upper().str.contains(r'O-13|O-15|O-23|O-47|R-99-PN', regex=True)
+
+            valores[item] = texto
+            aprobados[item] = ok.astype(bool)
+
+        return valores, aprobados
+
+    def tabla_reglas_tributarias(df):
+        """
+        Construye la tabla larga de resultados tributarios (un registro por documento e Item).
+
+        Args:
+            df (pd.DataFrame): Documentos NC o ND de DocumentsProcessing.
+
+        Returns:
+            pd.DataFrame: Columnas ID_Registro, NIT, Item, Valor_XML, Aprobado ('SI'/'NO')
+                          y Falla (bool), ordenada por documento y luego por Item.
+        """
+        columnas = ['ID_Registro', 'NIT', 'Item', 'Valor_XML', 'Aprobado', 'Falla']
+        if df.empty:
+            return pd.DataFrame(columns=columnas)
+
+        valores, aprobados = calcular_reglas_tributarias(df)
+        items = [item for item, _, _ in REGLAS_TRIBUTARIAS]
+
+        ids = texto_vectorizado(df['ID']) if 'ID' in df.columns else pd.Series("", index=df.index)
+        nits = (texto_vectorizado(df['nit_emisor_o_nit_del_proveedor'])
+                if 'nit_emisor_o_nit_del_proveedor' in df.columns else pd.Series("", index=df.index))
+
+        largo = pd.DataFrame({
+            'Posicion': np.tile(np.arange(len(df)), len(items)),
+            'OrdenItem': np.repeat(np.arange(len(items)), len(df)),
+            'ID_Registro': np.tile(ids.to_numpy(dtype=object), len(items)),
+            'NIT': np.tile(nits.to_numpy(dtype=object), len(items)),
+            'Item': np.repeat(np.array(items, dtype=object), len(df)),
+            'Valor_XML': valores[items].to_numpy(dtype=object).ravel(order='F'),
+            'Falla': ~aprobados[items].to_numpy(dtype=bool).ravel(order='F')
+        })
+        largo['Aprobado'] = np.where(largo['Falla'], 'NO', 'SI')
+        largo = largo.sort_values(['Posicion', 'OrdenItem'], kind='stable')
+        return largo[columnas].reset_index(drop=True)
+
+    def registrar_items_tributarios(buffer, df_items):
+        """
+        Acumula la tabla larga de resultados tributarios en el buffer de Comparativa_NC/ND.
+
+        La escritura en BD ocurre despues en una sola operacion con escribir_items_comparativa_bulk.
+
+        Args:
+            buffer (dict): Acumulador de registrar_item_comparativa.
+            df_items (pd.DataFrame): Resultado de tabla_reglas_tributarias.
+
+        Returns:
+            int: Cantidad de items con falla (Aprobado = 'NO').
+        """
+        for reg_id, nit, item, valor_xml, aprobado in df_items[['ID_Registro', 'NIT', 'Item', 'Valor_XML', 'Aprobado']].itertuples(index=False, name=None):
+            registrar_item_comparativa(buffer, reg_id, nit,
+                                       nombre_item=item,
+                                       valor_xml=valor_xml,
+                                       valor_aprobado=aprobado,
+                                       valor_factura=None,
+                                       nombre_proveedor=None,
+                                       fecha_retoma=None)
+        return int(df_items['Falla'].sum())
    
+    def cargar_fv_candidatas(cx, df_nc, fecha_inicio, fecha_fin):
+        """
+        Carga las Facturas (FV) candidatas al cruce, limitadas a las referencias de las NC pendientes.
+
+        Envia el conjunto (NIT, PrefijoYNumero) de las NC a la tabla temporal #NCReferencias y
+        retorna solo las FV de la ventana de fechas que coinciden con alguna referencia, con
+        ResultadoFinalAntesEventos EXITOSO/RECHAZADO y sin NotaCreditoReferenciada. Todos los
+        filtros se aplican en SQL Server con parametros, de modo que la memoria y la
+        transferencia dependen del numero de NC pendientes y no del volumen de FV del periodo.
+
+        Args:
+            cx (pyodbc.Connection): Conexion activa.
+            df_nc (pandas.DataFrame): NC pendientes.
+            fecha_inicio (str): Inicio de la ventana de emision ('YYYY-MM-DD').
+            fecha_fin (str): Fin de la ventana de emision ('YYYY-MM-DD').
+
+        Returns:
+            pandas.DataFrame: FV con las columnas que leen las reglas NC
+            (ID, nit_emisor_o_nit_del_proveedor, numero_de_factura, valor_a_pagar,
+            ResultadoFinalAntesEventos).
+        """
+        columnas_fv = ['ID', 'nit_emisor_o_nit_del_proveedor', 'numero_de_factura',
+                       'valor_a_pagar', 'ResultadoFinalAntesEventos']
+
+        referencias = set()
+        if not df_nc.empty and 'PrefijoYNumero' in df_nc.columns:
+            for nit, referencia in zip(df_nc['nit_emisor_o_nit_del_proveedor'], df_nc['PrefijoYNumero']):
+                nit_str = safe_str(nit)
+                ref_str = safe_str(referencia)
+                if nit_str and ref_str:
+                    referencias.add((nit_str, ref_str))
+
+        if not referencias:
+            print("[INFO] No hay NC con referencia para cruzar contra FV.")
+            return pd.DataFrame(columns=columnas_fv)
+
+        cur = cx.cursor()
+        try:
+            cur.execute("""
+            IF OBJECT_ID('tempdb..#NCReferencias') IS NOT NULL DROP TABLE #NCReferencias;
+            CREATE TABLE #NCReferencias (
+                nit NVARCHAR(100),
+                referencia NVARCHAR(200)
+            );
+            """)
+            cur.fast_executemany = True
+            cur.executemany("INSERT INTO #NCReferencias (nit, referencia) VALUES (?, ?)", sorted(referencias))
+            cur.close()
+
+            query_fv = """
+            SELECT
+                fv.ID,
+                fv.nit_emisor_o_nit_del_proveedor,
+                fv.numero_de_factura,
+                fv.valor_a_pagar,
+                fv.ResultadoFinalAntesEventos
+            FROM [CxP].[DocumentsProcessing] fv WITH (NOLOCK)
+            WHERE fv.documenttype = 'FV'
+              AND fv.fecha_de_emision_documento >= ?
+              AND fv.fecha_de_emision_documento <= ?
+              AND (fv.NotaCreditoReferenciada IS NULL OR fv.NotaCreditoReferenciada = '')
+              AND (fv.ResultadoFinalAntesEventos LIKE '%EXITOSO%' OR fv.ResultadoFinalAntesEventos LIKE '%RECHAZADO%')
+              AND EXISTS (
+                  SELECT 1 FROM #NCReferencias r
+                  WHERE r.nit = fv.nit_emisor_o_nit_del_proveedor
+                    AND r.referencia = fv.numero_de_factura
+              )
+            """
+            df_fv = pd.read_sql(query_fv, cx, params=[fecha_inicio, fecha_fin])
+
+            cur = cx.cursor()
+            cur.execute("DROP TABLE #NCReferencias")
+            cx.commit()
+            cur.close()
+        except Exception as e:
+            print(f"[ERROR] Fallo al cargar FV candidatas: {e}")
+            raise
+
+        print(f"[INFO] FV candidatas: {len(df_fv)} para {len(referencias)} referencias NC.")
+        return df_fv
+
+    def inicializar_fechas_retoma_bulk(cx, ids_registro, fecha_referencia):
+        """
+        Asigna la fecha de retoma inicial a todos los registros indicados con un solo UPDATE ... JOIN.
+
+        Args:
+            cx (pyodbc.Connection): Conexion activa.
+            ids_registro (iterable): IDs de DocumentsProcessing sin fecha de retoma.
+            fecha_referencia (datetime): Fecha a asignar.
+
+        Returns:
+            int: Filas actualizadas.
+        """
+        ids = sorted({safe_str(i) for i in ids_registro if safe_str(i)})
+        if not ids:
+            return 0
+
+        cur = cx.cursor()
+        try:
+            cur.execute("""
+            IF OBJECT_ID('tempdb..#RetomaInicial') IS NOT NULL DROP TABLE #RetomaInicial;
+            CREATE TABLE #RetomaInicial (ID NVARCHAR(100));
+            """)
+            cur.fast_executemany = True
+            cur.executemany("INSERT INTO #RetomaInicial (ID) VALUES (?)", [(i,) for i in ids])
+            cur.execute("""
+            UPDATE dp
+            SET [Fecha_de_retoma_antes_de_contabilizacion] = ?
+            FROM [CxP].[DocumentsProcessing] dp
+            INNER JOIN #RetomaInicial r ON dp.[ID] = r.ID
+            """, (fecha_referencia.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],))
+            filas = cur.rowcount
+            cur.execute("DROP TABLE #RetomaInicial")
+            cx.commit()
+            cur.close()
+        except Exception as e:
+            print(f"[ERROR] Fallo al asignar fechas de retoma iniciales: {e}")
+            cx.rollback()
+            raise e
+
+        print(f"[INFO] Fecha de retoma inicial asignada a {filas} registros.")
+        return filas
+
+    def resolver_referencias_nc(df_nc, df_fv_final):
+        """
+        Resuelve en un solo cruce vectorizado la Factura (FV) referenciada por cada NC.
+
+        Indexa las FV candidatas una sola vez por (NIT, numero_de_factura), conservando la
+        primera FV por llave (equivalente a resultado.iloc[0] del filtro por fila), y hace un
+        LEFT JOIN contra las NC por (nit_emisor_o_nit_del_proveedor, PrefijoYNumero).
+
+        Args:
+            df_nc (pandas.DataFrame): NC pendientes.
+            df_fv_final (pandas.DataFrame): FV candidatas (EXITOSO/RECHAZADO).
+
+        Returns:
+            pandas.DataFrame: df_nc (mismo indice y orden) con las columnas
+            FV_Encontrada (bool), FV_ID y FV_valor_a_pagar.
+        """
+        df_ref = df_nc.copy()
+        df_ref['FV_Encontrada'] = False
+        df_ref['FV_ID'] = None
+        df_ref['FV_valor_a_pagar'] = None
+
+        if df_nc.empty or df_fv_final.empty or 'PrefijoYNumero' not in df_nc.columns:
+            return df_ref
+
+        # Indice de FV por (NIT, Factura); las llaves nulas nunca coinciden
+        df_fv_idx = (
+            df_fv_final[['nit_emisor_o_nit_del_proveedor', 'numero_de_factura', 'ID', 'valor_a_pagar']]
+            .dropna(subset=['nit_emisor_o_nit_del_proveedor', 'numero_de_factura'])
+            .drop_duplicates(subset=['nit_emisor_o_nit_del_proveedor', 'numero_de_factura'], keep='first')
+            .rename(columns={
+                'nit_emisor_o_nit_del_proveedor': '_clave_nit',
+                'numero_de_factura': '_clave_ref',
+                'ID': 'FV_ID',
+                'valor_a_pagar': 'FV_valor_a_pagar'
+            })
+        )
+        df_fv_idx['FV_Encontrada'] = True
+        # Tipo object para conservar el ID original (sin promocion a float por los NaN del LEFT JOIN)
+        df_fv_idx['FV_ID'] = df_fv_idx['FV_ID'].astype(object)
+
+        df_claves = pd.DataFrame({
+            '_clave_nit': df_nc['nit_emisor_o_nit_del_proveedor'].map(safe_str).to_numpy(),
+            '_clave_ref': df_nc['PrefijoYNumero'].to_numpy()
+        }, index=df_nc.index)
+        df_claves['_clave_nit'] = df_claves['_clave_nit'].astype(object)
+        df_claves['_clave_ref'] = df_claves['_clave_ref'].astype(object)
+        df_fv_idx['_clave_nit'] = df_fv_idx['_clave_nit'].astype(object)
+        df_fv_idx['_clave_ref'] = df_fv_idx['_clave_ref'].astype(object)
+
+        df_cruce = df_claves.merge(df_fv_idx, on=['_clave_nit', '_clave_ref'], how='left')
+        df_cruce.index = df_nc.index
+
+        encontrada = df_cruce['FV_Encontrada'].eq(True) & df_claves['_clave_ref'].notna()
+        df_ref['FV_Encontrada'] = encontrada.to_numpy()
+        df_ref['FV_ID'] = df_cruce['FV_ID'].where(encontrada, None).to_numpy()
+        df_ref['FV_valor_a_pagar'] = df_cruce['FV_valor_a_pagar'].where(encontrada, None).to_numpy()
+
+        print(f"[INFO] Referencias NC->FV resueltas: {int(encontrada.sum())}/{len(df_nc)}")
+        return df_ref
+
+    def escribir_reporte_streaming(ruta_completa, hoja_destino, encabezados, filas_nuevas):
+        """
+        Escribe el reporte Excel en modo streaming (xlsxwriter constant_memory).
+
+        Las filas se vuelcan a disco a medida que se escriben, por lo que la memoria
+        no crece con el volumen (cientos de miles de filas). Los estilos se definen una
+        sola vez como formatos compartidos de encabezado y de celda.
+
+        Como un libro en streaming no puede reabrirse para anexar, si el archivo ya
+        existe se lee en modo read_only de openpyxl (tambien en streaming) y sus hojas
+        se copian al libro nuevo; las filas nuevas se anexan al final de la hoja
+        destino. El libro se escribe en un archivo temporal que reemplaza al original
+        solo al cerrar correctamente; si la escritura o el reemplazo fallan, el
+        temporal se elimina. Las celdas datetime/date se escriben con formato de
+        fecha (como las mostraba openpyxl) y no como numero serial.
+
+        Args:
+            ruta_completa (str): Ruta final del archivo .xlsx.
+            hoja_destino (str): Hoja donde se anexan las filas nuevas.
+            encabezados (list): Encabezados de la hoja destino si se crea.
+            filas_nuevas (iterable): Tuplas con los valores de cada fila nueva.
+
+        Returns:
+            int: Cantidad de filas de datos escritas en la hoja destino.
+        """
+        ruta_temporal = os.path.splitext(ruta_completa)[0] + "_tmp.xlsx"
+        wb_origen = None
+        filas_destino = 0
+
+        try:
+            if os.path.exists(ruta_completa):
+                print("[INFO] El archivo existe. Se agregaran datos.")
+                wb_origen = load_workbook(ruta_completa, read_only=True)
+            else:
+                print("[INFO] El archivo no existe. Se creara uno nuevo.")
+
+            wb = xlsxwriter.Workbook(ruta_temporal, {
+                'constant_memory': True,
+                'strings_to_numbers': False,
+                'strings_to_formulas': False,
+                'strings_to_urls': False
+            })
+
+            try:
+                formato_encabezado = wb.add_format({'bold': True, 'border': 1})
+                formato_celda = wb.add_format({'border': 1})
+                # Mismos formatos numericos que openpyxl aplica a datetime y date
+                formato_fecha_hora = wb.add_format({'border': 1, 'num_format': 'yyyy-mm-dd hh:mm:ss'})
+                formato_fecha = wb.add_format({'border': 1, 'num_format': 'yyyy-mm-dd'})
+
+                def escribir_fila(ws, idx_fila, fila):
+                    """write_row con formato de fecha en las celdas datetime/date."""
+                    if not any(isinstance(v, (datetime, date)) for v in fila):
+                        ws.write_row(idx_fila, 0, fila, formato_celda)
+                        return
+                    for idx_col, valor in enumerate(fila):
+                        if isinstance(valor, datetime):
+                            if pd.isna(valor):
+                                ws.write_blank(idx_fila, idx_col, None, formato_celda)
+                            else:
+                                ws.write_datetime(idx_fila, idx_col, valor, formato_fecha_hora)
+                        elif isinstance(valor, date):
+                            ws.write_datetime(idx_fila, idx_col, valor, formato_fecha)
+                        else:
+                            ws.write(idx_fila, idx_col, valor, formato_celda)
+
+                def volcar_hoja(nombre, filas_hoja, anexar=None):
+                    ws = wb.add_worksheet(nombre)
+                    ws.set_column(0, 4, 20)
+                    escritas = 0
+                    for idx_fila, fila in enumerate(filas_hoja):
+                        if idx_fila == 0:
+                            ws.write_row(0, 0, fila, formato_encabezado)
+                        else:
+                            escribir_fila(ws, idx_fila, fila)
+                            escritas += 1
+                    siguiente = escritas + 1
+                    for fila in (anexar or []):
+                        escribir_fila(ws, siguiente, fila)
+                        siguiente += 1
+                        escritas += 1
+                    return escritas
+
+                hojas_origen = wb_origen.sheetnames if wb_origen is not None else []
+
+                for nombre in hojas_origen:
+                    filas_hoja = wb_origen[nombre].iter_rows(values_only=True)
+                    if nombre == hoja_destino:
+                        filas_destino = volcar_hoja(nombre, filas_hoja, filas_nuevas)
+                    else:
+                        volcar_hoja(nombre, filas_hoja)
+
+                if hoja_destino not in hojas_origen:
+                    filas_destino = volcar_hoja(hoja_destino, [encabezados], filas_nuevas)
+
+            finally:
+                wb.close()
+
+            os.replace(ruta_temporal, ruta_completa)
+
+        except Exception:
+            # No se deja el temporal en la carpeta de reportes si algo fallo
+            if os.path.exists(ruta_temporal):
+                try:
+                    os.remove(ruta_temporal)
+                except OSError as e:
+                    print(f"[WARNING] No se pudo eliminar el temporal {ruta_temporal}: {e}")
+            raise
+
+        finally:
+            if wb_origen is not None:
+                wb_origen.close()
+
+        return filas_destino
+
     def generar_reporte_retorno_nc(cx, ruta_base, nombre_reporte):
         """
         Genera o actualiza un archivo Excel con el reporte de registros 'CON NOVEDAD'.
@@ -1252,42 +2153,20 @@ def HU42_ValidarNotasCreditoDebito():
             if not df_novedades.empty:
                 print(f"[INFO] Se encontraron {len(df_novedades)} registros CON NOVEDAD para reportar.")
                 
-                wb = None
-                ws = None
                 encabezados = ["ID", "Fecha_Carga", "Nit", "Numero_Nota_Credito", "Estado_CXP_Bot"]
-
-                # Logica para crear o abrir archivo
-                if not os.path.exists(ruta_completa):
-                    print("[INFO] El archivo no existe. Se creara uno nuevo.")
-                    wb = Workbook()
-                    ws = wb.active
-                    ws.title = 'NC'
-                    ws.append(encabezados) 
-                else:
-                    print("[INFO] El archivo existe. Se agregaran datos.")
-                    wb = load_workbook(ruta_completa)
-                    
-                    if 'NC' not in wb.sheetnames:
-                        ws = wb.create_sheet('NC')
-                        ws.append(encabezados)
-                    else:
-                        ws = wb['NC']
-
                 fecha_carga = fecha_actual.strftime('%Y-%m-%d %H:%M:%S')
-                
-                # Escribimos filas
-                for index, row in df_novedades.iterrows():
-                    fila_excel = [
-                        row['ID'],
-                        fecha_carga,
-                        row['Nit'],
-                        row['Numero_Nota_Credito'],
-                        row['Estado_CXP_Bot']
-                    ]
-                    ws.append(fila_excel)
-
-                wb.save(ruta_completa)
-                wb.close()
+
+                df_filas = pd.DataFrame({
+                    'ID': df_novedades['ID'],
+                    'Fecha_Carga': fecha_carga,
+                    'Nit': df_novedades['Nit'],
+                    'Numero_Nota_Credito': df_novedades['Numero_Nota_Credito'],
+                    'Estado_CXP_Bot': df_novedades['Estado_CXP_Bot']
+                }).astype(object).where(lambda d: d.notna(), None)
+                filas_nuevas = df_filas.itertuples(index=False, name=None)
+
+                filas = escribir_reporte_streaming(ruta_completa, 'NC', encabezados, filas_nuevas)
+                print(f"[INFO] Filas escritas en hoja NC: {filas}")
                 print("[SUCCESS] Reporte guardado exitosamente.")
                 
             else:
@@ -1299,383 +2178,562 @@ def HU42_ValidarNotasCreditoDebito():
         
         
     # =========================================================================
-    # LOGICA PRINCIPAL DE ORQUESTACION
+    # FASES DE PROCESAMIENTO NC / ND
     # =========================================================================
 
-    try:
-        print("")
-        print("=" * 80)
-        print("[INFO] INICIO HU4.2 - Validacion NC/ND")
-        print("=" * 80)
+    def procesar_lote_nc(cx, df_nc, plazo_max, now, reconstruir_comparativas, podar_snapshot=True):
+        """
+        Procesa un lote de Notas Credito (NC): todas las pendientes o una pagina keyset.
 
-        # 1. Parsing de Configuracion
-        cfg = parse_config(GetVar("vLocDicConfig"))
+        Solo escribe en [CxP].[Comparativa_NC] y en los registros NC/FV de DocumentsProcessing,
+        por lo que puede correr en paralelo con la fase ND en otra conexion. Al terminar, los
+        items del lote quedan escritos en BD (no se retiene estado entre lotes).
 
-        plazo_max = int(cfg.get('PlazoMaximoRetoma', 120))
-        now = datetime.now()
+        Args:
+            cx (pyodbc.Connection): Conexion activa (exclusiva de la fase).
+            df_nc (pandas.DataFrame): NC pendientes del lote.
+            plazo_max (int): Plazo maximo de retoma en dias.
+            now (datetime): Fecha de referencia de la ejecucion.
+            reconstruir_comparativas (bool): True para poblado completo del snapshot.
+            podar_snapshot (bool): False en modo paginado (la poda se hace una sola vez).
+
+        Returns:
+            dict: NC procesadas y filas escritas en Comparativa_NC.
+        """
+        filas_escritas = {}
+
+        print(f"[INFO] Procesando {len(df_nc)} Notas Credito (NC)...")
         
-        # 2. Conexion a Base de Datos (Context Manager)
-        with crear_conexion_db(cfg) as cx:
+        # Snapshot de Comparativa_NC: incremental por defecto, completo si se solicita reconstruir
+        try:
+            if reconstruir_comparativas:
+                filas_escritas['snapshot_insertadas'] = poblar_inicial_comparativa_nc(cx, df_nc)
+            else:
+                snapshot_nc = sincronizar_snapshot_comparativa(cx, 'NC', df_nc, podar_snapshot)
+                filas_escritas['snapshot_eliminadas'] = snapshot_nc['filas_eliminadas']
+                filas_escritas['snapshot_insertadas'] = snapshot_nc['filas_insertadas']
+                filas_escritas['snapshot_restablecidas'] = snapshot_nc['filas_restablecidas']
+        except Exception as e:
+            error_msg = traceback.format_exc() 
+            SetVar("vGblStrDetalleError", error_msg)
+            SetVar("vGblStrSystemError", "ErrorHU4_4.1")
+            SetVar("vLocStrResultadoSP", "False")
+            print(f"[ERROR] Critico al preparar snapshot NC: {error_msg}")
+            raise e
+        
+        # Carga de Facturas (FV) para cruce
+        try:
+            fecha_ejecucion = datetime.now()
+
+            # Ventana de tiempo: Mes actual + Mes anterior completo
+            fecha_inicio_filtro = (fecha_ejecucion.replace(day=1) - relativedelta(months=1)).strftime('%Y-%m-%d')
+            fecha_fin_filtro = fecha_ejecucion.strftime('%Y-%m-%d')
 
-            # -----------------------------------------------------------------
-            # FASE 1: PROCESAMIENTO DE NOTAS CREDITO (NC)
-            # -----------------------------------------------------------------
-            # Buscamos NC pendientes que no esten ya finalizadas
-            df_nc = pd.read_sql("SELECT * FROM [CxP].[DocumentsProcessing] WHERE [tipo_de_documento]='NC' AND ([ResultadoFinalAntesEventos] IS NULL OR [ResultadoFinalAntesEventos] NOT IN ('ENCONTRADO', 'NO EXITOSO'))", cx)
-            print(f"[INFO] Procesando {len(df_nc)} Notas Credito (NC)...")
+            print(f"[INFO] Buscando documentos emitidos entre: {fecha_inicio_filtro} y {fecha_fin_filtro}")
+
+            # Solo FV referenciadas por las NC pendientes, filtradas en el servidor
+            df_fv_final = cargar_fv_candidatas(cx, df_nc, fecha_inicio_filtro, fecha_fin_filtro)
             
-            # Limpieza previa de tablas
-            try:
-                limpiar_tablas_comparativas(cx)
-            except Exception as e:
-                error_msg = traceback.format_exc() 
-                SetVar("vGblStrDetalleError", error_msg)
-                SetVar("vGblStrSystemError", "ErrorHU4_4.1")
-                SetVar("vLocStrResultadoSP", "False")
-                print(f"[ERROR] Critico al limpiar tablas: {error_msg}")
-                raise e
+        except Exception as e:
+            error_msg = traceback.format_exc() 
+            SetVar("vGblStrDetalleError", error_msg)
+            SetVar("vGblStrSystemError", "ErrorHU4_4.1")
+            SetVar("vLocStrResultadoSP", "False")
+            print(f"[ERROR] Fallo al cargar Facturas candidatas: {error_msg}")
+            raise e
+            
+        # Resolucion de referencias NC -> FV en un solo cruce (hash join por NIT + Factura)
+        df_nc = resolver_referencias_nc(df_nc, df_fv_final)
+            
+        # Regla de plazo de retoma para todas las NC en una sola pasada
+        plazos_nc = calcular_plazos_retoma(df_nc, now, plazo_max)
+        df_nc = df_nc.join(plazos_nc)
+        print(f"[INFO] NC que exceden el plazo de retoma ({plazo_max} dias): {int(plazos_nc['ExcedePlazo'].sum())}")
+        
+        # Fecha de retoma inicial para las NC que no la tienen, en un solo UPDATE
+        inicializar_fechas_retoma_bulk(cx, df_nc.loc[plazos_nc['RequiereFechaRetoma'], 'ID'], now)
+            
+        cnt_nc = 0
+        list_nov = []
+        items_nc = {}
+        estados_nc = {}
+        
+        # Regla 2 (tributarias emisor/receptor) para todas las NC dentro de plazo en una sola pasada
+        reglas_nc = tabla_reglas_tributarias(df_nc[~df_nc['ExcedePlazo'].astype(bool)])
+        fallas_nc = registrar_items_tributarios(items_nc, reglas_nc)
+        print(f"[INFO] Reglas tributarias NC: {len(reglas_nc)} items evaluados, {fallas_nc} con falla")
+        
+        # Iteracion sobre cada Nota Credito
+        for idx, r in df_nc.iterrows():
+            reg_id = safe_str(r.get('ID', ''))
+            nit = safe_str(r.get('nit_emisor_o_nit_del_proveedor', ''))
+            num_nc = safe_str(r.get('numero_de_nota_credito', ''))
+            oc = safe_str(r.get('numero_de_liquidacion_u_orden_de_compra', ''))
+            num_factura = r.get('numero_de_factura') 
+            obs_anterior = safe_str(r.get('ObservacionesFase_4')) 
+            
+            fecha_retoma = r.get('Fecha_retoma_contabilizacion')
+            tipo_doc = r.get('tipo_de_documento')
+            nombre_prov = r.get('nombre_emisor')
+
+            print(f"[INFO] Analizando NC: {num_nc} (ID: {reg_id})")
+
+            # Regla 1: Validacion de plazos de Retoma (precalculada en plazos_nc)
+            if r.get('ExcedePlazo'):
+                obs = f"Registro excede el plazo maximo de retoma, {obs_anterior}"
+                # Marcamos como No Exitoso en BD y Comparativa
+                actualizar_bd_cxp(cx, reg_id, {
+                    'EstadoFinalFase_4': 'VALIDACION DATOS DE FACTURACION: No exitoso',
+                    'ObservacionesFase_4': truncar_observacion(obs),
+                    'ResultadoFinalAntesEventos': 'NO EXITOSO'
+                })
                 
-            # Poblado inicial (Snapshot)
-            try:
-                poblar_inicial_comparativa_nc(cx, df_nc)
-            except Exception as e:
-                error_msg = traceback.format_exc() 
-                SetVar("vGblStrDetalleError", error_msg)
-                SetVar("vGblStrSystemError", "ErrorHU4_4.1")
-                SetVar("vLocStrResultadoSP", "False")
-                print(f"[ERROR] Critico al poblar NC: {error_msg}")
-                raise e
+                registrar_item_comparativa(items_nc, reg_id, nit,
+                                                nombre_item='Observaciones',
+                                                valor_xml=truncar_observacion(obs),
+                                                valor_aprobado=None,
+                                                valor_factura=None,
+                                                nombre_proveedor=None,
+                                                fecha_retoma=None)
+                
+                registrar_estado_comparativa(estados_nc, nit, reg_id, 'NO EXITOSO')
+                cnt_nc += 1
+                continue
+
+            # Regla 2: Validaciones Tributarias (Emisor/Receptor) precalculadas en reglas_nc
             
-            # Carga de Facturas (FV) para cruce
-            try:
-                fecha_ejecucion = datetime.now()
-
-                # Ventana de tiempo: Mes actual + Mes anterior completo
-                fecha_inicio_filtro = (fecha_ejecucion.replace(day=1) - relativedelta(months=1)).strftime('%Y-%m-%d')
-                fecha_fin_filtro = fecha_ejecucion.strftime('%Y-%m-%d')
-
-                print(f"[INFO] Buscando documentos emitidos entre: {fecha_inicio_filtro} y {fecha_fin_filtro}")
-
-                query_fv = f"""
-                            SELECT *
-                            FROM [CxP].[DocumentsProcessing]
-                            WHERE 
-                                documenttype = 'FV'
-                                AND fecha_de_emision_documento >= '{fecha_inicio_filtro}'
-                                AND fecha_de_emision_documento <= '{fecha_fin_filtro}'
-                                AND (NotaCreditoReferenciada IS NULL OR NotaCreditoReferenciada = '')
-                        """
+            tiene_estado_final = True if safe_str(r.get('ResultadoFinalAntesEventos')) else False
+            
+            # Regla 3: Validaciones de Tipo Nota Credito y Referencia
+            if not tiene_estado_final:
+                tipo_nc = safe_str(r.get('tipo_de_nota_credito', ''))
                 
-                df_fv = pd.read_sql(query_fv, cx)
+                # Si es Tipo 20 (NC sin referencia o devolucion total/parcial especifica)
+                if tipo_nc == '20':
+                    registrar_item_comparativa(items_nc, reg_id, nit,
+                                                        nombre_item='Tipo de nota credito',
+                                                        valor_xml=r.get('Tipo_de_nota_cred_deb'),
+                                                        valor_aprobado='SI' if campo_con_valor(r.get('Tipo_de_nota_cred_deb')) else 'NO',
+                                                        valor_factura=None,
+                                                        nombre_proveedor=None,
+                                                        fecha_retoma=None)
+                    
+                    registrar_item_comparativa(items_nc, reg_id, nit,
+                                                        nombre_item='Codigo CUFE de la factura',
+                                                        valor_xml=r.get('cufeuuid', ''),
+                                                        valor_aprobado='SI' if campo_con_valor(r.get('cufeuuid')) else 'NO',
+                                                        valor_factura=None,
+                                                        nombre_proveedor=None,
+                                                        fecha_retoma=None)
+                    
+                    registrar_item_comparativa(items_nc, reg_id, nit,
+                                                        nombre_item='Cude de la Nota Credito',
+                                                        valor_xml=r.get('cufe_fe', ''),
+                                                        valor_aprobado='SI' if campo_con_valor(r.get('cufe_fe')) else 'NO',
+                                                        valor_factura=None,
+                                                        nombre_proveedor=None,
+                                                        fecha_retoma=None)
+                else:
+                    # Si no es tipo 20 y no tiene referencia, es Novedad
+                    obs = f"Nota credito sin referencia, {obs_anterior}"
+                    actualizar_bd_cxp(cx, reg_id, {'EstadoFinalFase_4': 'VALIDACION DATOS DE FACTURACION: Exitoso', 'ObservacionesFase_4': truncar_observacion(obs), 'ResultadoFinalAntesEventos': 'CON NOVEDAD'})
+                    
+                    registrar_item_comparativa(items_nc, reg_id, nit,
+                                                        nombre_item='Tipo de nota credito',
+                                                        valor_xml=r.get('Tipo_de_nota_cred_deb'),
+                                                        valor_aprobado='NO',
+                                                        valor_factura=None,
+                                                        nombre_proveedor=None,
+                                                        fecha_retoma=None)
+                    
+                    registrar_item_comparativa(items_nc, reg_id, nit,
+                                                        nombre_item='Observaciones',
+                                                        valor_xml=truncar_observacion(obs),
+                                                        valor_aprobado='NO',
+                                                        valor_factura=None,
+                                                        nombre_proveedor=None,
+                                                        fecha_retoma=None)
+                    
+                    registrar_item_comparativa(items_nc, reg_id, nit,
+                                                        nombre_item='Cude de la Nota Credito',
+                                                        valor_xml=r.get('cufe_fe', ''),
+                                                        valor_aprobado='NO',
+                                                        valor_factura=None,
+                                                        nombre_proveedor=None,
+                                                        fecha_retoma=None)
+
+                    registrar_estado_comparativa(estados_nc, nit, reg_id, 'CON NOVEDAD')
+                    cnt_nc += 1
+                    continue
+                    
+            # Regla 4: Cruce contra Facturas (Match de Referencia y Monto)
+            if r.get('FV_Encontrada'):
+                print(f"[SUCCESS] Encontrada FV para NC {r.get('numero_de_factura')}")
                 
-                # Filtramos FV candidatas (Exitosas o Rechazadas)
-                condicion = df_fv['ResultadoFinalAntesEventos'].str.contains('EXITOSO|RECHAZADO', case=False, na=False, regex=True)
-                df_fv_final = df_fv[condicion].copy()
+                # Marcamos referencia encontrada
+                registrar_item_comparativa(items_nc, reg_id, nit,
+                                                nombre_item='Referencia',
+                                                valor_xml=r.get('PrefijoYNumero'),
+                                                valor_aprobado='SI',
+                                                valor_factura=r.get('numero_de_factura'),
+                                                nombre_proveedor=None,
+                                                fecha_retoma=None)
                 
-            except Exception as e:
-                error_msg = traceback.format_exc() 
-                SetVar("vGblStrDetalleError", error_msg)
-                SetVar("vGblStrSystemError", "ErrorHU4_4.1")
-                SetVar("vLocStrResultadoSP", "False")
-                print(f"[ERROR] Fallo al cargar Facturas candidatas: {error_msg}")
-                raise e
+                # Normalizacion y comparacion de montos (con tolerancia 0.01)
+                v_nc = normalizar_decimal(r.get('valor_a_pagar_nc'))
+                v_fv = normalizar_decimal(r.get('FV_valor_a_pagar'))
+                
+                es_coincidencia = abs(v_nc - v_fv) < 0.01
+                
+                if es_coincidencia:
+                    obs = f"Nota credito con referencia no encontrada, {obs_anterior}" # Nota: Texto heredado de logica original
+                    actualizar_bd_cxp(cx, r.get('FV_ID'), {'EstadoFinalFase_4': 'VALIDACION DATOS DE FACTURACION: Exitoso','ResultadoFinalAntesEventos': 'ENCONTRADO','NotaCreditoReferenciada':f"{r.get('Numero_de_nota_credito')}"})
+
+                    registrar_item_comparativa(items_nc, reg_id, nit,
+                                                nombre_item='LineExtensionAmount',
+                                                valor_xml=r.get('valor_a_pagar_nc'),
+                                                valor_aprobado='SI',
+                                                valor_factura=r.get('valor_a_pagar'),
+                                                nombre_proveedor=None,
+                                                fecha_retoma=None)
+                    
+                    registrar_estado_comparativa(estados_nc, nit, reg_id, 'ENCONTRADO')
+                
+            else:
+                # No se encontro factura cruce
+                obs = f"Nota credito con referencia no encontrada, {obs_anterior}"
+                actualizar_bd_cxp(cx, reg_id, {'EstadoFinalFase_4': 'VALIDACION DATOS DE FACTURACION: Exitoso', 'ObservacionesFase_4': truncar_observacion(obs), 'ResultadoFinalAntesEventos': 'CON NOVEDAD'})
+                
+                registrar_item_comparativa(items_nc, reg_id, nit,
+                                                nombre_item='Referencia',
+                                                valor_xml=r.get('PrefijoYNumero'),
+                                                valor_aprobado='NO',
+                                                valor_factura=r.get('numero_de_factura'),
+                                                nombre_proveedor=None,
+                                                fecha_retoma=None)
+                
+                registrar_item_comparativa(items_nc, reg_id, nit,
+                                                nombre_item='Observaciones',
+                                                valor_xml=obs,
+                                                valor_aprobado=None,
+                                                valor_factura=None,
+                                                nombre_proveedor=None,
+                                                fecha_retoma=None)
                 
-            cnt_nc = 0
-            list_nov = []
+                registrar_estado_comparativa(estados_nc, nit, reg_id, 'CON NOVEDAD')
+                cnt_nc += 1
+                continue
             
-            # Iteracion sobre cada Nota Credito
-            for idx, r in df_nc.iterrows():
-                retorno_manual = True if 'EXITOSO' in str(r.get('EstadoFase_3').upper()) else False
+        # Escritura masiva de items y estados de Comparativa_NC
+        escritura_nc = escribir_items_comparativa_bulk(cx, 'NC', items_nc, estados_nc)
+        filas_escritas.update(escritura_nc)
+
+        return {'procesadas': cnt_nc, 'filas_escritas': filas_escritas}
+
+    def procesar_lote_nd(cx, df_nd, reconstruir_comparativas, podar_snapshot=True):
+        """
+        Procesa un lote de Notas Debito (ND): todas las pendientes o una pagina keyset.
+
+        Solo escribe en [CxP].[Comparativa_ND] y en los registros ND de DocumentsProcessing,
+        por lo que puede correr en paralelo con la fase NC en otra conexion.
+
+        Args:
+            cx (pyodbc.Connection): Conexion activa (exclusiva de la fase).
+            df_nd (pandas.DataFrame): ND pendientes del lote.
+            reconstruir_comparativas (bool): True para poblado completo del snapshot.
+            podar_snapshot (bool): False en modo paginado (la poda se hace una sola vez).
+
+        Returns:
+            dict: ND procesadas y filas escritas en Comparativa_ND.
+        """
+        filas_escritas = {}
+
+        print(f"[INFO] Procesando {len(df_nd)} Notas Debito (ND)...")
+        
+        try:
+            if reconstruir_comparativas:
+                filas_escritas['snapshot_insertadas'] = poblar_inicial_comparativa_nd(cx, df_nd)
+            else:
+                snapshot_nd = sincronizar_snapshot_comparativa(cx, 'ND', df_nd, podar_snapshot)
+                filas_escritas['snapshot_eliminadas'] = snapshot_nd['filas_eliminadas']
+                filas_escritas['snapshot_insertadas'] = snapshot_nd['filas_insertadas']
+                filas_escritas['snapshot_restablecidas'] = snapshot_nd['filas_restablecidas']
+        except Exception as e:
+            error_msg = traceback.format_exc() 
+            SetVar("vGblStrDetalleError", error_msg)
+            SetVar("vGblStrSystemError", "ErrorHU4_4.1")
+            SetVar("vLocStrResultadoSP", "False")
+            print(f"[ERROR] Critico al poblar ND: {error_msg}")
+            raise e
+        
+        cnt_nd = 0
+        items_nd = {}
+        
+        # Validaciones Tributarias de todas las ND en una sola pasada
+        reglas_nd = tabla_reglas_tributarias(df_nd)
+        fallas_nd = registrar_items_tributarios(items_nd, reglas_nd)
+        print(f"[INFO] Reglas tributarias ND: {len(reglas_nd)} items evaluados, {fallas_nd} con falla")
+        
+        for idx, r in df_nd.iterrows():
+            try:
                 reg_id = safe_str(r.get('ID', ''))
                 nit = safe_str(r.get('nit_emisor_o_nit_del_proveedor', ''))
-                num_nc = safe_str(r.get('numero_de_nota_credito', ''))
-                oc = safe_str(r.get('numero_de_liquidacion_u_orden_de_compra', ''))
-                num_factura = r.get('numero_de_factura') 
-                obs_anterior = safe_str(r.get('ObservacionesFase_4')) 
+                num_nd = safe_str(r.get('numero_de_nota_debito', ''))
                 
-                fecha_retoma = r.get('Fecha_retoma_contabilizacion')
-                tipo_doc = r.get('tipo_de_documento')
                 nombre_prov = r.get('nombre_emisor')
+                
+                print(f"[INFO] Analizando ND: {num_nd} (ID: {reg_id})")
 
-                print(f"[INFO] Analizando NC: {num_nc} (ID: {reg_id})")
-
-                # Regla 1: Validacion de plazos de Retoma
-                if not retorno_manual:
-                    f_ret = r.get('Fecha_retoma_contabilizacion')
-                    if campo_con_valor(f_ret):
-                        dias = calcular_dias_diferencia(f_ret, now)
-                        if dias > plazo_max:
-                            obs = f"Registro excede el plazo maximo de retoma, {obs_anterior}"
-                            # Marcamos como No Exitoso en BD y Comparativa
-                            actualizar_bd_cxp(cx, reg_id, {
-                                'EstadoFinalFase_4': 'VALIDACION DATOS DE FACTURACION: No exitoso',
-                                'ObservacionesFase_4': truncar_observacion(obs),
-                                'ResultadoFinalAntesEventos': 'NO EXITOSO'
-                            })
-                            
-                            actualizar_items_comparativa_nc(reg_id, cx, nit,
-                                                            nombre_item='Observaciones',
-                                                            valor_xml=truncar_observacion(obs),
-                                                            valor_aprobado=None,
-                                                            valor_factura=None,
-                                                            nombre_proveedor=None,
-                                                            fecha_retoma=None)
-                            
-                            actualizar_estado_comparativa_nc(cx, nit, reg_id, 'NO EXITOSO')
-                            cnt_nc += 1
-                            continue
-                    else:
-                        # Asignamos fecha retoma inicial si no existe
-                        cx.cursor().execute("UPDATE [CxP].[DocumentsProcessing] SET [Fecha_de_retoma_antes_de_contabilizacion]=? WHERE [ID]=?", (now.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3], reg_id))
-
-                # Regla 2: Validaciones Tributarias (Emisor/Receptor)
-                validaciones = {
-                    'Nombre Emisor': {'val': r.get('nombre_emisor'), 'check': campo_con_valor},
-                    'NIT Emisor': {'val': r.get('nit_emisor_o_nit_del_proveedor'), 'check': campo_con_valor},
-                    'Fecha emision del documento': {'val': r.get('fecha_de_emision_documento'), 'check': campo_con_valor},
-                    'Nombre Receptor': {'val': r.get('nombre_del_adquiriente'), 'check': validar_nombre_receptor},
-                    'Nit Receptor': {'val': r.get('nit_del_adquiriente'), 'check': validar_nit_receptor},
-                    'Tipo Persona Receptor': {'val': r.get('tipo_persona'), 'check': validar_tipo_persona},
-                    'DigitoVerificacion Receptor': {'val': r.get('digito_de_verificacion'), 'check': validar_digito_verificacion},
-                    'TaxLevelCode Receptor': {'val': r.get('responsabilidad_tributaria_adquiriente'), 'check': validar_tax_level_code}
-                }
+                # Validaciones Tributarias precalculadas en reglas_nd
+
+                # Actualizacion Exitosa en BD Principal
+                actualizar_bd_cxp(cx, reg_id, {'EstadoFinalFase_4': 'VALIDACION DATOS DE FACTURACION: Exitoso', 'ResultadoFinalAntesEventos': 'EXITOSO'})
                 
-                # Actualizamos tabla comparativa con resultados
-                for k, v in validaciones.items():
-                    actualizar_items_comparativa_nc(reg_id, cx, nit,
-                                                            nombre_item=k,
-                                                            valor_xml=safe_str(v['val']),
-                                                            valor_aprobado='SI' if v['check'](v['val']) else 'NO',
-                                                            valor_factura=None,
-                                                            nombre_proveedor=None,
-                                                            fecha_retoma=None)
+                # Actualizacion de campos informativos finales en comparativa
+                registrar_item_comparativa(items_nd, reg_id, nit,
+                                                        nombre_item='LineExtensionAmount',
+                                                        valor_xml=safe_str(r.get('valor_a_pagar')),
+                                                        valor_aprobado=None,
+                                                        nombre_proveedor=None)
                 
-                tiene_estado_final = True if safe_str(r.get('ResultadoFinalAntesEventos')) else False
+                registrar_item_comparativa(items_nd, reg_id, nit,
+                                                        nombre_item='Tipo de nota debito',
+                                                        valor_xml=safe_str(r.get('Tipo_de_nota_cred_deb')),
+                                                        valor_aprobado=None,
+                                                        nombre_proveedor=None)
                 
-                # Regla 3: Validaciones de Tipo Nota Credito y Referencia
-                if not tiene_estado_final:
-                    tipo_nc = safe_str(r.get('tipo_de_nota_credito', ''))
-                    
-                    # Si es Tipo 20 (NC sin referencia o devolucion total/parcial especifica)
-                    if tipo_nc == '20':
-                        actualizar_items_comparativa_nc(reg_id, cx, nit,
-                                                            nombre_item='Tipo de nota credito',
-                                                            valor_xml=r.get('Tipo_de_nota_cred_deb'),
-                                                            valor_aprobado='SI' if campo_con_valor(r.get('Tipo_de_nota_cred_deb')) else 'NO',
-                                                            valor_factura=None,
-                                                            nombre_proveedor=None,
-                                                            fecha_retoma=None)
-                        
-                        actualizar_items_comparativa_nc(reg_id, cx, nit,
-                                                            nombre_item='Codigo CUFE de la factura',
-                                                            valor_xml=r.get('cufeuuid', ''),
-                                                            valor_aprobado='SI' if campo_con_valor(r.get('cufeuuid')) else 'NO',
-                                                            valor_factura=None,
-                                                            nombre_proveedor=None,
-                                                            fecha_retoma=None)
-                        
-                        actualizar_items_comparativa_nc(reg_id, cx, nit,
-                                                            nombre_item='Cude de la Nota Credito',
-                                                            valor_xml=r.get('cufe_fe', ''),
-                                                            valor_aprobado='SI' if campo_con_valor(r.get('cufe_fe')) else 'NO',
-                                                            valor_factura=None,
-                                                            nombre_proveedor=None,
-                                                            fecha_retoma=None)
-                    else:
-                        # Si no es tipo 20 y no tiene referencia, es Novedad
-                        obs = f"Nota credito sin referencia, {obs_anterior}"
-                        actualizar_bd_cxp(cx, reg_id, {'EstadoFinalFase_4': 'VALIDACION DATOS DE FACTURACION: Exitoso', 'ObservacionesFase_4': truncar_observacion(obs), 'ResultadoFinalAntesEventos': 'CON NOVEDAD'})
-                        
-                        actualizar_items_comparativa_nc(reg_id, cx, nit,
-                                                            nombre_item='Tipo de nota credito',
-                                                            valor_xml=r.get('Tipo_de_nota_cred_deb'),
-                                                            valor_aprobado='NO',
-                                                            valor_factura=None,
-                                                            nombre_proveedor=None,
-                                                            fecha_retoma=None)
-                        
-                        actualizar_items_comparativa_nc(reg_id, cx, nit,
-                                                            nombre_item='Observaciones',
-                                                            valor_xml=truncar_observacion(obs),
-                                                            valor_aprobado='NO',
-                                                            valor_factura=None,
-                                                            nombre_proveedor=None,
-                                                            fecha_retoma=None)
-                        
-                        actualizar_items_comparativa_nc(reg_id, cx, nit,
-                                                            nombre_item='Cude de la Nota Credito',
-                                                            valor_xml=r.get('cufe_fe', ''),
-                                                            valor_aprobado='NO',
-                                                            valor_factura=None,
-                                                            nombre_proveedor=None,
-                                                            fecha_retoma=None)
-
-                        actualizar_estado_comparativa_nc(cx, nit, reg_id, 'CON NOVEDAD')
-                        cnt_nc += 1
-                        continue
-                        
-                # Regla 4: Cruce contra Facturas (Match de Referencia y Monto)
-                condicion = (df_fv_final['numero_de_factura'] == r.get('PrefijoYNumero')) & (df_fv_final['nit_emisor_o_nit_del_proveedor'] == nit)
-                resultado = df_fv_final[condicion]
+                registrar_item_comparativa(items_nd, reg_id, nit,
+                                                        nombre_item='Referencia',
+                                                        valor_xml=safe_str(r.get('PrefijoYNumero')),
+                                                        valor_aprobado=None,
+                                                        nombre_proveedor=None)
                 
-                if not resultado.empty:
-                    print(f"[SUCCESS] Encontrada FV para NC {r.get('numero_de_factura')}")
-                    
-                    # Marcamos referencia encontrada
-                    actualizar_items_comparativa_nc(reg_id, cx, nit,
-                                                    nombre_item='Referencia',
-                                                    valor_xml=r.get('PrefijoYNumero'),
-                                                    valor_aprobado='SI',
-                                                    valor_factura=r.get('numero_de_factura'),
-                                                    nombre_proveedor=None,
-                                                    fecha_retoma=None)
-                    
-                    fv_encontrada = resultado.iloc[0]
-                    
-                    # Normalizacion y comparacion de montos (con tolerancia 0.01)
-                    v_nc = normalizar_decimal(r.get('valor_a_pagar_nc'))
-                    v_fv = normalizar_decimal(fv_encontrada['valor_a_pagar'])
-                    
-                    es_coincidencia = abs(v_nc - v_fv) < 0.01
-                    
-                    if es_coincidencia:
-                        obs = f"Nota credito con referencia no encontrada, {obs_anterior}" # Nota: Texto heredado de logica original
-                        actualizar_bd_cxp(cx, fv_encontrada['ID'], {'EstadoFinalFase_4': 'VALIDACION DATOS DE FACTURACION: Exitoso','ResultadoFinalAntesEventos': 'ENCONTRADO','NotaCreditoReferenciada':f"{r.get('Numero_de_nota_credito')}"})
-
-                        actualizar_items_comparativa_nc(reg_id, cx, nit,
-                                                    nombre_item='LineExtensionAmount',
-                                                    valor_xml=r.get('valor_a_pagar_nc'),
-                                                    valor_aprobado='SI',
-                                                    valor_factura=r.get('valor_a_pagar'),
-                                                    nombre_proveedor=None,
-                                                    fecha_retoma=None)
-                        
-                        actualizar_estado_comparativa_nc(cx, nit, reg_id, 'ENCONTRADO')
-                    
-                else:
-                    # No se encontro factura cruce
-                    obs = f"Nota credito con referencia no encontrada, {obs_anterior}"
-                    actualizar_bd_cxp(cx, reg_id, {'EstadoFinalFase_4': 'VALIDACION DATOS DE FACTURACION: Exitoso', 'ObservacionesFase_4': truncar_observacion(obs), 'ResultadoFinalAntesEventos': 'CON NOVEDAD'})
-                    
-                    actualizar_items_comparativa_nc(reg_id, cx, nit,
-                                                    nombre_item='Referencia',
-                                                    valor_xml=r.get('PrefijoYNumero'),
-                                                    valor_aprobado='NO',
-                                                    valor_factura=r.get('numero_de_factura'),
-                                                    nombre_proveedor=None,
-                                                    fecha_retoma=None)
-                    
-                    actualizar_items_comparativa_nc(reg_id, cx, nit,
-                                                    nombre_item='Observaciones',
-                                                    valor_xml=obs,
-                                                    valor_aprobado=None,
-                                                    valor_factura=None,
-                                                    nombre_proveedor=None,
-                                                    fecha_retoma=None)
-                    
-                    actualizar_estado_comparativa_nc(cx, nit, reg_id, 'CON NOVEDAD')
-                    cnt_nc += 1
-                    continue
+                registrar_item_comparativa(items_nd, reg_id, nit,
+                                                        nombre_item='Codigo CUFE de la factura',
+                                                        valor_xml=safe_str(r.get('cufeuuid')),
+                                                        valor_aprobado=None,
+                                                        nombre_proveedor=None)
                 
-            # Generacion de Reporte Excel al final de procesar NCs
+                registrar_item_comparativa(items_nd, reg_id, nit,
+                                                        nombre_item='Cude de la Nota Debito',
+                                                        valor_xml=safe_str(r.get('cufe_fe')),
+                                                        valor_aprobado=None,
+                                                        nombre_proveedor=None)
+                cnt_nd += 1
+            except Exception as e:
+                print(f"[ERROR] Procesando ND {r.get('ID')}: {e}")
+                print(traceback.format_exc())
+                cnt_nd += 1
+
+        # Escritura masiva de items de Comparativa_ND
+        escritura_nd = escribir_items_comparativa_bulk(cx, 'ND', items_nd)
+        filas_escritas.update(escritura_nd)
+
+        return {'procesadas': cnt_nd, 'filas_escritas': filas_escritas}
+
+    def procesar_fase(cx, tipo_nota, procesar_lote, paginacion, *args):
+        """
+        Ejecuta una fase completa (NC o ND) sobre la conexion indicada.
+
+        Sin paginacion lee todos los pendientes y procesa un unico lote. Con paginacion
+        recorre paginas keyset por ID: cada pagina se carga, valida y escribe antes de
+        leer la siguiente, y su ultimo ID se registra en el checkpoint para que una corrida
+        reiniciada continue desde ahi.
+
+        Args:
+            cx (pyodbc.Connection): Conexion activa (exclusiva de la fase).
+            tipo_nota (str): 'NC' o 'ND'.
+            procesar_lote (callable): procesar_lote_nc o procesar_lote_nd.
+            paginacion (dict): tamano_pagina, ruta_checkpoint, fecha, ultimo_id, reconstruir.
+            *args: Argumentos del lote posteriores al DataFrame.
+
+        Returns:
+            dict: Documentos procesados, filas escritas, paginas y ultimo ID procesado.
+        """
+        tamano_pagina = paginacion['tamano_pagina']
+
+        # -----------------------------------------------------------------
+        # Modo completo: todos los pendientes en un solo lote
+        # -----------------------------------------------------------------
+        if tamano_pagina <= 0:
+            orden = " ORDER BY [executionDate] DESC" if tipo_nota == 'ND' else ""
+            df = pd.read_sql(f"SELECT * FROM [CxP].[DocumentsProcessing] WHERE {FILTRO_PENDIENTES[tipo_nota]}{orden}", cx)
+            resultado = procesar_lote(cx, df, *args)
+            resultado.update({'paginas': 1, 'ultimo_id': None})
+            return resultado
+
+        # -----------------------------------------------------------------
+        # Modo paginado (keyset por ID) con checkpoint por pagina
+        # -----------------------------------------------------------------
+        ultimo_id = paginacion['ultimo_id'].get(tipo_nota)
+        if ultimo_id is None:
+            if not paginacion['reconstruir']:
+                podar_snapshot_comparativa(cx, tipo_nota)
+        else:
+            print(f"[INFO] Reanudando fase {tipo_nota} desde checkpoint: ID > {ultimo_id}")
+
+        procesadas = 0
+        paginas = 0
+        filas_escritas = {}
+        for df_pagina, id_pagina in iterar_paginas_pendientes(cx, tipo_nota, tamano_pagina, ultimo_id):
+            paginas += 1
+            print(f"[INFO] Fase {tipo_nota} pagina {paginas}: {len(df_pagina)} documentos (hasta ID {id_pagina})")
+
+            resultado_pagina = procesar_lote(cx, df_pagina, *args, podar_snapshot=False)
+            procesadas += resultado_pagina['procesadas']
+            acumular_filas_escritas(filas_escritas, resultado_pagina['filas_escritas'])
+
+            ultimo_id = id_pagina
+            guardar_checkpoint(paginacion['ruta_checkpoint'], paginacion['fecha'], tipo_nota, ultimo_id)
+            del df_pagina
+
+        return {'procesadas': procesadas, 'filas_escritas': filas_escritas,
+                'paginas': paginas, 'ultimo_id': ultimo_id}
+
+    def procesar_fase_nc(cx, paginacion, plazo_max, now, reconstruir_comparativas):
+        """Fase de Notas Credito (NC): completa o paginada segun configuracion."""
+        return procesar_fase(cx, 'NC', procesar_lote_nc, paginacion, plazo_max, now, reconstruir_comparativas)
+
+    def procesar_fase_nd(cx, paginacion, reconstruir_comparativas):
+        """Fase de Notas Debito (ND): completa o paginada segun configuracion."""
+        return procesar_fase(cx, 'ND', procesar_lote_nd, paginacion, reconstruir_comparativas)
+
+    def ejecutar_fase_en_conexion(cfg, nombre_fase, funcion_fase, *args):
+        """
+        Ejecuta una fase en su propia conexion y mide su duracion.
+
+        Args:
+            cfg (dict): Configuracion de conexion.
+            nombre_fase (str): 'NC' o 'ND' (solo para log).
+            funcion_fase (callable): procesar_fase_nc o procesar_fase_nd.
+            *args: Argumentos adicionales de la fase.
+
+        Returns:
+            tuple: (resultado de la fase, segundos transcurridos)
+        """
+        t_fase = time.time()
+        print(f"[INFO] Iniciando fase {nombre_fase} en conexion dedicada...")
+        with crear_conexion_db(cfg) as cx_fase:
+            resultado = funcion_fase(cx_fase, *args)
+        duracion = time.time() - t_fase
+        print(f"[INFO] Fase {nombre_fase} finalizada en {round(duracion, 2)}s")
+        return resultado, duracion
+
+    # =========================================================================
+    # LOGICA PRINCIPAL DE ORQUESTACION
+    # =========================================================================
+
+    try:
+        print("")
+        print("=" * 80)
+        print("[INFO] INICIO HU4.2 - Validacion NC/ND")
+        print("=" * 80)
+
+        # 1. Parsing de Configuracion
+        cfg = parse_config(GetVar("vLocDicConfig"))
+
+        plazo_max = int(cfg.get('PlazoMaximoRetoma', 120))
+        reconstruir_comparativas = str(cfg.get('ReconstruirComparativas', 'False')).strip().lower() in ('true', '1', 'si', 'yes')
+        fases_concurrentes = str(cfg.get('FasesConcurrentes', 'False')).strip().lower() in ('true', '1', 'si', 'yes')
+        now = datetime.now()
+
+        # Paginacion keyset opcional (TamanoPagina > 0) con checkpoint reanudable
+        tamano_pagina = int(cfg.get('TamanoPagina', 0) or 0)
+        ruta_checkpoint = None
+        checkpoint = {}
+        if tamano_pagina > 0:
+            ruta_checkpoint = cfg.get('RutaCheckpoint') or os.path.join(tempfile.gettempdir(), 'HU42_ValidarNC_ND_checkpoint.json')
+            checkpoint = leer_checkpoint(ruta_checkpoint, now)
+            print(f"[INFO] Paginacion keyset activa: {tamano_pagina} documentos por pagina. Checkpoint: {ruta_checkpoint}")
+            if checkpoint:
+                print(f"[INFO] Checkpoint vigente encontrado: {checkpoint}")
+        paginacion = {
+            'tamano_pagina': tamano_pagina,
+            'ruta_checkpoint': ruta_checkpoint,
+            'fecha': now,
+            'ultimo_id': checkpoint,
+            'reconstruir': reconstruir_comparativas
+        }
+        
+        # 2. Limpieza completa previa (solo en reconstruccion), antes de lanzar cualquier fase.
+        #    Al reanudar desde checkpoint no se limpia para conservar las paginas ya escritas.
+        if reconstruir_comparativas and checkpoint:
+            print("[INFO] ReconstruirComparativas activo pero se reanuda desde checkpoint: no se limpian las tablas.")
+        elif reconstruir_comparativas:
+            print("[INFO] ReconstruirComparativas activo: limpieza y poblado completo.")
             try:
-                generar_reporte_retorno_nc(cx, cfg['RutaBaseReporteNC'], cfg['NombreReporteNC'])
+                with crear_conexion_db(cfg) as cx:
+                    limpiar_tablas_comparativas(cx)
             except Exception as e:
                 error_msg = traceback.format_exc() 
                 SetVar("vGblStrDetalleError", error_msg)
                 SetVar("vGblStrSystemError", "ErrorHU4_4.1")
                 SetVar("vLocStrResultadoSP", "False")
-                print(f"[ERROR] Critico generando reporte: {error_msg}")
-            
-            # -----------------------------------------------------------------
-            # FASE 2: PROCESAMIENTO DE NOTAS DEBITO (ND)
-            # -----------------------------------------------------------------
-            df_nd = pd.read_sql("SELECT * FROM [CxP].[DocumentsProcessing] WHERE [tipo_de_documento]='ND' AND ([ResultadoFinalAntesEventos] IS NULL OR [ResultadoFinalAntesEventos] NOT IN ('Exitoso')) ORDER BY [executionDate] DESC", cx)
-            print(f"[INFO] Procesando {len(df_nd)} Notas Debito (ND)...")
-            
+                print(f"[ERROR] Critico al limpiar tablas: {error_msg}")
+                raise e
+
+        # 3. Fases NC y ND: en paralelo (una conexion por fase) o secuenciales
+        t_fases = time.time()
+        if fases_concurrentes:
+            print("[INFO] FasesConcurrentes activo: NC y ND en paralelo con conexiones separadas.")
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix='HU42') as executor:
+                futuro_nc = executor.submit(ejecutar_fase_en_conexion, cfg, 'NC', procesar_fase_nc,
+                                            paginacion, plazo_max, now, reconstruir_comparativas)
+                futuro_nd = executor.submit(ejecutar_fase_en_conexion, cfg, 'ND', procesar_fase_nd,
+                                            paginacion, reconstruir_comparativas)
+                resultado_nc, tiempo_nc = futuro_nc.result()
+                resultado_nd, tiempo_nd = futuro_nd.result()
+        else:
+            with crear_conexion_db(cfg) as cx:
+                t_fase = time.time()
+                resultado_nc = procesar_fase_nc(cx, paginacion, plazo_max, now, reconstruir_comparativas)
+                tiempo_nc = time.time() - t_fase
+                t_fase = time.time()
+                resultado_nd = procesar_fase_nd(cx, paginacion, reconstruir_comparativas)
+                tiempo_nd = time.time() - t_fase
+        tiempo_fases = time.time() - t_fases
+        ahorro = max(0.0, (tiempo_nc + tiempo_nd) - tiempo_fases) if fases_concurrentes else 0.0
+
+        cnt_nc = resultado_nc['procesadas']
+        cnt_nd = resultado_nd['procesadas']
+        filas_escritas = {'NC': resultado_nc['filas_escritas'], 'ND': resultado_nd['filas_escritas']}
+
+        # Ambas fases completas: el checkpoint ya no es necesario
+        eliminar_checkpoint(ruta_checkpoint)
+
+        # 4. Reporte de novedades NC comun, al finalizar ambas fases
+        with crear_conexion_db(cfg) as cx:
+            # Generacion de Reporte Excel al final de procesar NCs
             try:
-                poblar_inicial_comparativa_nd(cx, df_nd)
+                generar_reporte_retorno_nc(cx, cfg['RutaBaseReporteNC'], cfg['NombreReporteNC'])
             except Exception as e:
                 error_msg = traceback.format_exc() 
                 SetVar("vGblStrDetalleError", error_msg)
                 SetVar("vGblStrSystemError", "ErrorHU4_4.1")
                 SetVar("vLocStrResultadoSP", "False")
-                print(f"[ERROR] Critico al poblar ND: {error_msg}")
-                raise e
-            
-            cnt_nd = 0
-            for idx, r in df_nd.iterrows():
-                try:
-                    reg_id = safe_str(r.get('ID', ''))
-                    nit = safe_str(r.get('nit_emisor_o_nit_del_proveedor', ''))
-                    num_nd = safe_str(r.get('numero_de_nota_debito', ''))
-                    
-                    nombre_prov = r.get('nombre_emisor')
-                    
-                    print(f"[INFO] Analizando ND: {num_nd} (ID: {reg_id})")
-
-                    validaciones = {
-                        'Nombre Emisor': {'val': r.get('nombre_emisor'), 'check': campo_con_valor},
-                        'NIT Emisor': {'val': r.get('nit_emisor_o_nit_del_proveedor'), 'check': campo_con_valor},
-                        'Fecha emision del documento': {'val': r.get('fecha_de_emision_documento'), 'check': campo_con_valor},
-                        'Nombre Receptor': {'val': r.get('nombre_del_adquiriente'), 'check': validar_nombre_receptor},
-                        'Nit Receptor': {'val': r.get('nit_del_adquiriente'), 'check': validar_nit_receptor},
-                        'Tipo Persona Receptor': {'val': r.get('tipo_persona'), 'check': validar_tipo_persona},
-                        'DigitoVerificacion Receptor': {'val': r.get('digito_de_verificacion'), 'check': validar_digito_verificacion},
-                        'TaxLevelCode Receptor': {'val': r.get('responsabilidad_tributaria_adquiriente'), 'check': validar_tax_level_code}
-                    }
-
-                    # Validaciones Tributarias
-                    for k, v in validaciones.items():
-                        actualizar_items_comparativa_nd(reg_id, cx, nit,
-                                                            nombre_item=k,
-                                                            valor_xml=safe_str(v['val']),
-                                                            valor_aprobado='SI' if v['check'](v['val']) else 'NO',
-                                                            nombre_proveedor=None)
-
-                    # Actualizacion Exitosa en BD Principal
-                    actualizar_bd_cxp(cx, reg_id, {'EstadoFinalFase_4': 'VALIDACION DATOS DE FACTURACION: Exitoso', 'ResultadoFinalAntesEventos': 'EXITOSO'})
-                    
-                    # Actualizacion de campos informativos finales en comparativa
-                    actualizar_items_comparativa_nd(reg_id, cx, nit,
-                                                            nombre_item='LineExtensionAmount',
-                                                            valor_xml=safe_str(r.get('valor_a_pagar')),
-                                                            valor_aprobado=None,
-                                                            nombre_proveedor=None)
-                    
-                    actualizar_items_comparativa_nd(reg_id, cx, nit,
-                                                            nombre_item='Tipo de nota debito',
-                                                            valor_xml=safe_str(r.get('Tipo_de_nota_cred_deb')),
-                                                            valor_aprobado=None,
-                                                            nombre_proveedor=None)
-                    
-                    actualizar_items_comparativa_nd(reg_id, cx, nit,
-                                                            nombre_item='Referencia',
-                                                            valor_xml=safe_str(r.get('PrefijoYNumero')),
-                                                            valor_aprobado=None,
-                                                            nombre_proveedor=None)
-                    
-                    actualizar_items_comparativa_nd(reg_id, cx, nit,
-                                                            nombre_item='Codigo CUFE de la factura',
-                                                            valor_xml=safe_str(r.get('cufeuuid')),
-                                                            valor_aprobado=None,
-                                                            nombre_proveedor=None)
-                    
-                    actualizar_items_comparativa_nd(reg_id, cx, nit,
-                                                            nombre_item='Cude de la Nota Debito',
-                                                            valor_xml=safe_str(r.get('cufe_fe')),
-                                                            valor_aprobado=None,
-                                                            nombre_proveedor=None)
-                    cnt_nd += 1
-                except Exception as e:
-                    print(f"[ERROR] Procesando ND {r.get('ID')}: {e}")
-                    print(traceback.format_exc())
-                    cnt_nd += 1
-
-            print(f"[SUCCESS] Procesamiento completado. NC procesadas: {cnt_nc}, ND procesadas: {cnt_nd}")
-
-            SetVar("vLocStrResultadoSP", "True")
-            SetVar("vLocStrResumenSP", f"Procesamiento Finalizado. NC: {cnt_nc}, ND: {cnt_nd}")
+                print(f"[ERROR] Critico generando reporte: {error_msg}")
+
+        print(f"[SUCCESS] Procesamiento completado. NC procesadas: {cnt_nc}, ND procesadas: {cnt_nd}")
+        for fase, filas in filas_escritas.items():
+            print(f"[INFO] Filas escritas {fase}: {filas}")
+        print(f"[INFO] Tiempos: NC={round(tiempo_nc, 2)}s ND={round(tiempo_nd, 2)}s "
+              f"fases={round(tiempo_fases, 2)}s ahorro={round(ahorro, 2)}s")
+
+        SetVar("vLocStrResultadoSP", "True")
+        SetVar("vLocStrResumenSP", f"Procesamiento Finalizado. NC: {cnt_nc}, ND: {cnt_nd}")
+        SetVar("vLocDicEstadisticas", str({
+            'nc_procesadas': cnt_nc,
+            'nd_procesadas': cnt_nd,
+            'filas_escritas': filas_escritas,
+            'fases_concurrentes': fases_concurrentes,
+            'tamano_pagina': tamano_pagina,
+            'paginas': {'NC': resultado_nc['paginas'], 'ND': resultado_nd['paginas']},
+            'reanudado_desde': checkpoint,
+            'tiempo_nc': round(tiempo_nc, 2),
+            'tiempo_nd': round(tiempo_nd, 2),
+            'tiempo_fases': round(tiempo_fases, 2),
+            'ahorro_concurrencia': round(ahorro, 2)
+        }))
 
     except Exception as e:
         print("")
@@ -13,10 +13,24 @@ Descripcion General:
     del plazo de dias maximos desde la fecha de retoma.
 
 Autor: Diego Ivan Lopez Ochoa
-Version: 1.1.0 - Modificado para preservar datos en Comparativa
+Version: 1.2.0 - Lotes por keyset y tiempos por lote en el resumen
 Base de Datos: NotificationsPaddy
 Schema: CxP
 
+================================================================================
+CAMBIOS EN VERSION 1.2.0
+================================================================================
+- El predicado de elegibilidad se evalua UNA vez y los IDs se guardan en
+  #WorkIDs (PK clustered). Los lotes se toman por keyset
+  (WHERE ID > @LastID ORDER BY ID) en lugar de TOP + anti-join contra
+  #ProcessedIDs, que re-escaneaba los elegibles en cada iteracion
+  (costo cuadratico con el backlog).
+- Documentos que se vuelven elegibles DESPUES de la foto inicial no se
+  toman en esta ejecucion; los toma la siguiente.
+- ResultSet 1 agrega columnas de tiempos al final (LotesProcesados,
+  MsPreparacionTrabajo, MsTotalLotes, MsLoteMaximo, TiemposLotesJson).
+  Las columnas existentes y el ResultSet 2 no cambian.
+
 ================================================================================
 CAMBIOS EN VERSION 1.1.0
 ================================================================================
@@ -63,12 +77,18 @@ DIAGRAMA DE FLUJO
                                   |
                                   v
     +-------------------------------------------------------------+
-    |  Procesar en lotes (@BatchSize):                            |
-    |  WHILE existan documentos elegibles                         |
+    |  Foto de elegibles -> #WorkIDs (una sola evaluacion):       |
+    |  - Documentos FV dentro de @DiasMaximos + 30                |
+    |  - Estado no en lista de omitir                             |
+    +-----------------------------+-------------------------------+
+                                  |
+                                  v
+    +-------------------------------------------------------------+
+    |  Procesar en lotes (@BatchSize) por keyset:                 |
+    |  WHILE queden IDs en #WorkIDs con ID > @LastID              |
     |  +-------------------------------------------------------+  |
-    |  |  Seleccionar batch de documentos FV:                  |  |
-    |  |  - Dentro de @DiasMaximos                             |  |
-    |  |  - Estado no en lista de omitir                       |  |
+    |  |  #Batch = TOP (@BatchSize) ID > @LastID ORDER BY ID   |  |
+    |  |  @LastID = MAX(ID) del batch                          |  |
     |  +-------------------------------------------------------+  |
     |  |  Actualizar fecha de retoma si es NULL                |  |
     |  +-------------------------------------------------------+  |
@@ -86,6 +106,8 @@ DIAGRAMA DE FLUJO
     |  +-------------------------------------------------------+  |
     |  |  Marcar RECHAZADO los que fallan validacion           |  |
     |  +-------------------------------------------------------+  |
+    |  |  Registrar tiempo del lote en #TiemposLote            |  |
+    |  +-------------------------------------------------------+  |
     +-----------------------------+-------------------------------+
                                   |
                                   v
@@ -207,6 +229,13 @@ ResultSet 1: Resumen de Ejecucion
     RegistrosNuevosComparativa  INT             - Registros NUEVOS en Comparativa
     FilasInsertadasComparativa  INT             - Filas insertadas en Comparativa
     RegistrosReporteNovedades   INT             - Registros en ReporteNovedades
+    LotesProcesados             INT             - Cantidad de lotes ejecutados
+    MsPreparacionTrabajo        INT             - ms para llenar #WorkIDs
+    MsTotalLotes                INT             - Suma de ms de todos los lotes
+    MsLoteMaximo                INT             - ms del lote mas lento
+    TiemposLotesJson            NVARCHAR(MAX)   - Tiempos por lote:
+                                                  [{"Lote","DesdeID","HastaID",
+                                                    "Filas","Ms"}, ...]
 
 ResultSet 2: Detalle de Registros
 ---------------------------------
@@ -264,7 +293,9 @@ NOTAS TECNICAS
 
     - El SP usa SET NOCOUNT ON y SET XACT_ABORT ON
     - Procesa en lotes para evitar bloqueos prolongados
-    - Usa tablas temporales (#ProcessedIDs, #Eligible, #Batch, #NewRecords)
+    - Usa tablas temporales (#WorkIDs, #ProcessedIDs, #Eligible, #Batch,
+      #NewRecords, #TiemposLote)
+    - Lotes por keyset sobre #WorkIDs: cada lote cuesta O(@BatchSize)
     - ** CAMBIO v1.1.0: La tabla Comparativa NO se limpia (proceso NO destructivo) **
     - Solo se insertan registros que NO existan en Comparativa
     - Las observaciones se concatenan (no se sobrescriben)
@@ -475,33 +506,69 @@ BEGIN
         @TotalFilasInsertadasComparativa     INT = 0,
         @TotalRegistrosReporteNovedades      INT = 0;
 
+    DECLARE
+        @LastID                 BIGINT,
+        @NumeroLote             INT = 0,
+        @InicioLote             DATETIME2(7),
+        @InicioTrabajo          DATETIME2(7) = SYSDATETIME(),
+        @MsPreparacionTrabajo   INT = 0;
+
     IF OBJECT_ID('tempdb..#ProcessedIDs') IS NOT NULL DROP TABLE #ProcessedIDs;
     CREATE TABLE #ProcessedIDs (ID BIGINT NOT NULL PRIMARY KEY);
 
+    IF OBJECT_ID('tempdb..#TiemposLote') IS NOT NULL DROP TABLE #TiemposLote;
+    CREATE TABLE #TiemposLote
+    (
+        Lote     INT    NOT NULL PRIMARY KEY,
+        DesdeID  BIGINT NOT NULL,
+        HastaID  BIGINT NOT NULL,
+        Filas    INT    NOT NULL,
+        Ms       INT    NOT NULL
+    );
+
+    -- =========================================================================
+    -- KEYSET: el predicado de elegibilidad se evalua UNA sola vez sobre
+    -- DocumentsProcessing y los IDs quedan en #WorkIDs (PK clustered). Cada
+    -- lote es un seek por rango (ID > @LastID ORDER BY ID) sobre esa tabla,
+    -- en lugar de re-escanear los elegibles con anti-join a #ProcessedIDs.
+    -- =========================================================================
+    IF OBJECT_ID('tempdb..#WorkIDs') IS NOT NULL DROP TABLE #WorkIDs;
+    CREATE TABLE #WorkIDs (ID BIGINT NOT NULL PRIMARY KEY);
+
+    INSERT INTO #WorkIDs (ID)
+    SELECT dp.ID
+    FROM [CxP].[DocumentsProcessing] dp WITH (READPAST)
+    WHERE dp.documenttype = N'FV'
+      AND (
+            dp.ResultadoFinalAntesEventos IS NULL
+            OR NOT EXISTS (SELECT 1 FROM @EstadosOmitir e WHERE e.Estado = dp.ResultadoFinalAntesEventos)
+          )
+      AND (
+            dp.Fecha_de_retoma_antes_de_contabilizacion IS NULL
+            OR dp.Fecha_de_retoma_antes_de_contabilizacion >= @CutoffPlus30
+          )
+    OPTION (RECOMPILE);
+
+    SELECT @LastID = ISNULL(MIN(ID), 0) - 1 FROM #WorkIDs;
+    SET @MsPreparacionTrabajo = DATEDIFF(MILLISECOND, @InicioTrabajo, SYSDATETIME());
+
     WHILE 1 = 1
     BEGIN
+        SET @InicioLote = SYSDATETIME();
+
         IF OBJECT_ID('tempdb..#Batch') IS NOT NULL DROP TABLE #Batch;
         CREATE TABLE #Batch (ID BIGINT NOT NULL PRIMARY KEY);
 
         INSERT INTO #Batch (ID)
-        SELECT TOP (@BatchSize) dp.ID
-        FROM [CxP].[DocumentsProcessing] dp WITH (READPAST)
-        LEFT JOIN #ProcessedIDs p ON p.ID = dp.ID
-        WHERE p.ID IS NULL
-          AND dp.documenttype = N'FV'
-          AND (
-                dp.ResultadoFinalAntesEventos IS NULL
-                OR NOT EXISTS (SELECT 1 FROM @EstadosOmitir e WHERE e.Estado = dp.ResultadoFinalAntesEventos)
-              )
-          AND (
-                dp.Fecha_de_retoma_antes_de_contabilizacion IS NULL
-                OR dp.Fecha_de_retoma_antes_de_contabilizacion >= @CutoffPlus30
-              )
-        ORDER BY dp.ID
-        OPTION (RECOMPILE);
+        SELECT TOP (@BatchSize) w.ID
+        FROM #WorkIDs w
+        WHERE w.ID > @LastID
+        ORDER BY w.ID;
 
         IF @@ROWCOUNT = 0 BREAK;
 
+        SELECT @LastID = MAX(ID) FROM #Batch;
+
         INSERT INTO #ProcessedIDs (ID)
         SELECT ID FROM #Batch;
 
@@ -919,6 +986,13 @@ BEGIN
             SET @TotalOKDentroDiasMaximos += (@BatchElegibles - @BatchRechazados);
 
             COMMIT;
+
+            SET @NumeroLote += 1;
+
+            INSERT INTO #TiemposLote (Lote, DesdeID, HastaID, Filas, Ms)
+            SELECT @NumeroLote, MIN(ID), MAX(ID), COUNT(1),
+                   DATEDIFF(MILLISECOND, @InicioLote, SYSDATETIME())
+            FROM #Batch;
         END TRY
         BEGIN CATCH
             IF @@TRANCOUNT > 0 ROLLBACK;
@@ -984,7 +1058,17 @@ BEGIN
         @TotalOKDentroDiasMaximos           AS OKDentroDiasMaximos,
         @TotalRegistrosNuevosComparativa    AS RegistrosNuevosComparativa,
         @TotalFilasInsertadasComparativa    AS FilasInsertadasComparativa,
-        @TotalRegistrosReporteNovedades     AS RegistrosReporteNovedades;
+        @TotalRegistrosReporteNovedades     AS RegistrosReporteNovedades,
+        @NumeroLote                         AS LotesProcesados,
+        @MsPreparacionTrabajo               AS MsPreparacionTrabajo,
+        ISNULL((SELECT SUM(t.Ms) FROM #TiemposLote t), 0) AS MsTotalLotes,
+        ISNULL((SELECT MAX(t.Ms) FROM #TiemposLote t), 0) AS MsLoteMaximo,
+        (
+            SELECT t.Lote, t.DesdeID, t.HastaID, t.Filas, t.Ms
+            FROM #TiemposLote t
+            ORDER BY t.Lote
+            FOR JSON PATH
+        )                                   AS TiemposLotesJson;
 
     SELECT
         dp.ID,
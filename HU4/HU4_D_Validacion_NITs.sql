@@ -13,10 +13,24 @@ Descripcion General:
     por campos mandatorios.
 
 Autor: Diego Ivan Lopez Ochoa
-Version: 1.0.0
+Version: 1.1.0 - JOIN por NIT normalizado persistido e indexado
 Base de Datos: NotificationsPaddy
 Schema: CxP
 
+================================================================================
+CAMBIOS EN VERSION 1.1.0
+================================================================================
+- [CxP].[DocumentsProcessing] gana la columna calculada PERSISTED
+  nit_emisor_normalizado (LTRIM/RTRIM + sin espacios, puntos ni guiones)
+  y el indice IX_DocumentsProcessing_NitEmisorNormalizado
+  (INCLUDE ResultadoFinalAntesEventos). El script los crea solo si no
+  existen, antes del ALTER PROCEDURE.
+- Los 3 JOIN contra @Nits usan la columna en lugar de la expresion
+  REPLACE anidada, que impedia usar indices y forzaba 3 escaneos completos
+  de DocumentsProcessing. Ahora cada NIT de la lista es un INDEX SEEK.
+- ejecutar_HU4_D_NITs.py normaliza los NITs del Excel con la misma regla
+  antes de deduplicar.
+
 ================================================================================
 DIAGRAMA DE FLUJO
 ================================================================================
@@ -58,7 +72,7 @@ DIAGRAMA DE FLUJO
     +------------------------+                    v
     +-------------------------------------------------------------+
     |  Buscar candidatos en DocumentsProcessing:                  |
-    |  - NIT coincide con lista                                   |
+    |  - nit_emisor_normalizado = NIT de la lista (INDEX SEEK)    |
     |  - Estado = RECHAZADO o RECHAZADO - PENDIENTE               |
     +-----------------------------+-------------------------------+
                                   |
@@ -141,7 +155,9 @@ Los NITs se normalizan para garantizar coincidencias correctas:
     '900.123-456'            -> '900123456'
 
 La normalizacion se aplica tanto a la lista de entrada como a los
-NITs en la base de datos para la comparacion.
+NITs en la base de datos para la comparacion. Del lado de la base de datos
+vive en la columna PERSISTED [CxP].[DocumentsProcessing].nit_emisor_normalizado
+(indexada), de modo que no se recalcula en cada ejecucion.
 
 ================================================================================
 ESTADOS AFECTADOS
@@ -232,7 +248,11 @@ NOTAS TECNICAS
 ================================================================================
 
     - Usa STRING_SPLIT para parsear la lista de NITs
-    - Normaliza NITs con REPLACE anidados
+    - Normaliza la lista de NITs con REPLACE anidados; los NITs de
+      DocumentsProcessing ya vienen normalizados en nit_emisor_normalizado
+    - El indice sobre una columna calculada requiere ANSI_NULLS,
+      QUOTED_IDENTIFIER, ANSI_PADDING y ARITHABORT en ON (por defecto en
+      ODBC Driver 17) para las sesiones que escriben DocumentsProcessing
     - Usa tabla variable @Nits para almacenar NITs unicos
     - Usa tabla variable @Updated para tracking de IDs actualizados
     - Las observaciones se concatenan (no se sobrescriben)
@@ -243,6 +263,43 @@ NOTAS TECNICAS
 
 USE [NotificationsPaddy]
 GO
+SET ANSI_NULLS ON
+GO
+SET QUOTED_IDENTIFIER ON
+GO
+SET ANSI_PADDING ON
+GO
+SET ARITHABORT ON
+GO
+
+/*
+    NIT normalizado persistido + indice (idempotente, se puede re-ejecutar).
+    Misma expresion que se aplica a @ListaNits; al ser PERSISTED se calcula
+    al escribir la fila y el JOIN del SP queda como INDEX SEEK.
+*/
+IF COL_LENGTH(N'CxP.DocumentsProcessing', N'nit_emisor_normalizado') IS NULL
+BEGIN
+    ALTER TABLE [CxP].[DocumentsProcessing]
+        ADD nit_emisor_normalizado AS CAST(
+            REPLACE(REPLACE(REPLACE(LTRIM(RTRIM(nit_emisor_o_nit_del_proveedor)), N' ', N''), N'.', N''), N'-', N'')
+            AS NVARCHAR(100)
+        ) PERSISTED;
+END
+GO
+
+IF NOT EXISTS (
+    SELECT 1
+    FROM sys.indexes
+    WHERE object_id = OBJECT_ID(N'[CxP].[DocumentsProcessing]')
+      AND name = N'IX_DocumentsProcessing_NitEmisorNormalizado'
+)
+BEGIN
+    CREATE NONCLUSTERED INDEX IX_DocumentsProcessing_NitEmisorNormalizado
+    ON [CxP].[DocumentsProcessing] (nit_emisor_normalizado)
+    INCLUDE (ResultadoFinalAntesEventos);
+END
+GO
+
 /****** Object:  StoredProcedure [CxP].[HU4_D_Validacion_NITs]    Script Date: 01/02/2026 4:39:27 ******/
 SET ANSI_NULLS ON
 GO
@@ -328,7 +385,7 @@ BEGIN
         INNER JOIN [CxP].[DocumentsProcessing] dp
             ON dp.ID = c.ID_registro
         INNER JOIN @Nits n
-            ON n.NIT_NORM = REPLACE(REPLACE(REPLACE(LTRIM(RTRIM(dp.nit_emisor_o_nit_del_proveedor)), N' ', N''), N'.', N''), N'-', N'')
+            ON n.NIT_NORM = dp.nit_emisor_normalizado
         WHERE dp.ResultadoFinalAntesEventos IN (N'RECHAZADO', N'RECHAZADO - PENDIENTE')
           AND ISNULL(LTRIM(RTRIM(c.Estado_validacion_antes_de_eventos)), N'') = N'';
 
@@ -339,7 +396,7 @@ BEGIN
         SELECT @Candidatos = COUNT_BIG(*)
         FROM [CxP].[DocumentsProcessing] dp
         INNER JOIN @Nits n
-            ON n.NIT_NORM = REPLACE(REPLACE(REPLACE(LTRIM(RTRIM(dp.nit_emisor_o_nit_del_proveedor)), N' ', N''), N'.', N''), N'-', N'')
+            ON n.NIT_NORM = dp.nit_emisor_normalizado
         WHERE dp.ResultadoFinalAntesEventos IN (N'RECHAZADO', N'RECHAZADO - PENDIENTE');
 
         DECLARE @Updated TABLE (ID_registro INT NOT NULL PRIMARY KEY);
@@ -360,7 +417,7 @@ BEGIN
         OUTPUT inserted.ID INTO @Updated(ID_registro)
         FROM [CxP].[DocumentsProcessing] dp
         INNER JOIN @Nits n
-            ON n.NIT_NORM = REPLACE(REPLACE(REPLACE(LTRIM(RTRIM(dp.nit_emisor_o_nit_del_proveedor)), N' ', N''), N'.', N''), N'-', N'')
+            ON n.NIT_NORM = dp.nit_emisor_normalizado
         WHERE dp.ResultadoFinalAntesEventos IN (N'RECHAZADO', N'RECHAZADO - PENDIENTE');
 
         DECLARE @RegistrosActualizados INT = (SELECT COUNT(*) FROM @Updated);
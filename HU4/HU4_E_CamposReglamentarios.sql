@@ -13,10 +13,38 @@ Descripcion General:
     CON NOVEDAD ANO CERRADO.
 
 Autor: Diego Ivan Lopez Ochoa
-Version: 1.0.0
+Version: 1.2.0 - Validacion set-based con escritura por lotes de ID
 Base de Datos: NotificationsPaddy
 Schema: CxP
 
+================================================================================
+CAMBIOS EN VERSION 1.2.0
+================================================================================
+- La escritura vuelve a ser por lotes: los documentos de #Docs se toman por
+  keyset (TOP (@BatchSize) WHERE ID > @LastID ORDER BY ID) y cada lote
+  aplica sus 3 UPDATE en su propia transaccion. En v1.1.0 todo el backlog
+  iba en una sola transaccion, que escalaba a bloqueo de tabla sobre
+  DocumentsProcessing / Comparativa y bloqueaba a los demas puntos HU4.
+- @BatchSize vuelve a tener efecto (<= 0 o NULL usa 500) y LotesProcesados
+  devuelve la cantidad real de lotes.
+- Si un lote falla (XACT_ABORT) se revierte solo ese lote; los anteriores
+  quedan confirmados, igual que con el loop original.
+
+================================================================================
+CAMBIOS EN VERSION 1.1.0
+================================================================================
+- Se elimina el loop WHILE @MinRow <= @TotalDocs. Todas las reglas se
+  evaluan como columnas de #Docs en la MISMA pasada que carga los
+  documentos elegibles (una lectura de DocumentsProcessing).
+- La observacion y el estado nuevo son columnas calculadas de #Docs que
+  reproducen el orden del loop anterior: cada regla fallida antepone su
+  mensaje y ANO CERRADO, la ultima, define el estado.
+- Las transiciones CON NOVEDAD / CON NOVEDAD ANO CERRADO y los Items de
+  Comparativa se aplican con una sentencia cada uno, dentro de una sola
+  transaccion (antes eran ~20 UPDATE por lote sin transaccion).
+- El ResultSet no cambia. LotesProcesados queda en 1 (una pasada) y
+  @BatchSize se conserva solo por compatibilidad de la firma.
+
 ================================================================================
 DIAGRAMA DE FLUJO
 ================================================================================
@@ -41,10 +69,12 @@ DIAGRAMA DE FLUJO
                                   |
                                   v
     +-------------------------------------------------------------+
-    |  Cargar documentos elegibles en #Docs:                      |
+    |  Cargar documentos elegibles en #Docs (una pasada):         |
     |  - Estado no en lista de omitir                             |
     |  - Fecha retoma dentro de @DiasMaximos                      |
     |  - documenttype = 'FV'                                      |
+    |  + Resultado de cada regla como columna (Falla*)            |
+    |  + ObservacionNueva / EstadoNuevo (columnas calculadas)     |
     +-----------------------------+-------------------------------+
                                   |
                   +---------------+---------------+
@@ -54,33 +84,32 @@ DIAGRAMA DE FLUJO
                          | NO             | SI
                          v                v
     +------------------------+   +--------------------------------+
-    |  Retornar sin procesar |   |  Validar TaxLevelCode Emisor   |
-    |  "SIN DOCUMENTOS"      |   +----------------+---------------+
-    +------------------------+                    |
+    |  Retornar sin procesar |   |  WHILE 1 = 1 (por lote):       |
+    |  "SIN DOCUMENTOS"      |   |  #Lote = TOP (@BatchSize) ID   |
+    +------------------------+   |    > @LastID ORDER BY ID       |
+                                 |  IF @@ROWCOUNT = 0 BREAK       |
+                                 |  BEGIN TRAN                    |
+                                 +----------------+---------------+
+                                                  |
                                                   v
     +-------------------------------------------------------------+
-    |  Validar TaxLevelCode Adquiriente                           |
+    |  UPDATE DocumentsProcessing (1 sentencia por lote):         |
+    |  - ResultadoFinalAntesEventos = EstadoNuevo                 |
+    |  - ObservacionesFase_4 = ObservacionNueva + anteriores      |
     +-----------------------------+-------------------------------+
                                   |
                                   v
     +-------------------------------------------------------------+
-    |  Procesar en lotes (@BatchSize):                            |
-    |  WHILE @MinRow <= @TotalDocs                                |
-    |  +-------------------------------------------------------+  |
-    |  |  Validar TaxLevelCode (Emisor y Adquiriente)          |  |
-    |  +-------------------------------------------------------+  |
-    |  |  Validar ValidationResultCode (02)                    |  |
-    |  +-------------------------------------------------------+  |
-    |  |  Validar InvoiceTypecode (01,02,03,04,91,92,96)       |  |
-    |  +-------------------------------------------------------+  |
-    |  |  Validar DescripcionCodigo (DIAN)                     |  |
-    |  +-------------------------------------------------------+  |
-    |  |  Validar PaymentMeans (01, 02)                        |  |
-    |  +-------------------------------------------------------+  |
-    |  |  Validar Ano de Emision (si mes <> enero)             |  |
-    |  +-------------------------------------------------------+  |
-    |  |  Actualizar Comparativa con Observaciones             |  |
-    |  +-------------------------------------------------------+  |
+    |  UPDATE Comparativa Items por regla (1 sentencia por lote): |
+    |  TaxLevelCode, ValidationResultCode, ResponseCode,          |
+    |  InvoiceTypecode, DescripcionCodigo, PaymentMeans,          |
+    |  FechaEmisionDocumento (solo ANO CERRADO)                   |
+    +-----------------------------+-------------------------------+
+                                  |
+                                  v
+    +-------------------------------------------------------------+
+    |  UPDATE Comparativa Estado/Observaciones (1 sentencia)      |
+    |  COMMIT del lote, siguiente lote                            |
     +-----------------------------+-------------------------------+
                                   |
                                   v
@@ -101,7 +130,8 @@ PARAMETROS
         Dias maximos desde la fecha de retoma.
         
     @BatchSize INT = 500
-        Cantidad de documentos por lote.
+        Documentos por lote de escritura (una transaccion por lote).
+        NULL o <= 0 usa 500.
         
     @RangoMaxValor INT = 500
         Rango maximo de valor (no utilizado actualmente).
@@ -197,7 +227,7 @@ ResultSet Unico:
     RegistrosProcesados         INT         - Total procesados
     RegistrosConNovedad         INT         - Con estado CON NOVEDAD
     RegistrosAnoCerrado         INT         - Con estado ANO CERRADO
-    LotesProcesados             INT         - Cantidad de lotes
+    LotesProcesados             INT         - Lotes de escritura (@BatchSize)
     TiempoTotalSegundos         INT         - Duracion
     RegistrosInsertadosReporte  INT         - En ReporteNovedades
     Estado                      VARCHAR     - COMPLETADO o SIN DOCUMENTOS
@@ -228,7 +258,9 @@ NOTAS TECNICAS
     - El chequeo de ano cerrado solo aplica si mes <> 1 (enero)
     - Las observaciones se concatenan con las existentes
     - Limite de 3900 caracteres en ObservacionesFase_4
-    - Procesa en lotes para evitar bloqueos
+    - Set-based: una pasada de lectura; la escritura son 3 sentencias por
+      lote de @BatchSize IDs, cada lote en su propia transaccion para no
+      escalar a bloqueo de tabla con backlogs grandes
 
 ================================================================================
 */
@@ -292,11 +324,12 @@ BEGIN
     DECLARE @MesActual  INT = MONTH(@Now);
 
     DECLARE @TotalDocs    INT = 0;
-    DECLARE @CurrentBatch INT = 0;
     DECLARE @StartTime    DATETIME2(3) = SYSDATETIME();
+    DECLARE @LastID       INT;
+    DECLARE @Lotes        INT = 0;
 
-    DECLARE @MinRow INT = 1;
-    DECLARE @MaxRow INT;
+    IF @BatchSize IS NULL OR @BatchSize <= 0
+        SET @BatchSize = 500;
 
     DECLARE @RegistrosProcesados INT = 0;
     DECLARE @RegistrosConNovedad INT = 0;
@@ -306,8 +339,9 @@ BEGIN
     IF OBJECT_ID('tempdb..#InvoiceTypecodeTable') IS NOT NULL DROP TABLE #InvoiceTypecodeTable;
     IF OBJECT_ID('tempdb..#EstadosOmitirTable') IS NOT NULL DROP TABLE #EstadosOmitirTable;
     IF OBJECT_ID('tempdb..#Docs') IS NOT NULL DROP TABLE #Docs;
-    IF OBJECT_ID('tempdb..#BatchIDs') IS NOT NULL DROP TABLE #BatchIDs;
+    IF OBJECT_ID('tempdb..#Lote') IS NOT NULL DROP TABLE #Lote;
 
+    CREATE TABLE #Lote (ID INT NOT NULL PRIMARY KEY);
     CREATE TABLE #TaxLevelCodeTable (Codigo NVARCHAR(50) PRIMARY KEY);
     CREATE TABLE #InvoiceTypecodeTable (Codigo NVARCHAR(50) PRIMARY KEY);
     CREATE TABLE #EstadosOmitirTable (Estado NVARCHAR(200) PRIMARY KEY);
@@ -327,52 +361,119 @@ BEGIN
     FROM STRING_SPLIT(@EstadosOmitir, ',')
     WHERE LEN(LTRIM(RTRIM(value))) > 0;
 
+    -- =========================================================================
+    -- Tabla de trabajo: una fila por documento con el resultado de TODAS las
+    -- reglas como columnas. Las columnas calculadas arman la observacion y el
+    -- estado nuevo en el mismo orden en que el loop anterior los aplicaba
+    -- (cada regla anteponia su mensaje; ANO CERRADO era la ultima y ganaba).
+    -- =========================================================================
     CREATE TABLE #Docs
     (
-        RowNum INT IDENTITY(1,1) PRIMARY KEY,
-        ID INT NOT NULL,
+        ID INT NOT NULL PRIMARY KEY,
 
         OldResultadoFinalAntesEventos NVARCHAR(100) NULL,
 
         responsabilidad_tributaria_emisor      NVARCHAR(MAX) NULL,
         responsabilidad_tributaria_adquiriente NVARCHAR(MAX) NULL,
-        validationresultcode                   NVARCHAR(50) NULL,
-        codigo_de_uso_autorizado_por_la_dian   NVARCHAR(50) NULL,
-        codigo_tipo_de_documento               NVARCHAR(50) NULL,
-        descripcion_del_codigo                 NVARCHAR(MAX) NULL,
-        fecha_de_emision_documento             DATETIME NULL,
-        documenttype                           NVARCHAR(50) NULL,
-
-        TieneCoincidenciaEmisor      BIT NOT NULL DEFAULT 0,
-        TieneCoincidenciaAdquiriente BIT NOT NULL DEFAULT 0,
 
-        INDEX IX_Docs_ID NONCLUSTERED (ID)
+        TieneCoincidenciaEmisor      BIT NOT NULL,
+        TieneCoincidenciaAdquiriente BIT NOT NULL,
+        FallaValidationResultCode    BIT NOT NULL,
+        FallaResponseCode            BIT NOT NULL,
+        FallaInvoiceTypecode         BIT NOT NULL,
+        FallaDescripcionCodigo       BIT NOT NULL,
+        FallaPaymentMeans            BIT NOT NULL,
+        FallaAnoCerrado              BIT NOT NULL,
+
+        FallaTaxLevelCode AS CAST(
+            CASE WHEN TieneCoincidenciaEmisor = 0 OR TieneCoincidenciaAdquiriente = 0 THEN 1 ELSE 0 END
+            AS BIT),
+
+        ObservacionNueva AS STUFF(CONCAT(
+            CASE WHEN FallaAnoCerrado = 1
+                 THEN N', Ano de Fecha de emision documento diferente a ano en curso' END,
+            CASE WHEN FallaPaymentMeans = 1
+                 THEN N', PaymentMeans diferente a 01 o 02' END,
+            CASE WHEN FallaDescripcionCodigo = 1
+                 THEN N', DescripcionCodigo diferente a "Documento validado por la DIAN"' END,
+            CASE WHEN FallaInvoiceTypecode = 1
+                 THEN N', InvoiceTypecode diferente a la lista permitida' END,
+            CASE WHEN FallaResponseCode = 1
+                 THEN N', ResponseCode diferente a 02 o 002' END,
+            CASE WHEN FallaValidationResultCode = 1
+                 THEN N', ValidationResultCode diferente a 02 o 002' END,
+            CASE
+                WHEN TieneCoincidenciaEmisor = 0 AND TieneCoincidenciaAdquiriente = 0
+                    THEN N', No se encuentra informacion en Taxlevelcode (Emisor y Receptor)'
+                WHEN TieneCoincidenciaEmisor = 0
+                    THEN N', No se encuentra informacion en Taxlevelcode (Emisor)'
+                WHEN TieneCoincidenciaAdquiriente = 0
+                    THEN N', No se encuentra informacion en Taxlevelcode (Receptor)'
+            END
+        ), 1, 2, N''),
+
+        EstadoNuevo AS
+            CASE
+                WHEN FallaAnoCerrado = 1 THEN N'CON NOVEDAD ANO CERRADO'
+                WHEN TieneCoincidenciaEmisor = 0
+                  OR TieneCoincidenciaAdquiriente = 0
+                  OR FallaValidationResultCode = 1
+                  OR FallaResponseCode = 1
+                  OR FallaInvoiceTypecode = 1
+                  OR FallaDescripcionCodigo = 1
+                  OR FallaPaymentMeans = 1
+                    THEN N'CON NOVEDAD'
+            END
     );
 
+    -- Una sola pasada sobre DocumentsProcessing: elegibilidad + reglas
     INSERT INTO #Docs
     (
         ID,
         OldResultadoFinalAntesEventos,
         responsabilidad_tributaria_emisor,
         responsabilidad_tributaria_adquiriente,
-        validationresultcode,
-        codigo_de_uso_autorizado_por_la_dian,
-        codigo_tipo_de_documento,
-        descripcion_del_codigo,
-        fecha_de_emision_documento,
-        documenttype
+        TieneCoincidenciaEmisor,
+        TieneCoincidenciaAdquiriente,
+        FallaValidationResultCode,
+        FallaResponseCode,
+        FallaInvoiceTypecode,
+        FallaDescripcionCodigo,
+        FallaPaymentMeans,
+        FallaAnoCerrado
     )
     SELECT
         dp.ID,
         dp.ResultadoFinalAntesEventos,
         dp.responsabilidad_tributaria_emisor,
         dp.responsabilidad_tributaria_adquiriente,
-        dp.validationresultcode,
-        dp.codigo_de_uso_autorizado_por_la_dian,
-        dp.codigo_tipo_de_documento,
-        dp.descripcion_del_codigo,
-        dp.fecha_de_emision_documento,
-        dp.documenttype
+        CASE WHEN EXISTS (
+                SELECT 1
+                FROM STRING_SPLIT(ISNULL(dp.responsabilidad_tributaria_emisor, N''), ';') s
+                INNER JOIN #TaxLevelCodeTable t ON t.Codigo = LTRIM(RTRIM(s.value))
+             ) THEN 1 ELSE 0 END,
+        CASE WHEN EXISTS (
+                SELECT 1
+                FROM STRING_SPLIT(ISNULL(dp.responsabilidad_tributaria_adquiriente, N''), ';') s
+                INNER JOIN #TaxLevelCodeTable t ON t.Codigo = LTRIM(RTRIM(s.value))
+             ) THEN 1 ELSE 0 END,
+        CASE WHEN LTRIM(RTRIM(ISNULL(dp.validationresultcode, N''))) IN (N'02', N'002')
+             THEN 0 ELSE 1 END,
+        CASE WHEN LTRIM(RTRIM(ISNULL(dp.codigo_de_uso_autorizado_por_la_dian, N''))) IN (N'02', N'002')
+             THEN 0 ELSE 1 END,
+        CASE WHEN EXISTS (
+                SELECT 1
+                FROM #InvoiceTypecodeTable it
+                WHERE it.Codigo = LTRIM(RTRIM(ISNULL(dp.codigo_tipo_de_documento, N'')))
+             ) THEN 0 ELSE 1 END,
+        CASE WHEN LTRIM(RTRIM(ISNULL(dp.descripcion_del_codigo, N''))) = N'Documento validado por la DIAN'
+             THEN 0 ELSE 1 END,
+        CASE WHEN UPPER(LTRIM(RTRIM(ISNULL(dp.forma_de_pago, N'')))) IN (N'01', N'02', N'1', N'2')
+             THEN 0 ELSE 1 END,
+        CASE WHEN @MesActual <> 1
+              AND dp.fecha_de_emision_documento IS NOT NULL
+              AND YEAR(dp.fecha_de_emision_documento) <> @AnioActual
+             THEN 1 ELSE 0 END
     FROM [CxP].[DocumentsProcessing] dp
     WHERE ISNULL(dp.ResultadoFinalAntesEventos, N'') NOT IN (SELECT Estado FROM #EstadosOmitirTable)
       AND dp.Fecha_de_retoma_antes_de_contabilizacion IS NOT NULL
@@ -394,318 +495,97 @@ BEGIN
         RETURN;
     END;
 
-    ;WITH EmisorOK AS
-    (
-        SELECT DISTINCT d.ID
-        FROM #Docs d
-        CROSS APPLY STRING_SPLIT(ISNULL(d.responsabilidad_tributaria_emisor, N''), ';') s
-        WHERE LEN(LTRIM(RTRIM(s.value))) > 0
-          AND LTRIM(RTRIM(s.value)) IN (SELECT Codigo FROM #TaxLevelCodeTable)
-    )
-    UPDATE d
-       SET d.TieneCoincidenciaEmisor = 1
-    FROM #Docs d
-    INNER JOIN EmisorOK e ON e.ID = d.ID;
+    -- Escritura por lotes de IDs: una transaccion por lote mantiene acotados
+    -- los bloqueos sobre DocumentsProcessing / Comparativa
+    SELECT @LastID = MIN(ID) - 1 FROM #Docs;
 
-    ;WITH AdqOK AS
-    (
-        SELECT DISTINCT d.ID
-        FROM #Docs d
-        CROSS APPLY STRING_SPLIT(ISNULL(d.responsabilidad_tributaria_adquiriente, N''), ';') s
-        WHERE LEN(LTRIM(RTRIM(s.value))) > 0
-          AND LTRIM(RTRIM(s.value)) IN (SELECT Codigo FROM #TaxLevelCodeTable)
-    )
-    UPDATE d
-       SET d.TieneCoincidenciaAdquiriente = 1
-    FROM #Docs d
-    INNER JOIN AdqOK a ON a.ID = d.ID;
-
-    CREATE TABLE #BatchIDs (ID INT NOT NULL PRIMARY KEY);
-
-    WHILE @MinRow <= @TotalDocs
+    WHILE 1 = 1
     BEGIN
-        SET @CurrentBatch = @CurrentBatch + 1;
-        SET @MaxRow = @MinRow + @BatchSize - 1;
+        TRUNCATE TABLE #Lote;
 
-        TRUNCATE TABLE #BatchIDs;
-
-        INSERT INTO #BatchIDs (ID)
-        SELECT d.ID
+        INSERT INTO #Lote (ID)
+        SELECT TOP (@BatchSize) d.ID
         FROM #Docs d
-        WHERE d.RowNum BETWEEN @MinRow AND @MaxRow;
-
-        UPDATE c
-           SET c.Valor_Orden_de_Compra = d.responsabilidad_tributaria_emisor,
-               c.Aprobado = N'SI'
-        FROM [dbo].[CxP.Comparativa] c
-        INNER JOIN #Docs d ON d.ID = c.ID_registro
-        INNER JOIN #BatchIDs b ON b.ID = d.ID
-        WHERE c.Item = N'TaxLevelCodeEmisor'
-          AND d.TieneCoincidenciaEmisor = 1
-          AND d.TieneCoincidenciaAdquiriente = 1;
-
-        UPDATE c
-           SET c.Valor_Orden_de_Compra = d.responsabilidad_tributaria_adquiriente,
-               c.Aprobado = N'SI'
-        FROM [dbo].[CxP.Comparativa] c
-        INNER JOIN #Docs d ON d.ID = c.ID_registro
-        INNER JOIN #BatchIDs b ON b.ID = d.ID
-        WHERE c.Item = N'TaxLevelCodeReceptor'
-          AND d.TieneCoincidenciaEmisor = 1
-          AND d.TieneCoincidenciaAdquiriente = 1;
-
-        UPDATE dp
-           SET dp.EstadoFinalFase_4 = N'VALIDACION DATOS DE FACTURACION: Exitoso.',
-               dp.ObservacionesFase_4 = LEFT(
-                    LTRIM(RTRIM(CONCAT(
-                        N'No se encuentra informacion en Taxlevelcode ' + 
-                        CASE 
-                            WHEN d.TieneCoincidenciaEmisor = 0 AND d.TieneCoincidenciaAdquiriente = 0 
-                                THEN N'(Emisor y Receptor)'
-                            WHEN d.TieneCoincidenciaEmisor = 0 
-                                THEN N'(Emisor)'
-                            ELSE N'(Receptor)'
-                        END,
-                        CASE WHEN ISNULL(LTRIM(RTRIM(dp.ObservacionesFase_4)), N'') <> N'' 
-                             THEN N', ' + dp.ObservacionesFase_4 ELSE N'' END
-                    ))),
-                    3900
-               ),
-               dp.ResultadoFinalAntesEventos = N'CON NOVEDAD'
-        FROM [CxP].[DocumentsProcessing] dp
-        INNER JOIN #Docs d ON d.ID = dp.ID
-        INNER JOIN #BatchIDs b ON b.ID = d.ID
-        WHERE (d.TieneCoincidenciaEmisor = 0 OR d.TieneCoincidenciaAdquiriente = 0);
+        WHERE d.ID > @LastID
+        ORDER BY d.ID;
 
-        UPDATE c
-           SET c.Valor_Orden_de_Compra = @TaxLevelCode,
-               c.Aprobado = N'NO'
-        FROM [dbo].[CxP.Comparativa] c
-        INNER JOIN #Docs d ON d.ID = c.ID_registro
-        INNER JOIN #BatchIDs b ON b.ID = d.ID
-        WHERE c.Item IN (N'TaxLevelCodeEmisor', N'TaxLevelCodeReceptor')
-          AND (d.TieneCoincidenciaEmisor = 0 OR d.TieneCoincidenciaAdquiriente = 0);
+        IF @@ROWCOUNT = 0 BREAK;
 
-        UPDATE c
-           SET c.Valor_Orden_de_Compra = N'02 - 002',
-               c.Aprobado = N'SI'
-        FROM [dbo].[CxP.Comparativa] c
-        INNER JOIN #Docs d ON d.ID = c.ID_registro
-        INNER JOIN #BatchIDs b ON b.ID = d.ID
-        WHERE c.Item = N'ValidationResultCode'
-          AND LTRIM(RTRIM(ISNULL(d.validationresultcode, N''))) IN (N'02', N'002');
+        SELECT @LastID = MAX(ID) FROM #Lote;
 
-        UPDATE dp
-           SET dp.EstadoFinalFase_4 = N'VALIDACION DATOS DE FACTURACION: Exitoso.',
-               dp.ObservacionesFase_4 = LEFT(
-                    LTRIM(RTRIM(CONCAT(
-                        N'ValidationResultCode diferente a 02 o 002',
-                        CASE WHEN ISNULL(LTRIM(RTRIM(dp.ObservacionesFase_4)), N'') <> N'' 
-                             THEN N', ' + dp.ObservacionesFase_4 ELSE N'' END
-                    ))),
-                    3900
-               ),
-               dp.ResultadoFinalAntesEventos = N'CON NOVEDAD'
-        FROM [CxP].[DocumentsProcessing] dp
-        INNER JOIN #Docs d ON d.ID = dp.ID
-        INNER JOIN #BatchIDs b ON b.ID = d.ID
-        WHERE LTRIM(RTRIM(ISNULL(d.validationresultcode, N''))) NOT IN (N'02', N'002');
-
-        UPDATE c
-           SET c.Valor_Orden_de_Compra = N'02 - 002',
-               c.Aprobado = N'NO'
-        FROM [dbo].[CxP.Comparativa] c
-        INNER JOIN #Docs d ON d.ID = c.ID_registro
-        INNER JOIN #BatchIDs b ON b.ID = d.ID
-        WHERE c.Item = N'ValidationResultCode'
-          AND LTRIM(RTRIM(ISNULL(d.validationresultcode, N''))) NOT IN (N'02', N'002');
-
-        UPDATE c
-           SET c.Valor_Orden_de_Compra = N'02 - 002',
-               c.Aprobado = N'SI'
-        FROM [dbo].[CxP.Comparativa] c
-        INNER JOIN #Docs d ON d.ID = c.ID_registro
-        INNER JOIN #BatchIDs b ON b.ID = d.ID
-        WHERE c.Item = N'ResponseCode'
-          AND LTRIM(RTRIM(ISNULL(d.codigo_de_uso_autorizado_por_la_dian, N''))) IN (N'02', N'002');
+        BEGIN TRAN;
 
+        -- Transiciones CON NOVEDAD / CON NOVEDAD ANO CERRADO en una sentencia
         UPDATE dp
            SET dp.EstadoFinalFase_4 = N'VALIDACION DATOS DE FACTURACION: Exitoso.',
                dp.ObservacionesFase_4 = LEFT(
                     LTRIM(RTRIM(CONCAT(
-                        N'ResponseCode diferente a 02 o 002',
-                        CASE WHEN ISNULL(LTRIM(RTRIM(dp.ObservacionesFase_4)), N'') <> N'' 
+                        d.ObservacionNueva,
+                        CASE WHEN ISNULL(LTRIM(RTRIM(dp.ObservacionesFase_4)), N'') <> N''
                              THEN N', ' + dp.ObservacionesFase_4 ELSE N'' END
                     ))),
                     3900
                ),
-               dp.ResultadoFinalAntesEventos = N'CON NOVEDAD'
+               dp.ResultadoFinalAntesEventos = d.EstadoNuevo
         FROM [CxP].[DocumentsProcessing] dp
         INNER JOIN #Docs d ON d.ID = dp.ID
-        INNER JOIN #BatchIDs b ON b.ID = d.ID
-        WHERE LTRIM(RTRIM(ISNULL(d.codigo_de_uso_autorizado_por_la_dian, N''))) NOT IN (N'02', N'002');
+        INNER JOIN #Lote l ON l.ID = d.ID
+        WHERE d.EstadoNuevo IS NOT NULL;
 
+        -- Items de Comparativa por regla (SI/NO) en una sentencia
         UPDATE c
-           SET c.Valor_Orden_de_Compra = N'02 - 002',
-               c.Aprobado = N'NO'
+           SET c.Valor_Orden_de_Compra =
+                CASE c.Item
+                    WHEN N'TaxLevelCodeEmisor'
+                        THEN CASE WHEN d.FallaTaxLevelCode = 0 THEN d.responsabilidad_tributaria_emisor ELSE @TaxLevelCode END
+                    WHEN N'TaxLevelCodeReceptor'
+                        THEN CASE WHEN d.FallaTaxLevelCode = 0 THEN d.responsabilidad_tributaria_adquiriente ELSE @TaxLevelCode END
+                    WHEN N'ValidationResultCode'  THEN N'02 - 002'
+                    WHEN N'ResponseCode'          THEN N'02 - 002'
+                    WHEN N'InvoiceTypecode'       THEN @InvoiceTypecode
+                    WHEN N'DescripcionCodigo'     THEN N'Documento validado por la DIAN'
+                    WHEN N'PaymentMeans'          THEN N'01 - 02'
+                    WHEN N'FechaEmisionDocumento' THEN N'ANO CERRADO'
+                END,
+               c.Aprobado =
+                CASE
+                    WHEN CASE c.Item
+                            WHEN N'TaxLevelCodeEmisor'    THEN d.FallaTaxLevelCode
+                            WHEN N'TaxLevelCodeReceptor'  THEN d.FallaTaxLevelCode
+                            WHEN N'ValidationResultCode'  THEN d.FallaValidationResultCode
+                            WHEN N'ResponseCode'          THEN d.FallaResponseCode
+                            WHEN N'InvoiceTypecode'       THEN d.FallaInvoiceTypecode
+                            WHEN N'DescripcionCodigo'     THEN d.FallaDescripcionCodigo
+                            WHEN N'PaymentMeans'          THEN d.FallaPaymentMeans
+                            WHEN N'FechaEmisionDocumento' THEN d.FallaAnoCerrado
+                         END = 1
+                        THEN N'NO'
+                    ELSE N'SI'
+                END
         FROM [dbo].[CxP.Comparativa] c
         INNER JOIN #Docs d ON d.ID = c.ID_registro
-        INNER JOIN #BatchIDs b ON b.ID = d.ID
-        WHERE c.Item = N'ResponseCode'
-          AND LTRIM(RTRIM(ISNULL(d.codigo_de_uso_autorizado_por_la_dian, N''))) NOT IN (N'02', N'002');
-
+        INNER JOIN #Lote l ON l.ID = d.ID
+        WHERE c.Item IN (
+                N'TaxLevelCodeEmisor', N'TaxLevelCodeReceptor', N'ValidationResultCode',
+                N'ResponseCode', N'InvoiceTypecode', N'DescripcionCodigo', N'PaymentMeans'
+              )
+           OR (c.Item = N'FechaEmisionDocumento' AND d.FallaAnoCerrado = 1);
+
+        -- Estado y Observaciones en Comparativa para los documentos que cambiaron
         UPDATE c
-           SET c.Valor_Orden_de_Compra = @InvoiceTypecode,
-               c.Aprobado = N'SI'
+           SET c.Estado_validacion_antes_de_eventos = dp.ResultadoFinalAntesEventos,
+               c.Valor_XML = CASE WHEN c.Item = N'Observaciones'
+                                  THEN LEFT(dp.ObservacionesFase_4, 3900)
+                                  ELSE c.Valor_XML END
         FROM [dbo].[CxP.Comparativa] c
         INNER JOIN #Docs d ON d.ID = c.ID_registro
-        INNER JOIN #BatchIDs b ON b.ID = d.ID
-        WHERE c.Item = N'InvoiceTypecode'
-          AND LTRIM(RTRIM(ISNULL(d.codigo_tipo_de_documento, N''))) IN (SELECT Codigo FROM #InvoiceTypecodeTable);
-
-        UPDATE dp
-           SET dp.EstadoFinalFase_4 = N'VALIDACION DATOS DE FACTURACION: Exitoso.',
-               dp.ObservacionesFase_4 = LEFT(
-                    LTRIM(RTRIM(CONCAT(
-                        N'InvoiceTypecode diferente a la lista permitida',
-                        CASE WHEN ISNULL(LTRIM(RTRIM(dp.ObservacionesFase_4)), N'') <> N'' 
-                             THEN N', ' + dp.ObservacionesFase_4 ELSE N'' END
-                    ))),
-                    3900
-               ),
-               dp.ResultadoFinalAntesEventos = N'CON NOVEDAD'
-        FROM [CxP].[DocumentsProcessing] dp
-        INNER JOIN #Docs d ON d.ID = dp.ID
-        INNER JOIN #BatchIDs b ON b.ID = d.ID
-        WHERE LTRIM(RTRIM(ISNULL(d.codigo_tipo_de_documento, N''))) NOT IN (SELECT Codigo FROM #InvoiceTypecodeTable);
-
-        UPDATE c
-           SET c.Valor_Orden_de_Compra = @InvoiceTypecode,
-               c.Aprobado = N'NO'
-        FROM [dbo].[CxP.Comparativa] c
-        INNER JOIN #Docs d ON d.ID = c.ID_registro
-        INNER JOIN #BatchIDs b ON b.ID = d.ID
-        WHERE c.Item = N'InvoiceTypecode'
-          AND LTRIM(RTRIM(ISNULL(d.codigo_tipo_de_documento, N''))) NOT IN (SELECT Codigo FROM #InvoiceTypecodeTable);
-
-        UPDATE c
-           SET c.Valor_Orden_de_Compra = N'Documento validado por la DIAN',
-               c.Aprobado = N'SI'
-        FROM [dbo].[CxP.Comparativa] c
-        INNER JOIN #Docs d ON d.ID = c.ID_registro
-        INNER JOIN #BatchIDs b ON b.ID = d.ID
-        WHERE c.Item = N'DescripcionCodigo'
-          AND LTRIM(RTRIM(ISNULL(d.descripcion_del_codigo, N''))) = N'Documento validado por la DIAN';
-
-        UPDATE dp
-           SET dp.EstadoFinalFase_4 = N'VALIDACION DATOS DE FACTURACION: Exitoso.',
-               dp.ObservacionesFase_4 = LEFT(
-                    LTRIM(RTRIM(CONCAT(
-                        N'DescripcionCodigo diferente a "Documento validado por la DIAN"',
-                        CASE WHEN ISNULL(LTRIM(RTRIM(dp.ObservacionesFase_4)), N'') <> N'' 
-                             THEN N', ' + dp.ObservacionesFase_4 ELSE N'' END
-                    ))),
-                    3900
-               ),
-               dp.ResultadoFinalAntesEventos = N'CON NOVEDAD'
-        FROM [CxP].[DocumentsProcessing] dp
-        INNER JOIN #Docs d ON d.ID = dp.ID
-        INNER JOIN #BatchIDs b ON b.ID = d.ID
-        WHERE LTRIM(RTRIM(ISNULL(d.descripcion_del_codigo, N''))) <> N'Documento validado por la DIAN';
-
-        UPDATE c
-           SET c.Valor_Orden_de_Compra = N'Documento validado por la DIAN',
-               c.Aprobado = N'NO'
-        FROM [dbo].[CxP.Comparativa] c
-        INNER JOIN #Docs d ON d.ID = c.ID_registro
-        INNER JOIN #BatchIDs b ON b.ID = d.ID
-        WHERE c.Item = N'DescripcionCodigo'
-          AND LTRIM(RTRIM(ISNULL(d.descripcion_del_codigo, N''))) <> N'Documento validado por la DIAN';
-
-        UPDATE c
-           SET c.Valor_Orden_de_Compra = N'01 - 02',
-               c.Aprobado = N'SI'
-        FROM [dbo].[CxP.Comparativa] c
-        INNER JOIN #Docs d ON d.ID = c.ID_registro
-        INNER JOIN #BatchIDs b ON b.ID = d.ID
-        INNER JOIN [CxP].[DocumentsProcessing] dp ON dp.ID = d.ID
-        WHERE c.Item = N'PaymentMeans'
-          AND UPPER(LTRIM(RTRIM(ISNULL(dp.forma_de_pago, N'')))) IN (N'01', N'02', N'1', N'2');
-
-        UPDATE dp
-           SET dp.EstadoFinalFase_4 = N'VALIDACION DATOS DE FACTURACION: Exitoso.',
-               dp.ObservacionesFase_4 = LEFT(
-                    LTRIM(RTRIM(CONCAT(
-                        N'PaymentMeans diferente a 01 o 02',
-                        CASE WHEN ISNULL(LTRIM(RTRIM(dp.ObservacionesFase_4)), N'') <> N'' 
-                             THEN N', ' + dp.ObservacionesFase_4 ELSE N'' END
-                    ))),
-                    3900
-               ),
-               dp.ResultadoFinalAntesEventos = N'CON NOVEDAD'
-        FROM [CxP].[DocumentsProcessing] dp
-        INNER JOIN #Docs d ON d.ID = dp.ID
-        INNER JOIN #BatchIDs b ON b.ID = d.ID
-        WHERE UPPER(LTRIM(RTRIM(ISNULL(dp.forma_de_pago, N'')))) NOT IN (N'01', N'02', N'1', N'2');
-
-        UPDATE c
-           SET c.Valor_Orden_de_Compra = N'01 - 02',
-               c.Aprobado = N'NO'
-        FROM [dbo].[CxP.Comparativa] c
-        INNER JOIN #Docs d ON d.ID = c.ID_registro
-        INNER JOIN #BatchIDs b ON b.ID = d.ID
-        INNER JOIN [CxP].[DocumentsProcessing] dp ON dp.ID = d.ID
-        WHERE c.Item = N'PaymentMeans'
-          AND UPPER(LTRIM(RTRIM(ISNULL(dp.forma_de_pago, N'')))) NOT IN (N'01', N'02', N'1', N'2');
-
-        IF @MesActual <> 1
-        BEGIN
-            UPDATE dp
-               SET dp.EstadoFinalFase_4 = N'VALIDACION DATOS DE FACTURACION: Exitoso.',
-                   dp.ObservacionesFase_4 = LEFT(
-                        LTRIM(RTRIM(CONCAT(
-                            N'Ano de Fecha de emision documento diferente a ano en curso',
-                            CASE WHEN ISNULL(LTRIM(RTRIM(dp.ObservacionesFase_4)), N'') <> N'' 
-                                 THEN N', ' + dp.ObservacionesFase_4 ELSE N'' END
-                        ))),
-                        3900
-                   ),
-                   dp.ResultadoFinalAntesEventos = N'CON NOVEDAD ANO CERRADO'
-            FROM [CxP].[DocumentsProcessing] dp
-            INNER JOIN #Docs d ON d.ID = dp.ID
-            INNER JOIN #BatchIDs b ON b.ID = d.ID
-            WHERE d.fecha_de_emision_documento IS NOT NULL
-              AND YEAR(d.fecha_de_emision_documento) <> @AnioActual;
-
-            UPDATE c
-               SET c.Valor_Orden_de_Compra = N'ANO CERRADO',
-                   c.Aprobado = N'NO'
-            FROM [dbo].[CxP.Comparativa] c
-            INNER JOIN #Docs d ON d.ID = c.ID_registro
-            INNER JOIN #BatchIDs b ON b.ID = d.ID
-            WHERE c.Item = N'FechaEmisionDocumento'
-              AND d.fecha_de_emision_documento IS NOT NULL
-              AND YEAR(d.fecha_de_emision_documento) <> @AnioActual;
-        END;
-
-        UPDATE c
-           SET c.Valor_XML = LEFT(dp.ObservacionesFase_4, 3900)
-        FROM [dbo].[CxP.Comparativa] c
-        INNER JOIN #Docs d ON d.ID = c.ID_registro
-        INNER JOIN #BatchIDs b ON b.ID = d.ID
-        INNER JOIN [CxP].[DocumentsProcessing] dp ON dp.ID = d.ID
-        WHERE c.Item = N'Observaciones'
-          AND ISNULL(dp.ResultadoFinalAntesEventos, N'') <> ISNULL(d.OldResultadoFinalAntesEventos, N'');
-
-        UPDATE c
-           SET c.Estado_validacion_antes_de_eventos = dp.ResultadoFinalAntesEventos
-        FROM [dbo].[CxP.Comparativa] c
-        INNER JOIN #Docs d ON d.ID = c.ID_registro
-        INNER JOIN #BatchIDs b ON b.ID = d.ID
+        INNER JOIN #Lote l ON l.ID = d.ID
         INNER JOIN [CxP].[DocumentsProcessing] dp ON dp.ID = d.ID
         WHERE ISNULL(dp.ResultadoFinalAntesEventos, N'') <> ISNULL(d.OldResultadoFinalAntesEventos, N'');
 
-        SET @MinRow = @MaxRow + 1;
+        COMMIT;
+
+        SET @Lotes += 1;
     END;
 
     SET @RegistrosProcesados = @TotalDocs;
@@ -764,7 +644,7 @@ BEGIN
         @RegistrosProcesados AS RegistrosProcesados,
         @RegistrosConNovedad AS RegistrosConNovedad,
         @RegistrosAnoCerrado AS RegistrosAnoCerrado,
-        @CurrentBatch AS LotesProcesados,
+        @Lotes AS LotesProcesados,
         DATEDIFF(SECOND, @StartTime, SYSDATETIME()) AS TiempoTotalSegundos,
         @RegistrosInsertadosReporte AS RegistrosInsertadosReporte,
         'COMPLETADO' AS Estado;
@@ -772,6 +652,6 @@ BEGIN
     IF OBJECT_ID('tempdb..#TaxLevelCodeTable') IS NOT NULL DROP TABLE #TaxLevelCodeTable;
     IF OBJECT_ID('tempdb..#InvoiceTypecodeTable') IS NOT NULL DROP TABLE #InvoiceTypecodeTable;
     IF OBJECT_ID('tempdb..#EstadosOmitirTable') IS NOT NULL DROP TABLE #EstadosOmitirTable;
-    IF OBJECT_ID('tempdb..#BatchIDs') IS NOT NULL DROP TABLE #BatchIDs;
     IF OBJECT_ID('tempdb..#Docs') IS NOT NULL DROP TABLE #Docs;
+    IF OBJECT_ID('tempdb..#Lote') IS NOT NULL DROP TABLE #Lote;
 END
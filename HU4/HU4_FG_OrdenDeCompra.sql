@@ -13,10 +13,24 @@ Descripcion General:
     compra comienza con '40' o '46'.
 
 Autor: Diego Ivan Lopez Ochoa
-Version: 1.0.0
+Version: 1.1.0 - Lotes por keyset y tiempos por lote en el resumen
 Base de Datos: NotificationsPaddy
 Schema: CxP
 
+================================================================================
+CAMBIOS EN VERSION 1.1.0
+================================================================================
+- El predicado de elegibilidad (FV, plazo, estado, prefijo 40/46) se evalua
+  UNA vez y los IDs se guardan en #WorkIDs (PK clustered). Los lotes se
+  toman por keyset (WHERE ID > @LastID ORDER BY ID) en lugar de TOP +
+  NOT EXISTS contra #ProcessedIDs, que re-escaneaba DocumentsProcessing en
+  cada iteracion (costo cuadratico con el backlog).
+- Documentos que se vuelven elegibles DESPUES de la foto inicial no se
+  toman en esta ejecucion; los toma la siguiente.
+- ResultSet 1 agrega columnas de tiempos al final (LotesProcesados,
+  MsPreparacionTrabajo, MsTotalLotes, MsLoteMaximo, TiemposLotesJson).
+  Las columnas existentes y el ResultSet 2 no cambian.
+
 ================================================================================
 DIAGRAMA DE FLUJO
 ================================================================================
@@ -52,15 +66,19 @@ DIAGRAMA DE FLUJO
                                   |
                                   v
     +-------------------------------------------------------------+
-    |  Procesar en lotes (@BatchSize):                            |
+    |  Foto de elegibles -> #WorkIDs (una sola evaluacion):       |
+    |  - Documentos FV con liquidacion '40' o '46'                |
+    |  - Dentro de @DiasMaximos                                   |
+    |  - Estado no en lista de omitir                             |
+    +-----------------------------+-------------------------------+
+                                  |
+                                  v
+    +-------------------------------------------------------------+
+    |  Procesar en lotes (@BatchSize) por keyset:                 |
     |  WHILE 1 = 1                                                |
     |  +-------------------------------------------------------+  |
-    |  |  Seleccionar batch de documentos FV:                  |  |
-    |  |  - numero_liquidacion comienza con '40' o '46'        |  |
-    |  |  - Dentro de @DiasMaximos                             |  |
-    |  |  - Estado no en lista de omitir                       |  |
-    |  +-------------------------------------------------------+  |
-    |  |  IF @@ROWCOUNT = 0 BREAK                              |  |
+    |  |  #Batch = TOP (@BatchSize) ID > @LastID ORDER BY ID   |  |
+    |  |  IF @@ROWCOUNT = 0 BREAK; @LastID = MAX(ID)           |  |
     |  +-------------------------------------------------------+  |
     |  |  Actualizar fecha de retoma si es NULL                |  |
     |  +-------------------------------------------------------+  |
@@ -74,6 +92,8 @@ DIAGRAMA DE FLUJO
     |  |  - Marcar EXCLUIDO COSTO INDIRECTO FLETES             |  |
     |  |  - Actualizar Comparativa                             |  |
     |  +-------------------------------------------------------+  |
+    |  |  Registrar tiempo del lote en #TiemposLote            |  |
+    |  +-------------------------------------------------------+  |
     +-----------------------------+-------------------------------+
                                   |
                                   v
@@ -170,6 +190,11 @@ ResultSet 1: Resumen de Ejecucion
     ComparativaObservacionesActualizadas INT
     ComparativaEstadosActualizados      INT
     RegistrosReporteNovedades           INT
+    LotesProcesados                     INT
+    MsPreparacionTrabajo                INT             (llenado de #WorkIDs)
+    MsTotalLotes                        INT
+    MsLoteMaximo                        INT
+    TiemposLotesJson                    NVARCHAR(MAX)   ([{Lote,DesdeID,HastaID,Filas,Ms}])
 
 ResultSet 2: Detalle de Registros
 ---------------------------------
@@ -232,8 +257,10 @@ NOTAS TECNICAS
 ================================================================================
 
     - Usa LEFT() para extraer prefijo de orden de compra
-    - Procesa en lotes infinitos (WHILE 1=1) hasta que no hay mas registros
-    - Usa tablas temporales para tracking (#ProcessedIDs, #Batch)
+    - Procesa en lotes (WHILE 1=1) por keyset sobre #WorkIDs hasta agotarla;
+      cada lote cuesta O(@BatchSize) sin importar el tamano del backlog
+    - Usa tablas temporales para tracking (#WorkIDs, #ProcessedIDs, #Batch,
+      #TiemposLote)
     - Inserta en Comparativa si no existe el Item 'Observaciones'
     - Las observaciones se concatenan (no se sobrescriben)
     - EstadoFinalFase_4 se establece como "VALIDACION DATOS DE FACTURACION: Exitoso"
@@ -348,35 +375,70 @@ BEGIN
     DECLARE @MsgImp   NVARCHAR(4000) = N'Factura excluida corresponde a Importaciones';
     DECLARE @MsgFlete NVARCHAR(4000) = N'Factura excluida corresponde a costo indirecto fletes';
 
+    DECLARE
+        @LastID                 BIGINT,
+        @NumeroLote             INT = 0,
+        @InicioLote             DATETIME2(7),
+        @InicioTrabajo          DATETIME2(7) = SYSDATETIME(),
+        @MsPreparacionTrabajo   INT = 0;
+
+    IF OBJECT_ID('tempdb..#TiemposLote') IS NOT NULL DROP TABLE #TiemposLote;
+    CREATE TABLE #TiemposLote
+    (
+        Lote     INT    NOT NULL PRIMARY KEY,
+        DesdeID  BIGINT NOT NULL,
+        HastaID  BIGINT NOT NULL,
+        Filas    INT    NOT NULL,
+        Ms       INT    NOT NULL
+    );
+
+    -- =========================================================================
+    -- KEYSET: elegibilidad evaluada UNA vez en #WorkIDs (PK clustered); cada
+    -- lote es un seek por rango (ID > @LastID ORDER BY ID) sobre esa tabla.
+    -- =========================================================================
+    IF OBJECT_ID('tempdb..#WorkIDs') IS NOT NULL DROP TABLE #WorkIDs;
+    CREATE TABLE #WorkIDs (ID BIGINT NOT NULL PRIMARY KEY);
+
+    INSERT INTO #WorkIDs(ID)
+    SELECT dp.ID
+    FROM [CxP].[DocumentsProcessing] dp WITH (READPAST)
+    WHERE dp.documenttype = N'FV'
+      AND (
+            dp.Fecha_de_retoma_antes_de_contabilizacion IS NULL
+            OR CAST(dp.Fecha_de_retoma_antes_de_contabilizacion AS DATETIME2(3)) >= @CutoffRetoma
+          )
+      AND (
+            dp.ResultadoFinalAntesEventos IS NULL
+            OR NOT EXISTS (SELECT 1 FROM #EstadosOmitir e WHERE e.Estado = dp.ResultadoFinalAntesEventos)
+          )
+      AND (
+            LEFT(TRY_CONVERT(NVARCHAR(100), dp.numero_de_liquidacion_u_orden_de_compra), 2) IN (N'40', N'46')
+          )
+    OPTION (RECOMPILE);
+
+    SELECT @LastID = ISNULL(MIN(ID), 0) - 1 FROM #WorkIDs;
+    SET @MsPreparacionTrabajo = DATEDIFF(MILLISECOND, @InicioTrabajo, SYSDATETIME());
+
     WHILE 1 = 1
     BEGIN
+        SET @InicioLote = SYSDATETIME();
+
         TRUNCATE TABLE #Batch;
 
         INSERT INTO #Batch(ID)
         SELECT TOP (@BatchSize)
-            dp.ID
-        FROM [CxP].[DocumentsProcessing] dp WITH (READPAST)
-        WHERE dp.documenttype = N'FV'
-          AND (
-                dp.Fecha_de_retoma_antes_de_contabilizacion IS NULL
-                OR CAST(dp.Fecha_de_retoma_antes_de_contabilizacion AS DATETIME2(3)) >= @CutoffRetoma
-              )
-          AND (
-                dp.ResultadoFinalAntesEventos IS NULL
-                OR NOT EXISTS (SELECT 1 FROM #EstadosOmitir e WHERE e.Estado = dp.ResultadoFinalAntesEventos)
-              )
-          AND (
-                LEFT(TRY_CONVERT(NVARCHAR(100), dp.numero_de_liquidacion_u_orden_de_compra), 2) IN (N'40', N'46')
-              )
-          AND NOT EXISTS (SELECT 1 FROM #ProcessedIDs p WHERE p.ID = dp.ID)
-        ORDER BY dp.ID;
+            w.ID
+        FROM #WorkIDs w
+        WHERE w.ID > @LastID
+        ORDER BY w.ID;
 
         IF @@ROWCOUNT = 0 BREAK;
 
+        SELECT @LastID = MAX(ID) FROM #Batch;
+
         INSERT INTO #ProcessedIDs(ID)
         SELECT b.ID
-        FROM #Batch b
-        WHERE NOT EXISTS (SELECT 1 FROM #ProcessedIDs p WHERE p.ID = b.ID);
+        FROM #Batch b;
 
         SET @TotalProcesados += (SELECT COUNT(1) FROM #Batch);
 
@@ -596,6 +658,13 @@ BEGIN
             END
 
             COMMIT;
+
+            SET @NumeroLote += 1;
+
+            INSERT INTO #TiemposLote(Lote, DesdeID, HastaID, Filas, Ms)
+            SELECT @NumeroLote, MIN(b.ID), MAX(b.ID), COUNT(1),
+                   DATEDIFF(MILLISECOND, @InicioLote, SYSDATETIME())
+            FROM #Batch b;
         END TRY
         BEGIN CATCH
             IF @@TRANCOUNT > 0 ROLLBACK;
@@ -659,7 +728,17 @@ BEGIN
         @TotalFleteExcluidos                AS ExcluidosCostoIndirectoFletes,
         @TotalComparativaObs                AS ComparativaObservacionesActualizadas,
         @TotalComparativaEstado             AS ComparativaEstadosActualizados,
-        @TotalRegistrosReporte              AS RegistrosReporteNovedades;
+        @TotalRegistrosReporte              AS RegistrosReporteNovedades,
+        @NumeroLote                         AS LotesProcesados,
+        @MsPreparacionTrabajo               AS MsPreparacionTrabajo,
+        ISNULL((SELECT SUM(t.Ms) FROM #TiemposLote t), 0) AS MsTotalLotes,
+        ISNULL((SELECT MAX(t.Ms) FROM #TiemposLote t), 0) AS MsLoteMaximo,
+        (
+            SELECT t.Lote, t.DesdeID, t.HastaID, t.Filas, t.Ms
+            FROM #TiemposLote t
+            ORDER BY t.Lote
+            FOR JSON PATH
+        )                                   AS TiemposLotesJson;
 
     SELECT
         dp.ID,
@@ -111,9 +111,10 @@ DIAGRAMA DE FLUJO - MODO FINALIZE
                                   |
                                   v
     +-------------------------------------------------------------+
-    |  Actualizar cola:                                           |
+    |  Actualizar cola (solo filas PENDIENTE):                    |
     |  - Estado = 'OK' o 'FAIL'                                   |
     |  - NuevaRutaArchivo, ErrorMsg                               |
+    |  - OUTPUT -> @Aplicados (filas transicionadas en la llamada)|
     +-----------------------------+-------------------------------+
                                   |
                                   v
@@ -140,7 +141,8 @@ DIAGRAMA DE FLUJO - MODO FINALIZE
                                   |
                                   v
     +-------------------------------------------------------------+
-    |  Retornar resumen: BatchId, OK, FAIL, RegistrosReporte      |
+    |  Retornar resumen: BatchId, OK, FAIL, RegistrosReporte,     |
+    |  Aplicados, Pendientes                                      |
     +-------------------------------------------------------------+
 
 ================================================================================
@@ -246,6 +248,23 @@ MODO FINALIZE - Retorna resumen:
     OK                          INT
     FAIL                        INT
     RegistrosReporteNovedades   INT
+    Aplicados                   INT  - Filas aplicadas en esta llamada
+    Pendientes                  INT  - Filas del lote aun en PENDIENTE
+
+    OK/FAIL/Pendientes se calculan sobre todo el lote, por lo que el
+    resumen de la ultima llamada refleja el estado final del BatchId.
+
+================================================================================
+FINALIZE POR CHUNKS (IDEMPOTENTE)
+================================================================================
+
+El FINALIZE puede invocarse varias veces con el mismo @BatchId, cada vez con
+una parte de los resultados. Cada llamada:
+
+    - Corre en su propia transaccion (bloqueos cortos, commit por chunk)
+    - Solo aplica los ID_registro que pasan de PENDIENTE a OK/FAIL
+    - Ignora resultados ya aplicados, por lo que reenviar un chunk tras un
+      fallo no duplica observaciones ni filas en ReporteNovedades
 
 ================================================================================
 EJEMPLOS DE USO
@@ -305,7 +324,8 @@ NOTAS TECNICAS
     - La cola se limpia completamente en cada QUEUE (DELETE con TABLOCK)
     - STRING_SPLIT se usa para separar archivos por punto y coma
     - OPENJSON se usa para parsear resultados en FINALIZE
-    - Las observaciones se concatenan (no se sobrescriben)
+    - Las observaciones se concatenan (no se sobrescriben), una sola vez por
+      registro gracias al filtro de filas PENDIENTE en FINALIZE
     - El indice UX_HU4_Punto_H_ID_Pendiente evita duplicados pendientes
 
 ================================================================================
@@ -576,21 +596,34 @@ BEGIN
                 WHERE TRY_CAST(ID_registro AS BIGINT) IS NOT NULL;
             END;
 
+            -- Solo se aplican los registros que esta llamada saca de PENDIENTE.
+            -- Un chunk reenviado (reintento) no encuentra filas pendientes y no
+            -- vuelve a concatenar observaciones ni a insertar en ReporteNovedades.
+            DECLARE @Aplicados TABLE
+            (
+                ID_registro BIGINT NOT NULL PRIMARY KEY,
+                Accion NVARCHAR(30) NULL,
+                MovimientoExitoso BIT NOT NULL,
+                NuevaRutaArchivo NVARCHAR(4000) NULL
+            );
+
             UPDATE q
                SET q.Estado = CASE WHEN r.MovimientoExitoso = 1 THEN 'OK' ELSE 'FAIL' END,
                    q.NuevaRutaArchivo = r.NuevaRutaArchivo,
                    q.ErrorMsg = r.ErrorMsg,
                    q.FechaActualizacion = SYSUTCDATETIME()
+            OUTPUT inserted.ID_registro, inserted.Accion, r.MovimientoExitoso, r.NuevaRutaArchivo
+              INTO @Aplicados(ID_registro, Accion, MovimientoExitoso, NuevaRutaArchivo)
             FROM [CxP].[HU4_Punto_H_FileOpsQueue] q
             INNER JOIN @Resultados r ON r.ID_registro = q.ID_registro
             WHERE q.BatchId = @BatchId AND UPPER(LTRIM(RTRIM(q.Estado))) = 'PENDIENTE';
 
+            DECLARE @RegistrosAplicados INT = @@ROWCOUNT;
+
             IF OBJECT_ID('tempdb..#BatchFinalize') IS NOT NULL DROP TABLE #BatchFinalize;
-            SELECT q.ID_registro AS ID, q.Accion, r.MovimientoExitoso, r.NuevaRutaArchivo
+            SELECT a.ID_registro AS ID, a.Accion, a.MovimientoExitoso, a.NuevaRutaArchivo
             INTO #BatchFinalize
-            FROM [CxP].[HU4_Punto_H_FileOpsQueue] q
-            INNER JOIN @Resultados r ON r.ID_registro = q.ID_registro
-            WHERE q.BatchId = @BatchId;
+            FROM @Aplicados a;
 
             IF OBJECT_ID('tempdb..#Msg') IS NOT NULL DROP TABLE #Msg;
             SELECT
@@ -674,7 +707,9 @@ BEGIN
                 @BatchId AS BatchId,
                 SUM(CASE WHEN q.Estado = 'OK' THEN 1 ELSE 0 END) AS OK,
                 SUM(CASE WHEN q.Estado = 'FAIL' THEN 1 ELSE 0 END) AS FAIL,
-                @RegistrosReporteNovedades AS RegistrosReporteNovedades
+                @RegistrosReporteNovedades AS RegistrosReporteNovedades,
+                @RegistrosAplicados AS Aplicados,
+                SUM(CASE WHEN UPPER(LTRIM(RTRIM(q.Estado))) = 'PENDIENTE' THEN 1 ELSE 0 END) AS Pendientes
             FROM [CxP].[HU4_Punto_H_FileOpsQueue] q
             WHERE q.BatchId = @BatchId;
 
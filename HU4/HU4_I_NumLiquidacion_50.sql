@@ -111,7 +111,10 @@ DIAGRAMA DE FLUJO - MODO FINALIZE
                                   |
                                   v
     +-------------------------------------------------------------+
-    |  Actualizar cola: Estado = 'OK' o 'FAIL'                    |
+    |  Actualizar cola (solo filas PENDIENTE):                    |
+    |  - Estado = 'OK' o 'FAIL'                                   |
+    |  - OUTPUT -> @Aplicados (filas transicionadas en la llamada)|
+    |  - Si @CerrarLote = 1: PENDIENTE sin resultado -> FAIL      |
     +-----------------------------+-------------------------------+
                                   |
                                   v
@@ -138,7 +141,8 @@ DIAGRAMA DE FLUJO - MODO FINALIZE
                                   v
     +-------------------------------------------------------------+
     |  Retornar resumen:                                          |
-    |  BatchId, IDsFinalizados, OK, FAIL, RegistrosReporte        |
+    |  BatchId, IDsFinalizados, OK, FAIL, RegistrosReporte,       |
+    |  Aplicados, Pendientes                                      |
     +-------------------------------------------------------------+
 
 ================================================================================
@@ -166,6 +170,10 @@ PARAMETROS
     @ResultadosJson NVARCHAR(MAX) = NULL
         JSON con resultados de la copia (usado en FINALIZE)
 
+    @CerrarLote BIT = 1
+        En FINALIZE, cierra como FAIL los registros del lote que siguen en
+        PENDIENTE sin resultado. Enviar 0 en todos los chunks menos el ultimo.
+
 ================================================================================
 CRITERIOS DE SELECCION
 ================================================================================
@@ -250,6 +258,25 @@ MODO FINALIZE - Retorna resumen:
     OK                          INT
     FAIL                        INT
     RegistrosReporteNovedades   INT
+    Aplicados                   INT  - Filas aplicadas en esta llamada
+    Pendientes                  INT  - Filas del lote aun en PENDIENTE
+
+    IDsFinalizados/OK/FAIL/Pendientes se calculan sobre todo el lote, por lo
+    que el resumen de la ultima llamada refleja el estado final del BatchId.
+
+================================================================================
+FINALIZE POR CHUNKS (IDEMPOTENTE)
+================================================================================
+
+El FINALIZE puede invocarse varias veces con el mismo @BatchId, cada vez con
+una parte de los resultados. Cada llamada:
+
+    - Corre en su propia transaccion (bloqueos cortos, commit por chunk)
+    - Solo aplica los ID_registro que pasan de PENDIENTE a OK/FAIL
+    - Ignora resultados ya aplicados, por lo que reenviar un chunk tras un
+      fallo no duplica observaciones ni filas en ReporteNovedades
+    - Con @CerrarLote = 0 deja intactos los registros sin resultado; el
+      ultimo chunk (@CerrarLote = 1) los cierra con mensaje de novedad
 
 ================================================================================
 EJEMPLOS DE USO
@@ -315,7 +342,8 @@ NOTAS TECNICAS
     - STRING_SPLIT se usa para separar archivos por punto y coma
     - OPENJSON se usa para parsear resultados en FINALIZE
     - TieneInsumos filtra solo registros con archivos validos
-    - Las observaciones se concatenan (no se sobrescriben)
+    - Las observaciones se concatenan (no se sobrescriben), una sola vez por
+      registro gracias al filtro de filas PENDIENTE en FINALIZE
     - El indice UX_HU4_Punto_I_ID_Pendiente evita duplicados pendientes
 
 ================================================================================
@@ -337,7 +365,8 @@ ALTER PROCEDURE [CxP].[HU4_I_NumLiquidacion_50]
     @DiasMaximos    INT = 120,
     @UseBogotaTime  BIT = 0,
     @BatchSize      INT = 500,
-    @ResultadosJson NVARCHAR(MAX) = NULL
+    @ResultadosJson NVARCHAR(MAX) = NULL,
+    @CerrarLote     BIT = 1
 )
 AS
 BEGIN
@@ -591,28 +620,58 @@ BEGIN
                 WHERE TRY_CAST(ID_registro AS BIGINT) IS NOT NULL;
             END;
 
+            -- Solo se aplican los registros que esta llamada saca de PENDIENTE.
+            -- Un chunk reenviado (reintento) no encuentra filas pendientes y no
+            -- vuelve a concatenar observaciones ni a insertar en ReporteNovedades.
+            DECLARE @Aplicados TABLE
+            (
+                ID_registro BIGINT NOT NULL PRIMARY KEY,
+                ConResultado BIT NOT NULL,
+                MovimientoExitoso BIT NOT NULL,
+                NuevaRutaArchivo NVARCHAR(4000) NULL
+            );
+
             UPDATE q
                SET q.Estado = CASE WHEN r.MovimientoExitoso = 1 THEN 'OK' ELSE 'FAIL' END,
                    q.NuevaRutaArchivo = r.NuevaRutaArchivo,
                    q.ErrorMsg = r.ErrorMsg,
                    q.FechaActualizacion = SYSUTCDATETIME()
+            OUTPUT inserted.ID_registro, 1, r.MovimientoExitoso, r.NuevaRutaArchivo
+              INTO @Aplicados(ID_registro, ConResultado, MovimientoExitoso, NuevaRutaArchivo)
             FROM [CxP].[HU4_Punto_I_FileOpsQueue] q
             INNER JOIN @Resultados r ON r.ID_registro = q.ID_registro
             WHERE q.BatchId = @BatchId AND UPPER(LTRIM(RTRIM(q.Estado))) = 'PENDIENTE';
 
+            -- Cierre del lote (ultimo chunk): los registros que nunca recibieron
+            -- resultado (p.ej. sin insumos) se cierran como FAIL para que reciban
+            -- la observacion de novedad una unica vez.
+            IF @CerrarLote = 1
+            BEGIN
+                UPDATE q
+                   SET q.Estado = 'FAIL',
+                       q.ErrorMsg = ISNULL(q.ErrorMsg, N'Sin resultado de copia'),
+                       q.FechaActualizacion = SYSUTCDATETIME()
+                OUTPUT inserted.ID_registro, 0, 0, NULL
+                  INTO @Aplicados(ID_registro, ConResultado, MovimientoExitoso, NuevaRutaArchivo)
+                FROM [CxP].[HU4_Punto_I_FileOpsQueue] q
+                WHERE q.BatchId = @BatchId AND UPPER(LTRIM(RTRIM(q.Estado))) = 'PENDIENTE';
+            END;
+
+            DECLARE @RegistrosAplicados INT = (SELECT COUNT(*) FROM @Aplicados);
+
             IF OBJECT_ID('tempdb..#BatchAll') IS NOT NULL DROP TABLE #BatchAll;
-            SELECT DISTINCT q.ID_registro AS ID
+            SELECT a.ID_registro AS ID
             INTO #BatchAll
-            FROM [CxP].[HU4_Punto_I_FileOpsQueue] q
-            WHERE q.BatchId = @BatchId;
+            FROM @Aplicados a;
 
             IF OBJECT_ID('tempdb..#BatchConResultados') IS NOT NULL DROP TABLE #BatchConResultados;
             SELECT 
-                r.ID_registro AS ID,
-                r.MovimientoExitoso,
-                r.NuevaRutaArchivo
+                a.ID_registro AS ID,
+                a.MovimientoExitoso,
+                a.NuevaRutaArchivo
             INTO #BatchConResultados
-            FROM @Resultados r;
+            FROM @Aplicados a
+            WHERE a.ConResultado = 1;
 
             IF OBJECT_ID('tempdb..#Msg') IS NOT NULL DROP TABLE #Msg;
             SELECT
@@ -695,7 +754,9 @@ BEGIN
                 COUNT(*) AS IDsFinalizados,
                 SUM(CASE WHEN q.Estado = 'OK' THEN 1 ELSE 0 END) AS OK,
                 SUM(CASE WHEN q.Estado = 'FAIL' THEN 1 ELSE 0 END) AS FAIL,
-                @RegistrosReporteNovedades AS RegistrosReporteNovedades
+                @RegistrosReporteNovedades AS RegistrosReporteNovedades,
+                @RegistrosAplicados AS Aplicados,
+                SUM(CASE WHEN UPPER(LTRIM(RTRIM(q.Estado))) = 'PENDIENTE' THEN 1 ELSE 0 END) AS Pendientes
             FROM [CxP].[HU4_Punto_I_FileOpsQueue] q
             WHERE q.BatchId = @BatchId;
 
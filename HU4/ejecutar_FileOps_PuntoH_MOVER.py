@@ -19,10 +19,17 @@ Version: 1.0.0
 
 Caracteristicas Principales:
 ----------------------------
-    - Operacion: MOVER archivos (shutil.move)
+    - Operacion: MOVER archivos. Mismo volumen: os.replace (rename atomico).
+      Distinto volumen: copia a temporal + verificacion + os.replace + borrado
+      del origen
     - Idempotencia: Si origen no existe pero destino si -> OK (ya movido)
-    - Re-ejecucion: Si ambos existen, elimina destino y mueve de nuevo
+    - Re-ejecucion: Si ambos existen y el destino coincide (tamano + mtime,
+      opcionalmente hash) solo se elimina el origen; si no coincide se
+      reemplaza el destino
     - Agrupacion: Resultados agrupados por ID_registro (1 resultado por registro)
+    - Concurrencia: registros en un pool de hilos acotado (FileOpsConcurrencia);
+      los archivos de un mismo registro se mueven en orden. makedirs se ejecuta
+      una sola vez por carpeta destino
 
 ================================================================================
 DIAGRAMA DE FLUJO
@@ -50,7 +57,7 @@ DIAGRAMA DE FLUJO
                                   |
                                   v
     +-------------------------------------------------------------+
-    |  Para cada ID_registro:                                     |
+    |  Para cada ID_registro (pool de hilos, en paralelo):        |
     |  +-------------------------------------------------------+  |
     |  |  Para cada archivo del registro:                      |  |
     |  |  +---------------------------------------------------+|  |
@@ -66,9 +73,9 @@ DIAGRAMA DE FLUJO
     |  |  +---------------------------------------------------+|  |
     |  |  |  Verificar idempotencia:                          ||  |
     |  |  |  - Si !src y dst existe -> OK (ya movido)         ||  |
-    |  |  |  - Si src y dst existen -> eliminar dst, mover    ||  |
+    |  |  |  - Si src y dst iguales -> borrar src (ya movido)  ||  |
     |  |  |  - Si !src y !dst -> ERROR                        ||  |
-    |  |  |  - Si src existe -> shutil.move(src, dst)         ||  |
+    |  |  |  - Si src existe -> os.replace / copia verificada  ||  |
     |  |  +---------------------------------------------------+|  |
     |  +-------------------------------------------------------+  |
     +-----------------------------+-------------------------------+
@@ -115,6 +122,11 @@ Variables de Entrada (GetVar):
             ...
         ]
 
+    vLocDicConfig : dict o str (opcional)
+        - FileOpsConcurrencia: registros procesados en paralelo (defecto 8)
+        - FileOpsVerificarHash: "True" para comparar SHA-256 ademas de
+          tamano + mtime (defecto False)
+
 Variables de Salida (SetVar):
 -----------------------------
     vLocJsonResultadosFileOpsPuntoH : str (JSON)
@@ -130,7 +142,8 @@ Variables de Salida (SetVar):
         ]
         
     vLocStrResultadoSP : bool - True si exito.
-    vLocStrResumenSP : str - Resumen de ejecucion.
+    vLocStrResumenSP : str - Resumen de ejecucion (incluye Hilos, Segundos,
+        ArchivosPorSeg y conteo de Renombrados/Copiados/Omitidos).
     vGblStrMensajeError : str - Mensaje de error.
     vGblStrSystemError : str - Stack trace.
 
@@ -141,7 +154,9 @@ LOGICA DE IDEMPOTENCIA
 La funcion maneja los siguientes casos para garantizar idempotencia:
 
     Caso 1: Origen existe, Destino NO existe
-        -> Mover normalmente (shutil.move)
+        -> Mismo volumen: os.replace (un solo rename atomico)
+        -> Distinto volumen: copia a temporal, verificacion de tamano
+           (y hash si FileOpsVerificarHash), os.replace y borrado del origen
         -> Resultado: OK
         
     Caso 2: Origen NO existe, Destino existe
@@ -149,7 +164,10 @@ La funcion maneja los siguientes casos para garantizar idempotencia:
         -> Resultado: OK (idempotente)
         
     Caso 3: Origen existe, Destino existe
-        -> Re-ejecucion: eliminar destino, mover de nuevo
+        -> Destino igual al origen (tamano + mtime, y hash si
+           FileOpsVerificarHash): solo se elimina el origen, sin transferir
+        -> Destino distinto: se reemplaza con el mismo camino del Caso 1
+           (os.replace sobrescribe; no se borra el destino antes)
         -> Resultado: OK
         
     Caso 4: Origen NO existe, Destino NO existe
@@ -160,13 +178,17 @@ La funcion maneja los siguientes casos para garantizar idempotencia:
 """
 
 
-async def ejecutar_FileOps_PuntoH_MOVER():
+async def ejecutar_FileOps_PuntoH_MOVER(file_ops=None):
     """
     Lee vLocJsonFileOpsPuntoH, mueve los archivos y genera ResultadosJson.
     
     Procesa la lista de archivos generada por QUEUE, mueve cada archivo
     a su destino, y guarda los resultados para FINALIZE.
     
+    Args:
+        file_ops (list|None): Operaciones a procesar. Si es None se leen de
+            vLocJsonFileOpsPuntoH; el driver en pipeline las pasa por chunks.
+    
     Returns:
         tuple: (bool, list|None)
             - bool: True si exito, False si error
@@ -193,13 +215,19 @@ async def ejecutar_FileOps_PuntoH_MOVER():
                 else:
                     print(f"  ID {r['ID_registro']}: FAIL -> {r['ErrorMsg']}")
     """
+    import ast
     import asyncio
+    import errno
+    import hashlib
     import json
     import os
     import shutil
+    import threading
+    import time
     import traceback
     import unicodedata
     from collections import defaultdict
+    from concurrent.futures import ThreadPoolExecutor
 
     def safe_str(v):
         """Convierte valor a string de forma segura."""
@@ -232,21 +260,241 @@ async def ejecutar_FileOps_PuntoH_MOVER():
         except Exception:
             pass
 
+    def leer_config():
+        """Lee vLocDicConfig (opcional); dict vacio si no existe o es invalido."""
+        try:
+            raw = GetVar("vLocDicConfig")
+            if isinstance(raw, dict):
+                return raw
+            t = safe_str(raw).strip()
+            if not t or t.upper() == "ERROR_NOT_VAR":
+                return {}
+            try:
+                return json.loads(t)
+            except Exception:
+                return ast.literal_eval(t)
+        except Exception:
+            return {}
+
+    def leer_concurrencia(cfg, default=8):
+        """Lee FileOpsConcurrencia (minimo 1)."""
+        try:
+            v = cfg.get("FileOpsConcurrencia", default)
+            return max(1, int(float(safe_str(v).strip() or default)))
+        except Exception:
+            return default
+
+    # Bloqueos por clave (carpeta o archivo destino) compartidos entre hilos
+    bloqueos = {}
+    bloqueos_lock = threading.Lock()
+
+    def bloqueo_para(clave):
+        """Retorna el lock asociado a una clave, creandolo si no existe."""
+        with bloqueos_lock:
+            lk = bloqueos.get(clave)
+            if lk is None:
+                lk = threading.Lock()
+                bloqueos[clave] = lk
+            return lk
+
+    # Carpetas destino ya creadas/verificadas en esta ejecucion
+    carpetas_creadas = set()
+
+    def asegurar_carpeta(dest_dir):
+        """os.makedirs una sola vez por carpeta destino (cada llamada es un viaje al share)."""
+        clave = os.path.normcase(os.path.normpath(dest_dir))
+        if clave in carpetas_creadas:
+            return
+        with bloqueo_para("dir:" + clave):
+            if clave in carpetas_creadas:
+                return
+            os.makedirs(dest_dir, exist_ok=True)
+            carpetas_creadas.add(clave)
+
     # ==========================================================================
     # LEER JSON DE OPERACIONES
     # ==========================================================================
     try:
-        raw = safe_str(GetVar("vLocJsonFileOpsPuntoH")).strip()
-        file_ops = json.loads(raw) if raw else []
+        if file_ops is None:
+            raw = safe_str(GetVar("vLocJsonFileOpsPuntoH")).strip()
+            file_ops = json.loads(raw) if raw else []
     except Exception as e:
         set_error("ERROR Punto H FileOps | JSON invalido en vLocJsonFileOpsPuntoH", e)
         return False, None
 
+    cfg_fileops = leer_config()
+    concurrencia = leer_concurrencia(cfg_fileops)
+    verificar_hash = safe_str(cfg_fileops.get("FileOpsVerificarHash", "False")).strip().lower() in ("true", "1", "si", "yes")
+
+    # ==========================================================================
+    # MOVIMIENTO: RENAME MISMO VOLUMEN / COPIA VERIFICADA / OMISION
+    # ==========================================================================
+    TOLERANCIA_MTIME = 2.0  # segundos (granularidad de SMB/FAT)
+
+    def hash_archivo(ruta):
+        """SHA-256 del archivo leido en bloques de 1 MB."""
+        h = hashlib.sha256()
+        with open(ruta, "rb") as f:
+            for bloque in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(bloque)
+        return h.hexdigest()
+
+    def mismo_contenido(src, dst, st_src=None, st_dst=None):
+        """True si dst coincide con src por tamano + mtime (y hash si se configura)."""
+        st_src = st_src or os.stat(src)
+        st_dst = st_dst or os.stat(dst)
+        if st_src.st_size != st_dst.st_size:
+            return False
+        if abs(st_src.st_mtime - st_dst.st_mtime) > TOLERANCIA_MTIME:
+            return False
+        if verificar_hash:
+            return hash_archivo(src) == hash_archivo(dst)
+        return True
+
+    # st_dev por carpeta destino: un solo os.stat por carpeta, como asegurar_carpeta
+    dispositivos_carpeta = {}
+
+    def dispositivo_carpeta(dest_dir):
+        """st_dev de la carpeta destino (cacheado); None si no se puede leer."""
+        clave = os.path.normcase(os.path.normpath(dest_dir))
+        dev = dispositivos_carpeta.get(clave)
+        if dev is not None:
+            return dev
+        with bloqueo_para("dev:" + clave):
+            dev = dispositivos_carpeta.get(clave)
+            if dev is None:
+                try:
+                    dev = os.stat(dest_dir).st_dev
+                except OSError:
+                    return None
+                dispositivos_carpeta[clave] = dev
+            return dev
+
+    def mismo_volumen(st_src, dest_dir):
+        """True si origen y carpeta destino estan en el mismo volumen (st_dev)."""
+        return st_src.st_dev == dispositivo_carpeta(dest_dir)
+
+    def es_error_cruce_volumen(ex):
+        """OSError de rename entre volumenes (EXDEV / ERROR_NOT_SAME_DEVICE)."""
+        return getattr(ex, "errno", None) == errno.EXDEV or getattr(ex, "winerror", None) == 17
+
+    def copiar_verificar_mover(src, dst_full, st_src):
+        """Copia a temporal en la carpeta destino, verifica, reemplaza y elimina el origen."""
+        tmp = dst_full + ".fileops_tmp"
+        try:
+            shutil.copy2(src, tmp)
+            st_tmp = os.stat(tmp)
+            if st_tmp.st_size != st_src.st_size:
+                raise IOError(f"Verificacion de copia fallida (tamano) {src} -> {dst_full}")
+            if verificar_hash and hash_archivo(src) != hash_archivo(tmp):
+                raise IOError(f"Verificacion de copia fallida (hash) {src} -> {dst_full}")
+            os.replace(tmp, dst_full)
+        except Exception:
+            try:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            except Exception:
+                pass
+            raise
+        os.remove(src)
+
+    def mover_archivo(src, dst_full, dest_dir, st_src):
+        """Mueve src a dst_full; retorna el contador afectado ('renombrados' o 'copiados')."""
+        if mismo_volumen(st_src, dest_dir):
+            try:
+                os.replace(src, dst_full)
+                return "renombrados"
+            except OSError as ex:
+                if not es_error_cruce_volumen(ex):
+                    raise
+        copiar_verificar_mover(src, dst_full, st_src)
+        return "copiados"
+
     # ==========================================================================
     # EJECUTAR MOVIMIENTOS
     # ==========================================================================
+    def mover_registro(_id, items):
+        """
+        Mueve los archivos de un ID_registro en orden y retorna su resultado.
+
+        Se ejecuta en un hilo del pool; los archivos de un mismo registro
+        siempre se procesan secuencialmente y en el orden recibido.
+        """
+        ok = True
+        err = ""
+        nueva_ruta = ""
+        contadores = {"archivos": 0, "renombrados": 0, "copiados": 0, "omitidos": 0}
+
+        for (src, dest_dir, filename) in items:
+            try:
+                contadores["archivos"] += 1
+
+                # Validaciones
+                if not _id:
+                    raise ValueError("ID_registro vacio")
+                if not src:
+                    raise ValueError("RutaOrigenFull vacia")
+                if not dest_dir:
+                    raise ValueError("CarpetaDestino vacia")
+                if not filename:
+                    raise ValueError("NombreArchivo vacio")
+
+                # Crear directorio destino (una vez por carpeta)
+                asegurar_carpeta(dest_dir)
+                dst_full = os.path.join(dest_dir, filename)
+
+                # Un mismo destino nunca se opera desde dos hilos a la vez
+                with bloqueo_para("dst:" + os.path.normcase(os.path.normpath(dst_full))):
+                    try:
+                        st_src = os.stat(src)
+                    except FileNotFoundError:
+                        st_src = None
+                    try:
+                        st_dst = os.stat(dst_full)
+                    except FileNotFoundError:
+                        st_dst = None
+
+                    # IDEMPOTENCIA: si destino existe y origen no -> OK (ya movido)
+                    if st_src is None and st_dst is not None:
+                        contadores["omitidos"] += 1
+                        nueva_ruta = dest_dir
+                        continue
+
+                    # ERROR: origen no existe
+                    if st_src is None:
+                        raise FileNotFoundError(f"No existe origen: {src}")
+
+                    # RE-EJECUCION: destino ya igual al origen -> solo completar el movimiento
+                    if st_dst is not None and mismo_contenido(src, dst_full, st_src, st_dst):
+                        try:
+                            os.remove(src)
+                        except Exception as ex_rm:
+                            raise RuntimeError(
+                                f"Destino ya movido pero no se pudo borrar origen: {src} | {safe_str(ex_rm)}"
+                            )
+                        contadores["omitidos"] += 1
+                        nueva_ruta = dest_dir
+                        continue
+
+                    # MOVER archivo (os.replace sobrescribe un destino distinto)
+                    contadores[mover_archivo(src, dst_full, dest_dir, st_src)] += 1
+                    nueva_ruta = dest_dir
+
+            except Exception as e:
+                ok = False
+                err = safe_str(e)
+                break
+
+        resultado = {
+            "ID_registro": _id,
+            "MovimientoExitoso": bool(ok),
+            "NuevaRutaArchivo": nueva_ruta if ok else "",
+            "ErrorMsg": "" if ok else err
+        }
+        return resultado, contadores
+
     def run_move_sync():
-        """Ejecuta movimientos de forma sincrona."""
+        """Ejecuta movimientos en un pool de hilos acotado (un registro por tarea)."""
         
         # Agrupar por ID_registro para devolver 1 resultado por registro
         por_id = defaultdict(list)
@@ -262,74 +510,30 @@ async def ejecutar_FileOps_PuntoH_MOVER():
 
             por_id[_id].append((src, dest_dir, filename))
 
-        resultados = []
-        ok_ids = 0
-        fail_ids = 0
+        t_inicio = time.time()
 
-        for _id, items in por_id.items():
-            ok = True
-            err = ""
-            nueva_ruta = ""
+        # Registros en paralelo; executor.map conserva el orden de los resultados
+        hilos = max(1, min(concurrencia, len(por_id)))
+        with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="FileOpsH") as executor:
+            salidas = list(executor.map(mover_registro, por_id.keys(), por_id.values()))
 
-            for (src, dest_dir, filename) in items:
-                try:
-                    # Validaciones
-                    if not _id:
-                        raise ValueError("ID_registro vacio")
-                    if not src:
-                        raise ValueError("RutaOrigenFull vacia")
-                    if not dest_dir:
-                        raise ValueError("CarpetaDestino vacia")
-                    if not filename:
-                        raise ValueError("NombreArchivo vacio")
-
-                    # Crear directorio destino
-                    os.makedirs(dest_dir, exist_ok=True)
-                    dst_full = os.path.join(dest_dir, filename)
-
-                    # IDEMPOTENCIA: si destino existe y origen no -> OK (ya movido)
-                    if (not os.path.exists(src)) and os.path.exists(dst_full):
-                        nueva_ruta = dest_dir
-                        continue
-
-                    # RE-EJECUCION: si ambos existen, eliminar destino y mover
-                    if os.path.exists(src) and os.path.exists(dst_full):
-                        try:
-                            os.remove(dst_full)
-                        except Exception as ex_rm:
-                            raise RuntimeError(
-                                f"Destino ya existe y no se pudo borrar: {dst_full} | {safe_str(ex_rm)}"
-                            )
-
-                    # ERROR: origen no existe
-                    if not os.path.exists(src):
-                        raise FileNotFoundError(f"No existe origen: {src}")
-
-                    # MOVER archivo
-                    shutil.move(src, dst_full)
-                    nueva_ruta = dest_dir
-
-                except Exception as e:
-                    ok = False
-                    err = safe_str(e)
-                    break
-
-            # Agregar resultado para este ID_registro
-            resultados.append({
-                "ID_registro": _id,
-                "MovimientoExitoso": bool(ok),
-                "NuevaRutaArchivo": nueva_ruta if ok else "",
-                "ErrorMsg": "" if ok else err
-            })
-
-            if ok:
-                ok_ids += 1
-            else:
-                fail_ids += 1
+        segundos = time.time() - t_inicio
+        resultados = [r for r, _ in salidas]
+        totales = {"archivos": 0, "renombrados": 0, "copiados": 0, "omitidos": 0}
+        for _, contadores in salidas:
+            for clave, valor in contadores.items():
+                totales[clave] += valor
+        archivos_procesados = totales["archivos"]
+        ok_ids = sum(1 for r in resultados if r["MovimientoExitoso"])
+        fail_ids = len(resultados) - ok_ids
+        archivos_seg = archivos_procesados / segundos if segundos > 0 else float(archivos_procesados)
 
         resumen = (
             f"Punto H FileOps MOVE OK | IDs_OK={ok_ids} | IDs_FAIL={fail_ids} | "
-            f"TotalIDs={len(por_id)} | TotalArchivos={len(file_ops)}"
+            f"TotalIDs={len(por_id)} | TotalArchivos={len(file_ops)} | "
+            f"Renombrados={totales['renombrados']} | Copiados={totales['copiados']} | "
+            f"Omitidos={totales['omitidos']} | "
+            f"Hilos={hilos} | Segundos={segundos:.2f} | ArchivosPorSeg={archivos_seg:.1f}"
         )
         return True, resultados, resumen
 
@@ -354,6 +558,11 @@ async def ejecutar_FileOps_PuntoH_MOVER():
         return False, None
 
 
+# Registro para ejecutar_HU4_PuntosHI_Pipeline (puede correr en otro espacio de nombres)
+import sys
+vars(sys).setdefault("_cxp_runners_hu4", {})["ejecutar_FileOps_PuntoH_MOVER"] = ejecutar_FileOps_PuntoH_MOVER
+
+
 # ==============================================================================
 # EJEMPLOS DE USO
 # ==============================================================================
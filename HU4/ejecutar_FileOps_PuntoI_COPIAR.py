@@ -24,6 +24,9 @@ Caracteristicas Principales:
     - Idempotencia: Si origen no existe pero destino si -> OK (ya copiado)
     - Re-ejecucion: Si destino existe, lo elimina y copia de nuevo
     - Agrupacion: Resultados agrupados por ID_registro
+    - Concurrencia: registros en un pool de hilos acotado (FileOpsConcurrencia);
+      los archivos de un mismo registro se copian en orden. makedirs se ejecuta
+      una sola vez por carpeta destino
 
 ================================================================================
 DIAGRAMA DE FLUJO
@@ -51,7 +54,7 @@ DIAGRAMA DE FLUJO
                                   |
                                   v
     +-------------------------------------------------------------+
-    |  Para cada ID_registro:                                     |
+    |  Para cada ID_registro (pool de hilos, en paralelo):        |
     |  +-------------------------------------------------------+  |
     |  |  Validar insumos: RutaOrigen, NombresArchivos, Destino|  |
     |  +-------------------------------------------------------+  |
@@ -112,6 +115,9 @@ Variables de Entrada (GetVar):
         
         NOTA: NombresArchivos puede contener multiples archivos separados por ;
 
+    vLocDicConfig : dict o str (opcional)
+        - FileOpsConcurrencia: registros procesados en paralelo (defecto 8)
+
 Variables de Salida (SetVar):
 -----------------------------
     vLocJsonResultadosFileOpsPuntoI : str (JSON)
@@ -127,7 +133,8 @@ Variables de Salida (SetVar):
         ]
         
     vLocStrResultadoSP : bool - True si exito.
-    vLocStrResumenSP : str - Resumen de ejecucion.
+    vLocStrResumenSP : str - Resumen de ejecucion (incluye Hilos, Segundos
+        y ArchivosPorSeg).
     vGblStrMensajeError : str - Mensaje de error.
     vGblStrSystemError : str - Stack trace.
 
@@ -171,7 +178,7 @@ LOGICA DE IDEMPOTENCIA
 """
 
 
-async def ejecutar_FileOps_PuntoI_COPIAR():
+async def ejecutar_FileOps_PuntoI_COPIAR(file_ops=None):
     """
     Lee vLocJsonFileOpsPuntoI, copia los archivos y genera ResultadosJson.
     
@@ -179,6 +186,10 @@ async def ejecutar_FileOps_PuntoI_COPIAR():
     a su destino (puede haber multiples archivos por registro), y guarda
     los resultados para FINALIZE.
     
+    Args:
+        file_ops (list|None): Operaciones a procesar. Si es None se leen de
+            vLocJsonFileOpsPuntoI; el driver en pipeline las pasa por chunks.
+    
     Returns:
         tuple: (bool, list|None)
             - bool: True si exito, False si error
@@ -204,13 +215,17 @@ async def ejecutar_FileOps_PuntoI_COPIAR():
                 else:
                     print(f"ID {r['ID_registro']}: FAIL -> {r['ErrorMsg']}")
     """
+    import ast
     import asyncio
     import json
     import os
     import shutil
+    import threading
+    import time
     import traceback
     import unicodedata
     from collections import defaultdict
+    from concurrent.futures import ThreadPoolExecutor
 
     def safe_str(v):
         """Convierte valor a string de forma segura."""
@@ -280,78 +295,121 @@ async def ejecutar_FileOps_PuntoI_COPIAR():
         
         return ruta_origen + "\\" + filename
 
+    def leer_concurrencia(default=8):
+        """Lee FileOpsConcurrencia de vLocDicConfig (opcional, minimo 1)."""
+        try:
+            raw = GetVar("vLocDicConfig")
+            if isinstance(raw, dict):
+                cfg = raw
+            else:
+                t = safe_str(raw).strip()
+                if not t or t.upper() == "ERROR_NOT_VAR":
+                    return default
+                try:
+                    cfg = json.loads(t)
+                except Exception:
+                    cfg = ast.literal_eval(t)
+            v = cfg.get("FileOpsConcurrencia", default)
+            return max(1, int(float(safe_str(v).strip() or default)))
+        except Exception:
+            return default
+
+    # Bloqueos por clave (carpeta o archivo destino) compartidos entre hilos
+    bloqueos = {}
+    bloqueos_lock = threading.Lock()
+
+    def bloqueo_para(clave):
+        """Retorna el lock asociado a una clave, creandolo si no existe."""
+        with bloqueos_lock:
+            lk = bloqueos.get(clave)
+            if lk is None:
+                lk = threading.Lock()
+                bloqueos[clave] = lk
+            return lk
+
+    # Carpetas destino ya creadas/verificadas en esta ejecucion
+    carpetas_creadas = set()
+
+    def asegurar_carpeta(dest_dir):
+        """os.makedirs una sola vez por carpeta destino (cada llamada es un viaje al share)."""
+        clave = os.path.normcase(os.path.normpath(dest_dir))
+        if clave in carpetas_creadas:
+            return
+        with bloqueo_para("dir:" + clave):
+            if clave in carpetas_creadas:
+                return
+            os.makedirs(dest_dir, exist_ok=True)
+            carpetas_creadas.add(clave)
+
     # ==========================================================================
     # LEER JSON DE OPERACIONES
     # ==========================================================================
     try:
-        raw = safe_str(GetVar("vLocJsonFileOpsPuntoI")).strip()
-        file_ops = json.loads(raw) if raw else []
+        if file_ops is None:
+            raw = safe_str(GetVar("vLocJsonFileOpsPuntoI")).strip()
+            file_ops = json.loads(raw) if raw else []
     except Exception as e:
         set_error("ERROR Punto I FileOps | JSON invalido en vLocJsonFileOpsPuntoI", e)
         return False, None
 
+    concurrencia = leer_concurrencia()
+
     # ==========================================================================
     # EJECUTAR COPIAS
     # ==========================================================================
-    def run_copy_sync():
-        """Ejecuta copias de forma sincrona."""
-        
-        # Agrupar por ID_registro
-        por_id = defaultdict(list)
+    def copiar_registro(_id, packs):
+        """
+        Copia los archivos de un ID_registro en orden y retorna su resultado.
 
-        for op in file_ops:
-            _id = safe_str(op.get("ID_registro")).strip()
-            ruta_origen = safe_str(op.get("RutaOrigen")).strip()
-            nombres = safe_str(op.get("NombresArchivos")).strip()
-            dest_dir = safe_str(op.get("CarpetaDestino")).strip()
-            por_id[_id].append((ruta_origen, nombres, dest_dir))
+        Se ejecuta en un hilo del pool; los archivos de un mismo registro
+        siempre se procesan secuencialmente y en el orden recibido.
+        """
+        ok = True
+        err = ""
+        nueva_ruta = ""
+        archivos_procesados = 0
+
+        # Validar insumos: si no hay ruta o nombres => FAIL
+        archivos = []
+        for (ruta_origen, nombres, dest_dir) in packs:
+            if not dest_dir:
+                ok = False
+                err = "CarpetaDestino vacia"
+                break
+            if (not ruta_origen) or (not nombres):
+                ok = False
+                err = "No se logran identificar insumos (RutaOrigen o NombresArchivos vacio)"
+                break
+
+            # Separar multiples archivos por ;
+            for nombre in [x.strip() for x in nombres.split(";") if x.strip()]:
+                archivos.append((build_src_full(ruta_origen, nombre), dest_dir, nombre))
 
-        resultados = []
-        ok_ids = 0
-        fail_ids = 0
-        total_archivos = 0
-
-        for _id, packs in por_id.items():
-            ok = True
-            err = ""
-            nueva_ruta = ""
-
-            # Validar insumos: si no hay ruta o nombres => FAIL
-            archivos = []
-            for (ruta_origen, nombres, dest_dir) in packs:
-                if not dest_dir:
-                    ok = False
-                    err = "CarpetaDestino vacia"
-                    break
-                if (not ruta_origen) or (not nombres):
-                    ok = False
-                    err = "No se logran identificar insumos (RutaOrigen o NombresArchivos vacio)"
-                    break
-
-                # Separar multiples archivos por ;
-                for nombre in [x.strip() for x in nombres.split(";") if x.strip()]:
-                    archivos.append((build_src_full(ruta_origen, nombre), dest_dir, nombre))
-
-            if ok:
-                try:
-                    for (src_full, dest_dir, nombre) in archivos:
-                        total_archivos += 1
-                        
-                        # Crear directorio destino
-                        os.makedirs(dest_dir, exist_ok=True)
-                        dst_full = os.path.join(dest_dir, nombre)
+        if ok:
+            try:
+                for (src_full, dest_dir, nombre) in archivos:
+                    archivos_procesados += 1
+                    
+                    # Crear directorio destino (una vez por carpeta)
+                    asegurar_carpeta(dest_dir)
+                    dst_full = os.path.join(dest_dir, nombre)
+
+                    # Un mismo destino nunca se opera desde dos hilos a la vez
+                    with bloqueo_para("dst:" + os.path.normcase(os.path.normpath(dst_full))):
+                        src_existe = os.path.exists(src_full)
+                        dst_existe = os.path.exists(dst_full)
 
                         # IDEMPOTENCIA: si destino existe y origen no -> OK
-                        if (not os.path.exists(src_full)) and os.path.exists(dst_full):
+                        if (not src_existe) and dst_existe:
                             nueva_ruta = dest_dir
                             continue
 
                         # ERROR: origen no existe
-                        if not os.path.exists(src_full):
+                        if not src_existe:
                             raise FileNotFoundError(f"No existe origen: {src_full}")
 
                         # RE-EJECUCION: si destino existe, eliminarlo
-                        if os.path.exists(dst_full):
+                        if dst_existe:
                             try:
                                 os.remove(dst_full)
                             except Exception as ex_rm:
@@ -363,26 +421,49 @@ async def ejecutar_FileOps_PuntoI_COPIAR():
                         shutil.copy2(src_full, dst_full)
                         nueva_ruta = dest_dir
 
-                except Exception as e:
-                    ok = False
-                    err = safe_str(e)
+            except Exception as e:
+                ok = False
+                err = safe_str(e)
 
-            # Agregar resultado para este ID_registro
-            resultados.append({
-                "ID_registro": _id,
-                "MovimientoExitoso": bool(ok),
-                "NuevaRutaArchivo": nueva_ruta if ok else "",
-                "ErrorMsg": "" if ok else err
-            })
+        resultado = {
+            "ID_registro": _id,
+            "MovimientoExitoso": bool(ok),
+            "NuevaRutaArchivo": nueva_ruta if ok else "",
+            "ErrorMsg": "" if ok else err
+        }
+        return resultado, archivos_procesados
 
-            if ok:
-                ok_ids += 1
-            else:
-                fail_ids += 1
+    def run_copy_sync():
+        """Ejecuta copias en un pool de hilos acotado (un registro por tarea)."""
+        
+        # Agrupar por ID_registro
+        por_id = defaultdict(list)
+
+        for op in file_ops:
+            _id = safe_str(op.get("ID_registro")).strip()
+            ruta_origen = safe_str(op.get("RutaOrigen")).strip()
+            nombres = safe_str(op.get("NombresArchivos")).strip()
+            dest_dir = safe_str(op.get("CarpetaDestino")).strip()
+            por_id[_id].append((ruta_origen, nombres, dest_dir))
+
+        t_inicio = time.time()
+
+        # Registros en paralelo; executor.map conserva el orden de los resultados
+        hilos = max(1, min(concurrencia, len(por_id)))
+        with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="FileOpsI") as executor:
+            salidas = list(executor.map(copiar_registro, por_id.keys(), por_id.values()))
+
+        segundos = time.time() - t_inicio
+        resultados = [r for r, _ in salidas]
+        total_archivos = sum(n for _, n in salidas)
+        ok_ids = sum(1 for r in resultados if r["MovimientoExitoso"])
+        fail_ids = len(resultados) - ok_ids
+        archivos_seg = total_archivos / segundos if segundos > 0 else float(total_archivos)
 
         resumen = (
             f"Punto I FileOps COPY OK | IDs_OK={ok_ids} | IDs_FAIL={fail_ids} | "
-            f"TotalIDs={len(por_id)} | TotalArchivos={total_archivos}"
+            f"TotalIDs={len(por_id)} | TotalArchivos={total_archivos} | "
+            f"Hilos={hilos} | Segundos={segundos:.2f} | ArchivosPorSeg={archivos_seg:.1f}"
         )
         return True, resultados, resumen
 
@@ -403,6 +484,11 @@ async def ejecutar_FileOps_PuntoI_COPIAR():
         return False, None
 
 
+# Registro para ejecutar_HU4_PuntosHI_Pipeline (puede correr en otro espacio de nombres)
+import sys
+vars(sys).setdefault("_cxp_runners_hu4", {})["ejecutar_FileOps_PuntoI_COPIAR"] = ejecutar_FileOps_PuntoI_COPIAR
+
+
 # ==============================================================================
 # EJEMPLOS DE USO
 # ==============================================================================
@@ -33,6 +33,7 @@ Dependencias:
     - pyodbc: Para conexion a SQL Server
     - json: Para parseo de configuracion y serializacion
     - ast: Para parseo alternativo de configuracion
+    - csv / os / datetime: Para el archivo de DETALLE en modo streaming
     - traceback: Para captura de errores detallados
     - collections.Counter: Para estadisticas de resumen
 
@@ -89,6 +90,7 @@ DIAGRAMA DE FLUJO
     |  - RegistrosProcesados, RetomaSetDesdeNull                  |
     |  - MarcadosNoExitoso, MarcadosRechazado                     |
     |  - OKDentroDiasMaximos, FilasInsertadasComparativa          |
+    |  - LotesProcesados, MsTotalLotes, TiemposLotesJson          |
     +-------------------------+-----------------------------------+
                               |
                               v
@@ -98,11 +100,14 @@ DIAGRAMA DE FLUJO
     |  - documenttype, Fecha_retoma, DiasTranscurridos            |
     |  - ResultadoFinalAntesEventos, EstadoFinalFase_4            |
     |  - ObservacionesFase_4                                      |
+    |  fetchmany(TamanoFetch) + contar_detalle() por fila         |
+    |  - Streaming: filas -> archivo NDJSON/CSV en RutaLogs       |
+    |  - Normal:    filas -> payload JSON (detalle_registros)     |
     +-------------------------+-----------------------------------+
                               |
                               v
     +-------------------------------------------------------------+
-    |  build_summary()                                            |
+    |  build_summary() con contadores ya acumulados               |
     |  - Generar resumen legible con estadisticas                 |
     |  - Contar estados mas comunes (TopEstados)                  |
     |  - Contar observaciones mas frecuentes (TopObs)             |
@@ -134,9 +139,17 @@ Variables de Entrada (GetVar):
             "NombreBaseDatos": "CxP_Database",
             "PlazoMaximo": 120,        # o "DiasMaximos"
             "Lote": 500,               # o "BatchSize"
-            "CommandTimeout": 0        # Opcional, 0 = sin timeout
+            "CommandTimeout": 0,       # Opcional, 0 = sin timeout
+            "DetalleStreaming": false, # Opcional, detalle a archivo
+            "FormatoDetalle": "ndjson",# Opcional, "ndjson" o "csv"
+            "TamanoFetch": 1000,       # Opcional, filas por fetchmany
+            "RutaLogs": "C:\\Logs"     # Solo si no existe vGblStrRutaLogs
         }
 
+    vGblStrRutaLogs : str (opcional)
+        Carpeta del dia generada por generar_ruta_logs(). En modo streaming
+        el archivo de DETALLE se escribe aqui (o en RutaLogs si no existe).
+
 Variables de Salida (SetVar):
 -----------------------------
     vLocStrResultadoSP : bool
@@ -153,6 +166,9 @@ Variables de Salida (SetVar):
         Error:
         "ERROR | configuracion | HU4_ABCD | Ver vGblStrSystemError"
         
+    vLocStrRutaDetalleSP : str
+        Solo en modo streaming: ruta del archivo NDJSON/CSV con el DETALLE.
+        
     vGblStrMensajeError : str
         Mensaje de error amigable para el usuario (vacio si exito).
         
@@ -175,7 +191,14 @@ El segundo valor de retorno es un JSON string con la siguiente estructura:
         "MarcadosNoExitoso": 10,
         "MarcadosRechazado": 5,
         "OKDentroDiasMaximos": 1435,
-        "FilasInsertadasComparativa": 1500
+        "RegistrosNuevosComparativa": 20,
+        "FilasInsertadasComparativa": 1500,
+        "RegistrosReporteNovedades": 15,
+        "LotesProcesados": 3,
+        "MsPreparacionTrabajo": 120,
+        "MsTotalLotes": 4500,
+        "MsLoteMaximo": 1700,
+        "TiemposLotesJson": "[{\"Lote\":1,\"DesdeID\":10,\"HastaID\":510,\"Filas\":500,\"Ms\":1400}, ...]"
     },
     "detalle_registros": [
         {
@@ -194,6 +217,21 @@ El segundo valor de retorno es un JSON string con la siguiente estructura:
     "detalle_errores": [...]  // Alias de detalle_registros por compatibilidad
 }
 
+Con DetalleStreaming=true el DETALLE no viaja en el payload; solo la ruta
+del archivo (una fila JSON por linea en NDJSON, o CSV con encabezado) y el
+total de filas escritas. La memoria queda acotada por TamanoFetch sin
+importar el tamano del lote:
+
+{
+    "resumen_general": {...},
+    "detalle_archivo": "C:\\Logs\\2026\\02\\01\\HU4_ABCD_Detalle_20260201_103000.ndjson",
+    "detalle_formato": "ndjson",
+    "detalle_total": 1500
+}
+
+El archivo se escribe primero como ".part" y se renombra al terminar, de
+modo que un archivo sin ese sufijo siempre esta completo.
+
 ================================================================================
 """
 
@@ -255,10 +293,14 @@ async def ejecutar_HU4_ABCD_CamposObligatorios():
     # ==========================================================================
     import asyncio
     import pyodbc
+    import sys
     import json
     import ast
+    import csv
+    import os
     import traceback
     from collections import Counter
+    from datetime import datetime
 
     # ==========================================================================
     # FUNCIONES AUXILIARES (HELPERS)
@@ -406,7 +448,34 @@ async def ejecutar_HU4_ABCD_CamposObligatorios():
             out.append(d)
         return out
 
-    def build_summary(resumen_dict, detalle_list):
+    def contar_detalle(d, c_estados, top_obs):
+        """
+        Acumula una fila del DETALLE en los contadores del resumen.
+        
+        Se invoca fila a fila mientras se consume el ResultSet 2, de modo
+        que el resumen no necesita volver a recorrer (ni re-parsear) el
+        detalle completo.
+        
+        Args:
+            d: Fila del detalle como diccionario.
+            c_estados: Counter de ResultadoFinalAntesEventos.
+            top_obs: Counter de ObservacionesFase_4.
+        """
+        est = safe_str(d.get("ResultadoFinalAntesEventos")).strip() or "SIN_ESTADO"
+        c_estados[est] += 1
+        obs = safe_str(d.get("ObservacionesFase_4")).strip()
+        if obs:
+            top_obs[obs] += 1
+
+    def as_bool(x, default=False):
+        """Interpreta banderas de configuracion (True/"true"/"1"/"si")."""
+        if x is None or safe_str(x).strip() == "":
+            return default
+        if isinstance(x, bool):
+            return x
+        return safe_str(x).strip().lower() in ("true", "1", "si", "yes")
+
+    def build_summary(resumen_dict, detalle_list, c_estados=None, top_obs=None):
         """
         Construye resumen legible de la ejecucion del SP.
         
@@ -416,6 +485,9 @@ async def ejecutar_HU4_ABCD_CamposObligatorios():
         Args:
             resumen_dict: Diccionario con datos del ResultSet 1.
             detalle_list: Lista de diccionarios del ResultSet 2.
+            c_estados: Counter ya acumulado con contar_detalle() (opcional).
+            top_obs: Counter ya acumulado con contar_detalle() (opcional).
+                Si se reciben los contadores, detalle_list se ignora.
         
         Returns:
             str: Resumen formateado para vLocStrResumenSP.
@@ -425,6 +497,7 @@ async def ejecutar_HU4_ABCD_CamposObligatorios():
             "OK | Fecha=2025-01-15 | DiasMax=120 | Batch=500 | 
              Procesados=1500 | RetomaSet=50 | NoExitoso=10 | 
              Rechazados=5 | OKDentroDias=1435 | FilasComparativa=1500 |
+             Lotes=3 | MsPreparacion=120 | MsLotes=4500 | MsLoteMax=1700 |
              TopEstados=PENDIENTE=800, APROBADO=500, RECHAZADO=200 |
              TopObs=Campo vacio=300, NIT invalido=150"
         """
@@ -441,20 +514,17 @@ async def ejecutar_HU4_ABCD_CamposObligatorios():
         rech = as_int(resumen_dict.get("MarcadosRechazado"))
         ok = as_int(resumen_dict.get("OKDentroDiasMaximos"))
         filas_comp = as_int(resumen_dict.get("FilasInsertadasComparativa"))
+        lotes = as_int(resumen_dict.get("LotesProcesados"))
+        ms_prep = as_int(resumen_dict.get("MsPreparacionTrabajo"))
+        ms_lotes = as_int(resumen_dict.get("MsTotalLotes"))
+        ms_max = as_int(resumen_dict.get("MsLoteMaximo"))
 
         # Contadores para estadisticas del detalle
-        c_estados = Counter()
-        top_obs = Counter()
-        
-        for r in (detalle_list or []):
-            # Contar estados
-            est = safe_str(r.get("ResultadoFinalAntesEventos")).strip() or "SIN_ESTADO"
-            c_estados[est] += 1
-            
-            # Contar observaciones
-            obs = safe_str(r.get("ObservacionesFase_4")).strip()
-            if obs:
-                top_obs[obs] += 1
+        if c_estados is None or top_obs is None:
+            c_estados = Counter()
+            top_obs = Counter()
+            for r in (detalle_list or []):
+                contar_detalle(r, c_estados, top_obs)
 
         # Construir extras del resumen
         extra = ""
@@ -473,7 +543,8 @@ async def ejecutar_HU4_ABCD_CamposObligatorios():
             f"OK | Fecha={fecha} | DiasMax={dias} | Batch={batch} | "
             f"Procesados={proc} | RetomaSet={retoma} | NoExitoso={noex} | "
             f"Rechazados={rech} | OKDentroDias={ok} | "
-            f"FilasComparativa={filas_comp}{extra}"
+            f"FilasComparativa={filas_comp} | Lotes={lotes} | "
+            f"MsPreparacion={ms_prep} | MsLotes={ms_lotes} | MsLoteMax={ms_max}{extra}"
         )
 
     # ==========================================================================
@@ -501,6 +572,30 @@ async def ejecutar_HU4_ABCD_CamposObligatorios():
         # Timeout opcional (0 = sin timeout)
         cmd_timeout = int(cfg.get("CommandTimeout", 0) or 0)
 
+        # Modo streaming del DETALLE (opcional, por defecto desactivado)
+        streaming = as_bool(cfg.get("DetalleStreaming"), False)
+        formato_detalle = safe_str(cfg.get("FormatoDetalle", "ndjson")).strip().lower() or "ndjson"
+        tamano_fetch = max(1, as_int(cfg.get("TamanoFetch"), 1000))
+
+        ruta_detalle = ""
+        if streaming:
+            if formato_detalle not in ("ndjson", "csv"):
+                raise ValueError(f"FormatoDetalle no soportado: {formato_detalle}")
+            # Carpeta de logs del dia (generar_ruta_logs) o RutaLogs base
+            carpeta_logs = ""
+            try:
+                carpeta_logs = safe_str(GetVar("vGblStrRutaLogs")).strip()
+            except Exception:
+                carpeta_logs = ""
+            if not carpeta_logs or carpeta_logs == "ERROR_NOT_VAR":
+                carpeta_logs = safe_str(cfg.get("RutaLogs")).strip()
+            if not carpeta_logs:
+                raise ValueError("DetalleStreaming requiere vGblStrRutaLogs o RutaLogs")
+            ruta_detalle = os.path.join(
+                carpeta_logs,
+                "HU4_ABCD_Detalle_" + datetime.now().strftime("%Y%m%d_%H%M%S") + "." + formato_detalle,
+            )
+
     except Exception as e:
         set_error_vars("Error configuracion HU4_ABCD_CamposObligatorios", e)
         try:
@@ -521,8 +616,12 @@ async def ejecutar_HU4_ABCD_CamposObligatorios():
         Esta funcion interna maneja la conexion a SQL Server y la
         ejecucion del SP con WITH RESULT SETS para conversion de tipos.
         
+        El DETALLE se consume con fetchmany(TamanoFetch) y los contadores
+        del resumen se acumulan fila a fila. En modo streaming las filas se
+        escriben a ruta_detalle (NDJSON/CSV) y no se retienen en memoria.
+        
         Returns:
-            str: JSON con payload de resultados.
+            tuple: (payload_json, resumen, c_estados, top_obs)
         
         Raises:
             RuntimeError: Si hay error de pyodbc.
@@ -550,7 +649,14 @@ async def ejecutar_HU4_ABCD_CamposObligatorios():
                 MarcadosNoExitoso INT,
                 MarcadosRechazado INT,
                 OKDentroDiasMaximos INT,
-                FilasInsertadasComparativa INT
+                RegistrosNuevosComparativa INT,
+                FilasInsertadasComparativa INT,
+                RegistrosReporteNovedades INT,
+                LotesProcesados INT,
+                MsPreparacionTrabajo INT,
+                MsTotalLotes INT,
+                MsLoteMaximo INT,
+                TiemposLotesJson NVARCHAR(MAX)
             ),
             (
                 ID BIGINT,
@@ -567,7 +673,8 @@ async def ejecutar_HU4_ABCD_CamposObligatorios():
         """
 
         try:
-            with pyodbc.connect(conn_str) as c:
+            pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+            with (pool_sql.conectar(conn_str) if pool_sql else pyodbc.connect(conn_str)) as c:
                 c.autocommit = True
                 cur = c.cursor()
 
@@ -585,22 +692,70 @@ async def ejecutar_HU4_ABCD_CamposObligatorios():
                 r1 = cur.fetchone()
                 resumen = row_to_dict(cur, r1) if r1 else None
 
-                # ResultSet 2: Detalle (N filas)
+                # ResultSet 2: Detalle (N filas, por paginas de fetchmany)
                 detalle = []
-                if cur.nextset():
+                total_detalle = 0
+                c_estados = Counter()
+                top_obs = Counter()
+                hay_detalle = cur.nextset() and cur.description
+
+                if streaming:
+                    ruta_tmp = ruta_detalle + ".part"
+                    os.makedirs(os.path.dirname(ruta_detalle) or ".", exist_ok=True)
                     try:
-                        rows = cur.fetchall()
-                        detalle = rows_to_dicts(cur, rows)
+                        with open(ruta_tmp, "w", encoding="utf-8", newline="") as f:
+                            writer = None
+                            if hay_detalle and formato_detalle == "csv":
+                                writer = csv.writer(f)
+                                writer.writerow([col[0] for col in cur.description])
+                            while hay_detalle:
+                                rows = cur.fetchmany(tamano_fetch)
+                                if not rows:
+                                    break
+                                for d in rows_to_dicts(cur, rows):
+                                    contar_detalle(d, c_estados, top_obs)
+                                    if writer is not None:
+                                        writer.writerow([safe_str(v) for v in d.values()])
+                                    else:
+                                        f.write(json.dumps(d, ensure_ascii=False, default=str) + "\n")
+                                total_detalle += len(rows)
+                        os.replace(ruta_tmp, ruta_detalle)
+                    except Exception:
+                        try:
+                            os.remove(ruta_tmp)
+                        except Exception:
+                            pass
+                        raise
+                else:
+                    try:
+                        while hay_detalle:
+                            rows = cur.fetchmany(tamano_fetch)
+                            if not rows:
+                                break
+                            for d in rows_to_dicts(cur, rows):
+                                contar_detalle(d, c_estados, top_obs)
+                                detalle.append(d)
                     except Exception:
                         detalle = []
+                        c_estados, top_obs = Counter(), Counter()
+                    total_detalle = len(detalle)
 
                 # Construir payload
-                payload = {
-                    "resumen_general": resumen,
-                    "detalle_registros": detalle,
-                    "detalle_errores": detalle,  # Alias por compatibilidad
-                }
-                return json.dumps(payload, ensure_ascii=False, default=str)
+                if streaming:
+                    payload = {
+                        "resumen_general": resumen,
+                        "detalle_archivo": ruta_detalle,
+                        "detalle_formato": formato_detalle,
+                        "detalle_total": total_detalle,
+                    }
+                else:
+                    payload = {
+                        "resumen_general": resumen,
+                        "detalle_registros": detalle,
+                        "detalle_errores": detalle,  # Alias por compatibilidad
+                    }
+                payload_json = json.dumps(payload, ensure_ascii=False, default=str)
+                return payload_json, resumen, c_estados, top_obs
 
         except pyodbc.Error as e:
             raise RuntimeError(f"pyodbc.Error ejecutando HU4_ABCD: {safe_str(e)}") from e
@@ -612,7 +767,7 @@ async def ejecutar_HU4_ABCD_CamposObligatorios():
     try:
         # Ejecutar funcion sincrona en thread pool
         loop = asyncio.get_running_loop()
-        payload_json = await loop.run_in_executor(None, run_sp_sync)
+        payload_json, resumen, c_estados, top_obs = await loop.run_in_executor(None, run_sp_sync)
 
         # Si llego aqui, ejecuto OK
         try:
@@ -620,20 +775,15 @@ async def ejecutar_HU4_ABCD_CamposObligatorios():
         except Exception:
             pass
 
-        # Parsear payload para construir resumen
-        try:
-            payload = json.loads(payload_json) if payload_json else {}
-        except Exception:
-            payload = {}
-
-        # Construir y guardar resumen
-        resumen_txt = build_summary(
-            payload.get("resumen_general"),
-            payload.get("detalle_registros") or payload.get("detalle_errores")
-        )
+        # Construir y guardar resumen (contadores ya acumulados en el thread)
+        resumen_txt = build_summary(resumen, None, c_estados, top_obs)
+        if streaming and resumen:
+            resumen_txt += f" | Detalle={ruta_detalle}"
 
         try:
             SetVar("vLocStrResumenSP", resumen_txt)
+            if streaming:
+                SetVar("vLocStrRutaDetalleSP", ruta_detalle)
         except Exception:
             pass
 
@@ -649,6 +799,11 @@ async def ejecutar_HU4_ABCD_CamposObligatorios():
         return False, None
 
 
+# Registro para ejecutar_HU4_Orquestador (puede correr en otro espacio de nombres)
+import sys
+vars(sys).setdefault("_cxp_runners_hu4", {})["ejecutar_HU4_ABCD_CamposObligatorios"] = ejecutar_HU4_ABCD_CamposObligatorios
+
+
 # ==============================================================================
 # EJEMPLOS DE USO
 # ==============================================================================
@@ -731,4 +886,27 @@ EJEMPLO 4: Procesamiento del detalle
         
         print(f"NITs unicos: {len(por_nit)}")
         print(f"Rechazados: {len(rechazados)}")
+
+EJEMPLO 5: Detalle en streaming (lotes grandes)
+-----------------------------------------------
+    await generar_ruta_logs()   # deja vGblStrRutaLogs con la carpeta del dia
+    
+    SetVar("vLocDicConfig", {
+        "ServidorBaseDatos": "SQLPROD\\INSTANCIA",
+        "NombreBaseDatos": "CxP_Produccion",
+        "PlazoMaximo": 120,
+        "Lote": 50000,
+        "DetalleStreaming": True,
+        "FormatoDetalle": "ndjson",
+        "TamanoFetch": 2000
+    })
+    
+    ok, payload = await ejecutar_HU4_ABCD_CamposObligatorios()
+    
+    if ok:
+        ruta = GetVar("vLocStrRutaDetalleSP")
+        with open(ruta, encoding="utf-8") as f:
+            for linea in f:
+                registro = json.loads(linea)
+                # procesar registro sin cargar todo el detalle
 """
\ No newline at end of file
@@ -84,7 +84,9 @@ DIAGRAMA DE FLUJO
                                                    v
     +-------------------------------------------------------------+
     |  Procesar NITs:                                             |
-    |  - Limpiar espacios (strip)                                 |
+    |  - normalizar_nit(): sin espacios, puntos ni guiones        |
+    |    (misma regla que DocumentsProcessing.                    |
+    |     nit_emisor_normalizado)                                 |
     |  - Eliminar duplicados (set)                                |
     |  - Ordenar (sorted)                                         |
     |  - Unir con comas (join)                                    |
@@ -250,6 +252,7 @@ async def ejecutar_HU4_D_NITs():
     import asyncio
     import os
     import pyodbc
+    import sys
     import openpyxl
     import json
     import ast
@@ -277,6 +280,26 @@ async def ejecutar_HU4_D_NITs():
         except Exception:
             return default
 
+    def normalizar_nit(v):
+        """
+        Normaliza un NIT con la misma regla que la columna PERSISTED
+        [CxP].[DocumentsProcessing].nit_emisor_normalizado: sin espacios,
+        puntos ni guiones.
+        
+        Las celdas numericas de Excel llegan como float (900123456.0); se
+        convierten a entero antes, para que el ".0" no termine pegado al NIT
+        al quitar el punto.
+        
+        Example:
+            >>> normalizar_nit(" 900.123.456-7 ")
+            '9001234567'
+            >>> normalizar_nit(900123456.0)
+            '900123456'
+        """
+        if isinstance(v, float) and v.is_integer():
+            v = int(v)
+        return safe_str(v).strip().replace(" ", "").replace(".", "").replace("-", "")
+
     def reset_vars():
         """Inicializa variables de salida."""
         try:
@@ -439,11 +462,12 @@ async def ejecutar_HU4_D_NITs():
         nits = []
         for r in ws.iter_rows(min_row=2, max_col=1, values_only=True):
             if r and r[0]:
-                nit_txt = str(r[0]).strip()
+                nit_txt = normalizar_nit(r[0])
                 if nit_txt:
                     nits.append(nit_txt)
 
-        # Eliminar duplicados y ordenar
+        # Eliminar duplicados y ordenar (ya normalizados: "900.123.456" y
+        # "900123456" cuentan como un solo NIT, igual que en SQL)
         nits_unicos = sorted(set(nits))
         
         # Crear lista CSV para el SP
@@ -481,7 +505,8 @@ async def ejecutar_HU4_D_NITs():
                 timezone(timedelta(hours=tup[7], minutes=tup[8]))
             )
 
-        with pyodbc.connect(conn_str) as c:
+        pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+        with (pool_sql.conectar(conn_str) if pool_sql else pyodbc.connect(conn_str)) as c:
             c.autocommit = True
 
             # Registrar converter para DATETIMEOFFSET ANTES de ejecutar
@@ -560,6 +585,11 @@ async def ejecutar_HU4_D_NITs():
         return False, None
 
 
+# Registro para ejecutar_HU4_Orquestador (puede correr en otro espacio de nombres)
+import sys
+vars(sys).setdefault("_cxp_runners_hu4", {})["ejecutar_HU4_D_NITs"] = ejecutar_HU4_D_NITs
+
+
 # ==============================================================================
 # EJEMPLOS DE USO
 # ==============================================================================
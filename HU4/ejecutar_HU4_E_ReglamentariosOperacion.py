@@ -22,7 +22,7 @@ Stored Procedure:
     
     Parametros:
         @DiasMaximos INT - Dias maximos para filtrar
-        @BatchSize INT - Tamano del lote
+        @BatchSize INT - Tamano del lote (documentos por transaccion)
         @RangoMaxValor INT - Rango maximo de valor
         @TaxLevelCodes NVARCHAR - Codigos de nivel de impuesto (CSV)
         @InvoiceTypecodes NVARCHAR - Codigos de tipo de factura (CSV)
@@ -232,6 +232,7 @@ async def ejecutar_HU4_E_ReglamentariosOperacion():
     # ==========================================================================
     import asyncio
     import pyodbc
+    import sys
     import json
     import ast
     import traceback
@@ -378,12 +379,14 @@ async def ejecutar_HU4_E_ReglamentariosOperacion():
         Consume todas las filas del ResultSet actual.
         
         Necesario para evitar dejar el cursor en estado inconsistente
-        cuando hay multiples ResultSets.
+        cuando hay multiples ResultSets. Se descarta por paginas con
+        fetchmany para no materializar el ResultSet completo en memoria.
         """
         try:
             if not cur.description:
                 return
-            _ = cur.fetchall()
+            while cur.fetchmany(1000):
+                pass
         except Exception:
             return
 
@@ -509,7 +512,8 @@ async def ejecutar_HU4_E_ReglamentariosOperacion():
             "Trusted_Connection=yes;"
         )
 
-        with pyodbc.connect(conn_str) as c:
+        pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+        with (pool_sql.conectar(conn_str) if pool_sql else pyodbc.connect(conn_str)) as c:
             c.autocommit = True
             cur = c.cursor()
 
@@ -558,6 +562,11 @@ async def ejecutar_HU4_E_ReglamentariosOperacion():
         return False, None
 
 
+# Registro para ejecutar_HU4_Orquestador (puede correr en otro espacio de nombres)
+import sys
+vars(sys).setdefault("_cxp_runners_hu4", {})["ejecutar_HU4_E_ReglamentariosOperacion"] = ejecutar_HU4_E_ReglamentariosOperacion
+
+
 # ==============================================================================
 # EJEMPLOS DE USO
 # ==============================================================================
@@ -142,7 +142,8 @@ Variables de Salida (SetVar):
         "Estado=OK | SP=CxP.HU4_FG_OrdenDeCompra | FechaEjecucion=2025-01-15 |
          DiasMaximos=120 | BatchSize=500 | Procesados=1500 | RetomaSetDesdeNull=50 |
          ExcluidosImportaciones=100 | ExcluidosCostoIndirectoFletes=25 |
-         ComparativaObsActualizadas=1400 | ComparativaEstadosActualizados=1350"
+         ComparativaObsActualizadas=1400 | ComparativaEstadosActualizados=1350 |
+         Lotes=3 | MsPreparacion=80 | MsLotes=2100 | MsLoteMax=900"
          
     vGblStrMensajeError : str
         Mensaje de error (vacio si exito).
@@ -229,6 +230,7 @@ async def ejecutar_HU4_FG_OrdenDeCompra():
     # ==========================================================================
     import asyncio
     import pyodbc
+    import sys
     import json
     import ast
     import traceback
@@ -339,10 +341,11 @@ async def ejecutar_HU4_FG_OrdenDeCompra():
             return None
 
     def consume_all_rows(cur):
-        """Consume todas las filas del ResultSet actual."""
+        """Consume todas las filas del ResultSet actual (por paginas, sin retenerlas)."""
         try:
             if cur.description:
-                _ = cur.fetchall()
+                while cur.fetchmany(1000):
+                    pass
         except Exception:
             pass
 
@@ -379,6 +382,10 @@ async def ejecutar_HU4_FG_OrdenDeCompra():
         fletes = safe_str(rs1.get("ExcluidosCostoIndirectoFletes", "0"))
         obs = safe_str(rs1.get("ComparativaObservacionesActualizadas", "0"))
         est = safe_str(rs1.get("ComparativaEstadosActualizados", "0"))
+        lotes = safe_str(rs1.get("LotesProcesados", "0"))
+        ms_prep = safe_str(rs1.get("MsPreparacionTrabajo", "0"))
+        ms_lotes = safe_str(rs1.get("MsTotalLotes", "0"))
+        ms_max = safe_str(rs1.get("MsLoteMaximo", "0"))
 
         # Estado siempre OK (incluso si procesados=0)
         estado = "OK"
@@ -395,6 +402,10 @@ async def ejecutar_HU4_FG_OrdenDeCompra():
             + " | ExcluidosCostoIndirectoFletes=" + fletes
             + " | ComparativaObsActualizadas=" + obs
             + " | ComparativaEstadosActualizados=" + est
+            + " | Lotes=" + lotes
+            + " | MsPreparacion=" + ms_prep
+            + " | MsLotes=" + ms_lotes
+            + " | MsLoteMax=" + ms_max
         )
 
     # ==========================================================================
@@ -438,7 +449,8 @@ async def ejecutar_HU4_FG_OrdenDeCompra():
             "Trusted_Connection=yes;"
         )
 
-        with pyodbc.connect(conn_str) as c:
+        pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+        with (pool_sql.conectar(conn_str) if pool_sql else pyodbc.connect(conn_str)) as c:
             c.autocommit = True
             cur = c.cursor()
 
@@ -486,6 +498,11 @@ async def ejecutar_HU4_FG_OrdenDeCompra():
         return False, None
 
 
+# Registro para ejecutar_HU4_Orquestador (puede correr en otro espacio de nombres)
+import sys
+vars(sys).setdefault("_cxp_runners_hu4", {})["ejecutar_HU4_FG_OrdenDeCompra"] = ejecutar_HU4_FG_OrdenDeCompra
+
+
 # ==============================================================================
 # EJEMPLOS DE USO
 # ==============================================================================
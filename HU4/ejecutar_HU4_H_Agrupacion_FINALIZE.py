@@ -41,6 +41,7 @@ DIAGRAMA DE FLUJO
     |  Parsear configuracion:                                     |
     |  - ServidorBaseDatos, NombreBaseDatos                       |
     |  - DiasMaximos, BatchSize, executionNum                     |
+    |  - FinalizeChunkSize (default 500, 0 = un solo EXEC)        |
     +-----------------------------+-------------------------------+
                                   |
                                   v
@@ -68,12 +69,10 @@ DIAGRAMA DE FLUJO
     +------------------------+                    |
                                                   v
     +-------------------------------------------------------------+
+    |  Por cada chunk de FinalizeChunkSize resultados:            |
     |  EXEC [CxP].[HU4_H_Agrupacion] @Modo='FINALIZE'...          |
-    +-----------------------------+-------------------------------+
-                                  |
-                                  v
-    +-------------------------------------------------------------+
-    |  ResultSet 1: RESUMEN (OK, FAIL)                            |
+    |  (mismo BatchId, una transaccion por EXEC)                  |
+    |  ResultSet 1: RESUMEN (OK, FAIL, Aplicados)                 |
     +-----------------------------+-------------------------------+
                                   |
                                   v
@@ -95,7 +94,16 @@ Variables de Entrada (GetVar):
         GUID del batch generado en la fase QUEUE.
         
     vLocJsonResultadosFileOpsPuntoH : str (JSON)
-        Resultados del movimiento de archivos.
+        Resultados del movimiento de archivos. Se ignora si la funcion
+        recibe el parametro resultados.
+
+Configuracion adicional (vLocDicConfig):
+----------------------------------------
+    FinalizeChunkSize : int (default 500)
+        Registros por EXEC de FINALIZE. Evita JSON gigantes y bloqueos
+        largos en lotes grandes; 0 envia todo en un solo EXEC. El SP aplica
+        cada chunk de forma idempotente (solo filas PENDIENTE), por lo que
+        reintentar tras un fallo parcial no duplica observaciones.
 
 Variables de Salida (SetVar):
 -----------------------------
@@ -108,12 +116,17 @@ Variables de Salida (SetVar):
 """
 
 
-async def ejecutar_HU4_H_Agrupacion_FINALIZE():
+async def ejecutar_HU4_H_Agrupacion_FINALIZE(resultados=None):
     """
     Ejecuta [CxP].[HU4_H_Agrupacion] en modo FINALIZE.
     
     Fase final del proceso de dos fases. Reporta los resultados del
-    movimiento de archivos al SP para actualizar estados en BD.
+    movimiento de archivos al SP para actualizar estados en BD, en chunks
+    de FinalizeChunkSize registros con el mismo BatchId.
+    
+    Args:
+        resultados (list|str|None): Resultados a reportar. Si es None se
+            leen de vLocJsonResultadosFileOpsPuntoH.
     
     Returns:
         tuple: (bool, str|None)
@@ -130,10 +143,11 @@ async def ejecutar_HU4_H_Agrupacion_FINALIZE():
         
         if ok:
             print(f"FINALIZE exitoso: {resumen}")
-            # Punto H FINALIZE OK | BatchId=A1B2C3D4-... | OK=145 | FAIL=5
+            # Punto H FINALIZE OK | BatchId=A1B2C3D4-... | Chunks=1 | Aplicados=150 | OK=145 | FAIL=5
     """
     import asyncio
     import pyodbc
+    import sys
     import json
     import ast
     import traceback
@@ -189,6 +203,25 @@ async def ejecutar_HU4_H_Agrupacion_FINALIZE():
         )
         return m.group(1) if m else ""
 
+    def parse_resultados(raw):
+        """Convierte los resultados (lista o JSON) en lista de dicts."""
+        if isinstance(raw, list):
+            return raw
+        t = safe_str(raw).strip()
+        if not t or t in ("[]", "null", "None"):
+            return []
+        try:
+            data = json.loads(t)
+        except Exception:
+            data = ast.literal_eval(t)
+        return data if isinstance(data, list) else [data]
+
+    def partir_en_chunks(items, tamano):
+        """Divide la lista en chunks; siempre retorna al menos uno."""
+        if tamano <= 0 or len(items) <= tamano:
+            return [items]
+        return [items[i:i + tamano] for i in range(0, len(items), tamano)]
+
     def set_error(user_msg, exc=None):
         """Establece variables de error."""
         try:
@@ -209,6 +242,7 @@ async def ejecutar_HU4_H_Agrupacion_FINALIZE():
 
         dias_max = int(cfg.get("DiasMaximos", cfg.get("PlazoMaximo", 120)))
         batch_size = int(cfg.get("BatchSize", cfg.get("Lote", 500)))
+        chunk_size = int(cfg.get("FinalizeChunkSize", 500) or 0)
 
         exec_num = cfg.get("executionNum")
         try:
@@ -224,19 +258,30 @@ async def ejecutar_HU4_H_Agrupacion_FINALIZE():
     # OBTENER BATCH ID Y RESULTADOS
     # ==========================================================================
     batch_id = normalize_guid_text(GetVar("vLocStrBatchIdPuntoH"))
-    resultados_json = safe_str(GetVar("vLocJsonResultadosFileOpsPuntoH")).strip()
-    if not resultados_json:
-        resultados_json = "[]"
 
     if not batch_id:
         set_error("ERROR Punto H FINALIZE | BatchId vacio o invalido (vLocStrBatchIdPuntoH).")
         return False, None
 
+    try:
+        if resultados is None:
+            resultados = GetVar("vLocJsonResultadosFileOpsPuntoH")
+        chunks = partir_en_chunks(parse_resultados(resultados), chunk_size)
+    except Exception as e:
+        set_error("ERROR Punto H FINALIZE | Resultados JSON invalidos.", e)
+        return False, None
+
     # ==========================================================================
     # EJECUCION SP
     # ==========================================================================
     def run_finalize_sync():
-        """Ejecuta SP FINALIZE de forma sincrona."""
+        """
+        Ejecuta SP FINALIZE de forma sincrona, un EXEC por chunk.
+        
+        Cada EXEC corre en su propia transaccion del SP. Si un chunk falla,
+        los anteriores quedan aplicados y reintentar el FINALIZE completo es
+        seguro: el SP ignora los registros que ya no estan PENDIENTE.
+        """
         conn_str = (
             "DRIVER={ODBC Driver 17 for SQL Server};"
             f"SERVER={servidor};"
@@ -244,28 +289,48 @@ async def ejecutar_HU4_H_Agrupacion_FINALIZE():
             "Trusted_Connection=yes;"
         )
 
-        with pyodbc.connect(conn_str) as conn:
+        rs1 = None
+        aplicados = 0
+
+        pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+        with (pool_sql.conectar(conn_str) if pool_sql else pyodbc.connect(conn_str)) as conn:
             conn.autocommit = True
             cur = conn.cursor()
 
-            cur.execute(
-                "EXEC [CxP].[HU4_H_Agrupacion] "
-                "@Modo=?, @executionNum=?, @BatchId=?, @DiasMaximos=?, "
-                "@UseBogotaTime=?, @BatchSize=?, @ResultadosJson=?;",
-                "FINALIZE", exec_num, batch_id, dias_max, 0, batch_size, resultados_json
-            )
-
-            rs1 = None
-            if cur.description:
-                row = cur.fetchone()
-                if row:
-                    cols = [c[0] for c in cur.description]
-                    rs1 = {cols[i]: row[i] for i in range(len(cols))}
-
+            for idx, chunk in enumerate(chunks, start=1):
+                try:
+                    cur.execute(
+                        "EXEC [CxP].[HU4_H_Agrupacion] "
+                        "@Modo=?, @executionNum=?, @BatchId=?, @DiasMaximos=?, "
+                        "@UseBogotaTime=?, @BatchSize=?, @ResultadosJson=?;",
+                        "FINALIZE", exec_num, batch_id, dias_max, 0, batch_size,
+                        json.dumps(chunk, ensure_ascii=False, default=str)
+                    )
+                except Exception as e:
+                    raise RuntimeError(
+                        f"Chunk {idx}/{len(chunks)} fallo (aplicados previos={aplicados}): {e}"
+                    ) from e
+
+                if cur.description:
+                    row = cur.fetchone()
+                    if row:
+                        cols = [c[0] for c in cur.description]
+                        rs1 = {cols[i]: row[i] for i in range(len(cols))}
+                        try:
+                            aplicados += int(rs1.get("Aplicados") or 0)
+                        except Exception:
+                            pass
+
+                print(f"[DEBUG] Punto H FINALIZE chunk {idx}/{len(chunks)} | registros={len(chunk)}")
+
+            # OK/FAIL del ultimo chunk son totales del lote completo
             ok_cnt = safe_str(rs1.get("OK") if rs1 else "")
             fail_cnt = safe_str(rs1.get("FAIL") if rs1 else "")
 
-            resumen = f"Punto H FINALIZE OK | BatchId={batch_id} | OK={ok_cnt or '0'} | FAIL={fail_cnt or '0'}"
+            resumen = (
+                f"Punto H FINALIZE OK | BatchId={batch_id} | Chunks={len(chunks)} | "
+                f"Aplicados={aplicados} | OK={ok_cnt or '0'} | FAIL={fail_cnt or '0'}"
+            )
             return True, resumen
 
     # ==========================================================================
@@ -288,6 +353,11 @@ async def ejecutar_HU4_H_Agrupacion_FINALIZE():
         return False, None
 
 
+# Registro para ejecutar_HU4_PuntosHI_Pipeline (puede correr en otro espacio de nombres)
+import sys
+vars(sys).setdefault("_cxp_runners_hu4", {})["ejecutar_HU4_H_Agrupacion_FINALIZE"] = ejecutar_HU4_H_Agrupacion_FINALIZE
+
+
 # ==============================================================================
 # EJEMPLOS DE USO
 # ==============================================================================
@@ -316,7 +386,12 @@ EJEMPLO 2: FINALIZE manual con resultados propios
     SetVar("vLocJsonResultadosFileOpsPuntoH", json.dumps(resultados))
     ok, resumen = await ejecutar_HU4_H_Agrupacion_FINALIZE()
 
-EJEMPLO 3: Error por BatchId faltante
+EJEMPLO 3: Reporte directo de un chunk (sin pasar por SetVar)
+--------------------------------------------------------------
+    # Reenviar el mismo chunk es seguro: el SP solo aplica filas PENDIENTE
+    ok, resumen = await ejecutar_HU4_H_Agrupacion_FINALIZE(resultados[:500])
+
+EJEMPLO 4: Error por BatchId faltante
 -------------------------------------
     SetVar("vLocStrBatchIdPuntoH", "")
     ok, resumen = await ejecutar_HU4_H_Agrupacion_FINALIZE()
@@ -29,6 +29,7 @@ Stored Procedure:
         @Modo = 'FINALIZE'
         @BatchId UNIQUEIDENTIFIER - BatchId del QUEUE (REQUERIDO si hay datos)
         @ResultadosJson NVARCHAR(MAX) - JSON con resultados
+        @CerrarLote BIT - 1 solo en el ultimo chunk del lote
 
 ================================================================================
 DIAGRAMA DE FLUJO
@@ -58,6 +59,7 @@ DIAGRAMA DE FLUJO
     +------------------------+                    v
     +-------------------------------------------------------------+
     |  Parsear configuracion y obtener BatchId                    |
+    |  - FinalizeChunkSize (default 500, 0 = un solo EXEC)        |
     +-----------------------------+-------------------------------+
                                   |
                   +---------------+---------------+
@@ -68,11 +70,14 @@ DIAGRAMA DE FLUJO
                          v                v
     +------------------------+   +--------------------------------+
     |  set_error()           |   |  Ejecutar SP @Modo='FINALIZE'  |
-    |  return False, None    |   +----------------+---------------+
-    +------------------------+                    |
+    |  return False, None    |   |  una vez por chunk (mismo      |
+    +------------------------+   |  BatchId, @CerrarLote=1 solo   |
+                                 |  en el ultimo chunk)           |
+                                 +----------------+---------------+
+                                                  |
                                                   v
     +-------------------------------------------------------------+
-    |  ResultSet 1: RESUMEN (OK, FAIL, IDsFinalizados)            |
+    |  ResultSet 1: RESUMEN (OK, FAIL, IDsFinalizados, Aplicados) |
     +-----------------------------+-------------------------------+
                                   |
                                   v
@@ -97,7 +102,16 @@ Variables de Entrada (GetVar):
         Lista de operaciones del QUEUE. Se usa para detectar si hay datos.
         
     vLocJsonResultadosFileOpsPuntoI : str (JSON)
-        Resultados de la copia de archivos.
+        Resultados de la copia de archivos. Se ignora si la funcion
+        recibe el parametro resultados.
+
+Configuracion adicional (vLocDicConfig):
+----------------------------------------
+    FinalizeChunkSize : int (default 500)
+        Registros por EXEC de FINALIZE. Evita JSON gigantes y bloqueos
+        largos en lotes grandes; 0 envia todo en un solo EXEC. El SP aplica
+        cada chunk de forma idempotente (solo filas PENDIENTE), por lo que
+        reintentar tras un fallo parcial no duplica observaciones.
 
 Variables de Salida (SetVar):
 -----------------------------
@@ -123,15 +137,23 @@ Esto permite que el flujo continue sin errores cuando no hay trabajo.
 """
 
 
-async def ejecutar_HU4_I_NumLiquidacion_50_FINALIZE():
+async def ejecutar_HU4_I_NumLiquidacion_50_FINALIZE(resultados=None, cerrar_lote=True):
     """
     Ejecuta [CxP].[HU4_I_NumLiquidacion_50] en modo FINALIZE.
     
     Fase final del proceso de dos fases para Punto I. Reporta los resultados
-    de la copia de archivos al SP para actualizar estados en BD.
+    de la copia de archivos al SP para actualizar estados en BD, en chunks
+    de FinalizeChunkSize registros con el mismo BatchId.
     
     NOTA: Si el QUEUE no devolvio candidatos, retorna exito sin ejecutar SP.
     
+    Args:
+        resultados (list|str|None): Resultados a reportar. Si es None se
+            leen de vLocJsonResultadosFileOpsPuntoI.
+        cerrar_lote (bool): Si True, el ultimo chunk cierra como FAIL los
+            registros del lote que siguen sin resultado. Usar False cuando
+            quedan resultados por reportar en llamadas posteriores.
+    
     Returns:
         tuple: (bool, str|None)
             - bool: True si exito, False si error
@@ -140,7 +162,7 @@ async def ejecutar_HU4_I_NumLiquidacion_50_FINALIZE():
     Example:
         # Caso con datos
         ok, resumen = await ejecutar_HU4_I_NumLiquidacion_50_FINALIZE()
-        # "Punto I FINALIZE OK | BatchId=... | IDsFinalizados=75 | OK=70 | FAIL=5"
+        # "Punto I FINALIZE OK | BatchId=... | Chunks=1 | Aplicados=75 | IDsFinalizados=75 | OK=70 | FAIL=5"
         
         # Caso sin datos (QUEUE vacio)
         ok, resumen = await ejecutar_HU4_I_NumLiquidacion_50_FINALIZE()
@@ -148,6 +170,7 @@ async def ejecutar_HU4_I_NumLiquidacion_50_FINALIZE():
     """
     import asyncio
     import pyodbc
+    import sys
     import json
     import ast
     import traceback
@@ -200,6 +223,25 @@ async def ejecutar_HU4_I_NumLiquidacion_50_FINALIZE():
         )
         return m.group(1) if m else ""
 
+    def parse_resultados(raw):
+        """Convierte los resultados (lista o JSON) en lista de dicts."""
+        if isinstance(raw, list):
+            return raw
+        t = safe_str(raw).strip()
+        if not t or t in ("[]", "null", "None"):
+            return []
+        try:
+            data = json.loads(t)
+        except Exception:
+            data = ast.literal_eval(t)
+        return data if isinstance(data, list) else [data]
+
+    def partir_en_chunks(items, tamano):
+        """Divide la lista en chunks; siempre retorna al menos uno."""
+        if tamano <= 0 or len(items) <= tamano:
+            return [items]
+        return [items[i:i + tamano] for i in range(0, len(items), tamano)]
+
     def set_error(user_msg, exc=None):
         """Establece variables de error."""
         try:
@@ -213,11 +255,12 @@ async def ejecutar_HU4_I_NumLiquidacion_50_FINALIZE():
     # ==========================================================================
     # VERIFICAR SI QUEUE DEVOLVIO CANDIDATOS
     # ==========================================================================
+    # Si los resultados llegan por parametro, el llamador ya tiene datos del QUEUE.
     try:
         raw_queue = safe_str(GetVar("vLocJsonFileOpsPuntoI")).strip()
-        hay_queue = False
+        hay_queue = resultados is not None
         
-        if raw_queue and raw_queue not in ("[]", "null", "None"):
+        if not hay_queue and raw_queue and raw_queue not in ("[]", "null", "None"):
             try:
                 arr = json.loads(raw_queue)
                 hay_queue = isinstance(arr, list) and len(arr) > 0
@@ -244,6 +287,7 @@ async def ejecutar_HU4_I_NumLiquidacion_50_FINALIZE():
 
         dias_max = int(cfg.get("DiasMaximos", cfg.get("PlazoMaximo", 120)))
         batch_size = int(cfg.get("BatchSize", cfg.get("Lote", 500)))
+        chunk_size = int(cfg.get("FinalizeChunkSize", 500) or 0)
 
         exec_num = cfg.get("executionNum")
         try:
@@ -259,17 +303,31 @@ async def ejecutar_HU4_I_NumLiquidacion_50_FINALIZE():
     # OBTENER BATCH ID Y RESULTADOS
     # ==========================================================================
     batch_id = normalize_guid_text(GetVar("vLocStrBatchIdPuntoI"))
-    resultados_json = safe_str(GetVar("vLocJsonResultadosFileOpsPuntoI")).strip() or "[]"
 
     if not batch_id:
         set_error("ERROR Punto I FINALIZE | BatchId vacio o invalido (vLocStrBatchIdPuntoI).")
         return False, None
 
+    try:
+        if resultados is None:
+            resultados = GetVar("vLocJsonResultadosFileOpsPuntoI")
+        chunks = partir_en_chunks(parse_resultados(resultados), chunk_size)
+    except Exception as e:
+        set_error("ERROR Punto I FINALIZE | Resultados JSON invalidos.", e)
+        return False, None
+
     # ==========================================================================
     # EJECUCION SP
     # ==========================================================================
     def run_finalize_sync():
-        """Ejecuta SP FINALIZE de forma sincrona."""
+        """
+        Ejecuta SP FINALIZE de forma sincrona, un EXEC por chunk.
+        
+        Cada EXEC corre en su propia transaccion del SP. Si un chunk falla,
+        los anteriores quedan aplicados y el lote NO se cierra; reintentar el
+        FINALIZE completo es seguro porque el SP ignora los registros que ya
+        no estan PENDIENTE.
+        """
         conn_str = (
             "DRIVER={ODBC Driver 17 for SQL Server};"
             f"SERVER={servidor};"
@@ -277,30 +335,49 @@ async def ejecutar_HU4_I_NumLiquidacion_50_FINALIZE():
             "Trusted_Connection=yes;"
         )
 
-        with pyodbc.connect(conn_str, unicode_results=False) as conn:
+        rs1 = None
+        aplicados = 0
+
+        pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+        with (pool_sql.conectar(conn_str, unicode_results=False) if pool_sql else pyodbc.connect(conn_str, unicode_results=False)) as conn:
             conn.autocommit = True
             cur = conn.cursor()
 
-            cur.execute(
-                "EXEC [CxP].[HU4_I_NumLiquidacion_50] "
-                "@executionNum=?, @DiasMaximos=?, @UseBogotaTime=?, @BatchSize=?, "
-                "@Modo=?, @BatchId=?, @ResultadosJson=?;",
-                exec_num, dias_max, 0, batch_size, "FINALIZE", batch_id, resultados_json
-            )
-
-            rs1 = None
-            if cur.description:
-                row = cur.fetchone()
-                if row:
-                    cols = [safe_str(c[0]) for c in cur.description]
-                    rs1 = {cols[i]: row[i] for i in range(len(cols))}
-
+            for idx, chunk in enumerate(chunks, start=1):
+                cerrar = 1 if (cerrar_lote and idx == len(chunks)) else 0
+                try:
+                    cur.execute(
+                        "EXEC [CxP].[HU4_I_NumLiquidacion_50] "
+                        "@executionNum=?, @DiasMaximos=?, @UseBogotaTime=?, @BatchSize=?, "
+                        "@Modo=?, @BatchId=?, @ResultadosJson=?, @CerrarLote=?;",
+                        exec_num, dias_max, 0, batch_size, "FINALIZE", batch_id,
+                        json.dumps(chunk, ensure_ascii=False, default=str), cerrar
+                    )
+                except Exception as e:
+                    raise RuntimeError(
+                        f"Chunk {idx}/{len(chunks)} fallo (aplicados previos={aplicados}): {e}"
+                    ) from e
+
+                if cur.description:
+                    row = cur.fetchone()
+                    if row:
+                        cols = [safe_str(c[0]) for c in cur.description]
+                        rs1 = {cols[i]: row[i] for i in range(len(cols))}
+                        try:
+                            aplicados += int(rs1.get("Aplicados") or 0)
+                        except Exception:
+                            pass
+
+                print(f"[DEBUG] Punto I FINALIZE chunk {idx}/{len(chunks)} | registros={len(chunk)} | cerrar={cerrar}")
+
+            # IDsFinalizados/OK/FAIL del ultimo chunk son totales del lote completo
             ok_cnt = safe_str(rs1.get("OK") if rs1 else "")
             fail_cnt = safe_str(rs1.get("FAIL") if rs1 else "")
             ids_fin = safe_str(rs1.get("IDsFinalizados") if rs1 else "")
 
             resumen = (
                 f"Punto I FINALIZE OK | BatchId={batch_id} | "
+                f"Chunks={len(chunks)} | Aplicados={aplicados} | "
                 f"IDsFinalizados={ids_fin or '0'} | "
                 f"OK={ok_cnt or '0'} | FAIL={fail_cnt or '0'}"
             )
@@ -322,6 +399,11 @@ async def ejecutar_HU4_I_NumLiquidacion_50_FINALIZE():
         return False, None
 
 
+# Registro para ejecutar_HU4_PuntosHI_Pipeline (puede correr en otro espacio de nombres)
+import sys
+vars(sys).setdefault("_cxp_runners_hu4", {})["ejecutar_HU4_I_NumLiquidacion_50_FINALIZE"] = ejecutar_HU4_I_NumLiquidacion_50_FINALIZE
+
+
 # ==============================================================================
 # EJEMPLOS DE USO
 # ==============================================================================
@@ -338,7 +420,13 @@ EJEMPLO 1: Flujo completo QUEUE -> COPY -> FINALIZE
     ok, resumen = await ejecutar_HU4_I_NumLiquidacion_50_FINALIZE()
     print(f"Resultado: {resumen}")
 
-EJEMPLO 2: QUEUE sin candidatos (comportamiento especial)
+EJEMPLO 2: Reporte incremental por chunks (mismo BatchId)
+---------------------------------------------------------
+    # Chunks intermedios sin cerrar el lote; el ultimo lo cierra
+    await ejecutar_HU4_I_NumLiquidacion_50_FINALIZE(parte_1, cerrar_lote=False)
+    await ejecutar_HU4_I_NumLiquidacion_50_FINALIZE(parte_2, cerrar_lote=True)
+
+EJEMPLO 3: QUEUE sin candidatos (comportamiento especial)
 ---------------------------------------------------------
     # Si QUEUE no devolvio nada
     # vLocJsonFileOpsPuntoI = "[]"
@@ -348,7 +436,7 @@ EJEMPLO 2: QUEUE sin candidatos (comportamiento especial)
     # resumen = "Punto I FINALIZE | Sin candidatos en QUEUE..."
     # El SP NO se ejecuta
 
-EJEMPLO 3: Error por BatchId faltante
+EJEMPLO 4: Error por BatchId faltante
 -------------------------------------
     # Si hay datos pero no BatchId
     SetVar("vLocJsonFileOpsPuntoI", '[{"ID_registro": "123"}]')
@@ -123,13 +123,21 @@ DIFERENCIAS CON PUNTO H
 """
 
 
-async def ejecutar_HU4_I_NumLiquidacion_50_QUEUE():
+async def ejecutar_HU4_I_NumLiquidacion_50_QUEUE(al_recibir_pagina=None, tamano_pagina=500):
     """
     Ejecuta [CxP].[HU4_I_NumLiquidacion_50] en modo QUEUE.
     
     Fase inicial del proceso de dos fases para Punto I. Obtiene la lista
     de IDs candidatos y genera un BatchId unico para seguimiento.
     
+    Args:
+        al_recibir_pagina (callable|None): Si se indica, se invoca (desde el
+            hilo del executor) con cada pagina de filas apenas se lee, para
+            que un driver en pipeline empiece las operaciones de archivo sin
+            esperar la lista completa. El BatchId se publica con SetVar al
+            leer la primera pagina.
+        tamano_pagina (int): Filas por fetchmany (default 500).
+    
     Returns:
         tuple: (bool, list|None)
             - bool: True si exito, False si error
@@ -152,6 +160,7 @@ async def ejecutar_HU4_I_NumLiquidacion_50_QUEUE():
     """
     import asyncio
     import pyodbc
+    import sys
     import json
     import ast
     import traceback
@@ -296,7 +305,8 @@ async def ejecutar_HU4_I_NumLiquidacion_50_QUEUE():
         filas = []
         batch_id = ""
 
-        with pyodbc.connect(conn_str, unicode_results=False) as conn:
+        pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+        with (pool_sql.conectar(conn_str, unicode_results=False) if pool_sql else pyodbc.connect(conn_str, unicode_results=False)) as conn:
             conn.autocommit = True
             cur = conn.cursor()
 
@@ -312,21 +322,32 @@ async def ejecutar_HU4_I_NumLiquidacion_50_QUEUE():
                     cols = [safe_str(c[0]) for c in cur.description]
                     cols_lower = [safe_str(c[0]).lower() for c in cur.description]
                     
-                    try:
-                        rows = cur.fetchall()
-                    except Exception:
-                        rows = []
+                    # Lectura por paginas: con al_recibir_pagina cada pagina se
+                    # entrega apenas llega, sin esperar el ResultSet completo
+                    while True:
+                        try:
+                            rows = cur.fetchmany(tamano_pagina)
+                        except Exception:
+                            rows = []
+                        if not rows:
+                            break
 
-                    if rows:
                         if (not batch_id) and ("batchid" in cols_lower):
                             idx = cols_lower.index("batchid")
                             batch_id = normalize_guid_text(rows[0][idx])
+                            if al_recibir_pagina is not None and batch_id:
+                                SetVar("vLocStrBatchIdPuntoI", batch_id)
 
+                        pagina = []
                         for r in rows:
                             d = {}
                             for i, name in enumerate(cols):
                                 d[safe_str(name)] = safe_str(r[i])
-                            filas.append(d)
+                            pagina.append(d)
+                        filas.extend(pagina)
+
+                        if al_recibir_pagina is not None:
+                            al_recibir_pagina(pagina)
 
                 if not cur.nextset():
                     break
@@ -366,6 +387,11 @@ async def ejecutar_HU4_I_NumLiquidacion_50_QUEUE():
         return False, None
 
 
+# Registro para ejecutar_HU4_PuntosHI_Pipeline (puede correr en otro espacio de nombres)
+import sys
+vars(sys).setdefault("_cxp_runners_hu4", {})["ejecutar_HU4_I_NumLiquidacion_50_QUEUE"] = ejecutar_HU4_I_NumLiquidacion_50_QUEUE
+
+
 # ==============================================================================
 # EJEMPLOS DE USO
 # ==============================================================================
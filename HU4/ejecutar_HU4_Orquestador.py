@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+================================================================================
+MODULO: ejecutar_HU4_Orquestador.py
+================================================================================
+
+Descripcion General:
+--------------------
+    Orquestador de los runners del proceso HU4. Declara las dependencias
+    entre puntos como un grafo dirigido (DAG) y ejecuta concurrentemente,
+    con asyncio, los pasos cuyas dependencias ya terminaron OK. Solo corren
+    en paralelo pasos cuyos conjuntos de filas no se solapan.
+
+    Cada runner abre su propia conexion pyodbc dentro de run_in_executor,
+    por lo que los pasos paralelos usan conexiones separadas sin cambios
+    en los runners.
+
+    Cada script de runner se registra en sys._cxp_runners_hu4 al cargarse
+    (igual que el pool de conexiones), asi que el orquestador puede correr
+    en otro espacio de nombres de RocketBot.
+
+Autor: Diego Ivan Lopez Ochoa
+Version: 1.0.0
+
+================================================================================
+GRAFO DE DEPENDENCIAS (DEFAULT)
+================================================================================
+
+                    +----------+
+                    |   ABCD   |  Campos obligatorios
+                    +----+-----+
+                         |
+                         v
+                    +---------+
+                    |    D    |  NITs (RECHAZADO -> CON NOVEDAD)
+                    +----+----+
+                         |
+                         v
+                    +---------+
+                    |    E    |  Campos reglamentarios
+                    +----+----+
+                         |
+                         v
+                    +---------+
+                    |   FG    |  Orden de compra (EXCLUIDO ...)
+                    +----+----+
+                         |
+                         v
+                    +---------+
+                    |    H    |  Agrupacion (pipeline QUEUE/MOVER/FINALIZE)
+                    +----+----+
+                         |
+                         v
+                    +---------+
+                    |    I    |  NumLiquidacion 50 (pipeline QUEUE/COPIAR/FINALIZE)
+                    +---------+
+
+    D, E y FG NO son independientes: los tres leen y escriben
+    DocumentsProcessing.ResultadoFinalAntesEventos sobre los mismos documentos.
+        - D pasa RECHAZADO / RECHAZADO - PENDIENTE a CON NOVEDAD.
+        - E (@EstadosOmitir por defecto) y FG (#EstadosOmitir) omiten los
+          RECHAZADO, por lo que su conjunto de candidatos cambia segun D haya
+          confirmado o no.
+        - FG marca EXCLUIDO IMPORTACIONES / EXCLUIDO COSTO INDIRECTO FLETES
+          sobre documentos que E puede estar actualizando, y E no omite
+          esos estados.
+    Por eso el grafo por defecto los encadena en el orden del proceso
+    (D -> E -> FG): ejecutarlos en paralelo da resultados que dependen del
+    orden de los commits y genera bloqueos entre los SP. Ningun par de pasos
+    del grafo por defecto tiene conjuntos de filas disjuntos, asi que no se
+    paraleliza ninguno; el paralelismo se obtiene dentro de H e I (pipeline)
+    y, si una instalacion garantiza estados disjuntos, declarandolo con
+    HU4Dependencias.
+
+    H e I actualizan las observaciones finales de los documentos ya validados,
+    por eso esperan a FG (y con ello a D y E). El grafo puede reemplazarse con
+    la clave de configuracion HU4Dependencias.
+
+================================================================================
+POLITICAS DE FALLO (HU4PoliticaFallo)
+================================================================================
+
+    fail-fast (default):
+        Ante el primer paso fallido no se inicia ningun paso nuevo. Los pasos
+        que ya estan corriendo terminan (un SP en curso no se interrumpe) y
+        los pendientes quedan OMITIDO.
+
+    continuar:
+        Los pasos independientes siguen ejecutandose. Solo se omiten los
+        pasos que dependen (directa o indirectamente) de un paso fallido.
+
+================================================================================
+VARIABLES DE ENTRADA/SALIDA
+================================================================================
+
+Variables de Entrada (GetVar):
+------------------------------
+    vLocDicConfig : dict o str
+        Configuracion comun de los runners, mas:
+        - HU4PoliticaFallo : "fail-fast" | "continuar"
+        - HU4MaxParalelo   : int (default 4) pasos simultaneos
+        - HU4Pasos         : lista de pasos a ejecutar (default: todos)
+        - HU4Dependencias  : dict {paso: [dependencias]} (opcional)
+
+Variables de Salida (SetVar):
+-----------------------------
+    vLocDicResumenHU4 : str (JSON)
+        Detalle por paso: Estado, Segundos, Inicio, Fin, Resumen, Error.
+    vLocStrResultadoSP : bool - True si todos los pasos terminaron OK.
+    vLocStrResumenSP : str - Resumen combinado.
+    vGblStrMensajeError : str - Pasos fallidos (si hay).
+
+    NOTA: los runners escriben vLocStrResultadoSP / vLocStrResumenSP al
+    terminar; con pasos concurrentes esas variables se pisan entre si. El
+    orquestador usa el valor de retorno de cada runner y escribe las
+    variables finales al terminar todos los pasos.
+
+================================================================================
+"""
+
+
+async def ejecutar_HU4_Orquestador():
+    """
+    Ejecuta los runners HU4 respetando dependencias y en paralelo cuando es posible.
+
+    Returns:
+        tuple: (bool, dict|None)
+            - bool: True si todos los pasos ejecutados terminaron OK
+            - dict: Detalle por paso (incluye "Retorno" con el valor original
+              del runner), o None si error de configuracion
+
+    Example:
+        SetVar("vLocDicConfig", {
+            "ServidorBaseDatos": "SQLPROD\\CXP",
+            "NombreBaseDatos": "CuentasPorPagar",
+            "HU4PoliticaFallo": "continuar",
+            "HU4MaxParalelo": 3
+        })
+        ok, detalle = await ejecutar_HU4_Orquestador()
+        # "HU4 ORQUESTADOR OK | Politica=continuar | Segundos=120.60 |
+        #  ABCD=OK(20.1s) | D=OK(31.0s) | E=OK(12.4s) | FG=OK(25.7s) | ..."
+    """
+    import asyncio
+    import ast
+    import json
+    import sys
+    import time
+    import traceback
+    import unicodedata
+    from datetime import datetime
+
+    # Paso -> (funcion, argumentos, dependencias)
+    PASOS = {
+        "ABCD": ("ejecutar_HU4_ABCD_CamposObligatorios", (), []),
+        "D": ("ejecutar_HU4_D_NITs", (), ["ABCD"]),
+        # D, E y FG escriben ResultadoFinalAntesEventos sobre los mismos
+        # documentos: se encadenan (ver GRAFO DE DEPENDENCIAS).
+        "E": ("ejecutar_HU4_E_ReglamentariosOperacion", (), ["D"]),
+        "FG": ("ejecutar_HU4_FG_OrdenDeCompra", (), ["E"]),
+        "H": ("ejecutar_HU4_PuntosHI_Pipeline", ("H",), ["FG"]),
+        "I": ("ejecutar_HU4_PuntosHI_Pipeline", ("I",), ["H"]),
+    }
+
+    def resolver_runner(nombre):
+        """Runner registrado en sys._cxp_runners_hu4 al cargar su script."""
+        registrados = getattr(sys, "_cxp_runners_hu4", None) or {}
+        fn = registrados.get(nombre) or globals().get(nombre)
+        if not callable(fn):
+            raise NameError(f"Runner no cargado: {nombre} (ejecutar antes {nombre}.py)")
+        return fn
+
+    def safe_str(v):
+        """Convierte valor a string de forma segura."""
+        try:
+            return "" if v is None else str(v)
+        except Exception:
+            return ""
+
+    def to_ascii(s):
+        """Convierte texto a ASCII puro."""
+        try:
+            s = "" if s is None else str(s)
+            s = unicodedata.normalize("NFKD", s)
+            s = s.encode("ascii", "ignore").decode("ascii", "ignore")
+            s = "".join(ch if 32 <= ord(ch) <= 126 else " " for ch in s)
+            return " ".join(s.split())
+        except Exception:
+            return ""
+
+    def set_error(user_msg, exc=None):
+        """Establece variables de error."""
+        try:
+            SetVar("vGblStrMensajeError", to_ascii(user_msg))
+            SetVar("vGblStrSystemError", "" if exc is None else to_ascii(traceback.format_exc()))
+            SetVar("vLocStrResultadoSP", False)
+            SetVar("vLocStrResumenSP", to_ascii(user_msg))
+        except Exception:
+            pass
+
+    def parse_config(raw):
+        """Parsea configuracion desde JSON o literal."""
+        if isinstance(raw, dict):
+            return raw
+        text = safe_str(raw).strip()
+        if not text:
+            raise ValueError("vLocDicConfig vacio")
+        try:
+            return json.loads(text)
+        except Exception:
+            return ast.literal_eval(text)
+
+    def resumen_corto(valor, limite=300):
+        """Texto corto del segundo valor de retorno de un runner (str, dict o JSON)."""
+        if isinstance(valor, (dict, list)):
+            valor = json.dumps(valor, ensure_ascii=True, default=str)
+        return to_ascii(valor)[:limite]
+
+    def validar_grafo(pasos, dependencias):
+        """Valida dependencias conocidas y ausencia de ciclos (Kahn)."""
+        for paso, deps in dependencias.items():
+            desconocidas = [d for d in deps if d not in pasos]
+            if desconocidas:
+                raise ValueError(f"Paso {paso} depende de pasos no ejecutados: {desconocidas}")
+        grados = {p: len(dependencias[p]) for p in pasos}
+        listos = [p for p in pasos if grados[p] == 0]
+        visitados = 0
+        while listos:
+            actual = listos.pop()
+            visitados += 1
+            for p in pasos:
+                if actual in dependencias[p]:
+                    grados[p] -= 1
+                    if grados[p] == 0:
+                        listos.append(p)
+        if visitados != len(pasos):
+            raise ValueError("HU4Dependencias contiene un ciclo")
+
+    # ==========================================================================
+    # CONFIGURACION
+    # ==========================================================================
+    try:
+        cfg = parse_config(GetVar("vLocDicConfig"))
+
+        politica = safe_str(cfg.get("HU4PoliticaFallo", "fail-fast")).strip().lower()
+        if politica not in ("fail-fast", "continuar"):
+            raise ValueError(f"HU4PoliticaFallo invalida: {politica}")
+
+        max_paralelo = max(1, int(cfg.get("HU4MaxParalelo", 4) or 4))
+
+        seleccion = cfg.get("HU4Pasos") or list(PASOS.keys())
+        if isinstance(seleccion, str):
+            seleccion = [s.strip() for s in seleccion.split(",") if s.strip()]
+        pasos = [safe_str(p).strip().upper() for p in seleccion]
+        desconocidos = [p for p in pasos if p not in PASOS]
+        if desconocidos:
+            raise ValueError(f"Pasos desconocidos en HU4Pasos: {desconocidos}")
+
+        deps_cfg = cfg.get("HU4Dependencias") or {}
+        if isinstance(deps_cfg, str):
+            deps_cfg = json.loads(deps_cfg)
+        deps_cfg = {safe_str(k).strip().upper(): v for k, v in deps_cfg.items()}
+        dependencias = {}
+        for p in pasos:
+            if p in deps_cfg:
+                dependencias[p] = [safe_str(d).strip().upper() for d in deps_cfg[p]]
+            else:
+                # Dependencias por defecto a pasos no seleccionados se ignoran (ejecucion parcial)
+                dependencias[p] = [d for d in PASOS[p][2] if d in pasos]
+        validar_grafo(pasos, dependencias)
+
+        funciones = {}
+        for p in pasos:
+            funciones[p] = resolver_runner(PASOS[p][0])
+
+    except Exception as e:
+        set_error("ERROR HU4 Orquestador | configuracion", e)
+        return False, None
+
+    # ==========================================================================
+    # EJECUCION DEL DAG
+    # ==========================================================================
+    detalle = {p: {"Estado": "PENDIENTE", "Segundos": None, "Inicio": None,
+                   "Fin": None, "Resumen": "", "Error": ""} for p in pasos}
+    retornos = {}
+
+    async def ejecutar_paso(paso):
+        """Ejecuta un runner y registra tiempos; nunca propaga excepciones."""
+        info = detalle[paso]
+        t0 = time.time()
+        info["Inicio"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        print(f"[INFO] HU4 Orquestador | inicia paso {paso}")
+        try:
+            ok, valor = await funciones[paso](*PASOS[paso][1])
+            retornos[paso] = valor
+            info["Estado"] = "OK" if ok else "FAIL"
+            info["Resumen"] = resumen_corto(valor)
+            if not ok:
+                info["Error"] = to_ascii(GetVar("vGblStrMensajeError"))
+        except Exception as e:
+            info["Estado"] = "FAIL"
+            info["Error"] = to_ascii(f"{type(e).__name__}: {safe_str(e)}")
+        info["Segundos"] = round(time.time() - t0, 2)
+        info["Fin"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        print(f"[INFO] HU4 Orquestador | paso {paso} -> {info['Estado']} ({info['Segundos']}s)")
+        return paso
+
+    t_inicio = time.time()
+    en_curso = {}
+    detener = False
+
+    while True:
+        # Omitir pasos cuyas dependencias fallaron o fueron omitidas
+        for p in pasos:
+            if detalle[p]["Estado"] == "PENDIENTE" and any(
+                detalle[d]["Estado"] in ("FAIL", "OMITIDO") for d in dependencias[p]
+            ):
+                detalle[p]["Estado"] = "OMITIDO"
+                detalle[p]["Error"] = "Dependencia fallida u omitida"
+
+        if not detener:
+            for p in pasos:
+                if len(en_curso) >= max_paralelo:
+                    break
+                if detalle[p]["Estado"] == "PENDIENTE" and all(
+                    detalle[d]["Estado"] == "OK" for d in dependencias[p]
+                ):
+                    detalle[p]["Estado"] = "EJECUTANDO"
+                    en_curso[asyncio.ensure_future(ejecutar_paso(p))] = p
+
+        if not en_curso:
+            break
+
+        terminadas, _ = await asyncio.wait(list(en_curso.keys()), return_when=asyncio.FIRST_COMPLETED)
+        for tarea in terminadas:
+            paso = en_curso.pop(tarea)
+            if detalle[paso]["Estado"] == "FAIL" and politica == "fail-fast":
+                detener = True
+
+    for p in pasos:
+        if detalle[p]["Estado"] == "PENDIENTE":
+            detalle[p]["Estado"] = "OMITIDO"
+            detalle[p]["Error"] = "Detenido por politica fail-fast"
+
+    # ==========================================================================
+    # RESUMEN COMBINADO
+    # ==========================================================================
+    segundos = time.time() - t_inicio
+    fallidos = [p for p in pasos if detalle[p]["Estado"] == "FAIL"]
+    omitidos = [p for p in pasos if detalle[p]["Estado"] == "OMITIDO"]
+    ok_total = not fallidos and not omitidos
+
+    partes = []
+    for p in pasos:
+        seg = detalle[p]["Segundos"]
+        partes.append(f"{p}={detalle[p]['Estado']}" + (f"({seg}s)" if seg is not None else ""))
+    resumen = (
+        f"HU4 ORQUESTADOR {'OK' if ok_total else 'CON ERRORES'} | Politica={politica} | "
+        f"MaxParalelo={max_paralelo} | Segundos={segundos:.2f} | " + " | ".join(partes)
+    )
+    print(f"[INFO] {resumen}")
+
+    try:
+        SetVar("vLocDicResumenHU4", json.dumps(detalle, ensure_ascii=True))
+        SetVar("vLocStrResultadoSP", ok_total)
+        SetVar("vLocStrResumenSP", to_ascii(resumen))
+        if fallidos:
+            SetVar("vGblStrMensajeError", to_ascii(
+                "HU4 Orquestador | pasos fallidos: "
+                + "; ".join(f"{p}: {detalle[p]['Error']}" for p in fallidos)
+            ))
+    except Exception:
+        pass
+
+    for p in pasos:
+        detalle[p]["Retorno"] = retornos.get(p)
+    return ok_total, detalle
+
+
+# ==============================================================================
+# EJEMPLOS DE USO
+# ==============================================================================
+"""
+EJEMPLO 1: Ejecucion completa con grafo por defecto
+---------------------------------------------------
+    ok, detalle = await ejecutar_HU4_Orquestador()
+    print(GetVar("vLocStrResumenSP"))
+
+EJEMPLO 2: Solo validaciones, continuando ante fallos
+-----------------------------------------------------
+    cfg["HU4Pasos"] = ["ABCD", "D", "E", "FG"]
+    cfg["HU4PoliticaFallo"] = "continuar"
+    SetVar("vLocDicConfig", cfg)
+    ok, detalle = await ejecutar_HU4_Orquestador()
+    # Si E falla, D ya termino y FG queda OMITIDO (depende de E)
+
+EJEMPLO 3: Grafo personalizado
+------------------------------
+    # Solo si los estados que tocan D y FG son disjuntos en la instalacion
+    cfg["HU4Dependencias"] = {"D": [], "E": ["D"], "FG": [], "H": ["E", "FG"], "I": ["H"]}
+    SetVar("vLocDicConfig", cfg)
+    ok, detalle = await ejecutar_HU4_Orquestador()
+"""
@@ -0,0 +1,405 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+================================================================================
+MODULO: ejecutar_HU4_PuntosHI_Pipeline.py
+================================================================================
+
+Descripcion General:
+--------------------
+    Driver asincrono que ejecuta en pipeline las tres fases de los Puntos H
+    (Agrupacion, MOVER) e I (NumLiquidacion 50, COPIAR) del proceso HU4:
+
+        QUEUE  ->  FileOps  ->  FINALIZE
+
+    En el flujo secuencial el bot espera la lista completa del QUEUE, opera
+    todos los archivos y solo entonces ejecuta FINALIZE. En este modo:
+
+        - El ResultSet del QUEUE se consume por paginas (fetchmany) y cada
+          pagina entra a una cola asyncio apenas se lee.
+        - Las operaciones de archivo empiezan con la primera pagina, en
+          chunks de registros completos (PipelineChunkSize).
+        - Los resultados se envian a FINALIZE en chunks rodantes
+          (FinalizeChunkSize) con el mismo BatchId, mientras el siguiente
+          chunk de archivos ya se esta procesando.
+
+    Reutiliza sin duplicar logica las funciones existentes; cada script se
+    registra en sys._cxp_runners_hu4 al cargarse, por lo que basta con
+    haberlos ejecutado antes en el mismo bot:
+
+        Punto H: ejecutar_HU4_H_Agrupacion_QUEUE
+                 ejecutar_FileOps_PuntoH_MOVER
+                 ejecutar_HU4_H_Agrupacion_FINALIZE
+        Punto I: ejecutar_HU4_I_NumLiquidacion_50_QUEUE
+                 ejecutar_FileOps_PuntoI_COPIAR
+                 ejecutar_HU4_I_NumLiquidacion_50_FINALIZE
+
+Autor: Diego Ivan Lopez Ochoa
+Version: 1.0.0
+
+================================================================================
+DIAGRAMA DE FLUJO
+================================================================================
+
+    +-------------------------------------------------------------+
+    |                        INICIO                               |
+    |          ejecutar_HU4_PuntosHI_Pipeline(punto)              |
+    +-----------------------------+-------------------------------+
+                                  |
+                 +----------------+----------------+
+                 |                                 |
+                 v                                 v
+    +---------------------------+    +---------------------------------+
+    |  PRODUCTOR (executor)     |    |  CONSUMIDOR (event loop)        |
+    |  QUEUE con fetchmany:     |    |  - Toma paginas de la cola      |
+    |  cada pagina -> cola      |--->|  - Retiene el ultimo ID (puede  |
+    |  asyncio (sin bloqueo)    |    |    continuar en la pagina sig.) |
+    +---------------------------+    |  - FileOps del chunk listo      |
+                                     |  - Acumula resultados           |
+                                     +----------------+----------------+
+                                                      |
+                                                      v
+                                     +---------------------------------+
+                                     |  FINALIZE rodante (en serie,    |
+                                     |  solapado con el siguiente      |
+                                     |  chunk de FileOps)              |
+                                     +----------------+----------------+
+                                                      |
+                                                      v
+                                     +---------------------------------+
+                                     |  Ultimo FINALIZE (cierra lote   |
+                                     |  en Punto I) y resumen          |
+                                     +---------------------------------+
+
+================================================================================
+CONSIDERACIONES
+================================================================================
+
+    - El productor nunca espera al consumidor: las paginas se encolan sin
+      limite. Asi el SELECT del QUEUE termina a la velocidad de lectura y no
+      retiene bloqueos sobre la tabla de cola mientras FINALIZE la actualiza.
+    - Las filas del QUEUE vienen ORDER BY QueueId, por lo que los archivos de
+      un mismo ID_registro son contiguos. El ultimo ID de cada pagina se
+      retiene hasta la pagina siguiente para no partir un registro.
+    - FINALIZE es idempotente por chunk (solo aplica filas PENDIENTE); si el
+      pipeline falla a mitad, reintentar no duplica observaciones.
+    - En Punto I solo el ultimo FINALIZE envia cerrar_lote=True; si el
+      pipeline falla, el lote queda abierto.
+
+================================================================================
+VARIABLES DE ENTRADA/SALIDA
+================================================================================
+
+Variables de Entrada (GetVar):
+------------------------------
+    vLocDicConfig : dict o str
+        Ademas de la configuracion de cada fase:
+        - PipelineChunkSize : int (default 100) filas del QUEUE por pagina
+          y tamano aproximado de cada chunk de FileOps
+        - FinalizeChunkSize : int (default 500) resultados por FINALIZE
+
+Variables de Salida (SetVar):
+-----------------------------
+    vLocJsonResultadosFileOpsPuntoH / vLocJsonResultadosFileOpsPuntoI : str
+        Resultados completos de FileOps (mismo formato que el flujo normal).
+    vLocStrResultadoSP : bool - True si exito, False si error.
+    vLocStrResumenSP : str - Resumen del pipeline.
+    vGblStrMensajeError : str - Mensaje de error.
+    vGblStrSystemError : str - Stack trace.
+
+================================================================================
+"""
+
+
+async def ejecutar_HU4_PuntosHI_Pipeline(punto="H"):
+    """
+    Ejecuta QUEUE -> FileOps -> FINALIZE en pipeline para el Punto H o I.
+
+    Args:
+        punto (str): "H" (Agrupacion, mover archivos) o "I" (NumLiquidacion
+            50, copiar archivos).
+
+    Returns:
+        tuple: (bool, str|None)
+            - bool: True si exito, False si error
+            - str: Resumen de ejecucion o None si error
+
+    Example:
+        ok, resumen = await ejecutar_HU4_PuntosHI_Pipeline("H")
+        # "Punto H PIPELINE OK | BatchId=... | IDs=1500 | IDs_OK=1498 |
+        #  IDs_FAIL=2 | ChunksFileOps=15 | ChunksFinalize=3 |
+        #  SegPrimerFileOp=0.42 | Segundos=61.30"
+    """
+    import asyncio
+    import ast
+    import json
+    import sys
+    import time
+    import traceback
+    import unicodedata
+
+    PUNTOS = {
+        "H": (
+            "ejecutar_HU4_H_Agrupacion_QUEUE",
+            "ejecutar_FileOps_PuntoH_MOVER",
+            "ejecutar_HU4_H_Agrupacion_FINALIZE",
+        ),
+        "I": (
+            "ejecutar_HU4_I_NumLiquidacion_50_QUEUE",
+            "ejecutar_FileOps_PuntoI_COPIAR",
+            "ejecutar_HU4_I_NumLiquidacion_50_FINALIZE",
+        ),
+    }
+
+    def resolver_runner(nombre):
+        """Runner registrado en sys._cxp_runners_hu4 al cargar su script."""
+        registrados = getattr(sys, "_cxp_runners_hu4", None) or {}
+        fn = registrados.get(nombre) or globals().get(nombre)
+        if not callable(fn):
+            raise NameError(f"Runner no cargado: {nombre} (ejecutar antes {nombre}.py)")
+        return fn
+
+    def safe_str(v):
+        """Convierte valor a string de forma segura."""
+        try:
+            if v is None:
+                return ""
+            return str(v)
+        except Exception:
+            return ""
+
+    def to_ascii(s):
+        """Convierte texto a ASCII puro."""
+        try:
+            s = "" if s is None else str(s)
+            s = unicodedata.normalize("NFKD", s)
+            s = s.encode("ascii", "ignore").decode("ascii", "ignore")
+            s = "".join(ch if 32 <= ord(ch) <= 126 else " " for ch in s)
+            return " ".join(s.split())
+        except Exception:
+            return ""
+
+    def set_error(user_msg, exc=None):
+        """Establece variables de error."""
+        try:
+            SetVar("vGblStrMensajeError", to_ascii(user_msg))
+            SetVar("vGblStrSystemError", "" if exc is None else to_ascii(traceback.format_exc()))
+            SetVar("vLocStrResultadoSP", False)
+            SetVar("vLocStrResumenSP", to_ascii(user_msg))
+        except Exception:
+            pass
+
+    def leer_config():
+        """Lee vLocDicConfig (opcional); dict vacio si no existe o es invalido."""
+        try:
+            raw = GetVar("vLocDicConfig")
+            if isinstance(raw, dict):
+                return raw
+            t = safe_str(raw).strip()
+            if not t or t.upper() == "ERROR_NOT_VAR":
+                return {}
+            try:
+                return json.loads(t)
+            except Exception:
+                return ast.literal_eval(t)
+        except Exception:
+            return {}
+
+    def leer_entero(cfg, clave, default):
+        """Lee un entero positivo de la configuracion."""
+        try:
+            return max(1, int(float(safe_str(cfg.get(clave, default)).strip() or default)))
+        except Exception:
+            return default
+
+    def separar_listos(ops):
+        """
+        Separa las filas listas de las del ultimo ID_registro, que se retienen
+        porque sus archivos pueden continuar en la pagina siguiente.
+        """
+        if not ops:
+            return [], []
+        ultimo = safe_str(ops[-1].get("ID_registro")).strip()
+        corte = len(ops)
+        while corte > 0 and safe_str(ops[corte - 1].get("ID_registro")).strip() == ultimo:
+            corte -= 1
+        return ops[:corte], ops[corte:]
+
+    # ==========================================================================
+    # VALIDACION Y CONFIGURACION
+    # ==========================================================================
+    punto = safe_str(punto).strip().upper()
+    if punto not in PUNTOS:
+        set_error(f"ERROR Pipeline HU4 | Punto invalido '{punto}' (use H o I)")
+        return False, None
+
+    try:
+        nombres = PUNTOS[punto]
+        fn_queue, fn_fileops, fn_finalize = (resolver_runner(n) for n in nombres)
+
+        cfg = leer_config()
+        tamano_chunk = leer_entero(cfg, "PipelineChunkSize", 100)
+        tamano_finalize = leer_entero(cfg, "FinalizeChunkSize", 500)
+    except Exception as e:
+        set_error(f"ERROR Pipeline Punto {punto} | configuracion", e)
+        return False, None
+
+    # ==========================================================================
+    # PIPELINE
+    # ==========================================================================
+    loop = asyncio.get_running_loop()
+    paginas = asyncio.Queue()
+    FIN = object()
+
+    def al_recibir_pagina(pagina):
+        """Callback del hilo del QUEUE: encola sin bloquear al productor."""
+        loop.call_soon_threadsafe(paginas.put_nowait, pagina)
+
+    async def productor():
+        """Ejecuta el QUEUE; siempre marca el fin de la cola."""
+        try:
+            return await fn_queue(al_recibir_pagina=al_recibir_pagina, tamano_pagina=tamano_chunk)
+        finally:
+            paginas.put_nowait(FIN)
+
+    stats = {
+        "filas": 0, "ids": 0, "ids_ok": 0, "ids_fail": 0,
+        "chunks_fileops": 0, "chunks_finalize": 0, "seg_primer_fileop": None,
+    }
+    resultados_totales = []
+    pendientes_finalize = []
+    tarea_finalize = None
+    t_inicio = time.time()
+
+    async def esperar_finalize():
+        """Espera el FINALIZE en curso y valida su resultado."""
+        nonlocal tarea_finalize
+        if tarea_finalize is None:
+            return
+        tarea, tarea_finalize = tarea_finalize, None
+        ok_fin, _ = await tarea
+        if not ok_fin:
+            raise RuntimeError(f"FINALIZE fallo: {safe_str(GetVar('vGblStrMensajeError'))}")
+
+    async def enviar_finalize(resultados, ultimo):
+        """Lanza el FINALIZE de un chunk tras esperar el anterior (en serie)."""
+        nonlocal tarea_finalize
+        await esperar_finalize()
+        kwargs = {"resultados": resultados}
+        if punto == "I":
+            kwargs["cerrar_lote"] = ultimo
+        stats["chunks_finalize"] += 1
+        tarea_finalize = asyncio.ensure_future(fn_finalize(**kwargs))
+
+    async def procesar_chunk(ops):
+        """FileOps de un chunk de registros completos; encola sus resultados."""
+        nonlocal pendientes_finalize
+        if stats["seg_primer_fileop"] is None:
+            stats["seg_primer_fileop"] = time.time() - t_inicio
+        ok_ops, resultados = await fn_fileops(file_ops=ops)
+        if not ok_ops:
+            raise RuntimeError(f"FileOps fallo: {safe_str(GetVar('vGblStrMensajeError'))}")
+        stats["chunks_fileops"] += 1
+        resultados_totales.extend(resultados)
+        pendientes_finalize.extend(resultados)
+        while len(pendientes_finalize) >= tamano_finalize:
+            lote = pendientes_finalize[:tamano_finalize]
+            pendientes_finalize = pendientes_finalize[tamano_finalize:]
+            await enviar_finalize(lote, ultimo=False)
+
+    tarea_queue = asyncio.ensure_future(productor())
+    try:
+        retenidos = []
+        while True:
+            pagina = await paginas.get()
+            if pagina is FIN:
+                break
+            stats["filas"] += len(pagina)
+            listos, retenidos = separar_listos(retenidos + pagina)
+            if listos:
+                await procesar_chunk(listos)
+
+        ok_queue, _ = await tarea_queue
+        if not ok_queue:
+            raise RuntimeError(f"QUEUE fallo: {safe_str(GetVar('vGblStrMensajeError'))}")
+
+        if retenidos:
+            await procesar_chunk(retenidos)
+
+        if stats["filas"] > 0:
+            await enviar_finalize(pendientes_finalize, ultimo=True)
+            await esperar_finalize()
+
+    except Exception as e:
+        # Drenar tareas en curso antes de reportar (sus efectos ya son idempotentes)
+        for tarea in (tarea_queue, tarea_finalize):
+            if tarea is not None:
+                try:
+                    await tarea
+                except Exception:
+                    pass
+        set_error(f"ERROR Pipeline Punto {punto} | {safe_str(e)}", e)
+        return False, None
+
+    # ==========================================================================
+    # RESUMEN
+    # ==========================================================================
+    stats["ids"] = len(resultados_totales)
+    stats["ids_ok"] = sum(1 for r in resultados_totales if r.get("MovimientoExitoso"))
+    stats["ids_fail"] = stats["ids"] - stats["ids_ok"]
+    segundos = time.time() - t_inicio
+    seg_primer = stats["seg_primer_fileop"]
+
+    if stats["filas"] == 0:
+        resumen = f"Punto {punto} PIPELINE | Sin candidatos en QUEUE (no hay nada para procesar)."
+    else:
+        resumen = (
+            f"Punto {punto} PIPELINE OK | BatchId={safe_str(GetVar(f'vLocStrBatchIdPunto{punto}'))} | "
+            f"IDs={stats['ids']} | IDs_OK={stats['ids_ok']} | IDs_FAIL={stats['ids_fail']} | "
+            f"ChunksFileOps={stats['chunks_fileops']} | ChunksFinalize={stats['chunks_finalize']} | "
+            f"SegPrimerFileOp={seg_primer if seg_primer is not None else 0:.2f} | Segundos={segundos:.2f}"
+        )
+
+    print(f"[INFO] {resumen}")
+    try:
+        SetVar(f"vLocJsonResultadosFileOpsPunto{punto}", json.dumps(resultados_totales, ensure_ascii=True))
+        SetVar("vLocStrResultadoSP", True)
+        SetVar("vLocStrResumenSP", to_ascii(resumen))
+    except Exception:
+        pass
+
+    return True, resumen
+
+
+# Registro para ejecutar_HU4_Orquestador (puede correr en otro espacio de nombres)
+import sys
+vars(sys).setdefault("_cxp_runners_hu4", {})["ejecutar_HU4_PuntosHI_Pipeline"] = ejecutar_HU4_PuntosHI_Pipeline
+
+
+# ==============================================================================
+# EJEMPLOS DE USO
+# ==============================================================================
+"""
+EJEMPLO 1: Punto H en pipeline (reemplaza QUEUE -> MOVER -> FINALIZE)
+---------------------------------------------------------------------
+    SetVar("vLocDicConfig", {
+        "ServidorBaseDatos": "SQLPROD\\CXP",
+        "NombreBaseDatos": "CuentasPorPagar",
+        "DiasMaximos": 120,
+        "BatchSize": 5000,
+        "PipelineChunkSize": 100,
+        "FinalizeChunkSize": 500
+    })
+    ok, resumen = await ejecutar_HU4_PuntosHI_Pipeline("H")
+
+EJEMPLO 2: Punto I en pipeline
+------------------------------
+    ok, resumen = await ejecutar_HU4_PuntosHI_Pipeline("I")
+    # El ultimo FINALIZE cierra el lote (@CerrarLote = 1)
+
+EJEMPLO 3: Flujo secuencial (sigue disponible)
+----------------------------------------------
+    ok, archivos = await ejecutar_HU4_H_Agrupacion_QUEUE()
+    ok, resultados = await ejecutar_FileOps_PuntoH_MOVER()
+    ok, resumen = await ejecutar_HU4_H_Agrupacion_FINALIZE()
+"""
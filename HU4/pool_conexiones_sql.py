@@ -0,0 +1,433 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+================================================================================
+MODULO: pool_conexiones_sql.py
+================================================================================
+
+Descripcion General:
+--------------------
+    Pool de conexiones pyodbc compartido por todo el proceso de RocketBot.
+    Cada runner (HU4) y validador (HU4.1, HU4.2, HU8) abria su propia
+    conexion con pyodbc.connect, pagando el handshake Kerberos/NTLM o SQL en
+    cada llamada. Con el pool, una cadena nocturna completa reutiliza unas
+    pocas sesiones "calientes".
+
+    El pool se registra en el modulo sys (atributo _cxp_pool_conexiones_sql)
+    para que sea visible desde cualquier script, aunque cada uno se ejecute
+    con su propio espacio de nombres. Los scripts consumidores usan el pool
+    si esta registrado y, si no, conectan directamente como antes:
+
+        pool = getattr(sys, "_cxp_pool_conexiones_sql", None)
+        cx = pool.conectar(conn_str, timeout=30) if pool else pyodbc.connect(conn_str, timeout=30)
+
+Autor: Diego Ivan Lopez Ochoa
+Version: 1.0.0
+
+================================================================================
+FUNCIONAMIENTO
+================================================================================
+
+    Clave del pool:
+        (SERVER, DATABASE, modo de autenticacion) extraidos de la cadena de
+        conexion. El modo es "trusted" o "sql:<UID>".
+
+    Prestamo (conectar):
+        1. Descarta conexiones ociosas por mas de PoolIdleSegundos
+        2. Toma la conexion ociosa mas reciente de la clave
+        3. Si estuvo ociosa mas de PoolValidarSegundos: SELECT 1 (health check)
+        4. Si no hay ociosas y no se alcanzo PoolMaxConexiones: conexion nueva
+        5. Si se alcanzo el maximo: espera hasta PoolEsperaSegundos
+
+    Devolucion (close() o salida del bloque with):
+        - Si hubo rollback o excepcion: la conexion se DESCARTA (la sesion
+          puede tener estado inconsistente)
+        - Si no: rollback de cualquier transaccion abierta, se eliminan las
+          tablas #temporales de la sesion, se restablecen las opciones SET
+          (NOCOUNT OFF, READ COMMITTED, XACT_ABORT OFF, LOCK_TIMEOUT -1,
+          ROWCOUNT 0, opciones ANSI ...) y vuelve al pool. Sin este reset un
+          SET NOCOUNT ON de un llamador dejaria cursor.rowcount = -1 para el
+          siguiente, y los contadores basados en rowcount quedarian en cero.
+          LANGUAGE / DATEFORMAT / DATEFIRST no se restablecen: ningun script
+          los modifica y su valor inicial depende del login.
+
+    Al prestar una conexion reutilizada se restablece autocommit=False y se
+    limpian los output converters (p.ej. DATETIMEOFFSET de Punto D), igual
+    que en una conexion nueva.
+
+    La conexion prestada se comporta como la de pyodbc:
+        - with pool.conectar(...) as cx: commit al salir sin error, rollback
+          si hay excepcion (igual que pyodbc.Connection) y devolucion al pool
+        - cx.close() devuelve al pool en lugar de cerrar
+
+================================================================================
+VARIABLES DE ENTRADA/SALIDA
+================================================================================
+
+Variables de Entrada (GetVar):
+------------------------------
+    vLocDicConfig : dict o str (opcional)
+        - PoolMaxConexiones   : int (default 4) por clave
+        - PoolIdleSegundos    : int (default 300) desalojo por inactividad
+        - PoolValidarSegundos : int (default 60) health check tras inactividad
+        - PoolEsperaSegundos  : int (default 30) espera maxima por conexion
+
+Variables de Salida (SetVar):
+-----------------------------
+    vLocStrResultadoSP : bool
+    vLocStrResumenSP : str - Estado del pool.
+
+================================================================================
+"""
+
+
+def inicializar_pool_conexiones(accion="iniciar"):
+    """
+    Crea, consulta o cierra el pool de conexiones del proceso.
+
+    Args:
+        accion (str): "iniciar" (crea o reconfigura), "estado" o "cerrar".
+
+    Returns:
+        tuple: (bool, str) - exito y resumen del estado del pool.
+
+    Example:
+        # Al inicio del bot, una sola vez
+        ok, resumen = inicializar_pool_conexiones()
+        # ... runners y validadores reutilizan conexiones ...
+        # Al final del bot
+        ok, resumen = inicializar_pool_conexiones("cerrar")
+    """
+    import ast
+    import json
+    import sys
+    import threading
+    import time
+
+    ATRIBUTO_SYS = "_cxp_pool_conexiones_sql"
+
+    # Elimina las tablas #temporales creadas por la sesion y restablece las
+    # opciones SET a los valores de una conexion ODBC nueva antes de reutilizarla.
+    # IMPLICIT_TRANSACTIONS no se toca: lo administra el driver segun autocommit.
+    SQL_LIMPIEZA_SESION = """
+        SET NOCOUNT ON;
+        DECLARE @sql NVARCHAR(MAX) = N'';
+        SELECT @sql = @sql + N'DROP TABLE ' + QUOTENAME(t.nombre) + N';'
+        FROM (
+            SELECT o.object_id,
+                   CASE WHEN CHARINDEX(N'___', o.name) > 0
+                        THEN LEFT(o.name, CHARINDEX(N'___', o.name) - 1)
+                        ELSE o.name END AS nombre
+            FROM tempdb.sys.objects o
+            WHERE o.type = 'U' AND o.name LIKE N'#%' AND o.name NOT LIKE N'##%'
+        ) t
+        WHERE OBJECT_ID(N'tempdb..' + t.nombre) = t.object_id;
+        IF @sql <> N'' EXEC sys.sp_executesql @sql;
+
+        SET TRANSACTION ISOLATION LEVEL READ COMMITTED;
+        SET XACT_ABORT OFF;
+        SET LOCK_TIMEOUT -1;
+        SET DEADLOCK_PRIORITY NORMAL;
+        SET ROWCOUNT 0;
+        SET TEXTSIZE 2147483647;
+        SET ANSI_NULLS ON;
+        SET ANSI_PADDING ON;
+        SET ANSI_WARNINGS ON;
+        SET ANSI_NULL_DFLT_ON ON;
+        SET CONCAT_NULL_YIELDS_NULL ON;
+        SET QUOTED_IDENTIFIER ON;
+        SET NUMERIC_ROUNDABORT OFF;
+        SET NOCOUNT OFF;
+    """
+
+    def safe_str(v):
+        """Convierte valor a string de forma segura."""
+        try:
+            return "" if v is None else str(v)
+        except Exception:
+            return ""
+
+    def leer_config():
+        """Lee vLocDicConfig (opcional); dict vacio si no existe o es invalido."""
+        try:
+            raw = GetVar("vLocDicConfig")
+            if isinstance(raw, dict):
+                return raw
+            t = safe_str(raw).strip()
+            if not t or t.upper() == "ERROR_NOT_VAR":
+                return {}
+            try:
+                return json.loads(t)
+            except Exception:
+                return ast.literal_eval(t)
+        except Exception:
+            return {}
+
+    def leer_entero(cfg, clave, default):
+        """Entero positivo de la configuracion o default."""
+        try:
+            return max(1, int(float(safe_str(cfg.get(clave, default)).strip() or default)))
+        except Exception:
+            return default
+
+    class ConexionPrestada:
+        """
+        Envoltorio de pyodbc.Connection prestado por el pool.
+
+        Delega todo en la conexion real; close() y la salida del bloque with
+        devuelven la conexion al pool en lugar de cerrarla.
+        """
+
+        def __init__(self, pool, clave, cx):
+            object.__setattr__(self, "_pool", pool)
+            object.__setattr__(self, "_clave", clave)
+            object.__setattr__(self, "_cx", cx)
+            object.__setattr__(self, "_sucia", False)
+            object.__setattr__(self, "_devuelta", False)
+
+        def __getattr__(self, nombre):
+            if self._devuelta:
+                raise RuntimeError("Conexion ya devuelta al pool")
+            return getattr(self._cx, nombre)
+
+        def __setattr__(self, nombre, valor):
+            setattr(self._cx, nombre, valor)
+
+        def rollback(self):
+            object.__setattr__(self, "_sucia", True)
+            return self._cx.rollback()
+
+        def close(self):
+            if not self._devuelta:
+                object.__setattr__(self, "_devuelta", True)
+                self._pool._devolver(self._clave, self._cx, self._sucia)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, tipo, valor, tb):
+            try:
+                if tipo is None:
+                    if not self._cx.autocommit:
+                        self._cx.commit()
+                else:
+                    object.__setattr__(self, "_sucia", True)
+                    try:
+                        self._cx.rollback()
+                    except Exception:
+                        pass
+            finally:
+                self.close()
+            return False
+
+    class PoolConexionesSQL:
+        """Pool thread-safe de conexiones pyodbc por (servidor, base, autenticacion)."""
+
+        def __init__(self, max_conexiones, idle_segundos, validar_segundos, espera_segundos):
+            self.configurar(max_conexiones, idle_segundos, validar_segundos, espera_segundos)
+            self._cond = threading.Condition()
+            self._ociosas = {}    # clave -> [(cx, ultimo_uso)]
+            self._en_uso = {}     # clave -> cantidad prestada
+            self._stats = {"creadas": 0, "reutilizadas": 0, "descartadas": 0, "desalojadas": 0}
+            self._cerrado = False
+
+        def configurar(self, max_conexiones, idle_segundos, validar_segundos, espera_segundos):
+            self.max_conexiones = max_conexiones
+            self.idle_segundos = idle_segundos
+            self.validar_segundos = validar_segundos
+            self.espera_segundos = espera_segundos
+
+        @staticmethod
+        def clave_de(conn_str, kwargs):
+            """(SERVER, DATABASE, modo de autenticacion, kwargs de conexion)."""
+            partes = {}
+            for item in safe_str(conn_str).split(";"):
+                if "=" in item:
+                    k, v = item.split("=", 1)
+                    partes[k.strip().lower()] = v.strip()
+            servidor = partes.get("server", "").lower()
+            base = partes.get("database", "").lower()
+            if partes.get("trusted_connection", "").lower() in ("yes", "true"):
+                auth = "trusted"
+            else:
+                auth = "sql:" + partes.get("uid", "").lower()
+            extras = tuple(sorted((k, safe_str(v)) for k, v in kwargs.items() if k != "timeout"))
+            return (servidor, base, auth, extras)
+
+        def _cerrar_silencioso(self, cx):
+            try:
+                cx.close()
+            except Exception:
+                pass
+
+        def _desalojar_ociosas(self, ahora):
+            """Cierra las conexiones ociosas por mas de idle_segundos (con lock tomado)."""
+            for clave, lista in self._ociosas.items():
+                vigentes = []
+                for cx, ultimo in lista:
+                    if ahora - ultimo > self.idle_segundos:
+                        self._cerrar_silencioso(cx)
+                        self._stats["desalojadas"] += 1
+                    else:
+                        vigentes.append((cx, ultimo))
+                self._ociosas[clave] = vigentes
+
+        def _sana(self, cx):
+            """Health check liviano."""
+            try:
+                cur = cx.cursor()
+                cur.execute("SELECT 1")
+                cur.fetchall()
+                cur.close()
+                return True
+            except Exception:
+                return False
+
+        def conectar(self, conn_str, **kwargs):
+            """Presta una conexion (reutilizada o nueva) para conn_str."""
+            import pyodbc
+
+            clave = self.clave_de(conn_str, kwargs)
+            limite = time.time() + self.espera_segundos
+
+            while True:
+                candidata = None
+                with self._cond:
+                    ahora = time.time()
+                    self._desalojar_ociosas(ahora)
+                    ociosas = self._ociosas.setdefault(clave, [])
+                    if ociosas:
+                        candidata = ociosas.pop()
+                        self._en_uso[clave] = self._en_uso.get(clave, 0) + 1
+                    elif self._en_uso.get(clave, 0) < self.max_conexiones:
+                        self._en_uso[clave] = self._en_uso.get(clave, 0) + 1
+                    else:
+                        restante = limite - ahora
+                        if restante <= 0:
+                            raise TimeoutError(
+                                f"Pool SQL agotado para {clave[0]}/{clave[1]} "
+                                f"({self.max_conexiones} conexiones en uso)"
+                            )
+                        self._cond.wait(restante)
+                        continue
+
+                try:
+                    if candidata is not None:
+                        cx, ultimo = candidata
+                        if time.time() - ultimo <= self.validar_segundos or self._sana(cx):
+                            # Mismo estado inicial que una conexion nueva de pyodbc.connect
+                            cx.autocommit = False
+                            cx.clear_output_converters()
+                            with self._cond:
+                                self._stats["reutilizadas"] += 1
+                            return ConexionPrestada(self, clave, cx)
+                        self._cerrar_silencioso(cx)
+                        with self._cond:
+                            self._stats["descartadas"] += 1
+
+                    cx = pyodbc.connect(conn_str, **kwargs)
+                    with self._cond:
+                        self._stats["creadas"] += 1
+                    return ConexionPrestada(self, clave, cx)
+
+                except Exception:
+                    with self._cond:
+                        self._en_uso[clave] -= 1
+                        self._cond.notify()
+                    raise
+
+        def _devolver(self, clave, cx, sucia):
+            """Devuelve (o descarta) una conexion prestada."""
+            if not sucia:
+                try:
+                    if not cx.autocommit:
+                        cx.rollback()
+                    cur = cx.cursor()
+                    cur.execute(SQL_LIMPIEZA_SESION)
+                    cur.close()
+                    if not cx.autocommit:
+                        cx.commit()
+                except Exception:
+                    sucia = True
+
+            with self._cond:
+                self._en_uso[clave] = max(0, self._en_uso.get(clave, 0) - 1)
+                sucia = sucia or self._cerrado
+                if sucia:
+                    self._stats["descartadas"] += 1
+                else:
+                    self._ociosas.setdefault(clave, []).append((cx, time.time()))
+                self._cond.notify()
+
+            if sucia:
+                self._cerrar_silencioso(cx)
+
+        def cerrar(self):
+            """Cierra todas las conexiones ociosas (las prestadas se cierran al devolverse)."""
+            with self._cond:
+                for lista in self._ociosas.values():
+                    for cx, _ in lista:
+                        self._cerrar_silencioso(cx)
+                self._ociosas = {}
+                self._cerrado = True
+
+        def estado(self):
+            with self._cond:
+                ociosas = sum(len(v) for v in self._ociosas.values())
+                en_uso = sum(self._en_uso.values())
+                return (
+                    f"Claves={len(self._ociosas)} | Ociosas={ociosas} | EnUso={en_uso} | "
+                    f"Creadas={self._stats['creadas']} | Reutilizadas={self._stats['reutilizadas']} | "
+                    f"Descartadas={self._stats['descartadas']} | Desalojadas={self._stats['desalojadas']}"
+                )
+
+    # ==========================================================================
+    # ACCION
+    # ==========================================================================
+    try:
+        accion = safe_str(accion).strip().lower() or "iniciar"
+        pool = getattr(sys, ATRIBUTO_SYS, None)
+
+        if accion == "iniciar":
+            cfg = leer_config()
+            params = (
+                leer_entero(cfg, "PoolMaxConexiones", 4),
+                leer_entero(cfg, "PoolIdleSegundos", 300),
+                leer_entero(cfg, "PoolValidarSegundos", 60),
+                leer_entero(cfg, "PoolEsperaSegundos", 30),
+            )
+            if pool is None:
+                pool = PoolConexionesSQL(*params)
+                setattr(sys, ATRIBUTO_SYS, pool)
+            else:
+                pool.configurar(*params)
+            resumen = f"Pool SQL ACTIVO | MaxPorClave={params[0]} | IdleSeg={params[1]} | " + pool.estado()
+
+        elif accion == "estado":
+            resumen = ("Pool SQL ACTIVO | " + pool.estado()) if pool is not None else "Pool SQL NO INICIALIZADO"
+
+        elif accion == "cerrar":
+            if pool is not None:
+                resumen = "Pool SQL CERRADO | " + pool.estado()
+                pool.cerrar()
+                delattr(sys, ATRIBUTO_SYS)
+            else:
+                resumen = "Pool SQL NO INICIALIZADO"
+
+        else:
+            raise ValueError(f"Accion invalida: {accion} (use iniciar, estado o cerrar)")
+
+        print(f"[INFO] {resumen}")
+        SetVar("vLocStrResultadoSP", True)
+        SetVar("vLocStrResumenSP", resumen)
+        return True, resumen
+
+    except Exception as e:
+        resumen = f"ERROR Pool SQL | {safe_str(e)}"
+        print(f"[ERROR] {resumen}")
+        try:
+            SetVar("vLocStrResultadoSP", False)
+            SetVar("vLocStrResumenSP", resumen)
+        except Exception:
+            pass
+        return False, resumen
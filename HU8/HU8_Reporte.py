@@ -358,6 +358,7 @@ def HU8_GenerarReportesCxP():
     import ast
     import traceback
     import pyodbc
+    import sys
     import pandas as pd
     import numpy as np
     from datetime import datetime, timedelta
@@ -571,7 +572,8 @@ def HU8_GenerarReportesCxP():
         # Fase 1: Intentar Autenticacion SQL
         for attempt in range(max_retries):
             try:
-                cx = pyodbc.connect(conn_str_auth, timeout=30)
+                pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                cx = pool_sql.conectar(conn_str_auth, timeout=30) if pool_sql else pyodbc.connect(conn_str_auth, timeout=30)
                 cx.autocommit = False
                 conectado = True
                 break
@@ -584,7 +586,8 @@ def HU8_GenerarReportesCxP():
         if not conectado:
             for attempt in range(max_retries):
                 try:
-                    cx = pyodbc.connect(conn_str_trusted, timeout=30)
+                    pool_sql = getattr(sys, "_cxp_pool_conexiones_sql", None)
+                    cx = pool_sql.conectar(conn_str_trusted, timeout=30) if pool_sql else pyodbc.connect(conn_str_trusted, timeout=30)
                     cx.autocommit = False
                     conectado = True
                     break
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Carga los scripts de RocketBot fuera del bot para las pruebas.
+
+Los scripts definen funciones autocontenidas que usan GetVar/SetVar como
+globales; aqui se ejecutan en un espacio de nombres propio con esas dos
+funciones respaldadas por un dict.
+"""
+
+import ast
+import os
+import warnings
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def cargar_script(ruta_relativa, variables=None):
+    """
+    Ejecuta el script y devuelve (espacio_de_nombres, variables).
+
+    Args:
+        ruta_relativa (str): Ruta del script desde la raiz del repositorio.
+        variables (dict): Valores iniciales para GetVar.
+    """
+    variables = {} if variables is None else variables
+    espacio = {
+        "__name__": "script_rocketbot",
+        "GetVar": lambda nombre: variables.get(nombre, "ERROR_NOT_VAR"),
+        "SetVar": lambda nombre, valor: variables.__setitem__(nombre, valor),
+    }
+    with open(os.path.join(RAIZ, ruta_relativa), encoding="utf-8") as f:
+        codigo = compile(f.read(), ruta_relativa, "exec")
+    exec(codigo, espacio)
+    return espacio, variables
+
+
+def extraer_funcion(ruta_relativa, nombre, globales):
+    """
+    Compila por separado una funcion anidada de un script.
+
+    Los scripts definen sus utilidades dentro de la funcion principal; aqui se
+    toma la primera definicion con ese nombre y se ejecuta sola sobre los
+    globales indicados (modulos que usa la funcion).
+
+    Args:
+        ruta_relativa (str): Ruta del script desde la raiz del repositorio.
+        nombre (str): Nombre de la funcion anidada.
+        globales (dict): Nombres visibles para la funcion (pd, np, re, ...).
+    """
+    # Algunos scripts traen docstrings con escapes invalidos ('\d')
+    with open(os.path.join(RAIZ, ruta_relativa), encoding="utf-8") as f, warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        arbol = ast.parse(f.read(), ruta_relativa)
+    for nodo in ast.walk(arbol):
+        if isinstance(nodo, ast.FunctionDef) and nodo.name == nombre:
+            nodo.col_offset = 0
+            modulo = ast.Module(body=[nodo], type_ignores=[])
+            espacio = dict(globales)
+            exec(compile(modulo, ruta_relativa, "exec"), espacio)
+            return espacio[nombre]
+    raise LookupError(f"{nombre} no esta definida en {ruta_relativa}")
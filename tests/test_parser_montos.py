@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Paridad del parser compartido (HU4.1/parser_montos.py) con las conversiones
+originales: sumar_valores de los validadores ZPRE / ZPCN_ZPPA COP y USD y
+normalizar_decimal de HU4.1_ZPAF, HU4.1_ZPSA_ZPSS y HU4.1_ZVEN.
+"""
+
+import re
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from cargar_script import cargar_script, extraer_funcion
+
+
+def split_valores(valor_str):
+    """split_valores original de los validadores."""
+    if not valor_str or valor_str == "" or pd.isna(valor_str):
+        return []
+    valores = str(valor_str).split('|')
+    return [v.strip() for v in valores if v.strip()]
+
+
+def sumar_valores_original(valor_str):
+    """sumar_valores / sumar original (ZPRE COP/USD, ZPCN USD): quita ',' y float()."""
+    suma = 0.0
+    for v in split_valores(valor_str):
+        try:
+            suma += float(v.strip().replace(',', ''))
+        except Exception:
+            pass
+    return suma
+
+
+def normalizar_decimal_original(valor):
+    """normalizar_decimal original de HU4.1_ZPAF / HU4.1_ZPSA_ZPSS / HU4.1_ZVEN."""
+    if pd.isna(valor) or valor == '' or valor is None:
+        return 0.0
+    if isinstance(valor, (int, float)):
+        if np.isnan(valor) if isinstance(valor, float) else False:
+            return 0.0
+        return float(valor)
+    valor_str = str(valor).strip().replace(',', '.')
+    valor_str = re.sub(r'[^\d.\-]', '', valor_str)
+    try:
+        return float(valor_str)
+    except Exception:
+        return 0.0
+
+
+# Montos que sumar_valores original convierte bien: mismo resultado exacto
+CASOS_PARIDAD_VALIDADORES = [
+    # Separador de miles ','
+    "12,345", "1,000,000", "1,234.56", "2,500.50", "-1,234.5", "1,5",
+    # Decimal '.' (un '.' unico siempre es decimal)
+    "1200.50", "0.5", "-7", "1.000",
+    # Vacios y nulos
+    None, np.nan, "", "   ", "|", " | ",
+    # Celdas con varios montos
+    "1,000|2,500.50|3", "100| |200", "|5|", " 1,234 | 5.5 ",
+    # Celdas numericas
+    1500, 2500.75, 0, 0.0,
+    # Digitos no ASCII
+    "１２",
+]
+
+# Montos que sumar_valores original convertia mal (0.0 o separador errado)
+CASOS_CORREGIDOS_VALIDADORES = [
+    ("1.234,56", 1234.56),
+    ("$1,000", 1000.0),
+    ("$ 1,234.50", 1234.5),
+    ("COP 2,500", 2500.0),
+    ("USD1,000.25|$500", 1500.25),
+    ("1.000.000", 1000000.0),
+    ("1.000.000,75", 1000000.75),
+    ("abc", 0.0),
+    ("$", 0.0),
+]
+
+# Valores que normalizar_decimal original convierte bien: mismo resultado exacto
+CASOS_PARIDAD_NORMALIZAR = [
+    None, np.nan, float("nan"), pd.NA, "", "   ",
+    0, 12345, -3, 0.0, 2500.75, True, np.int64(7), np.float64(1.25),
+    "1200.50", "  -123.45  ", "0.5", "-7", "1.000", "COP 2.500",
+    "1,5", "12,345", "-1,5", "$500", "12%", "1|2",
+    "abc", "-", ".", "1-2", "１２", "１２,５",
+]
+
+# Valores que normalizar_decimal original convertia en 0.0 ('.' repetido
+# tras cambiar ',' por '.'); el docstring ya prometia estos resultados
+CASOS_CORREGIDOS_NORMALIZAR = [
+    ("1.234,56", 1234.56),
+    ("$1,000.00", 1000.0),
+    ("1.000.000", 1000000.0),
+    ("1,000,000", 1000000.0),
+    ("-1.234.567,89", -1234567.89),
+    ("USD 1,234.50", 1234.5),
+]
+
+
+class PruebasParserMontos(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        espacio, _ = cargar_script("HU4.1/parser_montos.py")
+        ok, _ = espacio["registrar_parser_montos"]()
+        assert ok
+        cls.parser = getattr(sys, "_cxp_parser_montos")
+
+    @classmethod
+    def tearDownClass(cls):
+        delattr(sys, "_cxp_parser_montos")
+
+    def test_paridad_con_sumar_valores_original(self):
+        serie = pd.Series(CASOS_PARIDAD_VALIDADORES, dtype=object)
+        sumas = self.parser.sumar_montos_por_factura(serie)
+        for celda, suma in zip(CASOS_PARIDAD_VALIDADORES, sumas):
+            with self.subTest(celda=celda):
+                self.assertEqual(suma, sumar_valores_original(celda))
+
+    def test_montos_corregidos_validadores(self):
+        celdas = [c for c, _ in CASOS_CORREGIDOS_VALIDADORES]
+        sumas = self.parser.sumar_montos_por_factura(pd.Series(celdas))
+        for (celda, esperado), suma in zip(CASOS_CORREGIDOS_VALIDADORES, sumas):
+            with self.subTest(celda=celda):
+                self.assertEqual(suma, esperado)
+
+    def test_paridad_con_normalizar_decimal_original(self):
+        for valor in CASOS_PARIDAD_NORMALIZAR:
+            with self.subTest(valor=valor):
+                self.assertEqual(self.parser.normalizar_decimal(valor), normalizar_decimal_original(valor))
+
+    def test_normalizar_decimal_corregidos(self):
+        for valor, esperado in CASOS_CORREGIDOS_NORMALIZAR:
+            with self.subTest(valor=valor):
+                self.assertEqual(normalizar_decimal_original(valor), 0.0)
+                self.assertEqual(self.parser.normalizar_decimal(valor), esperado)
+
+    def test_vectorizado_igual_a_normalizar_decimal(self):
+        # Con coma_decimal=True cada monto de la columna vale lo mismo que
+        # normalizar_decimal sobre el monto suelto
+        montos = [c for c in CASOS_PARIDAD_NORMALIZAR if isinstance(c, str) and '|' not in c]
+        montos += [c for c, _ in CASOS_CORREGIDOS_NORMALIZAR]
+        sumas = self.parser.sumar_montos_por_factura(pd.Series(montos), coma_decimal=True)
+        for monto, suma in zip(montos, sumas):
+            with self.subTest(monto=monto):
+                self.assertEqual(suma, self.parser.normalizar_decimal(monto))
+
+    def test_offsets_por_fila(self):
+        valores, offsets = self.parser.parsear_montos_vectorizado(
+            pd.Series(["1,234.56|10", None, "$1,000", 7, ""]))
+        self.assertEqual(valores.tolist(), [1234.56, 10.0, 1000.0, 7.0])
+        self.assertEqual(offsets.tolist(), [0, 2, 2, 3, 4, 4])
+
+    def test_indice_no_consecutivo(self):
+        serie = pd.Series(["1,000", "2"], index=[10, 3])
+        self.assertEqual(self.parser.sumar_montos_por_factura(serie).tolist(), [1000.0, 2.0])
+
+    def test_serie_vacia(self):
+        self.assertEqual(self.parser.sumar_montos_por_factura(pd.Series([], dtype=object)).size, 0)
+
+
+class PruebasSinParserRegistrado(unittest.TestCase):
+    """Los scripts usan su conversion local si el parser no esta registrado."""
+
+    def setUp(self):
+        self.assertIsNone(getattr(sys, "_cxp_parser_montos", None))
+
+    def test_validadores_suman_con_sumar_valores(self):
+        celdas = ["12,345|1", None, "$5", "1,000,000"]
+        for ruta in ("HU4.1/ZPRE_ValidarCOP.py", "HU4.1/ZPRE_ValidarUSD.py",
+                     "HU4.1/ZPCN_ZPPA_ValidarCOP.py", "HU4.1/ZPCN_ZPPA_ValidarUSD.py"):
+            with self.subTest(ruta=ruta):
+                globales = {"pd": pd, "np": np, "sys": sys}
+                globales["split_valores"] = extraer_funcion(ruta, "split_valores", globales)
+                globales["sumar_valores"] = extraer_funcion(ruta, "sumar_valores", globales)
+                sumar = extraer_funcion(ruta, "sumar_montos_por_factura", globales)
+                esperado = [globales["sumar_valores"](c) for c in celdas]
+                self.assertEqual(sumar(pd.Series(celdas, dtype=object)).tolist(), esperado)
+
+    def test_normalizar_decimal_local(self):
+        for ruta in ("HU4.1/HU4.1_ZPAF.py", "HU4.1/HU4.1_ZPSA_ZPSS.py", "HU4.1/HU4.1_ZVEN.py"):
+            normalizar = extraer_funcion(ruta, "normalizar_decimal", {"pd": pd, "np": np, "re": re, "sys": sys})
+            for valor in CASOS_PARIDAD_NORMALIZAR + [c for c, _ in CASOS_CORREGIDOS_NORMALIZAR]:
+                with self.subTest(ruta=ruta, valor=valor):
+                    self.assertEqual(normalizar(valor), normalizar_decimal_original(valor))
+
+
+if __name__ == "__main__":
+    unittest.main()
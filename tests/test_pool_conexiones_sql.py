@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Pruebas del pool de conexiones (HU4/pool_conexiones_sql.py) con un pyodbc simulado."""
+
+import re
+import sys
+import types
+import unittest
+
+from cargar_script import cargar_script
+
+ATRIBUTO_SYS = "_cxp_pool_conexiones_sql"
+CONN_STR = "DRIVER={ODBC Driver 17 for SQL Server};SERVER=srv;DATABASE=CxP;Trusted_Connection=yes"
+
+
+class SesionSimulada:
+    """Estado de sesion de SQL Server que afecta a los llamadores (opciones SET)."""
+
+    def __init__(self):
+        self.nocount = False
+        self.aislamiento = "READ COMMITTED"
+
+
+class CursorSimulado:
+    def __init__(self, sesion):
+        self.sesion = sesion
+        self.rowcount = -1
+
+    def execute(self, sql, *params):
+        # Las opciones SET se aplican en el orden en que aparecen en el lote
+        for m in re.finditer(r"SET\s+(NOCOUNT\s+(ON|OFF)|TRANSACTION\s+ISOLATION\s+LEVEL\s+(\w+(?:\s+COMMITTED|\s+UNCOMMITTED|\s+READ)?))", sql, re.I):
+            if m.group(2):
+                self.sesion.nocount = m.group(2).upper() == "ON"
+            else:
+                self.sesion.aislamiento = " ".join(m.group(3).upper().split())
+        self.rowcount = -1 if self.sesion.nocount else (3 if sql.lstrip().upper().startswith("UPDATE") else -1)
+        return self
+
+    def fetchall(self):
+        return [(1,)]
+
+    def close(self):
+        pass
+
+
+class ConexionSimulada:
+    def __init__(self):
+        self.sesion = SesionSimulada()
+        self.autocommit = False
+        self.cerrada = False
+
+    def cursor(self):
+        return CursorSimulado(self.sesion)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def clear_output_converters(self):
+        pass
+
+    def close(self):
+        self.cerrada = True
+
+
+class PruebasPoolConexiones(unittest.TestCase):
+
+    def setUp(self):
+        self.conexiones = []
+
+        def connect(conn_str, **kwargs):
+            cx = ConexionSimulada()
+            self.conexiones.append(cx)
+            return cx
+
+        self._pyodbc_original = sys.modules.get("pyodbc")
+        sys.modules["pyodbc"] = types.SimpleNamespace(connect=connect)
+        espacio, _ = cargar_script("HU4/pool_conexiones_sql.py")
+        self.inicializar = espacio["inicializar_pool_conexiones"]
+        ok, _ = self.inicializar()
+        self.assertTrue(ok)
+        self.pool = getattr(sys, ATRIBUTO_SYS)
+
+    def tearDown(self):
+        self.inicializar("cerrar")
+        if self._pyodbc_original is None:
+            sys.modules.pop("pyodbc", None)
+        else:
+            sys.modules["pyodbc"] = self._pyodbc_original
+
+    def test_nocount_no_se_filtra_al_siguiente_prestamo(self):
+        with self.pool.conectar(CONN_STR, timeout=30) as cx:
+            cur = cx.cursor()
+            cur.execute("SET NOCOUNT ON;")
+            cur.execute("UPDATE t SET x = 1")
+            self.assertEqual(cur.rowcount, -1)
+
+        with self.pool.conectar(CONN_STR, timeout=30) as cx:
+            cur = cx.cursor()
+            cur.execute("UPDATE t SET x = 1")
+            self.assertEqual(cur.rowcount, 3)
+
+        # La segunda vez se reutilizo la misma sesion
+        self.assertEqual(len(self.conexiones), 1)
+
+    def test_nivel_de_aislamiento_vuelve_a_read_committed(self):
+        cx = self.pool.conectar(CONN_STR, timeout=30)
+        cx.cursor().execute("SET TRANSACTION ISOLATION LEVEL SERIALIZABLE;")
+        cx.close()
+
+        cx = self.pool.conectar(CONN_STR, timeout=30)
+        self.assertEqual(self.conexiones[0].sesion.aislamiento, "READ COMMITTED")
+        cx.close()
+
+    def test_conexion_con_rollback_se_descarta(self):
+        cx = self.pool.conectar(CONN_STR, timeout=30)
+        cx.rollback()
+        cx.close()
+
+        self.assertTrue(self.conexiones[0].cerrada)
+        self.pool.conectar(CONN_STR, timeout=30).close()
+        self.assertEqual(len(self.conexiones), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
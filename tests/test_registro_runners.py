@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Registro de los runners HU4 en sys._cxp_runners_hu4 y su resolucion desde el
+orquestador y el pipeline H/I.
+"""
+
+import sys
+import unittest
+
+from cargar_script import cargar_script, extraer_funcion
+
+SCRIPTS_CON_RESOLUCION = ("HU4/ejecutar_HU4_Orquestador.py", "HU4/ejecutar_HU4_PuntosHI_Pipeline.py")
+
+
+class PruebasRegistroRunners(unittest.TestCase):
+
+    def setUp(self):
+        self.previo = getattr(sys, "_cxp_runners_hu4", None)
+        if self.previo is not None:
+            delattr(sys, "_cxp_runners_hu4")
+
+    def tearDown(self):
+        if hasattr(sys, "_cxp_runners_hu4"):
+            delattr(sys, "_cxp_runners_hu4")
+        if self.previo is not None:
+            sys._cxp_runners_hu4 = self.previo
+
+    def test_script_se_registra_al_cargarse(self):
+        espacio, _ = cargar_script("HU4/ejecutar_HU4_D_NITs.py")
+        self.assertIs(sys._cxp_runners_hu4["ejecutar_HU4_D_NITs"], espacio["ejecutar_HU4_D_NITs"])
+
+    def test_resolucion_desde_otro_espacio_de_nombres(self):
+        espacio, _ = cargar_script("HU4/ejecutar_FileOps_PuntoH_MOVER.py")
+        for ruta in SCRIPTS_CON_RESOLUCION:
+            with self.subTest(ruta=ruta):
+                resolver = extraer_funcion(ruta, "resolver_runner", {"sys": sys})
+                self.assertIs(resolver("ejecutar_FileOps_PuntoH_MOVER"),
+                              espacio["ejecutar_FileOps_PuntoH_MOVER"])
+
+    def test_runner_faltante_indica_su_nombre(self):
+        for ruta in SCRIPTS_CON_RESOLUCION:
+            with self.subTest(ruta=ruta):
+                resolver = extraer_funcion(ruta, "resolver_runner", {"sys": sys})
+                with self.assertRaisesRegex(NameError, "ejecutar_HU4_FG_OrdenDeCompra"):
+                    resolver("ejecutar_HU4_FG_OrdenDeCompra")
+
+
+if __name__ == "__main__":
+    unittest.main()
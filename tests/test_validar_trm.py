@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+comparar_trm_vectorizado de ZPCN_ZPPA_ValidarTRM frente a la comparacion
+original (primer valor de Trm_hoc == safe_str(CalculationRate_dp)).
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from cargar_script import extraer_funcion
+
+RUTA = "HU4.1/ZPCN_ZPPA_ValidarTRM.py"
+
+
+class PruebasCompararTrmZpcn(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        globales = {"pd": pd, "np": np}
+        globales["safe_str"] = extraer_funcion(RUTA, "safe_str", globales)
+        cls.comparar = staticmethod(extraer_funcion(RUTA, "comparar_trm_vectorizado", globales))
+
+    def comparar_filas(self, filas, tolerancia=0.0):
+        df = pd.DataFrame(filas, columns=["Trm_hoc", "CalculationRate_dp"], dtype=object)
+        return self.comparar(df, "Trm_hoc", tolerancia, solo_primer_valor=True).tolist()
+
+    def test_mismo_resultado_que_comparacion_original(self):
+        casos = [
+            (("4000.5", 4000.5), True),
+            (("4000.5|3900", "4000.5"), True),
+            (("3900|4000.5", 4000.5), False),
+            (("4,000.5", 4000.5), True),
+            (("4000.5", 4000.4), False),
+            # Sin TRM en SAP ni en el XML: '' == ''
+            ((None, None), True),
+            (("", np.nan), True),
+            ((" | ", ""), True),
+            # Solo uno de los dos vacio
+            (("4000.5", None), False),
+            ((None, 4000.5), False),
+            # CalculationRate ausente o no numerico nunca coincide con un "0" de SAP
+            (("0", None), False),
+            (("0", "N/A"), False),
+            (("N/A", "N/A"), False),
+        ]
+        resultado = self.comparar_filas([c for c, _ in casos])
+        for (caso, esperado), obtenido in zip(casos, resultado):
+            with self.subTest(caso=caso):
+                self.assertEqual(obtenido, esperado)
+
+    def test_tolerancia(self):
+        self.assertEqual(self.comparar_filas([("4000", 4000.4)], tolerancia=0.5), [True])
+
+    def test_lote_vacio(self):
+        self.assertEqual(self.comparar_filas([]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()